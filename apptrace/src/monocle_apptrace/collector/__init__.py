@@ -0,0 +1,3 @@
+from monocle_apptrace.collector.daemon import CollectorDaemon
+
+__all__ = ["CollectorDaemon"]
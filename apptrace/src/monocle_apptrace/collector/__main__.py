@@ -0,0 +1,38 @@
+"""
+Run the local Monocle span collector.
+
+    python -m monocle_apptrace.collector --exporters s3,okahu
+    python -m monocle_apptrace.collector --socket /run/monocle/collector.sock --exporters file
+
+Application processes send their spans to it with ``MONOCLE_EXPORTER=collector``.
+"""
+import argparse
+import logging
+import signal
+import sys
+import threading
+
+from monocle_apptrace.collector.daemon import COLLECTOR_EXPORTER_ENV, CollectorDaemon
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m monocle_apptrace.collector",
+                                     description="Collect the spans of the local processes and export them.")
+    parser.add_argument("--socket", help="Unix socket path (default: MONOCLE_COLLECTOR_SOCKET or "
+                                         "monocle_collector.sock in the temp folder)")
+    parser.add_argument("--exporters", help=f"comma separated exporters (default: {COLLECTOR_EXPORTER_ENV} or file)")
+    parser.add_argument("--log-level", default="INFO", help="logging level (default: %(default)s)")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    daemon = CollectorDaemon(socket_path=args.socket, exporters_list=args.exporters)
+    stopped = threading.Event()
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signal_number, lambda *_: stopped.set())
+    daemon.start()
+    while not stopped.wait(1):
+        pass
+    daemon.stop()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
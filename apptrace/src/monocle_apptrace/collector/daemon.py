@@ -0,0 +1,173 @@
+"""
+Local span collector daemon.
+
+Receives the spans of the application processes of a node from their ``CollectorSpanExporter`` over a Unix domain
+socket and runs them through one ``MonocleBatchSpanProcessor`` per exporter, so the trace assembly, compression,
+batching and upload happen once for the whole node with the regular exporters. Configured with:
+
+- ``MONOCLE_COLLECTOR_SOCKET``: path of the socket (default ``monocle_collector.sock`` in the temp folder)
+- ``MONOCLE_COLLECTOR_EXPORTER``: comma separated exporters of the daemon, same names as ``MONOCLE_EXPORTER``
+  (default ``file``)
+- ``MONOCLE_COLLECTOR_MAX_FRAME_BYTES``: largest accepted frame, a connection sending a larger one is closed
+  (default 64 MiB)
+"""
+import json
+import logging
+import os
+import socket
+import socketserver
+import threading
+from typing import List, Optional
+from opentelemetry.sdk.trace.export import SpanExporter
+from monocle_apptrace.exporters.collector_exporter import (
+    FRAME_HEADER, CollectorSpanExporter, get_collector_socket_path
+)
+from monocle_apptrace.exporters.monocle_exporters import get_monocle_exporter
+from monocle_apptrace.exporters.span_encoder import span_from_dict
+from monocle_apptrace.instrumentation.common.self_telemetry import (
+    COLLECTOR_SPANS, MonocleBatchSpanProcessor, add_counter
+)
+
+logger = logging.getLogger(__name__)
+
+COLLECTOR_EXPORTER_ENV = "MONOCLE_COLLECTOR_EXPORTER"
+COLLECTOR_MAX_FRAME_BYTES_ENV = "MONOCLE_COLLECTOR_MAX_FRAME_BYTES"
+
+DEFAULT_COLLECTOR_EXPORTER = "file"
+DEFAULT_MAX_FRAME_BYTES = 64 * 1024 * 1024
+
+class _CollectorRequestHandler(socketserver.BaseRequestHandler):
+    def handle(self) -> None:
+        self.server.collector._serve_connection(self.request)
+
+class _CollectorServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+class CollectorDaemon:
+    """Unix socket server feeding the received spans to the exporters of the node."""
+
+    def __init__(self, socket_path: Optional[str] = None, exporters: Optional[List[SpanExporter]] = None,
+                 exporters_list: Optional[str] = None, max_frame_bytes: Optional[int] = None):
+        self.socket_path = get_collector_socket_path(socket_path)
+        if exporters is None:
+            exporters = get_monocle_exporter(exporters_list or
+                                             os.environ.get(COLLECTOR_EXPORTER_ENV, DEFAULT_COLLECTOR_EXPORTER))
+        # sending to itself would loop
+        self.exporters = [exporter for exporter in exporters if not isinstance(exporter, CollectorSpanExporter)]
+        if len(self.exporters) < len(exporters):
+            logger.warning("The collector exporter can't be used by the collector daemon, skipping it")
+        self.max_frame_bytes = max_frame_bytes or \
+            int(os.environ.get(COLLECTOR_MAX_FRAME_BYTES_ENV, DEFAULT_MAX_FRAME_BYTES))
+        self.span_processors = [MonocleBatchSpanProcessor(exporter) for exporter in self.exporters]
+        self._server: Optional[_CollectorServer] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._connections = set()
+        self._metrics = {"connections": 0, "frames": 0, "spans": 0, "invalid_spans": 0, "rejected_frames": 0}
+
+    def start(self) -> None:
+        """Listen on the socket and serve the connections from a background thread."""
+        self._remove_stale_socket()
+        self._server = _CollectorServer(self.socket_path, _CollectorRequestHandler)
+        self._server.collector = self
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True, name="MonocleCollector")
+        self._thread.start()
+        logger.info(f"Monocle collector listening on {self.socket_path}, exporting to "
+                    f"{', '.join(type(exporter).__name__ for exporter in self.exporters)}")
+
+    def _remove_stale_socket(self) -> None:
+        if not os.path.exists(self.socket_path):
+            return
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(self.socket_path)
+        except OSError:
+            # left by a collector that is gone
+            os.remove(self.socket_path)
+            return
+        finally:
+            probe.close()
+        raise OSError(f"A Monocle collector is already listening on {self.socket_path}")
+
+    def _serve_connection(self, connection: socket.socket) -> None:
+        with self._lock:
+            self._metrics["connections"] += 1
+            self._connections.add(connection)
+        try:
+            self._read_frames(connection)
+        finally:
+            with self._lock:
+                self._connections.discard(connection)
+
+    def _read_frames(self, connection: socket.socket) -> None:
+        with connection.makefile("rb") as stream:
+            while True:
+                header = stream.read(FRAME_HEADER.size)
+                if len(header) < FRAME_HEADER.size:
+                    return
+                (size,) = FRAME_HEADER.unpack(header)
+                if size > self.max_frame_bytes:
+                    with self._lock:
+                        self._metrics["rejected_frames"] += 1
+                    logger.warning(f"Closing collector connection sending a frame of {size} bytes, over the "
+                                   f"{self.max_frame_bytes} bytes limit")
+                    return
+                payload = stream.read(size)
+                if len(payload) < size:
+                    # the process died or reconnected mid frame
+                    return
+                self.receive(payload)
+
+    def receive(self, payload: bytes) -> None:
+        """Process a frame of NDJSON spans."""
+        spans = []
+        invalid = 0
+        for line in payload.splitlines():
+            if not line:
+                continue
+            try:
+                spans.append(span_from_dict(json.loads(line)))
+            except Exception as e:
+                invalid += 1
+                logger.debug(f"Invalid span received by the collector: {e}")
+        for span in spans:
+            for span_processor in self.span_processors:
+                span_processor.on_end(span)
+        with self._lock:
+            self._metrics["frames"] += 1
+            self._metrics["spans"] += len(spans)
+            self._metrics["invalid_spans"] += invalid
+        add_counter(COLLECTOR_SPANS, len(spans), {"outcome": "received"})
+        if invalid:
+            add_counter(COLLECTOR_SPANS, invalid, {"outcome": "invalid"})
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return all(span_processor.force_flush(timeout_millis) for span_processor in self.span_processors)
+
+    def stop(self) -> None:
+        """Stop listening, then export the spans received so far."""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+            with self._lock:
+                connections = list(self._connections)
+            # the exporters of the processes see the connection closed and reconnect to the next collector
+            for connection in connections:
+                try:
+                    connection.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+            try:
+                os.remove(self.socket_path)
+            except OSError:
+                pass
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        for span_processor in self.span_processors:
+            span_processor.shutdown()
+
+    def get_metrics(self) -> dict:
+        with self._lock:
+            return dict(self._metrics)
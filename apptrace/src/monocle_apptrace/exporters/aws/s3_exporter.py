@@ -1,7 +1,6 @@
 import os
 import datetime
 import logging
-import asyncio
 import boto3
 from botocore.exceptions import ClientError
 from botocore.exceptions import (
@@ -15,11 +14,14 @@ from opentelemetry.sdk.trace import ReadableSpan
 from opentelemetry.sdk.trace.export import SpanExporter, SpanExportResult
 from monocle_apptrace.exporters.base_exporter import SpanExporterBase, format_trace_id_without_0x
 from monocle_apptrace.exporters.exporter_processor import ExportTaskProcessor
-from typing import Sequence, Optional, Dict, List, Tuple
-import json
+from monocle_apptrace.exporters.span_encoder import encode_spans_ndjson
+from monocle_apptrace.exporters.trace_buffer import TraceBuffer, TraceEntry, EVICT_EXPIRED
+from monocle_apptrace.exporters.upload_engine import get_upload_engine
+from monocle_apptrace.instrumentation.common.multiprocess import register_fork_handler
+from monocle_apptrace.instrumentation.common.self_telemetry import record_export_bytes
+from typing import Sequence, Optional, List
 logger = logging.getLogger(__name__)
 
-HANDLE_TIMEOUT_SECONDS = 60
 
 class S3SpanExporter(SpanExporterBase):
     def __init__(self, bucket_name=None, region_name=None, task_processor: Optional[ExportTaskProcessor] = None):
@@ -29,28 +31,17 @@ class S3SpanExporter(SpanExporterBase):
         DEFAULT_TIME_FORMAT = "%Y-%m-%d__%H.%M.%S"
         self.max_batch_size = 500
         self.export_interval = 1
-        # Dictionary to store spans by trace_id: {trace_id: (spans_list, creation_time, has_root_span)}
-        self.trace_spans: Dict[int, Tuple[List[ReadableSpan], datetime.datetime, bool]] = {}
-        if(os.getenv('MONOCLE_AWS_ACCESS_KEY_ID') and os.getenv('MONOCLE_AWS_SECRET_ACCESS_KEY')):
-            self.s3_client = boto3.client(
-                's3',
-                aws_access_key_id=os.getenv('MONOCLE_AWS_ACCESS_KEY_ID'),
-                aws_secret_access_key=os.getenv('MONOCLE_AWS_SECRET_ACCESS_KEY'),
-                region_name=region_name,
-            )
-        else:
-            self.s3_client = boto3.client(
-                's3',
-                aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-                aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
-                region_name=region_name,
-            )
+        # Spans buffered by trace_id until the root span arrives, traces over the time or size limits are uploaded early
+        self.trace_spans = TraceBuffer(on_evict=self._on_trace_evicted, name=type(self).__name__)
+        self.region_name = region_name
+        self.s3_client = self._create_s3_client()
         self.bucket_name = bucket_name or os.getenv('MONOCLE_S3_BUCKET_NAME','default-bucket')
         self.file_prefix = os.getenv('MONOCLE_S3_KEY_PREFIX', DEFAULT_FILE_PREFIX)
         self.time_format = DEFAULT_TIME_FORMAT
         self.task_processor = task_processor
         if self.task_processor is not None:
             self.task_processor.start()
+        self.upload_engine = get_upload_engine()
 
         # Check if bucket exists or create it
         if not self.__bucket_exists(self.bucket_name):
@@ -63,6 +54,26 @@ class S3SpanExporter(SpanExporterBase):
             except ClientError as e:
                 logger.error(f"Error creating bucket {self.bucket_name}: {e}")
                 raise e
+        register_fork_handler(self)
+
+    def _create_s3_client(self):
+        if(os.getenv('MONOCLE_AWS_ACCESS_KEY_ID') and os.getenv('MONOCLE_AWS_SECRET_ACCESS_KEY')):
+            return boto3.client(
+                's3',
+                aws_access_key_id=os.getenv('MONOCLE_AWS_ACCESS_KEY_ID'),
+                aws_secret_access_key=os.getenv('MONOCLE_AWS_SECRET_ACCESS_KEY'),
+                region_name=self.region_name,
+            )
+        return boto3.client(
+            's3',
+            aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
+            aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
+            region_name=self.region_name,
+        )
+
+    def _after_fork_in_child(self) -> None:
+        # the connection pool of the client is shared with the parent, botocore clients aren't fork safe
+        self.s3_client = self._create_s3_client()
 
     def __bucket_exists(self, bucket_name):
         try:
@@ -94,66 +105,44 @@ class S3SpanExporter(SpanExporterBase):
 
     def _cleanup_expired_traces(self) -> None:
         """Upload and remove traces that have exceeded the timeout."""
-        current_time = datetime.datetime.now()
-        expired_trace_ids = []
-        
-        for trace_id, (spans, creation_time, _) in self.trace_spans.items():
-            if (current_time - creation_time).total_seconds() > HANDLE_TIMEOUT_SECONDS:
-                expired_trace_ids.append(trace_id)
-        
-        for trace_id in expired_trace_ids:
-            self._upload_trace(trace_id)
+        self.trace_spans.expire()
+
+    def _on_trace_evicted(self, entry: TraceEntry, reason: str) -> None:
+        """Upload a trace that was removed from the buffer before its root span arrived."""
+        if reason != EVICT_EXPIRED:
+            logger.warning(f"Trace buffer limit reached ({reason}), uploading {entry.span_count} spans of trace {format_trace_id_without_0x(entry.trace_id)} early.")
+        self._upload_spans(entry.trace_id, entry.spans)
 
     def _add_spans_to_trace(self, trace_id: int, spans: List[ReadableSpan], has_root: bool = False) -> None:
         """Add spans to a trace buffer, creating it if needed."""
-        if trace_id in self.trace_spans:
-            existing_spans, creation_time, existing_root = self.trace_spans[trace_id]
-            existing_spans.extend(spans)
-            has_root = has_root or existing_root
-            self.trace_spans[trace_id] = (existing_spans, creation_time, has_root)
-        else:
-            self.trace_spans[trace_id] = (spans.copy(), datetime.datetime.now(), has_root)
+        self.trace_spans.add(trace_id, spans, has_root)
 
-    def _upload_trace(self, trace_id: int) -> None:
-        """Upload a specific trace to S3 and remove it from the buffer."""
-        if trace_id not in self.trace_spans:
-            return
-        
-        spans, _, _ = self.trace_spans[trace_id]
+    def _upload_trace(self, trace_id: int, is_root_span: bool = False) -> None:
+        """Hand a specific trace over for upload to S3 and remove it from the buffer."""
+        entry = self.trace_spans.pop(trace_id)
+        if entry is not None:
+            self._upload_spans(trace_id, entry.spans, is_root_span)
+
+    def _upload_spans(self, trace_id: int, spans: List[ReadableSpan], is_root_span: bool = False) -> None:
         if len(spans) == 0:
-            del self.trace_spans[trace_id]
             return
         
         serialized_data = self.__serialize_spans(spans)
-        if serialized_data:
-            try:
-                self.__upload_to_s3_with_trace_id(span_data_batch=serialized_data, trace_id=trace_id)
-            except Exception as e:
-                logger.error(f"Failed to upload trace {format_trace_id_without_0x(trace_id)}: {e}")
-        
-        del self.trace_spans[trace_id]
+        if not serialized_data:
+            return
+        record_export_bytes(self, len(serialized_data))
+        upload_kwargs = {'span_data_batch': serialized_data, 'trace_id': trace_id}
+        if is_root_span and self.task_processor is not None and callable(getattr(self.task_processor, 'queue_task', None)):
+            # Queue the upload task
+            self.task_processor.queue_task(self.__upload_to_s3_with_trace_id, kwargs=upload_kwargs, is_root_span=True)
+        else:
+            self.upload_engine.submit(self.__upload_to_s3_with_trace_id, kwargs=upload_kwargs,
+                                      description=f"trace {format_trace_id_without_0x(trace_id)} to S3")
 
     def export(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
-        """Synchronous export method that internally handles async logic."""
+        """Buffer spans by trace and queue the complete traces for upload."""
         try:
-            # Run the asynchronous export logic in an event loop
             logger.info(f"Exporting {len(spans)} spans to S3.")
-            try:
-                # Try to get the running event loop
-                loop = asyncio.get_running_loop()
-                # If we're already in an event loop, create a task
-                asyncio.create_task(self.__export_async(spans))
-            except RuntimeError:
-                # No event loop is running, so we can use asyncio.run()
-                asyncio.run(self.__export_async(spans))
-            return SpanExportResult.SUCCESS
-        except Exception as e:
-            logger.error(f"Error exporting spans: {e}")
-            return SpanExportResult.FAILURE
-
-    async def __export_async(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
-        try:
-            logger.info(f"__export_async {len(spans)} spans to S3.")
             
             # Cleanup expired traces first
             self._cleanup_expired_traces()
@@ -182,20 +171,7 @@ class S3SpanExporter(SpanExporterBase):
             
             # Upload complete traces (those with root spans)
             for trace_id in root_span_traces:
-                if self.task_processor is not None and callable(getattr(self.task_processor, 'queue_task', None)):
-                    # Queue the upload task
-                    if trace_id in self.trace_spans:
-                        spans_to_upload, _, _ = self.trace_spans[trace_id]
-                        serialized_data = self.__serialize_spans(spans_to_upload)
-                        if serialized_data:
-                            self.task_processor.queue_task(
-                                self.__upload_to_s3_with_trace_id,
-                                kwargs={'span_data_batch': serialized_data, 'trace_id': trace_id},
-                                is_root_span=True
-                            )
-                        del self.trace_spans[trace_id]
-                else:
-                    self._upload_trace(trace_id)
+                self._upload_trace(trace_id, is_root_span=True)
 
             return SpanExportResult.SUCCESS
         except Exception as e:
@@ -204,18 +180,7 @@ class S3SpanExporter(SpanExporterBase):
 
     def __serialize_spans(self, spans: Sequence[ReadableSpan]) -> str:
         try:
-            # Serialize spans to JSON or any other format you prefer
-            valid_json_list = []
-            for span in spans:
-                if self.skip_export(span):
-                    continue
-                try:
-                    valid_json_list.append(span.to_json(indent=0).replace("\n", ""))
-                except json.JSONDecodeError as e:
-                    logger.warning(f"Invalid JSON format in span data: {span.context.span_id}. Error: {e}")
-                    continue
-            ndjson_data = "\n".join(valid_json_list) + "\n"
-            return ndjson_data
+            return encode_spans_ndjson(span for span in spans if not self.skip_export(span))
         except Exception as e:
             logger.warning(f"Error serializing spans: {e}")
             return ""
@@ -233,20 +198,17 @@ class S3SpanExporter(SpanExporterBase):
         )
         logger.debug(f"Trace {format_trace_id_without_0x(trace_id)} uploaded to AWS S3 as {file_name}.")
 
-    async def force_flush(self, timeout_millis: int = 30000) -> bool:
-        """Flush all pending traces to S3."""
-        trace_ids_to_upload = list(self.trace_spans.keys())
-        for trace_id in trace_ids_to_upload:
-            self._upload_trace(trace_id)
-        return True
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        """Upload all pending traces to S3 and wait for the uploads to finish."""
+        for entry in self.trace_spans.drain():
+            self._upload_spans(entry.trace_id, entry.spans)
+        return self.upload_engine.flush(timeout_millis)
 
     def shutdown(self) -> None:
         """Upload all pending traces and shutdown."""
         # Upload all remaining traces
-        trace_ids_to_upload = list(self.trace_spans.keys())
-        for trace_id in trace_ids_to_upload:
-            self._upload_trace(trace_id)
+        self.force_flush()
         
         if hasattr(self, 'task_processor') and self.task_processor is not None:
             self.task_processor.stop()
-        logger.info("S3SpanExporter has been shut down.")
+        logger.info("S3SpanExporter has been shut down.")
\ No newline at end of file
@@ -2,16 +2,17 @@ import os
 import time
 import datetime
 import logging
-import asyncio
 from typing import Sequence, Optional
 from opentelemetry.sdk.trace import ReadableSpan
 from opentelemetry.sdk.trace.export import SpanExportResult
 from monocle_apptrace.exporters.base_exporter import SpanExporterBase
 from monocle_apptrace.exporters.exporter_processor import ExportTaskProcessor
+from monocle_apptrace.exporters.span_encoder import encode_spans_ndjson
+from monocle_apptrace.exporters.upload_engine import get_upload_engine
+from monocle_apptrace.instrumentation.common.self_telemetry import record_export_bytes
 from opendal import Operator
 from opendal.exceptions import PermissionDenied, ConfigInvalid, Unexpected
 
-import json
 
 logger = logging.getLogger(__name__)
 class OpenDALS3Exporter(SpanExporterBase):
@@ -40,29 +41,29 @@ class OpenDALS3Exporter(SpanExporterBase):
         self.task_processor = task_processor
         if self.task_processor is not None:
             self.task_processor.start()
+        self.upload_engine = get_upload_engine()
 
     def export(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
-        """Synchronous export method that internally handles async logic."""
+        """Queue spans and hand full or due batches over for upload."""
         try:
-            # Run the asynchronous export logic in an event loop
-            asyncio.run(self.__export_async(spans))
+            self.__queue_spans(spans)
             return SpanExportResult.SUCCESS
         except Exception as e:
             logger.error(f"Error exporting spans: {e}")
             return SpanExportResult.FAILURE
 
-    async def __export_async(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
+    def __queue_spans(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
         try:
             # Add spans to the export queue
             for span in spans:
                 self.export_queue.append(span)
                 if len(self.export_queue) >= self.max_batch_size:
-                    await self.__export_spans()
+                    self.__export_spans()
 
             # Check if it's time to force a flush
             current_time = time.time()
             if current_time - self.last_export_time >= self.export_interval:
-                await self.__export_spans()
+                self.__export_spans()
                 self.last_export_time = current_time
 
             return SpanExportResult.SUCCESS
@@ -72,24 +73,17 @@ class OpenDALS3Exporter(SpanExporterBase):
 
     def __serialize_spans(self, spans: Sequence[ReadableSpan]) -> str:
         try:
-            # Serialize spans to JSON or any other format you prefer
-            valid_json_list = []
-            for span in spans:
-                try:
-                    valid_json_list.append(span.to_json(indent=0).replace("\n", ""))
-                except json.JSONDecodeError as e:
-                    logger.warning(f"Invalid JSON format in span data: {span.context.span_id}. Error: {e}")
-                    continue
-            return "\n".join(valid_json_list) + "\n"
+            return encode_spans_ndjson(spans)
         except Exception as e:
             logger.warning(f"Error serializing spans: {e}")
 
-    async def __export_spans(self):
+    def __export_spans(self):
         if not self.export_queue:
             return
         # Take a batch of spans from the queue
         batch_to_export = self.export_queue[:self.max_batch_size]
         serialized_data = self.__serialize_spans(batch_to_export)
+        record_export_bytes(self, len(serialized_data or ""))
         self.export_queue = self.export_queue[self.max_batch_size:]
         
         # Calculate is_root_span by checking if any span has no parent
@@ -102,10 +96,11 @@ class OpenDALS3Exporter(SpanExporterBase):
                 is_root_span=is_root_span
             )
         else:
-            try:
-                self.__upload_to_s3(serialized_data, is_root_span)
-            except Exception as e:
-                logger.error(f"Failed to upload span batch: {e}")
+            self.upload_engine.submit(
+                self.__upload_to_s3,
+                kwargs={'span_data_batch': serialized_data, 'is_root_span': is_root_span},
+                description="span batch to S3"
+            )
 
     @SpanExporterBase.retry_with_backoff(exceptions=(Unexpected))
     def __upload_to_s3(self, span_data_batch: str, is_root_span: bool = False):
@@ -131,11 +126,13 @@ class OpenDALS3Exporter(SpanExporterBase):
                 raise e
 
 
-    async def force_flush(self, timeout_millis: int = 30000) -> bool:
-        await self.__export_spans()
-        return True
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        while self.export_queue:
+            self.__export_spans()
+        return self.upload_engine.flush(timeout_millis)
 
     def shutdown(self) -> None:
+        self.force_flush()
         if hasattr(self, 'task_processor') and self.task_processor is not None:
             self.task_processor.stop()
         logger.info("S3SpanExporter has been shut down.")
@@ -1,19 +1,21 @@
 import os
 import datetime
 import logging
-import asyncio
 from azure.storage.blob import BlobServiceClient, BlobClient, ContainerClient
 from azure.core.exceptions import ResourceNotFoundError, ClientAuthenticationError, ServiceRequestError
 from opentelemetry.sdk.trace import ReadableSpan
 from opentelemetry.sdk.trace.export import SpanExporter, SpanExportResult
-from typing import Sequence, Optional, Dict, List, Tuple
+from typing import Sequence, Optional, List
 from monocle_apptrace.exporters.base_exporter import SpanExporterBase, format_trace_id_without_0x
 from monocle_apptrace.exporters.exporter_processor import ExportTaskProcessor
-import json
+from monocle_apptrace.exporters.span_encoder import encode_spans_ndjson
+from monocle_apptrace.exporters.trace_buffer import TraceBuffer, TraceEntry, EVICT_EXPIRED
+from monocle_apptrace.exporters.upload_engine import get_upload_engine
+from monocle_apptrace.instrumentation.common.multiprocess import register_fork_handler
+from monocle_apptrace.instrumentation.common.self_telemetry import record_export_bytes
 from monocle_apptrace.instrumentation.common.constants import MONOCLE_SDK_VERSION
 logger = logging.getLogger(__name__)
 
-HANDLE_TIMEOUT_SECONDS = 60  # 1 minute timeout for orphaned traces
 
 class AzureBlobSpanExporter(SpanExporterBase):
     def __init__(self, connection_string=None, container_name=None, task_processor: Optional[ExportTaskProcessor] = None):
@@ -22,8 +24,8 @@ class AzureBlobSpanExporter(SpanExporterBase):
         DEFAULT_TIME_FORMAT = "%Y-%m-%d_%H.%M.%S"
         self.max_batch_size = 500
         self.export_interval = 1
-        # Dictionary to store spans by trace_id: {trace_id: (spans_list, creation_time, has_root_span)}
-        self.trace_spans: Dict[int, Tuple[List[ReadableSpan], datetime.datetime, bool]] = {}
+        # Spans buffered by trace_id until the root span arrives, traces over the time or size limits are uploaded early
+        self.trace_spans = TraceBuffer(on_evict=self._on_trace_evicted, name=type(self).__name__)
         # Use default values if none are provided
         if not connection_string:
             connection_string = os.getenv('MONOCLE_BLOB_CONNECTION_STRING')
@@ -33,6 +35,7 @@ class AzureBlobSpanExporter(SpanExporterBase):
         if not container_name:
             container_name = os.getenv('MONOCLE_BLOB_CONTAINER_NAME', 'default-container')
 
+        self._connection_string = connection_string
         self.blob_service_client = BlobServiceClient.from_connection_string(connection_string)
         self.container_name = container_name
         self.file_prefix = DEFAULT_FILE_PREFIX
@@ -50,6 +53,12 @@ class AzureBlobSpanExporter(SpanExporterBase):
         self.task_processor = task_processor
         if self.task_processor is not None:
             self.task_processor.start()
+        self.upload_engine = get_upload_engine()
+        register_fork_handler(self)
+
+    def _after_fork_in_child(self) -> None:
+        # the transport session of the client is shared with the parent and can't be reopened once closed
+        self.blob_service_client = BlobServiceClient.from_connection_string(self._connection_string)
 
     def __container_exists(self, container_name):
         try:
@@ -68,57 +77,42 @@ class AzureBlobSpanExporter(SpanExporterBase):
 
     def _cleanup_expired_traces(self) -> None:
         """Upload and remove traces that have exceeded the timeout."""
-        current_time = datetime.datetime.now()
-        expired_trace_ids = []
-        
-        for trace_id, (spans, creation_time, _) in self.trace_spans.items():
-            if (current_time - creation_time).total_seconds() > HANDLE_TIMEOUT_SECONDS:
-                expired_trace_ids.append(trace_id)
-        
-        for trace_id in expired_trace_ids:
-            self._upload_trace(trace_id)
+        self.trace_spans.expire()
+
+    def _on_trace_evicted(self, entry: TraceEntry, reason: str) -> None:
+        """Upload a trace that was removed from the buffer before its root span arrived."""
+        if reason != EVICT_EXPIRED:
+            logger.warning(f"Trace buffer limit reached ({reason}), uploading {entry.span_count} spans of trace {format_trace_id_without_0x(entry.trace_id)} early.")
+        self._upload_spans(entry.trace_id, entry.spans)
 
     def _add_spans_to_trace(self, trace_id: int, spans: List[ReadableSpan], has_root: bool = False) -> None:
         """Add spans to a trace buffer, creating it if needed."""
-        if trace_id in self.trace_spans:
-            existing_spans, creation_time, existing_root = self.trace_spans[trace_id]
-            existing_spans.extend(spans)
-            has_root = has_root or existing_root
-            self.trace_spans[trace_id] = (existing_spans, creation_time, has_root)
-        else:
-            self.trace_spans[trace_id] = (spans.copy(), datetime.datetime.now(), has_root)
+        self.trace_spans.add(trace_id, spans, has_root)
 
-    def _upload_trace(self, trace_id: int) -> None:
-        """Upload a specific trace to Azure Blob and remove it from the buffer."""
-        if trace_id not in self.trace_spans:
-            return
-        
-        spans, _, _ = self.trace_spans[trace_id]
+    def _upload_trace(self, trace_id: int, is_root_span: bool = False) -> None:
+        """Hand a specific trace over for upload to Azure Blob and remove it from the buffer."""
+        entry = self.trace_spans.pop(trace_id)
+        if entry is not None:
+            self._upload_spans(trace_id, entry.spans, is_root_span)
+
+    def _upload_spans(self, trace_id: int, spans: List[ReadableSpan], is_root_span: bool = False) -> None:
         if len(spans) == 0:
-            del self.trace_spans[trace_id]
             return
         
         serialized_data = self.__serialize_spans(spans)
-        if serialized_data:
-            try:
-                self.__upload_to_blob_with_trace_id(serialized_data, trace_id)
-            except Exception as e:
-                logger.error(f"Failed to upload trace {format_trace_id_without_0x(trace_id)}: {e}")
-        
-        del self.trace_spans[trace_id]
+        if not serialized_data:
+            return
+        record_export_bytes(self, len(serialized_data))
+        upload_kwargs = {'span_data_batch': serialized_data, 'trace_id': trace_id}
+        if is_root_span and self.task_processor is not None and callable(getattr(self.task_processor, 'queue_task', None)):
+            # Queue the upload task
+            self.task_processor.queue_task(self.__upload_to_blob_with_trace_id, kwargs=upload_kwargs, is_root_span=True)
+        else:
+            self.upload_engine.submit(self.__upload_to_blob_with_trace_id, kwargs=upload_kwargs,
+                                      description=f"trace {format_trace_id_without_0x(trace_id)} to Azure Blob")
 
     def export(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
-        """Synchronous export method that internally handles async logic."""
-        try:
-            # Run the asynchronous export logic in an event loop
-            asyncio.run(self._export_async(spans))
-            return SpanExportResult.SUCCESS
-        except Exception as e:
-            logger.error(f"Error exporting spans: {e}")
-            return SpanExportResult.FAILURE
-
-    async def _export_async(self, spans: Sequence[ReadableSpan]):
-        """The actual async export logic is run here."""
+        """Buffer spans by trace and queue the complete traces for upload."""
         try:
             # Cleanup expired traces first
             self._cleanup_expired_traces()
@@ -151,35 +145,15 @@ class AzureBlobSpanExporter(SpanExporterBase):
             
             # Upload complete traces (those with root spans)
             for trace_id in root_span_traces:
-                if self.task_processor is not None and callable(getattr(self.task_processor, 'queue_task', None)):
-                    # Queue the upload task
-                    if trace_id in self.trace_spans:
-                        spans_to_upload, _, _ = self.trace_spans[trace_id]
-                        serialized_data = self.__serialize_spans(spans_to_upload)
-                        if serialized_data:
-                            self.task_processor.queue_task(
-                                self.__upload_to_blob_with_trace_id,
-                                kwargs={'span_data_batch': serialized_data, 'trace_id': trace_id},
-                                is_root_span=True
-                            )
-                        del self.trace_spans[trace_id]
-                else:
-                    self._upload_trace(trace_id)
+                self._upload_trace(trace_id, is_root_span=True)
+            return SpanExportResult.SUCCESS
         except Exception as e:
-            logger.error(f"Error in _export_async: {e}")
+            logger.error(f"Error exporting spans: {e}")
+            return SpanExportResult.FAILURE
 
     def __serialize_spans(self, spans: Sequence[ReadableSpan]) -> str:
         try:
-            valid_json_list = []
-            for span in spans:
-                try:
-                    valid_json_list.append(span.to_json(indent=0).replace("\n", ""))
-                except json.JSONDecodeError as e:
-                    logger.warning(f"Invalid JSON format in span data: {span.context.span_id}. Error: {e}")
-                    continue
-
-            ndjson_data = "\n".join(valid_json_list) + "\n"
-            return ndjson_data
+            return encode_spans_ndjson(spans)
         except Exception as e:
             logger.warning(f"Error serializing spans: {e}")
             return ""
@@ -193,20 +167,17 @@ class AzureBlobSpanExporter(SpanExporterBase):
         blob_client.upload_blob(span_data_batch, overwrite=True)
         logger.debug(f"Trace {format_trace_id_without_0x(trace_id)} uploaded to Azure Blob Storage as {file_name}.")
 
-    async def force_flush(self, timeout_millis: int = 30000) -> bool:
-        """Flush all pending traces to Azure Blob."""
-        trace_ids_to_upload = list(self.trace_spans.keys())
-        for trace_id in trace_ids_to_upload:
-            self._upload_trace(trace_id)
-        return True
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        """Upload all pending traces to Azure Blob and wait for the uploads to finish."""
+        for entry in self.trace_spans.drain():
+            self._upload_spans(entry.trace_id, entry.spans)
+        return self.upload_engine.flush(timeout_millis)
 
     def shutdown(self) -> None:
         """Upload all pending traces and shutdown."""
         # Upload all remaining traces
-        trace_ids_to_upload = list(self.trace_spans.keys())
-        for trace_id in trace_ids_to_upload:
-            self._upload_trace(trace_id)
+        self.force_flush()
         
         if hasattr(self, 'task_processor') and self.task_processor is not None:
             self.task_processor.stop()
-        logger.info("AzureBlobSpanExporter has been shut down.")
+        logger.info("AzureBlobSpanExporter has been shut down.")
\ No newline at end of file
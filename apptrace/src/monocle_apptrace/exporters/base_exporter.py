@@ -1,11 +1,12 @@
 import time, os
-import random
 import logging
 from abc import ABC, abstractmethod
 from opentelemetry.sdk.trace import ReadableSpan
 from opentelemetry.sdk.trace.export import SpanExportResult
 from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+from monocle_apptrace.exporters.export_spool import get_export_resilience
 from monocle_apptrace.instrumentation.common.constants import MONOCLE_SDK_VERSION
+from monocle_apptrace.instrumentation.common.self_telemetry import DROP_FILTERED, record_dropped_spans
 from typing import Sequence
 
 logger = logging.getLogger(__name__)
@@ -31,24 +32,23 @@ class SpanExporterBase(ABC):
 
     def skip_export(self, span:ReadableSpan) -> bool:
         if self.export_monocle_only and (not span.attributes.get(MONOCLE_SDK_VERSION)):
+            record_dropped_spans(1, DROP_FILTERED, type(self).__name__)
             return True
         return False
 
     @staticmethod
     def retry_with_backoff(retries=3, backoff_in_seconds=1, max_backoff_in_seconds=32, exceptions=(Exception,)):
+        """
+        Retry an export method of the exporter, through its circuit breaker and spool (see ``export_spool``): once
+        the breaker is open the batches are spooled, or rejected if no spool is configured, without retry sleeps.
+        """
         def decorator(func):
             def wrapper(*args, **kwargs):
-                attempt = 0
-                while attempt < retries:
-                    try:
-                        return func(*args, **kwargs)
-                    except exceptions as e:
-                        attempt += 1
-                        sleep_time = min(max_backoff_in_seconds, backoff_in_seconds * (2 ** (attempt - 1)))
-                        sleep_time = sleep_time * (1 + random.uniform(-0.1, 0.1))  # Add jitter
-                        logger.warning(f"Network connectivity error, Attempt {attempt} failed: {e}. Retrying in {sleep_time:.2f} seconds...")
-                        time.sleep(sleep_time)
-                raise Exception(f"Failed after {retries} attempts")
+                resilience = get_export_resilience(args[0]) if args else None
+                if resilience is None:
+                    return func(*args, **kwargs)
+                return resilience.call(func, args, kwargs, retries, backoff_in_seconds, max_backoff_in_seconds,
+                                       exceptions)
 
             return wrapper
 
@@ -0,0 +1,123 @@
+"""
+Exporter shipping spans to the local Monocle collector daemon.
+
+Instead of running its own exporters, upload clients and trace buffers, each application process sends its spans,
+serialized in the Monocle wire format, over a Unix domain socket to the collector daemon of the node
+(``python -m monocle_apptrace.collector``), which assembles, batches and uploads the traces of all the processes
+with the regular exporters. Select it with ``MONOCLE_EXPORTER=collector``, the socket is ``MONOCLE_COLLECTOR_SOCKET``
+(default ``monocle_collector.sock`` in the temp folder).
+
+Every export call sends one frame: a 4 byte big endian length followed by the NDJSON spans of the batch.
+"""
+import logging
+import os
+import socket
+import struct
+import tempfile
+import threading
+from typing import Optional, Sequence
+from opentelemetry.sdk.trace import ReadableSpan
+from opentelemetry.sdk.trace.export import SpanExportResult
+from monocle_apptrace.exporters.base_exporter import SpanExporterBase
+from monocle_apptrace.exporters.exporter_processor import ExportTaskProcessor
+from monocle_apptrace.exporters.span_encoder import encode_span
+from monocle_apptrace.instrumentation.common.multiprocess import register_fork_handler
+from monocle_apptrace.instrumentation.common.self_telemetry import record_export_bytes
+
+logger = logging.getLogger(__name__)
+
+COLLECTOR_SOCKET_ENV = "MONOCLE_COLLECTOR_SOCKET"
+COLLECTOR_TIMEOUT_ENV = "MONOCLE_COLLECTOR_TIMEOUT"
+
+DEFAULT_COLLECTOR_SOCKET = os.path.join(tempfile.gettempdir(), "monocle_collector.sock")
+DEFAULT_COLLECTOR_TIMEOUT_SECONDS = 10.0
+
+FRAME_HEADER = struct.Struct(">I")
+
+def get_collector_socket_path(socket_path: Optional[str] = None) -> str:
+    return socket_path or os.environ.get(COLLECTOR_SOCKET_ENV) or DEFAULT_COLLECTOR_SOCKET
+
+def encode_frame(payload: bytes) -> bytes:
+    return FRAME_HEADER.pack(len(payload)) + payload
+
+class CollectorSpanExporter(SpanExporterBase):
+    def __init__(self, socket_path: Optional[str] = None, timeout: Optional[float] = None,
+                 task_processor: Optional[ExportTaskProcessor] = None):
+        """Exporter sending the spans to the local collector daemon, sends run on the span processor thread."""
+        super().__init__()
+        self.socket_path = get_collector_socket_path(socket_path)
+        self.timeout = timeout or float(os.environ.get(COLLECTOR_TIMEOUT_ENV, DEFAULT_COLLECTOR_TIMEOUT_SECONDS))
+        self._socket: Optional[socket.socket] = None
+        self._lock = threading.Lock()
+        self._connected = True
+        self._closed = False
+        register_fork_handler(self)
+
+    def _after_fork_in_child(self) -> None:
+        # the connection is the parent's, the child connects on its first export
+        self._lock = threading.Lock()
+        self._close_socket()
+
+    def _connect(self) -> socket.socket:
+        collector_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        collector_socket.settimeout(self.timeout)
+        try:
+            collector_socket.connect(self.socket_path)
+        except OSError:
+            collector_socket.close()
+            raise
+        return collector_socket
+
+    def _close_socket(self) -> None:
+        if self._socket is not None:
+            try:
+                self._socket.close()
+            except OSError:
+                pass
+            self._socket = None
+
+    def export(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
+        if self._closed:
+            logger.warning("Exporter already shutdown, ignoring batch")
+            return SpanExportResult.FAILURE
+        lines = []
+        for span in spans:
+            if self.skip_export(span):
+                continue
+            try:
+                lines.append(encode_span(span))
+            except Exception as e:
+                logger.warning(f"Error serializing span {span.context.span_id}: {e}")
+        if not lines:
+            return SpanExportResult.SUCCESS
+        frame = encode_frame(("\n".join(lines) + "\n").encode("utf-8"))
+        with self._lock:
+            # a connection closed by a restarted daemon fails on the first send, it's retried once on a new one
+            for _ in range(2):
+                try:
+                    if self._socket is None:
+                        self._socket = self._connect()
+                    self._socket.sendall(frame)
+                except OSError as e:
+                    self._close_socket()
+                    error = e
+                    continue
+                if not self._connected:
+                    logger.info(f"Connected to the Monocle collector at {self.socket_path}")
+                    self._connected = True
+                record_export_bytes(self, len(frame))
+                return SpanExportResult.SUCCESS
+            if self._connected:
+                # logged once until the collector is back
+                logger.warning(f"Unable to send spans to the Monocle collector at {self.socket_path}: {error}")
+                self._connected = False
+        return SpanExportResult.FAILURE
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        # frames are handed to the socket in export
+        return True
+
+    def shutdown(self) -> None:
+        with self._lock:
+            self._closed = True
+            self._close_socket()
@@ -0,0 +1,481 @@
+"""
+Circuit breaker and disk spool of the exporters.
+
+Every exporter using ``SpanExporterBase.retry_with_backoff`` gets a circuit breaker. After
+``MONOCLE_EXPORT_BREAKER_FAILURES`` consecutive failed attempts (default 5) the breaker opens: the exporter stops
+retrying and sleeping, and new batches are not sent to the backend until ``MONOCLE_EXPORT_BREAKER_RESET_SECONDS``
+(default 30) have passed, when one batch is let through to probe the backend.
+
+When ``MONOCLE_EXPORT_SPOOL_DIR`` is set, the batches that fail or arrive while the breaker is open are appended to a
+spool in ``<dir>/<exporter class>`` instead of being dropped. The spool is a set of append-only NDJSON segment files,
+one line per batch, rotated at ``MONOCLE_EXPORT_SPOOL_SEGMENT_BYTES`` (default 8 MiB) and capped to
+``MONOCLE_EXPORT_SPOOL_MAX_BYTES`` (default 256 MiB) by dropping the oldest segments. Once an export succeeds again,
+a background thread replays the spooled batches in the order they were written, and stops at the first failure. The
+spool survives restarts, batches left by a previous process are replayed by the next one.
+"""
+import atexit
+import glob
+import json
+import logging
+import os
+import random
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+from monocle_apptrace.exporters.upload_engine import _env_number
+from monocle_apptrace.instrumentation.common.multiprocess import register_fork_handler
+from monocle_apptrace.instrumentation.common.self_telemetry import (
+    EXPORT_BREAKER_TRIPS, EXPORT_RETRIES, EXPORT_SPOOL, add_counter, watch_export_resilience
+)
+
+logger = logging.getLogger(__name__)
+
+EXPORT_BREAKER_FAILURES_ENV = "MONOCLE_EXPORT_BREAKER_FAILURES"
+EXPORT_BREAKER_RESET_SECONDS_ENV = "MONOCLE_EXPORT_BREAKER_RESET_SECONDS"
+EXPORT_SPOOL_DIR_ENV = "MONOCLE_EXPORT_SPOOL_DIR"
+EXPORT_SPOOL_MAX_BYTES_ENV = "MONOCLE_EXPORT_SPOOL_MAX_BYTES"
+EXPORT_SPOOL_SEGMENT_BYTES_ENV = "MONOCLE_EXPORT_SPOOL_SEGMENT_BYTES"
+
+DEFAULT_BREAKER_FAILURES = 5
+DEFAULT_BREAKER_RESET_SECONDS = 30.0
+DEFAULT_SPOOL_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_SPOOL_SEGMENT_BYTES = 8 * 1024 * 1024
+
+CLOSED = "closed"
+HALF_OPEN = "half_open"
+OPEN = "open"
+BREAKER_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+# segment being written by a process, ready for replay, and being replayed by a process
+OPEN_SUFFIX = ".open"
+READY_SUFFIX = ".ndjson"
+CLAIMED_SUFFIX = ".replay"
+
+class CircuitOpenError(Exception):
+    pass
+
+class CircuitBreaker:
+    """Consecutive failure breaker with a single probe call once the reset timeout has passed."""
+
+    def __init__(self, name: str, failure_threshold: Optional[int] = None, reset_timeout: Optional[float] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold or
+                                     _env_number(EXPORT_BREAKER_FAILURES_ENV, DEFAULT_BREAKER_FAILURES))
+        self.reset_timeout = reset_timeout if reset_timeout is not None else \
+            _env_number(EXPORT_BREAKER_RESET_SECONDS_ENV, DEFAULT_BREAKER_RESET_SECONDS, float)
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        register_fork_handler(self)
+
+    def _after_fork_in_child(self) -> None:
+        self._lock = threading.Lock()
+        self._probe_in_flight = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == OPEN and self._clock() - self._opened_at >= self.reset_timeout:
+                return HALF_OPEN
+            return self._state
+
+    def allow(self) -> bool:
+        """Whether a call can be sent to the backend, in half open state only one probe call is let through."""
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            if self._state == OPEN:
+                if self._clock() - self._opened_at < self.reset_timeout:
+                    return False
+                self._state = HALF_OPEN
+                self._probe_in_flight = False
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._state = CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self) -> bool:
+        """Count a failed attempt, returns True if the breaker is open."""
+        with self._lock:
+            self._failures += 1
+            if self._state == OPEN:
+                return True
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                self._state = OPEN
+                self._opened_at = self._clock()
+                self._probe_in_flight = False
+                tripped = True
+            else:
+                tripped = False
+        if tripped:
+            add_counter(EXPORT_BREAKER_TRIPS, 1, {"exporter": self.name})
+            logger.warning(f"{self.name} export circuit is open, retrying in {self.reset_timeout:.0f} seconds")
+        return tripped
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+def _count_lines(path: str) -> int:
+    lines = 0
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            lines += chunk.count(b"\n")
+    return lines
+
+class ExportSpool:
+    """Bounded append-only spool of export batches, in NDJSON segment files."""
+
+    def __init__(self, directory: str, max_bytes: Optional[int] = None, segment_bytes: Optional[int] = None):
+        self.directory = directory
+        self.name = os.path.basename(os.path.normpath(directory))
+        self.max_bytes = max(1, max_bytes or _env_number(EXPORT_SPOOL_MAX_BYTES_ENV, DEFAULT_SPOOL_MAX_BYTES))
+        self.segment_bytes = max(1, segment_bytes or
+                                 _env_number(EXPORT_SPOOL_SEGMENT_BYTES_ENV, DEFAULT_SPOOL_SEGMENT_BYTES))
+        self._lock = threading.Lock()
+        self._file = None
+        self._file_path: Optional[str] = None
+        self._file_bytes = 0
+        self._sequence = 0
+        self._metrics = {"spooled": 0, "replayed": 0, "dropped": 0}
+        os.makedirs(directory, exist_ok=True)
+        self._recover_orphans()
+        self._bytes, self._batches = self._scan()
+        register_fork_handler(self)
+
+    def _after_fork_in_child(self) -> None:
+        # the open segment is still written by the parent, batches are flushed on append so closing the copy of the
+        # file doesn't write anything
+        self._lock = threading.Lock()
+        if self._file is not None:
+            try:
+                self._file.close()
+            except OSError:
+                pass
+        self._file = None
+        self._file_path = None
+        self._file_bytes = 0
+
+    def _segments(self, suffix: str) -> List[str]:
+        # segment names start with their creation time, sorting them by name keeps the write order
+        return sorted(glob.glob(os.path.join(self.directory, f"spool-*{suffix}")))
+
+    def _recover_orphans(self) -> None:
+        """Make the segments left open or half replayed by processes that are gone ready for replay."""
+        for suffix in (OPEN_SUFFIX, CLAIMED_SUFFIX):
+            for path in self._segments(suffix):
+                base = path[:-len(suffix)]
+                if suffix == CLAIMED_SUFFIX:
+                    base, _, pid = base.rpartition(".")
+                else:
+                    pid = base.rsplit("-", 2)[-2]
+                try:
+                    if not _pid_alive(int(pid)):
+                        os.rename(path, base + READY_SUFFIX)
+                except (ValueError, OSError) as e:
+                    logger.debug(f"Unable to recover spool segment {path}: {e}")
+
+    def _scan(self) -> Tuple[int, int]:
+        total_bytes = total_batches = 0
+        for path in self._segments(READY_SUFFIX) + self._segments(OPEN_SUFFIX) + self._segments(CLAIMED_SUFFIX):
+            try:
+                total_bytes += os.path.getsize(path)
+                total_batches += _count_lines(path)
+            except OSError:
+                pass
+        return total_bytes, total_batches
+
+    def append(self, record: dict) -> bool:
+        """Spool a batch, returns False if it couldn't be written."""
+        try:
+            line = (json.dumps(record, separators=(",", ":")) + "\n").encode("utf-8")
+        except (TypeError, ValueError) as e:
+            logger.warning(f"Unable to spool export batch of {self.name}: {e}")
+            return False
+        with self._lock:
+            try:
+                if self._file is not None and self._file_bytes + len(line) > self.segment_bytes:
+                    self._close_segment()
+                if not self._make_room(len(line)):
+                    self._dropped(1)
+                    logger.warning(f"Export spool of {self.name} is full, dropping batch")
+                    return False
+                if self._file is None:
+                    self._open_segment()
+                self._file.write(line)
+                self._file.flush()
+            except OSError as e:
+                logger.warning(f"Unable to spool export batch of {self.name}: {e}")
+                return False
+            self._file_bytes += len(line)
+            self._bytes += len(line)
+            self._batches += 1
+            self._metrics["spooled"] += 1
+        add_counter(EXPORT_SPOOL, 1, {"exporter": self.name, "outcome": "spooled"})
+        return True
+
+    def _open_segment(self) -> None:
+        # called with the lock held
+        self._sequence += 1
+        base = f"spool-{time.time_ns():020d}-{os.getpid()}-{self._sequence:06d}"
+        self._file_path = os.path.join(self.directory, base + OPEN_SUFFIX)
+        self._file = open(self._file_path, "ab")
+        self._file_bytes = 0
+
+    def _close_segment(self) -> None:
+        # called with the lock held
+        if self._file is None:
+            return
+        try:
+            self._file.close()
+            os.rename(self._file_path, self._file_path[:-len(OPEN_SUFFIX)] + READY_SUFFIX)
+        except OSError as e:
+            logger.warning(f"Unable to close export spool segment {self._file_path}: {e}")
+        self._file = None
+        self._file_path = None
+        self._file_bytes = 0
+
+    def _make_room(self, size: int) -> bool:
+        # called with the lock held, drops the oldest segments
+        if size > self.max_bytes:
+            return False
+        while self._bytes + size > self.max_bytes:
+            segments = self._segments(READY_SUFFIX)
+            if not segments:
+                if self._file is None:
+                    return False
+                self._close_segment()
+                continue
+            oldest = segments[0]
+            try:
+                dropped_bytes, dropped_batches = os.path.getsize(oldest), _count_lines(oldest)
+                os.remove(oldest)
+            except OSError:
+                # replayed or dropped by another process
+                self._bytes, self._batches = self._scan()
+                continue
+            self._bytes -= dropped_bytes
+            self._batches -= dropped_batches
+            self._dropped(dropped_batches)
+            logger.warning(f"Export spool of {self.name} is full, dropped {dropped_batches} oldest batches")
+        return True
+
+    def _dropped(self, batches: int) -> None:
+        self._metrics["dropped"] += batches
+        add_counter(EXPORT_SPOOL, batches, {"exporter": self.name, "outcome": "dropped"})
+
+    def replay(self, send: Callable[[dict], bool]) -> bool:
+        """
+        Send the spooled batches oldest first, ``send`` returns False to discard a batch and raises to stop the
+        replay, the batches not sent are kept. Returns True once the spool is empty.
+        """
+        with self._lock:
+            self._close_segment()
+            segments = self._segments(READY_SUFFIX)
+        for path in segments:
+            claimed = path[:-len(READY_SUFFIX)] + f".{os.getpid()}{CLAIMED_SUFFIX}"
+            try:
+                os.rename(path, claimed)
+            except OSError:
+                # claimed by another process
+                continue
+            if not self._replay_segment(claimed, path, send):
+                return False
+        return True
+
+    def _replay_segment(self, claimed: str, ready: str, send: Callable[[dict], bool]) -> bool:
+        with open(claimed, "rb") as f:
+            lines = f.readlines()
+        for index, line in enumerate(lines):
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            try:
+                sent = record is not None and send(record)
+            except Exception as e:
+                logger.warning(f"Replay of the export spool of {self.name} stopped: {e}")
+                self._requeue(claimed, ready, lines[index:])
+                return False
+            with self._lock:
+                self._bytes -= len(line)
+                self._batches -= 1
+                if sent:
+                    self._metrics["replayed"] += 1
+                else:
+                    self._dropped(1)
+            if sent:
+                add_counter(EXPORT_SPOOL, 1, {"exporter": self.name, "outcome": "replayed"})
+        os.remove(claimed)
+        return True
+
+    def _requeue(self, claimed: str, ready: str, lines: List[bytes]) -> None:
+        """Keep the batches of a segment that were not replayed, at the same place in the spool."""
+        try:
+            with open(claimed, "wb") as f:
+                f.writelines(lines)
+            os.rename(claimed, ready)
+        except OSError as e:
+            logger.warning(f"Unable to keep the export spool segment {ready}: {e}")
+
+    def close(self) -> None:
+        with self._lock:
+            self._close_segment()
+
+    def get_metrics(self) -> dict:
+        with self._lock:
+            metrics = dict(self._metrics)
+            metrics["bytes"] = self._bytes
+            metrics["batches"] = self._batches
+        return metrics
+
+_spools: Dict[str, ExportSpool] = {}
+_spools_lock = threading.Lock()
+
+def get_export_spool(name: str) -> Optional[ExportSpool]:
+    """Spool of the exporters of the given name, None if the spool is not configured."""
+    spool_dir = os.environ.get(EXPORT_SPOOL_DIR_ENV)
+    if not spool_dir:
+        return None
+    directory = os.path.abspath(os.path.join(spool_dir, name))
+    with _spools_lock:
+        spool = _spools.get(directory)
+        if spool is None:
+            try:
+                spool = ExportSpool(directory)
+            except OSError as e:
+                logger.warning(f"Unable to create the export spool {directory}: {e}")
+                return None
+            atexit.register(spool.close)
+            _spools[directory] = spool
+    return spool
+
+class ExportResilience:
+    """Circuit breaker and spool of an exporter, with the replay of the spooled batches."""
+
+    def __init__(self, name: str, breaker: Optional[CircuitBreaker] = None, spool: Optional[ExportSpool] = None):
+        self.name = name
+        self.breaker = breaker or CircuitBreaker(name)
+        self.spool = spool
+        self._functions: Dict[str, Callable] = {}
+        self._lock = threading.Lock()
+        self._replay_thread: Optional[threading.Thread] = None
+        watch_export_resilience(self)
+        register_fork_handler(self)
+
+    def _after_fork_in_child(self) -> None:
+        self._lock = threading.Lock()
+        self._replay_thread = None
+
+    def register(self, func: Callable) -> None:
+        """Export function the spooled calls are replayed with."""
+        if func.__name__ not in self._functions:
+            self._functions[func.__name__] = func
+
+    def spool_call(self, func: Callable, args: tuple, kwargs: dict) -> bool:
+        if self.spool is None:
+            return False
+        return self.spool.append({"function": func.__name__, "args": list(args), "kwargs": kwargs, "time": time.time()})
+
+    def replay_in_background(self, exporter) -> None:
+        if self.spool is None or not self.spool.get_metrics()["batches"]:
+            return
+        with self._lock:
+            if self._replay_thread is not None and self._replay_thread.is_alive():
+                return
+            self._replay_thread = threading.Thread(target=self._replay, args=(exporter,), daemon=True,
+                                                   name=f"MonocleSpoolReplay-{self.name}")
+            self._replay_thread.start()
+
+    def _replay(self, exporter) -> None:
+        def send(record: dict) -> bool:
+            func = self._functions.get(record.get("function"))
+            if func is None:
+                logger.warning(f"Discarding spooled batch of {self.name} for unknown function {record.get('function')}")
+                return False
+            if self.breaker.state == OPEN:
+                raise CircuitOpenError(f"{self.name} export circuit is open")
+            try:
+                func(exporter, *record.get("args", ()), **record.get("kwargs", {}))
+            except Exception:
+                self.breaker.record_failure()
+                raise
+            self.breaker.record_success()
+            return True
+        try:
+            if self.spool.replay(send):
+                logger.debug(f"Export spool of {self.name} replayed")
+        except Exception as e:
+            logger.warning(f"Error replaying the export spool of {self.name}: {e}")
+
+    def call(self, func: Callable, args: tuple, kwargs: dict, retries: int, backoff_in_seconds: float,
+             max_backoff_in_seconds: float, exceptions):
+        """Run an export call with retries, unless the breaker is open, spooling the batch if it fails."""
+        exporter = args[0]
+        self.register(func)
+        if not self.breaker.allow():
+            if self.spool_call(func, args[1:], kwargs):
+                return None
+            raise CircuitOpenError(f"{self.name} export circuit is open, batch not sent")
+        attempt = 0
+        while attempt < retries:
+            try:
+                result = func(*args, **kwargs)
+            except exceptions as e:
+                attempt += 1
+                if self.breaker.record_failure():
+                    logger.warning(f"Export attempt {attempt} of {self.name} failed: {e}")
+                    break
+                if attempt < retries:
+                    add_counter(EXPORT_RETRIES, 1, {"exporter": self.name})
+                    sleep_time = min(max_backoff_in_seconds, backoff_in_seconds * (2 ** (attempt - 1)))
+                    sleep_time = sleep_time * (1 + random.uniform(-0.1, 0.1))  # Add jitter
+                    logger.warning(f"Network connectivity error, Attempt {attempt} failed: {e}. Retrying in {sleep_time:.2f} seconds...")
+                    time.sleep(sleep_time)
+                else:
+                    logger.warning(f"Network connectivity error, Attempt {attempt} failed: {e}")
+                continue
+            self.breaker.record_success()
+            self.replay_in_background(exporter)
+            return result
+        if self.spool_call(func, args[1:], kwargs):
+            return None
+        raise Exception(f"Failed after {attempt} attempts")
+
+    def get_metrics(self) -> dict:
+        metrics = self.spool.get_metrics() if self.spool is not None else {}
+        metrics["breaker_state"] = self.breaker.state
+        return metrics
+
+_RESILIENCE_ATTRIBUTE = "_monocle_export_resilience"
+_resilience_lock = threading.Lock()
+
+def get_export_resilience(exporter) -> Optional[ExportResilience]:
+    """Breaker and spool of an exporter instance, created on first use."""
+    resilience = getattr(exporter, _RESILIENCE_ATTRIBUTE, None)
+    if resilience is None:
+        with _resilience_lock:
+            resilience = getattr(exporter, _RESILIENCE_ATTRIBUTE, None)
+            if resilience is None:
+                name = type(exporter).__name__
+                resilience = ExportResilience(name, spool=get_export_spool(name))
+                try:
+                    setattr(exporter, _RESILIENCE_ATTRIBUTE, resilience)
+                except AttributeError:
+                    return None
+    return resilience
@@ -1,20 +1,39 @@
 #pylint: disable=consider-using-with
 
+import logging
 from os import linesep, path
 from io import TextIOWrapper
 from datetime import datetime
 import os
-from typing import Optional, Callable, Sequence, Dict, Tuple
+from typing import Optional, Callable, Sequence, Tuple
 from opentelemetry.sdk.trace import ReadableSpan
 from opentelemetry.sdk.trace.export import SpanExporter, SpanExportResult
 from opentelemetry.sdk.resources import SERVICE_NAME
 from monocle_apptrace.exporters.base_exporter import SpanExporterBase, format_trace_id_without_0x
 from monocle_apptrace.exporters.exporter_processor import ExportTaskProcessor
+from monocle_apptrace.exporters.span_encoder import encode_span
+from monocle_apptrace.exporters.trace_buffer import TraceBuffer, TraceEntry
+from monocle_apptrace.exporters.segment_writer import SegmentWriter, DEFAULT_SEGMENT_MAX_BYTES, DEFAULT_SEGMENT_MAX_AGE_SECONDS
+from monocle_apptrace.instrumentation.common.multiprocess import register_fork_handler
+from monocle_apptrace.instrumentation.common.self_telemetry import DROP_WRITE_FAILED, record_dropped_spans, record_export_bytes
+
+logger = logging.getLogger(__name__)
 
 DEFAULT_FILE_PREFIX:str = "monocle_trace_"
 DEFAULT_TIME_FORMAT:str = "%Y-%m-%d_%H.%M.%S"
-HANDLE_TIMEOUT_SECONDS: int = 60  # 1 minute timeout
 DEFAULT_TRACE_FOLDER = ".monocle"
+# json: one JSON array file per trace, ndjson: rotated NDJSON segment files shared across traces
+OUTPUT_FORMAT_JSON = "json"
+OUTPUT_FORMAT_NDJSON = "ndjson"
+
+class TraceFile:
+    """Open trace file, stored as the payload of the trace buffer entry."""
+    __slots__ = ("handle", "file_path", "first_span")
+
+    def __init__(self, handle: TextIOWrapper, file_path: str):
+        self.handle = handle
+        self.file_path = file_path
+        self.first_span = True
 
 class FileSpanExporter(SpanExporterBase):
     def __init__(
@@ -25,13 +44,14 @@ class FileSpanExporter(SpanExporterBase):
         time_format = DEFAULT_TIME_FORMAT,
         formatter: Callable[
             [ReadableSpan], str
-        ] = lambda span: span.to_json(indent = 4)
+        ] = lambda span: encode_span(span, indent = 4)
         + linesep,
-        task_processor: Optional[ExportTaskProcessor] = None
+        task_processor: Optional[ExportTaskProcessor] = None,
+        output_format: Optional[str] = None
     ):
         super().__init__()
-        # Dictionary to store file handles: {trace_id: (file_handle, file_path, creation_time, first_span)}
-        self.file_handles: Dict[int, Tuple[TextIOWrapper, str, datetime, bool]] = {}
+        # Open trace files by trace_id, files are closed when the root span arrives or the trace is over the time or size limits
+        self.file_handles = TraceBuffer(on_evict=self._on_trace_evicted, name=type(self).__name__)
         self.formatter = formatter
         self.service_name = service_name
         self.output_path = os.getenv("MONOCLE_TRACE_OUTPUT_PATH", out_path)
@@ -45,6 +65,22 @@ class FileSpanExporter(SpanExporterBase):
             self.task_processor.start()
         self.last_file_processed:str = None
         self.last_trace_id = None
+        self.output_format = (output_format or os.getenv("MONOCLE_FILE_EXPORTER_FORMAT", OUTPUT_FORMAT_JSON)).lower()
+        self.segment_writer: Optional[SegmentWriter] = None
+        if self.output_format == OUTPUT_FORMAT_NDJSON:
+            self.segment_writer = SegmentWriter(
+                self.output_path, self.file_prefix, self.time_format,
+                compression=os.getenv("MONOCLE_FILE_EXPORTER_COMPRESSION", "none").lower(),
+                max_bytes=int(os.getenv("MONOCLE_FILE_SEGMENT_MAX_BYTES", DEFAULT_SEGMENT_MAX_BYTES)),
+                max_age_seconds=float(os.getenv("MONOCLE_FILE_SEGMENT_MAX_AGE", DEFAULT_SEGMENT_MAX_AGE_SECONDS)),
+            )
+        register_fork_handler(self)
+
+    def _before_fork(self) -> None:
+        # the open trace files are left to the parent, the child would write their buffers again when closing them
+        for entry in self.file_handles.entries():
+            if entry.payload is not None and entry.payload.handle is not None:
+                entry.payload.handle.flush()
 
     def export(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
         is_root_span = any(not span.parent for span in spans)
@@ -64,23 +100,18 @@ class FileSpanExporter(SpanExporterBase):
 
     def _cleanup_expired_handles(self) -> None:
         """Close and remove file handles that have exceeded the timeout."""
-        current_time = datetime.now()
-        expired_trace_ids = []
-        
-        for trace_id, (handle, file_path, creation_time, _) in self.file_handles.items():
-            if (current_time - creation_time).total_seconds() > HANDLE_TIMEOUT_SECONDS:
-                expired_trace_ids.append(trace_id)
-        
-        for trace_id in expired_trace_ids:
-            self._close_trace_handle(trace_id)
+        self.file_handles.expire()
+
+    def _on_trace_evicted(self, entry: TraceEntry, reason: str) -> None:
+        self._close_trace_file(entry.trace_id, entry.payload)
 
     def _get_or_create_handle(self, trace_id: int, service_name: str) -> Tuple[TextIOWrapper, str, bool]:
         """Get existing handle or create new one for the trace_id."""
         self._cleanup_expired_handles()
         
-        if trace_id in self.file_handles:
-            handle, file_path, creation_time, first_span = self.file_handles[trace_id]
-            return handle, file_path, first_span
+        entry = self.file_handles.get(trace_id)
+        if entry is not None:
+            return entry.payload.handle, entry.payload.file_path, entry.payload.first_span
         
         # Create new handle
         file_path = path.join(self.output_path,
@@ -88,34 +119,49 @@ class FileSpanExporter(SpanExporterBase):
                              + datetime.now().strftime(self.time_format) + ".json")
         
         try:
-            handle = open(file_path, "w", encoding='UTF-8')
+            handle = self._open_trace_file(file_path)
+            file_path = handle.name
             handle.write("[")
-            self.file_handles[trace_id] = (handle, file_path, datetime.now(), True)
+            self.file_handles.get_or_create(trace_id, lambda: TraceFile(handle, file_path))
             return handle, file_path, True
         except Exception as e:
-            print(f"Error creating file {file_path}: {e}")
+            logger.warning(f"Error creating file {file_path}: {e}")
             return None, file_path, True
 
+    @staticmethod
+    def _open_trace_file(file_path: str) -> TextIOWrapper:
+        """Open a new trace file, a trace that was closed early by the trace buffer continues in a numbered file."""
+        base_path, extension = path.splitext(file_path)
+        part = 1
+        while True:
+            try:
+                return open(file_path, "x", encoding='UTF-8')
+            except FileExistsError:
+                part += 1
+                file_path = f"{base_path}_{part}{extension}"
+
     def _close_trace_handle(self, trace_id: int) -> None:
         """Close and remove a specific trace handle."""
-        if trace_id in self.file_handles:
-            handle, file_path, creation_time, _ = self.file_handles[trace_id]
-            try:
-                if handle is not None:
-                    handle.write("]")
-                    handle.close()
-            except Exception as e:
-                print(f"Error closing file {file_path}: {e}")
-            finally:
-                del self.file_handles[trace_id]
-                self.last_file_processed = file_path
-                self.last_trace_id = trace_id
+        entry = self.file_handles.pop(trace_id)
+        if entry is not None:
+            self._close_trace_file(trace_id, entry.payload)
+
+    def _close_trace_file(self, trace_id: int, trace_file: TraceFile) -> None:
+        try:
+            if trace_file.handle is not None:
+                trace_file.handle.write("]")
+                trace_file.handle.close()
+        except Exception as e:
+            logger.warning(f"Error closing file {trace_file.file_path}: {e}")
+        finally:
+            self.last_file_processed = trace_file.file_path
+            self.last_trace_id = trace_id
 
     def _mark_span_written(self, trace_id: int) -> None:
         """Mark that a span has been written for this trace (no longer first span)."""
-        if trace_id in self.file_handles:
-            handle, file_path, creation_time, _ = self.file_handles[trace_id]
-            self.file_handles[trace_id] = (handle, file_path, creation_time, False)
+        entry = self.file_handles.get(trace_id)
+        if entry is not None:
+            entry.payload.first_span = False
 
     def _process_spans(self, spans: Sequence[ReadableSpan], is_root_span: bool = False) -> SpanExportResult:
         # Group spans by trace_id for efficient processing
@@ -135,57 +181,98 @@ class FileSpanExporter(SpanExporterBase):
             if not span.parent:
                 root_span_traces.add(trace_id)
         
+        if self.segment_writer is not None:
+            return self._write_segments(spans_by_trace, root_span_traces)
+
         # Process spans for each trace
         for trace_id, trace_spans in spans_by_trace.items():
-            if self.service_name is not None:
-                service_name = self.service_name
-            else:
-                service_name = trace_spans[0].resource.attributes.get(SERVICE_NAME, "unknown")
+            service_name = self._get_service_name(trace_spans)
             handle, file_path, is_first_span = self._get_or_create_handle(trace_id, service_name)
             
             if handle is None:
+                record_dropped_spans(len(trace_spans), DROP_WRITE_FAILED, type(self).__name__)
                 continue
             
+            written_spans = 0
+            written_bytes = 0
             for span in trace_spans:
                 if not is_first_span:
                     try:
                         handle.write(",")
                     except Exception as e:
-                        print(f"Error writing comma to file {file_path} for span {span.context.span_id}: {e}")
+                        logger.warning(f"Error writing comma to file {file_path} for span {span.context.span_id}: {e}")
+                        record_dropped_spans(1, DROP_WRITE_FAILED, type(self).__name__)
                         continue
                 
                 try:
-                    handle.write(self.formatter(span))
+                    formatted_span = self.formatter(span)
+                    handle.write(formatted_span)
+                    written_spans += 1
+                    written_bytes += len(formatted_span)
                     if is_first_span:
                         self._mark_span_written(trace_id)
                         is_first_span = False
                 except Exception as e:
-                    print(f"Error formatting span {span.context.span_id}: {e}")
+                    logger.warning(f"Error formatting span {span.context.span_id}: {e}")
+                    record_dropped_spans(1, DROP_WRITE_FAILED, type(self).__name__)
                     continue
+            record_export_bytes(self, written_bytes)
+            entry = self.file_handles.get(trace_id)
+            if entry is not None:
+                self.file_handles.account(entry, written_spans, written_bytes, trace_id in root_span_traces)
         
         # Close handles for traces with root spans
         for trace_id in root_span_traces:
             self._close_trace_handle(trace_id)
         
         # Flush remaining handles
-        for trace_id, (handle, file_path, _, _) in self.file_handles.items():
-            if trace_id not in root_span_traces:
+        for entry in self.file_handles.entries():
+            try:
+                if entry.payload.handle is not None:
+                    entry.payload.handle.flush()
+            except Exception as e:
+                logger.warning(f"Error flushing file {entry.payload.file_path}: {e}")
+        
+        return SpanExportResult.SUCCESS
+
+    def _get_service_name(self, trace_spans: Sequence[ReadableSpan]) -> str:
+        if self.service_name is not None:
+            return self.service_name
+        return trace_spans[0].resource.attributes.get(SERVICE_NAME, "unknown")
+
+    def _write_segments(self, spans_by_trace: dict, root_span_traces: set) -> SpanExportResult:
+        """Append the spans of each trace to the current NDJSON segment."""
+        for trace_id, trace_spans in spans_by_trace.items():
+            lines = []
+            for span in trace_spans:
                 try:
-                    if handle is not None:
-                        handle.flush()
+                    lines.append(encode_span(span))
                 except Exception as e:
-                    print(f"Error flushing file {file_path}: {e}")
-        
+                    logger.warning(f"Error formatting span {span.context.span_id}: {e}")
+                    record_dropped_spans(1, DROP_WRITE_FAILED, type(self).__name__)
+            try:
+                self.segment_writer.write_trace(trace_id, self._get_service_name(trace_spans), lines)
+            except Exception as e:
+                logger.warning(f"Error writing trace {format_trace_id_without_0x(trace_id)} to segment: {e}")
+                record_dropped_spans(len(lines), DROP_WRITE_FAILED, type(self).__name__)
+                continue
+            record_export_bytes(self, sum(len(line) + 1 for line in lines))
+            if trace_id in root_span_traces:
+                self.last_file_processed = self.segment_writer.segment_path
+                self.last_trace_id = trace_id
+        self.segment_writer.flush()
         return SpanExportResult.SUCCESS
 
     def force_flush(self, timeout_millis: int = 30000) -> bool:
         """Flush all open file handles."""
-        for trace_id, (handle, file_path, _, _) in self.file_handles.items():
+        if self.segment_writer is not None:
+            self.segment_writer.flush()
+        for entry in self.file_handles.entries():
             try:
-                if handle is not None:
-                    handle.flush()
+                if entry.payload.handle is not None:
+                    entry.payload.handle.flush()
             except Exception as e:
-                print(f"Error flushing file {file_path}: {e}")
+                logger.warning(f"Error flushing file {entry.payload.file_path}: {e}")
         return True
 
     def shutdown(self) -> None:
@@ -194,6 +281,7 @@ class FileSpanExporter(SpanExporterBase):
             self.task_processor.stop()
         
         # Close all remaining file handles
-        trace_ids_to_close = list(self.file_handles.keys())
-        for trace_id in trace_ids_to_close:
-            self._close_trace_handle(trace_id)
+        for entry in self.file_handles.drain():
+            self._close_trace_file(entry.trace_id, entry.payload)
+        if self.segment_writer is not None:
+            self.segment_writer.close()
@@ -1,20 +1,22 @@
 import os
 import datetime
 import logging
-import asyncio
 from google.cloud import storage
 from google.cloud.exceptions import NotFound, Forbidden, GoogleCloudError, Conflict, TooManyRequests
 from opentelemetry.sdk.trace import ReadableSpan
 from opentelemetry.sdk.trace.export import SpanExporter, SpanExportResult
-from typing import Sequence, Optional, Dict, List, Tuple
+from typing import Sequence, Optional, Dict, List
 from monocle_apptrace.exporters.base_exporter import SpanExporterBase, format_trace_id_without_0x
 from monocle_apptrace.exporters.exporter_processor import ExportTaskProcessor
-import json
+from monocle_apptrace.exporters.span_encoder import encode_spans_ndjson
+from monocle_apptrace.exporters.trace_buffer import TraceBuffer, TraceEntry, EVICT_EXPIRED
+from monocle_apptrace.exporters.upload_engine import get_upload_engine
+from monocle_apptrace.instrumentation.common.multiprocess import register_fork_handler
+from monocle_apptrace.instrumentation.common.self_telemetry import record_export_bytes
 from monocle_apptrace.instrumentation.common.constants import MONOCLE_SDK_VERSION
 
 logger = logging.getLogger(__name__)
 
-HANDLE_TIMEOUT_SECONDS = 60
 
 
 class GCSSpanExporter(SpanExporterBase):
@@ -37,8 +39,8 @@ class GCSSpanExporter(SpanExporterBase):
         self.max_batch_size = 500
         self.export_interval = 1
 
-        # trace_id: {trace_id: (spans_list, creation_time, has_root_span)}
-        self.trace_spans: Dict[int, Tuple[List[ReadableSpan], datetime.datetime, bool]] = {}
+        # Spans buffered by trace_id until the root span arrives, traces over the time or size limits are uploaded early
+        self.trace_spans = TraceBuffer(on_evict=self._on_trace_evicted, name=type(self).__name__)
 
         if not bucket_name:
             bucket_name = os.getenv('MONOCLE_GCS_BUCKET_NAME')
@@ -97,11 +99,18 @@ class GCSSpanExporter(SpanExporterBase):
         self.task_processor = task_processor
         if self.task_processor is not None:
             self.task_processor.start()
+        self.upload_engine = get_upload_engine()
 
         logger.info(
             f"GCSSpanExporter initialized successfully. "
             f"Bucket: {self.bucket_name}, Project: {self.project_id}, Location: {self.location}"
         )
+        register_fork_handler(self)
+
+    def _after_fork_in_child(self) -> None:
+        # the authorized session of the client is shared with the parent, the child opens its own connections
+        self.storage_client = storage.Client(project=self.project_id)
+        self.bucket = self.storage_client.bucket(self.bucket_name)
 
     def __bucket_exists(self, bucket_name: str) -> bool:
 
@@ -147,148 +156,105 @@ class GCSSpanExporter(SpanExporterBase):
             raise
 
     def _cleanup_expired_traces(self) -> None:
-        current_time = datetime.datetime.now()
-        expired_trace_ids = []
-
-        for trace_id, (spans, creation_time, _) in self.trace_spans.items():
-            if (current_time - creation_time).total_seconds() > HANDLE_TIMEOUT_SECONDS:
-                logger.warning(
-                    f"Trace {format_trace_id_without_0x(trace_id)} has expired "
-                    f"(timeout: {HANDLE_TIMEOUT_SECONDS}s). Uploading {len(spans)} spans."
-                )
-                expired_trace_ids.append(trace_id)
-
-        for trace_id in expired_trace_ids:
-            self._upload_trace(trace_id)
+        self.trace_spans.expire()
 
-    def _add_spans_to_trace(self, trace_id: int, spans: List[ReadableSpan], has_root: bool = False) -> None:
-        if trace_id in self.trace_spans:
-            # Trace already exists, append spans
-            existing_spans, creation_time, existing_root = self.trace_spans[trace_id]
-            existing_spans.extend(spans)
-            has_root = has_root or existing_root  # Update root flag
-            self.trace_spans[trace_id] = (existing_spans, creation_time, has_root)
-            logger.debug(
-                f"Added {len(spans)} spans to existing trace {format_trace_id_without_0x(trace_id)}. "
-                f"Total spans: {len(existing_spans)}, Has root: {has_root}"
+    def _on_trace_evicted(self, entry: TraceEntry, reason: str) -> None:
+        if reason == EVICT_EXPIRED:
+            logger.warning(
+                f"Trace {format_trace_id_without_0x(entry.trace_id)} has expired "
+                f"(timeout: {self.trace_spans.timeout_seconds}s). Uploading {entry.span_count} spans."
             )
         else:
-            # Create new trace entry
-            self.trace_spans[trace_id] = (spans.copy(), datetime.datetime.now(), has_root)
-            logger.debug(
-                f"Created new trace buffer for {format_trace_id_without_0x(trace_id)} "
-                f"with {len(spans)} spans. Has root: {has_root}"
+            logger.warning(
+                f"Trace buffer limit reached ({reason}). Uploading {entry.span_count} spans "
+                f"of trace {format_trace_id_without_0x(entry.trace_id)} early."
             )
+        self._upload_spans(entry.trace_id, entry.spans)
 
-    def _upload_trace(self, trace_id: int) -> None:
-        if trace_id not in self.trace_spans:
+    def _add_spans_to_trace(self, trace_id: int, spans: List[ReadableSpan], has_root: bool = False) -> None:
+        entry = self.trace_spans.add(trace_id, spans, has_root)
+        logger.debug(
+            f"Added {len(spans)} spans to trace {format_trace_id_without_0x(trace_id)}. "
+            f"Total spans: {entry.span_count}, Has root: {entry.has_root}"
+        )
+
+    def _upload_trace(self, trace_id: int, is_root_span: bool = False) -> None:
+        entry = self.trace_spans.pop(trace_id)
+        if entry is None:
             logger.debug(f"Trace {format_trace_id_without_0x(trace_id)} not found in buffer.")
             return
+        self._upload_spans(trace_id, entry.spans, is_root_span)
 
-        spans, _, _ = self.trace_spans[trace_id]
+    def _upload_spans(self, trace_id: int, spans: List[ReadableSpan], is_root_span: bool = False) -> None:
         if len(spans) == 0:
             logger.debug(f"Trace {format_trace_id_without_0x(trace_id)} has no spans. Skipping upload.")
-            del self.trace_spans[trace_id]
             return
 
         serialized_data = self.__serialize_spans(spans)
-        if serialized_data:
-            try:
-                self.__upload_to_gcs_with_trace_id(serialized_data, trace_id)
-                logger.info(
-                    f"Successfully uploaded trace {format_trace_id_without_0x(trace_id)} "
-                    f"with {len(spans)} spans to GCS bucket {self.bucket_name}"
-                )
-            except Exception as e:
-                logger.error(
-                    f"Failed to upload trace {format_trace_id_without_0x(trace_id)}: {e}",
-                    exc_info=True
-                )
-        else:
+        if not serialized_data:
             logger.warning(f"No valid data to upload for trace {format_trace_id_without_0x(trace_id)}")
+            return
+        record_export_bytes(self, len(serialized_data))
 
-        # Remove trace from buffer after upload attempt
-        del self.trace_spans[trace_id]
+        upload_kwargs = {'span_data_batch': serialized_data, 'trace_id': trace_id}
+        if is_root_span and self.task_processor is not None and callable(getattr(self.task_processor, 'queue_task', None)):
+            # Queue the upload task for async processing
+            logger.debug(f"Queuing upload task for trace {format_trace_id_without_0x(trace_id)}")
+            self.task_processor.queue_task(self.__upload_to_gcs_with_trace_id, kwargs=upload_kwargs, is_root_span=True)
+        else:
+            logger.debug(f"Submitting upload of trace {format_trace_id_without_0x(trace_id)} with {len(spans)} spans")
+            self.upload_engine.submit(
+                self.__upload_to_gcs_with_trace_id,
+                kwargs=upload_kwargs,
+                description=f"trace {format_trace_id_without_0x(trace_id)} to GCS bucket {self.bucket_name}"
+            )
 
     def export(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
         try:
-            # Run the asynchronous export logic in an event loop
-            asyncio.run(self._export_async(spans))
+            self._export_spans(spans)
             return SpanExportResult.SUCCESS
         except Exception as e:
             logger.error(f"Error exporting spans to GCS: {e}", exc_info=True)
             return SpanExportResult.FAILURE
 
-    async def _export_async(self, spans: Sequence[ReadableSpan]):
-        try:
-            # Cleanup expired traces first
-            self._cleanup_expired_traces()
-
-            # Group spans by trace_id
-            spans_by_trace: Dict[int, List[ReadableSpan]] = {}
-            root_span_traces = set()
-
-            for span in spans:
-                if self.skip_export(span):
-                    logger.debug(f"Skipping export of non-Monocle span: {span.name}")
-                    continue
-
-                trace_id = span.context.trace_id
-                if trace_id not in spans_by_trace:
-                    spans_by_trace[trace_id] = []
-                spans_by_trace[trace_id].append(span)
-
-                if not span.parent:
-                    root_span_traces.add(trace_id)
-                    logger.debug(f"Found root span for trace {format_trace_id_without_0x(trace_id)}")
-
-            # Add spans to their respective trace buffers
-            for trace_id, trace_spans in spans_by_trace.items():
-                has_root = trace_id in root_span_traces
-                self._add_spans_to_trace(trace_id, trace_spans, has_root)
-
-            # Upload complete traces
-            for trace_id in root_span_traces:
-                if self.task_processor is not None and callable(getattr(self.task_processor, 'queue_task', None)):
-                    # Queue the upload task for async processing
-                    if trace_id in self.trace_spans:
-                        spans_to_upload, _, _ = self.trace_spans[trace_id]
-                        serialized_data = self.__serialize_spans(spans_to_upload)
-                        if serialized_data:
-                            logger.debug(f"Queuing upload task for trace {format_trace_id_without_0x(trace_id)}")
-                            self.task_processor.queue_task(
-                                self.__upload_to_gcs_with_trace_id,
-                                kwargs={'span_data_batch': serialized_data, 'trace_id': trace_id},
-                                is_root_span=True
-                            )
-                        del self.trace_spans[trace_id]
-                else:
-                    self._upload_trace(trace_id)
-        except Exception as e:
-            logger.error(f"Error in _export_async: {e}", exc_info=True)
+    def _export_spans(self, spans: Sequence[ReadableSpan]):
+        # Cleanup expired traces first
+        self._cleanup_expired_traces()
+
+        # Group spans by trace_id
+        spans_by_trace: Dict[int, List[ReadableSpan]] = {}
+        root_span_traces = set()
+
+        for span in spans:
+            if self.skip_export(span):
+                logger.debug(f"Skipping export of non-Monocle span: {span.name}")
+                continue
+
+            trace_id = span.context.trace_id
+            if trace_id not in spans_by_trace:
+                spans_by_trace[trace_id] = []
+            spans_by_trace[trace_id].append(span)
+
+            if not span.parent:
+                root_span_traces.add(trace_id)
+                logger.debug(f"Found root span for trace {format_trace_id_without_0x(trace_id)}")
+
+        # Add spans to their respective trace buffers
+        for trace_id, trace_spans in spans_by_trace.items():
+            has_root = trace_id in root_span_traces
+            self._add_spans_to_trace(trace_id, trace_spans, has_root)
+
+        # Upload complete traces
+        for trace_id in root_span_traces:
+            self._upload_trace(trace_id, is_root_span=True)
 
     def __serialize_spans(self, spans: Sequence[ReadableSpan]) -> str:
         try:
-            valid_json_list = []
-            for span in spans:
-                try:
-                    span_json = span.to_json(indent=0).replace("\n", "")  # make oneline json
-                    valid_json_list.append(span_json)
-                except json.JSONDecodeError as e:
-                    logger.warning(
-                        f"Invalid JSON format in span data: {span.context.span_id}. Error: {e}"
-                    )
-                    continue
-                except Exception as e:
-                    logger.warning(f"Error serializing span {span.context.span_id}: {e}")
-                    continue
-
-            if not valid_json_list:
+            if not spans:
                 logger.warning("No valid spans to serialize")
                 return ""
-
-            ndjson_data = "\n".join(valid_json_list) + "\n"
-            logger.debug(f"Serialized {len(valid_json_list)} spans to NDJSON format")
+            ndjson_data = encode_spans_ndjson(spans)
+            logger.debug(f"Serialized {len(spans)} spans to NDJSON format")
             return ndjson_data
         except Exception as e:
             logger.error(f"Error serializing spans: {e}", exc_info=True)
@@ -336,22 +302,20 @@ class GCSSpanExporter(SpanExporterBase):
             logger.error(f"Unexpected error uploading to GCS: {e}", exc_info=True)
             raise
 
-    async def force_flush(self, timeout_millis: int = 30000) -> bool:
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
         logger.info(f"Force flushing {len(self.trace_spans)} pending traces to GCS")
-        trace_ids_to_upload = list(self.trace_spans.keys())
-        for trace_id in trace_ids_to_upload:
-            self._upload_trace(trace_id)
-        logger.info("Force flush completed")
-        return True
+        for entry in self.trace_spans.drain():
+            self._upload_spans(entry.trace_id, entry.spans)
+        flushed = self.upload_engine.flush(timeout_millis)
+        logger.info("Force flush completed" if flushed else "Force flush timed out with uploads still pending")
+        return flushed
 
     def shutdown(self) -> None:
         logger.info("Shutting down GCSSpanExporter")
 
-        trace_ids_to_upload = list(self.trace_spans.keys())
-        if trace_ids_to_upload:
-            logger.info(f"Uploading {len(trace_ids_to_upload)} remaining traces before shutdown")
-            for trace_id in trace_ids_to_upload:
-                self._upload_trace(trace_id)
+        if self.trace_spans:
+            logger.info(f"Uploading {len(self.trace_spans)} remaining traces before shutdown")
+        self.force_flush()
 
         if hasattr(self, 'task_processor') and self.task_processor is not None:
             self.task_processor.stop()
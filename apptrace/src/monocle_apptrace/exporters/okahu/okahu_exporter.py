@@ -1,19 +1,72 @@
-import json
+import gzip
 import logging
 import os
-from typing import Callable, Optional, Sequence
+import threading
+import time
+from typing import Callable, List, Optional, Sequence, Tuple
 import requests
+from requests.adapters import HTTPAdapter
 from opentelemetry.sdk.trace import ReadableSpan
 from opentelemetry.sdk.trace.export import SpanExporter, SpanExportResult, ConsoleSpanExporter
-from requests.exceptions import ReadTimeout
+from requests.exceptions import ReadTimeout, ConnectionError as RequestsConnectionError
 from monocle_apptrace.exporters.base_exporter import SpanExporterBase
 from monocle_apptrace.exporters.exporter_processor import ExportTaskProcessor
+from monocle_apptrace.exporters.span_encoder import dumps, encode_span, span_to_dict
+from monocle_apptrace.exporters.upload_engine import UploadEngine
+from monocle_apptrace.instrumentation.common.multiprocess import register_fork_handler
+from monocle_apptrace.instrumentation.common.self_telemetry import record_export_bytes
 
 REQUESTS_SUCCESS_STATUS_CODES = (200, 202, 204)
+RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
 OKAHU_PROD_INGEST_ENDPOINT = "https://ingest.okahu.co/api/v1/trace/ingest"
 
+# compression of the request body: none, gzip or zstd
+OKAHU_COMPRESSION_ENV = "MONOCLE_OKAHU_COMPRESSION"
+# size of the HTTP connection pool
+OKAHU_POOL_SIZE_ENV = "MONOCLE_OKAHU_POOL_SIZE"
+# true to coalesce batches and send them from background threads
+OKAHU_ASYNC_SEND_ENV = "MONOCLE_OKAHU_ASYNC_SEND"
+# upper bound of a coalesced request body before compression
+OKAHU_MAX_PAYLOAD_BYTES_ENV = "MONOCLE_OKAHU_MAX_PAYLOAD_BYTES"
+# how long spans wait for more batches before they are sent
+OKAHU_LINGER_MS_ENV = "MONOCLE_OKAHU_LINGER_MS"
+# concurrent requests of the background sender
+OKAHU_MAX_IN_FLIGHT_ENV = "MONOCLE_OKAHU_MAX_IN_FLIGHT"
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_MAX_PAYLOAD_BYTES = 1024 * 1024
+DEFAULT_LINGER_MS = 1000
+DEFAULT_MAX_IN_FLIGHT = 4
+GZIP_COMPRESS_LEVEL = 6
+
 logger = logging.getLogger(__name__)
 
+class OkahuRetryableError(Exception):
+    """Okahu ingest returned a status that is worth retrying, eg. 429 or 503."""
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        logger.warning(f"Invalid value for {name}, using default {default}")
+        return default
+
+def _load_compressor(compression: str) -> Tuple[Optional[str], Optional[Callable[[bytes], bytes]]]:
+    """Return the Content-Encoding and compress function for the configured compression."""
+    if compression == "zstd":
+        try:
+            import zstandard
+            compressor = zstandard.ZstdCompressor()
+            return "zstd", compressor.compress
+        except ImportError:
+            logger.warning("zstandard is not installed, falling back to gzip compression for Okahu exporter")
+            compression = "gzip"
+    if compression == "gzip":
+        return "gzip", lambda body: gzip.compress(body, compresslevel=GZIP_COMPRESS_LEVEL)
+    if compression not in ("", "none"):
+        logger.warning(f"Unsupported compression {compression} for Okahu exporter, sending uncompressed")
+    return None, None
+
 
 class OkahuSpanExporter(SpanExporterBase):
     def __init__(
@@ -35,15 +88,46 @@ class OkahuSpanExporter(SpanExporterBase):
         if not api_key:
             raise ValueError("OKAHU_API_KEY not set.")
         self.timeout = timeout or 15
-        self.session = session or requests.Session()
+        if session is None:
+            session = requests.Session()
+            pool_size = _env_int(OKAHU_POOL_SIZE_ENV, DEFAULT_POOL_SIZE)
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+        self.session = session
         self.session.headers.update(
             {"Content-Type": "application/json", "x-api-key": api_key}
         )
+        self.content_encoding, self.compress = _load_compressor(os.environ.get(OKAHU_COMPRESSION_ENV, "none").lower())
 
         self.task_processor = task_processor or None
         if task_processor is not None:
             task_processor.start()
 
+        # coalescing background sender, not used with a task processor which runs its own queue
+        self.async_send = self.task_processor is None and \
+            os.environ.get(OKAHU_ASYNC_SEND_ENV, "false").lower() == "true"
+        self.max_payload_bytes = _env_int(OKAHU_MAX_PAYLOAD_BYTES_ENV, DEFAULT_MAX_PAYLOAD_BYTES)
+        self.linger_seconds = _env_int(OKAHU_LINGER_MS_ENV, DEFAULT_LINGER_MS) / 1000
+        self._pending: List[str] = []
+        self._pending_bytes = 0
+        self._pending_lock = threading.Lock()
+        self._linger_timer: Optional[threading.Timer] = None
+        self.sender: Optional[UploadEngine] = None
+        if self.async_send:
+            self.sender = UploadEngine(max_workers=_env_int(OKAHU_MAX_IN_FLIGHT_ENV, DEFAULT_MAX_IN_FLIGHT),
+                                       name="MonocleOkahuSender")
+        register_fork_handler(self)
+
+    def _after_fork_in_child(self) -> None:
+        # pooled connections are shared with the parent, the session opens new ones on the next request
+        self.session.close()
+        # the pending spans are sent by the parent
+        self._pending = []
+        self._pending_bytes = 0
+        self._pending_lock = threading.Lock()
+        self._linger_timer = None
+
     def export(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
         # After the call to Shutdown subsequent calls to Export are
         # not allowed and should return a Failure result
@@ -53,6 +137,9 @@ class OkahuSpanExporter(SpanExporterBase):
         if self._closed:
             logger.warning("Exporter already shutdown, ignoring batch")
             return SpanExportResult.FAILURE
+
+        if self.async_send:
+            return self._coalesce(spans)
         
         span_list = {
             "batch": []
@@ -62,9 +149,8 @@ class OkahuSpanExporter(SpanExporterBase):
         for span in spans:
             if self.skip_export(span):
                 continue
-            # create a object from serialized span
-            obj = json.loads(span.to_json())
-            span_list["batch"].append(obj)
+            # build the wire format dict directly from the span
+            span_list["batch"].append(span_to_dict(span))
 
         # if there are no spans to export after filtering, then return
         if len(span_list["batch"]) == 0:
@@ -75,11 +161,7 @@ class OkahuSpanExporter(SpanExporterBase):
 
         def send_spans_to_okahu(span_list_local=None, is_root=False):
             try:
-                result = self.session.post(
-                    url=self.endpoint,
-                    data=json.dumps(span_list_local),
-                    timeout=self.timeout,
-                )
+                result = self._post(dumps(span_list_local))
                 if result.status_code not in REQUESTS_SUCCESS_STATUS_CODES:
                     logger.error(
                         "Traces cannot be uploaded; status code: %s, message %s",
@@ -103,14 +185,86 @@ class OkahuSpanExporter(SpanExporterBase):
             return SpanExportResult.SUCCESS
         return send_spans_to_okahu(span_list, is_root_span)
 
+    def _post(self, body: str) -> requests.Response:
+        data = body.encode("utf-8")
+        headers = None
+        if self.compress is not None:
+            data = self.compress(data)
+            headers = {"Content-Encoding": self.content_encoding}
+        record_export_bytes(self, len(data))
+        return self.session.post(url=self.endpoint, data=data, headers=headers, timeout=self.timeout)
+
+    def _coalesce(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
+        """Add spans to the pending payload, sealing it once it's over the size cap."""
+        sealed = []
+        with self._pending_lock:
+            for span in spans:
+                if self.skip_export(span):
+                    continue
+                try:
+                    encoded_span = encode_span(span)
+                except Exception as e:
+                    logger.warning(f"Error serializing span {span.context.span_id}: {e}")
+                    continue
+                if self._pending and self._pending_bytes + len(encoded_span) > self.max_payload_bytes:
+                    sealed.append(self._take_pending())
+                self._pending.append(encoded_span)
+                self._pending_bytes += len(encoded_span) + 1
+            if self._pending and self._linger_timer is None:
+                self._linger_timer = threading.Timer(self.linger_seconds, self._send_pending)
+                self._linger_timer.daemon = True
+                self._linger_timer.start()
+        for payload in sealed:
+            self._submit(payload)
+        return SpanExportResult.SUCCESS
+
+    def _take_pending(self) -> str:
+        # called with the pending lock held
+        payload = '{"batch":[' + ",".join(self._pending) + ']}'
+        self._pending = []
+        self._pending_bytes = 0
+        return payload
+
+    def _send_pending(self) -> None:
+        with self._pending_lock:
+            if self._linger_timer is not None:
+                self._linger_timer.cancel()
+                self._linger_timer = None
+            payload = self._take_pending() if self._pending else None
+        if payload is not None:
+            self._submit(payload)
+
+    def _submit(self, payload: str) -> None:
+        self.sender.submit(self._send_payload, kwargs={"payload": payload}, description="span batch to Okahu")
+
+    @SpanExporterBase.retry_with_backoff(retries=5, exceptions=(OkahuRetryableError, ReadTimeout, RequestsConnectionError))
+    def _send_payload(self, payload: str) -> None:
+        result = self._post(payload)
+        if result.status_code in RETRYABLE_STATUS_CODES:
+            raise OkahuRetryableError(f"status code {result.status_code}")
+        if result.status_code not in REQUESTS_SUCCESS_STATUS_CODES:
+            logger.error(
+                "Traces cannot be uploaded; status code: %s, message %s",
+                result.status_code,
+                result.text,
+            )
+            return
+        logger.debug("spans successfully exported to okahu.")
+
     def shutdown(self) -> None:
         if self._closed:
             logger.warning("Exporter already shutdown, ignoring call")
             return
+        if self.sender is not None:
+            self._send_pending()
+            self.sender.shutdown()
         if hasattr(self, 'session'):
             self.session.close()
         self._closed = True
 
     def force_flush(self, timeout_millis: int = 30000) -> bool:
-        return True
+        if self.sender is None:
+            return True
+        self._send_pending()
+        return self.sender.flush(timeout_millis)
     
\ No newline at end of file
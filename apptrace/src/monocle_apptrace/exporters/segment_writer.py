@@ -0,0 +1,165 @@
+"""
+Rotated NDJSON segment files for the file exporter.
+
+Instead of one JSON array file per trace, spans of all the traces are appended as compact NDJSON to a shared segment
+file that is rotated by size and age. Every write is one frame holding the spans of a single trace, compressed as an
+independent gzip member or zstd frame when compression is enabled, so a frame can be read back on its own. Each
+segment has a sidecar ``.idx`` NDJSON file with one ``{"trace_id", "segment", "offset", "length", "spans"}`` record
+per frame, ``read_trace`` uses it to pull a single trace without decompressing whole segments.
+"""
+import glob
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from monocle_apptrace.instrumentation.common.multiprocess import register_fork_handler
+
+logger = logging.getLogger(__name__)
+
+COMPRESSION_NONE = "none"
+COMPRESSION_GZIP = "gzip"
+COMPRESSION_ZSTD = "zstd"
+SEGMENT_EXTENSIONS = {COMPRESSION_NONE: ".ndjson", COMPRESSION_GZIP: ".ndjson.gz", COMPRESSION_ZSTD: ".ndjson.zst"}
+INDEX_EXTENSION = ".idx"
+
+DEFAULT_SEGMENT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_SEGMENT_MAX_AGE_SECONDS = 3600
+
+def _get_codec(compression: str) -> Tuple[str, Callable[[bytes], bytes], Callable[[bytes], bytes]]:
+    """Return the effective compression with its compress and decompress functions."""
+    if compression == COMPRESSION_ZSTD:
+        try:
+            import zstandard
+            return COMPRESSION_ZSTD, zstandard.ZstdCompressor().compress, zstandard.ZstdDecompressor().decompress
+        except ImportError:
+            logger.warning("zstandard is not installed, using gzip compression for trace segments")
+            compression = COMPRESSION_GZIP
+    if compression == COMPRESSION_GZIP:
+        return COMPRESSION_GZIP, gzip.compress, gzip.decompress
+    if compression != COMPRESSION_NONE:
+        logger.warning(f"Unsupported trace segment compression {compression}, writing uncompressed segments")
+    return COMPRESSION_NONE, lambda data: data, lambda data: data
+
+def compression_of(segment_path: str) -> str:
+    for compression, extension in SEGMENT_EXTENSIONS.items():
+        if compression != COMPRESSION_NONE and segment_path.endswith(extension):
+            return compression
+    return COMPRESSION_NONE
+
+class SegmentWriter:
+    """Appends trace frames to size and time rotated segment files shared across traces."""
+
+    def __init__(self, output_path: str, file_prefix: str, time_format: str, compression: str = COMPRESSION_NONE,
+                 max_bytes: int = DEFAULT_SEGMENT_MAX_BYTES, max_age_seconds: float = DEFAULT_SEGMENT_MAX_AGE_SECONDS):
+        self.output_path = output_path
+        self.file_prefix = file_prefix
+        self.time_format = time_format
+        self.compression, self._compress, _ = _get_codec(compression)
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.segment_path: Optional[str] = None
+        self._segment = None
+        self._index = None
+        self._segment_bytes = 0
+        self._segment_opened = 0.0
+        self._sequence = 0
+        self._lock = threading.Lock()
+        register_fork_handler(self)
+
+    def _before_fork(self) -> None:
+        # the child would write the buffered frames again
+        self.flush()
+
+    def _after_fork_in_child(self) -> None:
+        # the child writes its own segments, named after its pid
+        self._lock = threading.Lock()
+        self._close_segment()
+
+    def write_trace(self, trace_id: int, service_name: str, lines: List[str]) -> None:
+        """Append the serialized spans of one trace as a single frame."""
+        if not lines:
+            return
+        frame = self._compress(("\n".join(lines) + "\n").encode("utf-8"))
+        with self._lock:
+            if self._segment is None or self._should_rotate():
+                self._rotate(service_name)
+            offset = self._segment_bytes
+            self._segment.write(frame)
+            self._segment_bytes += len(frame)
+            self._index.write(json.dumps({
+                "trace_id": f"{trace_id:032x}",
+                "segment": os.path.basename(self.segment_path),
+                "offset": offset,
+                "length": len(frame),
+                "spans": len(lines),
+            }, separators=(',', ':')) + "\n")
+
+    def _should_rotate(self) -> bool:
+        return self._segment_bytes >= self.max_bytes or \
+            time.monotonic() - self._segment_opened >= self.max_age_seconds
+
+    def _rotate(self, service_name: str) -> None:
+        # called with the lock held
+        self._close_segment()
+        self._sequence += 1
+        base_path = os.path.join(self.output_path, f"{self.file_prefix}{service_name}_"
+                                 f"{datetime.now().strftime(self.time_format)}_{os.getpid()}_{self._sequence}")
+        self.segment_path = base_path + SEGMENT_EXTENSIONS[self.compression]
+        self._segment = open(self.segment_path, "ab")
+        self._index = open(self.segment_path + INDEX_EXTENSION, "a", encoding="UTF-8")
+        self._segment_bytes = self._segment.tell()
+        self._segment_opened = time.monotonic()
+
+    def _close_segment(self) -> None:
+        for handle in (self._segment, self._index):
+            if handle is not None:
+                try:
+                    handle.close()
+                except Exception as e:
+                    logger.warning(f"Error closing trace segment {self.segment_path}: {e}")
+        self._segment = None
+        self._index = None
+
+    def flush(self) -> None:
+        with self._lock:
+            for handle in (self._segment, self._index):
+                if handle is not None:
+                    handle.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self._close_segment()
+
+def iter_index(output_path: str) -> Iterator[Dict]:
+    """Yield the index records of all the segments in a folder."""
+    for index_path in sorted(glob.glob(os.path.join(output_path, "*" + INDEX_EXTENSION))):
+        with open(index_path, encoding="UTF-8") as index_file:
+            for line in index_file:
+                if line.strip():
+                    yield json.loads(line)
+
+def read_frame(output_path: str, record: Dict) -> List[Dict]:
+    """Read the spans of one indexed frame."""
+    segment_path = os.path.join(output_path, record["segment"])
+    _, _, decompress = _get_codec(compression_of(segment_path))
+    with open(segment_path, "rb") as segment:
+        segment.seek(record["offset"])
+        data = decompress(segment.read(record["length"]))
+    return [json.loads(line) for line in data.decode("utf-8").splitlines() if line]
+
+def read_trace(output_path: str, trace_id) -> List[Dict]:
+    """Read all the spans of a trace from the segments in a folder, trace_id is an int or a hex string."""
+    if isinstance(trace_id, int):
+        trace_id = f"{trace_id:032x}"
+    trace_id = trace_id.lower()
+    if trace_id.startswith("0x"):
+        trace_id = trace_id[2:]
+    spans = []
+    for record in iter_index(output_path):
+        if record["trace_id"] == trace_id:
+            spans.extend(read_frame(output_path, record))
+    return spans
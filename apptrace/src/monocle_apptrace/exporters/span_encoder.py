@@ -0,0 +1,184 @@
+"""
+Monocle span encoder.
+
+Builds the Monocle wire format (OpenTelemetry ``ReadableSpan.to_json`` layout with trace, span and parent ids
+written without the ``0x`` prefix) straight from the ``ReadableSpan`` fields in a single pass.
+``orjson`` or ``msgspec`` are used for encoding when installed, ``json`` otherwise. The backend can be forced
+with the ``MONOCLE_SPAN_ENCODER`` environment variable (auto, orjson, msgspec or json).
+
+``span_from_dict`` rebuilds a ``ReadableSpan`` from the wire format, eg. for the spans received by the collector
+daemon. Timestamps are restored at the microsecond precision of the format.
+"""
+import json
+import logging
+import os
+import re
+from datetime import datetime, timezone
+from typing import Any, Iterable, Optional
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import Event, ReadableSpan
+from opentelemetry.sdk.util import ns_to_iso_str
+from opentelemetry.trace import Link, SpanContext, SpanKind, Status, StatusCode, TraceFlags, TraceState
+
+logger = logging.getLogger(__name__)
+
+SPAN_ENCODER_ENV = "MONOCLE_SPAN_ENCODER"
+
+def _json_default(obj) -> str:
+    return str(obj)
+
+def _json_dumps(obj: Any) -> str:
+    return json.dumps(obj, separators=(',', ':'), default=_json_default)
+
+def _load_compact_encoder():
+    preferred = os.environ.get(SPAN_ENCODER_ENV, "auto").lower()
+    if preferred in ("auto", "orjson"):
+        try:
+            import orjson
+            def _orjson_dumps(obj: Any) -> str:
+                try:
+                    return orjson.dumps(obj, default=_json_default).decode("utf-8")
+                except TypeError:
+                    # eg. integers beyond 64 bit
+                    return _json_dumps(obj)
+            return "orjson", _orjson_dumps
+        except ImportError:
+            if preferred == "orjson":
+                logger.warning("orjson is not installed, falling back to json span encoder")
+    if preferred in ("auto", "msgspec"):
+        try:
+            import msgspec
+            _msgspec_encoder = msgspec.json.Encoder(enc_hook=_json_default)
+            def _msgspec_dumps(obj: Any) -> str:
+                try:
+                    return _msgspec_encoder.encode(obj).decode("utf-8")
+                except (TypeError, OverflowError):
+                    return _json_dumps(obj)
+            return "msgspec", _msgspec_dumps
+        except ImportError:
+            if preferred == "msgspec":
+                logger.warning("msgspec is not installed, falling back to json span encoder")
+    return "json", _json_dumps
+
+encoder_name, dumps = _load_compact_encoder()
+
+def _strip_0x(value):
+    """Remove the 0x prefix of hex ids, recursively for sequences and dicts."""
+    if isinstance(value, str):
+        return value[2:] if value.startswith("0x") else value
+    if isinstance(value, (list, tuple)):
+        return [_strip_0x(item) for item in value]
+    if isinstance(value, dict):
+        return {key: _strip_0x(item) for key, item in value.items()}
+    return value
+
+def _format_attributes(attributes) -> Optional[dict]:
+    if attributes is None:
+        return None
+    return {key: _strip_0x(value) for key, value in attributes.items()}
+
+def _format_context(context) -> dict:
+    return {
+        "trace_id": f"{context.trace_id:032x}",
+        "span_id": f"{context.span_id:016x}",
+        "trace_state": repr(context.trace_state),
+    }
+
+def span_to_dict(span: ReadableSpan) -> dict:
+    """Convert a span to the Monocle wire format dict."""
+    parent = span.parent
+    status = span.status
+    formatted_status = {"status_code": status.status_code.name}
+    if status.description:
+        formatted_status["description"] = status.description
+    context = span.context
+    resource = span.resource
+    return {
+        "name": span.name,
+        "context": _format_context(context) if context else None,
+        "kind": str(span.kind),
+        "parent_id": f"{parent.span_id:016x}" if parent is not None else None,
+        "start_time": ns_to_iso_str(span.start_time) if span.start_time else None,
+        "end_time": ns_to_iso_str(span.end_time) if span.end_time else None,
+        "status": formatted_status,
+        "attributes": _format_attributes(span.attributes),
+        "events": [
+            {
+                "name": event.name,
+                "timestamp": ns_to_iso_str(event.timestamp),
+                "attributes": _format_attributes(event.attributes),
+            }
+            for event in span.events
+        ],
+        "links": [
+            {
+                "context": _format_context(link.context),
+                "attributes": _format_attributes(link.attributes),
+            }
+            for link in span.links
+        ],
+        "resource": {
+            "attributes": _format_attributes(resource.attributes) or {},
+            "schema_url": resource.schema_url,
+        },
+    }
+
+_TRACE_STATE_ENTRY = re.compile(r"\{key=(.*?), value=(.*?)\}")
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+def _iso_str_to_ns(value: Optional[str]) -> Optional[int]:
+    if not value:
+        return None
+    timestamp = datetime.strptime(value, "%Y-%m-%dT%H:%M:%S.%fZ").replace(tzinfo=timezone.utc) - _EPOCH
+    return (timestamp.days * 86400 + timestamp.seconds) * 1_000_000_000 + timestamp.microseconds * 1000
+
+def _parse_context(context: dict, span_id: Optional[str] = None) -> SpanContext:
+    return SpanContext(
+        trace_id=int(context["trace_id"], 16),
+        span_id=int(span_id or context["span_id"], 16),
+        is_remote=False,
+        trace_flags=TraceFlags(TraceFlags.SAMPLED),
+        trace_state=TraceState(_TRACE_STATE_ENTRY.findall(context.get("trace_state") or "")),
+    )
+
+def span_from_dict(span_dict: dict) -> ReadableSpan:
+    """Rebuild a span from the Monocle wire format dict."""
+    context = span_dict["context"]
+    status = span_dict.get("status") or {}
+    resource = span_dict.get("resource") or {}
+    return ReadableSpan(
+        name=span_dict["name"],
+        context=_parse_context(context),
+        parent=_parse_context(context, span_dict["parent_id"]) if span_dict.get("parent_id") else None,
+        resource=Resource(resource.get("attributes") or {}, resource.get("schema_url")),
+        attributes=span_dict.get("attributes") or {},
+        events=[
+            Event(event["name"], event.get("attributes"), _iso_str_to_ns(event.get("timestamp")))
+            for event in span_dict.get("events") or ()
+        ],
+        links=[
+            Link(_parse_context(link["context"]), link.get("attributes"))
+            for link in span_dict.get("links") or ()
+        ],
+        kind=SpanKind[span_dict.get("kind", "SpanKind.INTERNAL").rsplit(".", 1)[-1]],
+        status=Status(StatusCode[status.get("status_code", "UNSET")], status.get("description")),
+        start_time=_iso_str_to_ns(span_dict.get("start_time")),
+        end_time=_iso_str_to_ns(span_dict.get("end_time")),
+    )
+
+def encode_span(span: ReadableSpan, indent: Optional[int] = None) -> str:
+    """Serialize a span to JSON, compact unless an indent is given."""
+    span_dict = span_to_dict(span)
+    if indent is None:
+        return dumps(span_dict)
+    return json.dumps(span_dict, indent=indent, default=_json_default)
+
+def encode_spans_ndjson(spans: Iterable[ReadableSpan]) -> str:
+    """Serialize spans to newline delimited JSON, skipping the ones that fail to serialize."""
+    lines = []
+    for span in spans:
+        try:
+            lines.append(encode_span(span))
+        except Exception as e:
+            logger.warning(f"Error serializing span {span.context.span_id}: {e}")
+    return "\n".join(lines) + "\n"
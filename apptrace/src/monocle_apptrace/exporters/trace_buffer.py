@@ -0,0 +1,228 @@
+"""
+Trace assembly buffer shared by the exporters that write one file per trace.
+
+Spans are held per trace until the root span arrives. Traces are kept in creation order so that expiry only looks
+at the oldest entries, and in least recently used order so that the global span and byte caps evict the coldest
+trace first. A trace that reaches the per trace span cap is handed over early, the spans that arrive after that
+start a new entry for the same trace id. Limits are configured with:
+
+- ``MONOCLE_TRACE_BUFFER_TIMEOUT``: seconds a trace is held without its root span (default 60)
+- ``MONOCLE_TRACE_BUFFER_MAX_SPANS``: spans held across all traces (default 100000)
+- ``MONOCLE_TRACE_BUFFER_MAX_BYTES``: estimated bytes held across all traces (default 256MB)
+- ``MONOCLE_TRACE_BUFFER_MAX_SPANS_PER_TRACE``: spans held for a single trace (default 10000)
+"""
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, List, Optional, Sequence
+from opentelemetry.sdk.trace import ReadableSpan
+from monocle_apptrace.instrumentation.common.multiprocess import register_fork_handler
+from monocle_apptrace.instrumentation.common.self_telemetry import TRACE_BUFFER_EVICTIONS, add_counter, watch_trace_buffer
+
+logger = logging.getLogger(__name__)
+
+TRACE_BUFFER_TIMEOUT_ENV = "MONOCLE_TRACE_BUFFER_TIMEOUT"
+TRACE_BUFFER_MAX_SPANS_ENV = "MONOCLE_TRACE_BUFFER_MAX_SPANS"
+TRACE_BUFFER_MAX_BYTES_ENV = "MONOCLE_TRACE_BUFFER_MAX_BYTES"
+TRACE_BUFFER_MAX_SPANS_PER_TRACE_ENV = "MONOCLE_TRACE_BUFFER_MAX_SPANS_PER_TRACE"
+
+DEFAULT_TIMEOUT_SECONDS = 60
+DEFAULT_MAX_SPANS = 100_000
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_MAX_SPANS_PER_TRACE = 10_000
+
+# eviction reasons passed to the on_evict callback
+EVICT_EXPIRED = "expired"
+EVICT_CAPACITY = "capacity"
+EVICT_SPAN_LIMIT = "span_limit"
+
+# fixed cost of a serialized span without attributes and events: ids, timestamps, status, resource
+SPAN_OVERHEAD_BYTES = 512
+
+def _env_number(name: str, default, cast=int):
+    try:
+        return cast(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        logger.warning(f"Invalid value for {name}, using default {default}")
+        return default
+
+def _value_size(value) -> int:
+    if isinstance(value, str):
+        return len(value)
+    if isinstance(value, (list, tuple)):
+        return sum(_value_size(item) for item in value)
+    return 8
+
+def _attributes_size(attributes) -> int:
+    if not attributes:
+        return 0
+    return sum(len(key) + _value_size(value) for key, value in attributes.items())
+
+def estimate_span_size(span: ReadableSpan) -> int:
+    """Cheap estimate of the serialized size of a span, without serializing it."""
+    size = SPAN_OVERHEAD_BYTES + len(span.name or "") + _attributes_size(span.attributes)
+    for event in span.events:
+        size += len(event.name) + _attributes_size(event.attributes)
+    return size
+
+class TraceEntry:
+    """Buffered state of one trace. ``payload`` holds exporter specific state, eg. an open file handle."""
+    __slots__ = ("trace_id", "spans", "creation_time", "has_root", "span_count", "size_bytes", "payload")
+
+    def __init__(self, trace_id: int, creation_time: float, payload: Any = None):
+        self.trace_id = trace_id
+        self.spans: List[ReadableSpan] = []
+        self.creation_time = creation_time
+        self.has_root = False
+        self.span_count = 0
+        self.size_bytes = 0
+        self.payload = payload
+
+class TraceBuffer:
+    """Per trace span buffer with amortized O(1) expiry and bounded memory."""
+
+    def __init__(self, on_evict: Callable[[TraceEntry, str], None] = None,
+                 timeout_seconds: Optional[float] = None, max_spans: Optional[int] = None,
+                 max_bytes: Optional[int] = None, max_spans_per_trace: Optional[int] = None,
+                 clock: Callable[[], float] = time.monotonic, name: str = "trace_buffer"):
+        self.on_evict = on_evict
+        self.name = name
+        self.timeout_seconds = timeout_seconds if timeout_seconds is not None else \
+            _env_number(TRACE_BUFFER_TIMEOUT_ENV, DEFAULT_TIMEOUT_SECONDS, float)
+        self.max_spans = max_spans or _env_number(TRACE_BUFFER_MAX_SPANS_ENV, DEFAULT_MAX_SPANS)
+        self.max_bytes = max_bytes or _env_number(TRACE_BUFFER_MAX_BYTES_ENV, DEFAULT_MAX_BYTES)
+        self.max_spans_per_trace = max_spans_per_trace or \
+            _env_number(TRACE_BUFFER_MAX_SPANS_PER_TRACE_ENV, DEFAULT_MAX_SPANS_PER_TRACE)
+        self.clock = clock
+        # creation order, the oldest trace is always first
+        self._by_creation: "OrderedDict[int, TraceEntry]" = OrderedDict()
+        # least recently updated trace first
+        self._by_use: "OrderedDict[int, TraceEntry]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._total_spans = 0
+        self._total_bytes = 0
+        self._metrics = {"added_spans": 0, "completed": 0, EVICT_EXPIRED: 0, EVICT_CAPACITY: 0, EVICT_SPAN_LIMIT: 0}
+        watch_trace_buffer(self)
+        register_fork_handler(self)
+
+    def _after_fork_in_child(self) -> None:
+        # the traces of the parent are completed and exported by the parent, they are dropped without eviction
+        self._lock = threading.RLock()
+        self._by_creation = OrderedDict()
+        self._by_use = OrderedDict()
+        self._total_spans = 0
+        self._total_bytes = 0
+
+    def __contains__(self, trace_id: int) -> bool:
+        return trace_id in self._by_creation
+
+    def __len__(self) -> int:
+        return len(self._by_creation)
+
+    def __bool__(self) -> bool:
+        return bool(self._by_creation)
+
+    def keys(self) -> List[int]:
+        with self._lock:
+            return list(self._by_creation.keys())
+
+    def entries(self) -> List[TraceEntry]:
+        with self._lock:
+            return list(self._by_creation.values())
+
+    def get(self, trace_id: int) -> Optional[TraceEntry]:
+        return self._by_creation.get(trace_id)
+
+    def get_or_create(self, trace_id: int, payload_factory: Callable[[], Any] = None) -> TraceEntry:
+        """Return the entry of a trace, creating it (and its payload) if needed."""
+        with self._lock:
+            entry = self._by_creation.get(trace_id)
+            if entry is None:
+                entry = TraceEntry(trace_id, self.clock(), payload_factory() if payload_factory else None)
+                self._by_creation[trace_id] = entry
+                self._by_use[trace_id] = entry
+            return entry
+
+    def add(self, trace_id: int, spans: Sequence[ReadableSpan], has_root: bool = False) -> TraceEntry:
+        """Buffer spans of a trace and enforce the caps."""
+        with self._lock:
+            entry = self.get_or_create(trace_id)
+            entry.spans.extend(spans)
+        self.account(entry, len(spans), sum(estimate_span_size(span) for span in spans), has_root)
+        return entry
+
+    def account(self, entry: TraceEntry, span_count: int, size_bytes: int, has_root: bool = False) -> None:
+        """Record spans added to an entry, evicting entries that are over the caps."""
+        evicted = []
+        with self._lock:
+            if self._by_creation.get(entry.trace_id) is not entry:
+                return
+            entry.span_count += span_count
+            entry.size_bytes += size_bytes
+            entry.has_root = entry.has_root or has_root
+            self._total_spans += span_count
+            self._total_bytes += size_bytes
+            self._metrics["added_spans"] += span_count
+            self._by_use.move_to_end(entry.trace_id)
+            if entry.span_count >= self.max_spans_per_trace and not entry.has_root:
+                evicted.append((self._remove(entry.trace_id), EVICT_SPAN_LIMIT))
+            while self._by_use and (self._total_spans > self.max_spans or self._total_bytes > self.max_bytes):
+                lru_trace_id = next(iter(self._by_use))
+                evicted.append((self._remove(lru_trace_id), EVICT_CAPACITY))
+        self._evict(evicted)
+
+    def expire(self) -> List[TraceEntry]:
+        """Evict traces older than the timeout, only the oldest entries are looked at."""
+        evicted = []
+        with self._lock:
+            deadline = self.clock() - self.timeout_seconds
+            while self._by_creation:
+                entry = next(iter(self._by_creation.values()))
+                if entry.creation_time >= deadline:
+                    break
+                evicted.append((self._remove(entry.trace_id), EVICT_EXPIRED))
+        self._evict(evicted)
+        return [entry for entry, _ in evicted]
+
+    def pop(self, trace_id: int) -> Optional[TraceEntry]:
+        """Remove a trace that is complete, without calling on_evict."""
+        with self._lock:
+            if trace_id not in self._by_creation:
+                return None
+            self._metrics["completed"] += 1
+            return self._remove(trace_id)
+
+    def drain(self) -> List[TraceEntry]:
+        """Remove all the traces, oldest first."""
+        with self._lock:
+            return [self.pop(trace_id) for trace_id in list(self._by_creation.keys())]
+
+    def _remove(self, trace_id: int) -> TraceEntry:
+        # called with the lock held
+        entry = self._by_creation.pop(trace_id)
+        del self._by_use[trace_id]
+        self._total_spans -= entry.span_count
+        self._total_bytes -= entry.size_bytes
+        return entry
+
+    def _evict(self, evicted) -> None:
+        for entry, reason in evicted:
+            with self._lock:
+                self._metrics[reason] += 1
+            add_counter(TRACE_BUFFER_EVICTIONS, 1, {"buffer": self.name, "reason": reason})
+            if self.on_evict is None:
+                continue
+            try:
+                self.on_evict(entry, reason)
+            except Exception as e:
+                logger.error(f"Error evicting trace {entry.trace_id:032x} ({reason}): {e}")
+
+    def get_metrics(self) -> dict:
+        with self._lock:
+            metrics = dict(self._metrics)
+            metrics["traces"] = len(self._by_creation)
+            metrics["spans"] = self._total_spans
+            metrics["bytes"] = self._total_bytes
+        return metrics
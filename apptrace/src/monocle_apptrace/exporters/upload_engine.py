@@ -0,0 +1,191 @@
+"""
+Shared upload engine for the object store exporters.
+
+The S3, Azure Blob, GCS and OpenDAL exporters hand their serialized trace files to a long lived pool of upload
+workers instead of uploading on the BatchSpanProcessor thread. Pending uploads are held in a bounded queue, what
+happens when it's full is controlled by the drop policy:
+
+- ``drop_oldest`` (default): evict the oldest queued upload to make room for the new one
+- ``drop_newest``: reject the new upload
+- ``block``: wait up to ``MONOCLE_UPLOAD_BLOCK_TIMEOUT`` seconds for room, then reject the new upload
+
+The pool is configured with ``MONOCLE_UPLOAD_WORKERS``, ``MONOCLE_UPLOAD_QUEUE_SIZE`` and ``MONOCLE_UPLOAD_DROP_POLICY``.
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Callable, Optional
+from monocle_apptrace.instrumentation.common.multiprocess import register_fork_handler
+from monocle_apptrace.instrumentation.common.self_telemetry import UPLOADS, add_counter, watch_upload_engine
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_WORKERS_ENV = "MONOCLE_UPLOAD_WORKERS"
+UPLOAD_QUEUE_SIZE_ENV = "MONOCLE_UPLOAD_QUEUE_SIZE"
+UPLOAD_DROP_POLICY_ENV = "MONOCLE_UPLOAD_DROP_POLICY"
+UPLOAD_BLOCK_TIMEOUT_ENV = "MONOCLE_UPLOAD_BLOCK_TIMEOUT"
+
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+BLOCK = "block"
+DROP_POLICIES = (DROP_OLDEST, DROP_NEWEST, BLOCK)
+
+DEFAULT_UPLOAD_WORKERS = 4
+DEFAULT_UPLOAD_QUEUE_SIZE = 1000
+DEFAULT_BLOCK_TIMEOUT_SECONDS = 5.0
+
+def _env_number(name: str, default, cast=int):
+    try:
+        return cast(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        logger.warning(f"Invalid value for {name}, using default {default}")
+        return default
+
+class UploadEngine:
+    """Bounded pool of worker threads running blocking upload calls."""
+
+    def __init__(self, max_workers: Optional[int] = None, max_queue_size: Optional[int] = None,
+                 drop_policy: Optional[str] = None, block_timeout: Optional[float] = None,
+                 name: str = "MonocleUpload"):
+        self.max_workers = max(1, max_workers or _env_number(UPLOAD_WORKERS_ENV, DEFAULT_UPLOAD_WORKERS))
+        self.max_queue_size = max(1, max_queue_size or _env_number(UPLOAD_QUEUE_SIZE_ENV, DEFAULT_UPLOAD_QUEUE_SIZE))
+        drop_policy = (drop_policy or os.environ.get(UPLOAD_DROP_POLICY_ENV, DROP_OLDEST)).lower()
+        if drop_policy not in DROP_POLICIES:
+            logger.warning(f"Unknown upload drop policy {drop_policy}, using {DROP_OLDEST}")
+            drop_policy = DROP_OLDEST
+        self.drop_policy = drop_policy
+        self.block_timeout = block_timeout if block_timeout is not None else \
+            _env_number(UPLOAD_BLOCK_TIMEOUT_ENV, DEFAULT_BLOCK_TIMEOUT_SECONDS, float)
+        self.name = name
+        self._queue = deque()
+        self._condition = threading.Condition()
+        self._workers = []
+        self._in_flight = 0
+        self._stopped = False
+        self._metrics = {"submitted": 0, "completed": 0, "failed": 0, "dropped": 0}
+        watch_upload_engine(self)
+        register_fork_handler(self)
+
+    def _after_fork_in_child(self) -> None:
+        # the uploads queued in the parent are run by the parent, workers are started again on the next submit
+        self._queue = deque()
+        self._condition = threading.Condition()
+        self._workers = []
+        self._in_flight = 0
+        self._metrics = {"submitted": 0, "completed": 0, "failed": 0, "dropped": 0}
+
+    def submit(self, upload_task: Callable, kwargs: dict = None, description: str = None) -> bool:
+        """Queue an upload, returns False if it was dropped."""
+        task = (upload_task, kwargs or {}, description or getattr(upload_task, "__name__", "upload"))
+        with self._condition:
+            if self._stopped:
+                run_inline = True
+            else:
+                run_inline = False
+                if len(self._queue) >= self.max_queue_size and not self._make_room():
+                    self._metrics["dropped"] += 1
+                    add_counter(UPLOADS, 1, {"engine": self.name, "outcome": "dropped"})
+                    logger.warning(f"{self.name} queue is full, dropping upload {task[2]}")
+                    return False
+                self._ensure_workers()
+                self._queue.append(task)
+                self._metrics["submitted"] += 1
+                self._condition.notify_all()
+        if run_inline:
+            # engine is shut down, upload on the caller's thread rather than losing the spans
+            with self._condition:
+                self._metrics["submitted"] += 1
+            self._run(task)
+        return True
+
+    def _make_room(self) -> bool:
+        # called with the condition held
+        if self.drop_policy == DROP_OLDEST:
+            _, _, description = self._queue.popleft()
+            self._metrics["dropped"] += 1
+            add_counter(UPLOADS, 1, {"engine": self.name, "outcome": "dropped"})
+            logger.warning(f"{self.name} queue is full, dropping oldest upload {description}")
+            return True
+        if self.drop_policy == BLOCK:
+            return self._condition.wait_for(lambda: len(self._queue) < self.max_queue_size or self._stopped,
+                                            timeout=self.block_timeout) and not self._stopped
+        return False
+
+    def _ensure_workers(self) -> None:
+        # called with the condition held, workers are started on first use
+        self._workers = [worker for worker in self._workers if worker.is_alive()]
+        while len(self._workers) < self.max_workers:
+            worker = threading.Thread(target=self._worker_loop, daemon=True,
+                                      name=f"{self.name}-{len(self._workers)}")
+            worker.start()
+            self._workers.append(worker)
+
+    def _worker_loop(self) -> None:
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._queue or self._stopped)
+                if not self._queue:
+                    return
+                task = self._queue.popleft()
+                self._in_flight += 1
+                self._condition.notify_all()
+            try:
+                self._run(task)
+            finally:
+                with self._condition:
+                    self._in_flight -= 1
+                    self._condition.notify_all()
+
+    def _run(self, task) -> None:
+        upload_task, kwargs, description = task
+        try:
+            upload_task(**kwargs)
+            outcome = "completed"
+        except Exception as e:
+            logger.error(f"Failed to upload {description}: {e}")
+            outcome = "failed"
+        with self._condition:
+            self._metrics[outcome] += 1
+        add_counter(UPLOADS, 1, {"engine": self.name, "outcome": outcome})
+
+    def flush(self, timeout_millis: int = 30000) -> bool:
+        """Wait for queued and in-flight uploads, returns False on timeout."""
+        with self._condition:
+            return self._condition.wait_for(lambda: not self._queue and self._in_flight == 0,
+                                            timeout=timeout_millis / 1000)
+
+    def shutdown(self, timeout_millis: int = 30000) -> bool:
+        """Drain pending uploads and stop the workers."""
+        deadline = time.time() + timeout_millis / 1000
+        flushed = self.flush(timeout_millis)
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+            workers = list(self._workers)
+            self._workers = []
+        for worker in workers:
+            worker.join(max(0, deadline - time.time()))
+        return flushed
+
+    def get_metrics(self) -> dict:
+        with self._condition:
+            metrics = dict(self._metrics)
+            metrics["queued"] = len(self._queue)
+            metrics["in_flight"] = self._in_flight
+        return metrics
+
+_upload_engine: Optional[UploadEngine] = None
+_upload_engine_lock = threading.Lock()
+
+def get_upload_engine() -> UploadEngine:
+    """Return the process wide upload engine shared by the object store exporters."""
+    global _upload_engine
+    if _upload_engine is None:
+        with _upload_engine_lock:
+            if _upload_engine is None:
+                _upload_engine = UploadEngine()
+                atexit.register(_upload_engine.shutdown)
+    return _upload_engine
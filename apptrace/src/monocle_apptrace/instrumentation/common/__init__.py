@@ -17,4 +17,6 @@ from .scope_wrapper import (
     amonocle_trace_scope,
     monocle_trace_scope_method
 )
+from .resource_detector import refresh_monocle_resource
+from .multiprocess import monocle_process_task
 from .utils import MonocleSpanException
@@ -0,0 +1,211 @@
+"""
+Profiling and time budgets of the output processor accessors.
+
+When active, every accessor of a compiled output processor plan runs through a ``ProfiledAccessor`` that records
+its calls and wall time. Budgets are enforced per accessor function, while the report adds up the accessors sharing
+an output processor type and attribute or event name, eg. ``("inference", "entity.2.name")`` or
+``("inference", "data.input.input")``. Configured with:
+
+- ``MONOCLE_ACCESSOR_PROFILING``: set to true to record the accessor timings and, through tracemalloc, the memory
+  they allocate. The slowest accessors are logged at exit and returned by ``get_accessor_profile()``.
+- ``MONOCLE_ACCESSOR_BUDGET_MS``: time budget of a single accessor call (default off)
+- ``MONOCLE_ACCESSOR_BUDGET_STRIKES``: calls over the budget after which the accessor is disabled for the rest of the
+  process (default 3). A disabled accessor is skipped and named in the ``monocle.skipped_accessors`` span attribute.
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from monocle_apptrace.instrumentation.common.constants import (
+    ACCESSOR_PROFILING, ACCESSOR_BUDGET_MS, ACCESSOR_BUDGET_STRIKES, SKIPPED_ACCESSORS_KEY
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUDGET_STRIKES = 3
+DEFAULT_REPORT_SIZE = 10
+
+class AccessorStats:
+    __slots__ = ("processor_type", "name", "accessor", "calls", "total_time", "max_time", "allocated_bytes", "over_budget",
+                 "disabled")
+
+    def __init__(self, processor_type: str, name: str, accessor: str = ""):
+        self.processor_type = processor_type
+        self.name = name
+        self.accessor = accessor
+        self.calls = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.allocated_bytes = 0
+        self.over_budget = 0
+        self.disabled = False
+
+    def to_dict(self) -> dict:
+        return {
+            "processor_type": self.processor_type,
+            "name": self.name,
+            "calls": self.calls,
+            "total_ms": self.total_time * 1000,
+            "mean_ms": self.total_time * 1000 / self.calls if self.calls else 0.0,
+            "max_ms": self.max_time * 1000,
+            "allocated_bytes": self.allocated_bytes,
+            "over_budget": self.over_budget,
+            "disabled": self.disabled,
+        }
+
+def mark_skipped_accessor(span, label: str) -> None:
+    """Name a skipped accessor in the span attributes, ignored once the span has ended."""
+    if span is None or not span.is_recording():
+        return
+    skipped = span.attributes.get(SKIPPED_ACCESSORS_KEY) or ()
+    if label not in skipped:
+        span.set_attribute(SKIPPED_ACCESSORS_KEY, list(skipped) + [label])
+
+class ProfiledAccessor:
+    """Accessor wrapper timing each call and skipping the accessor once it's disabled."""
+    __slots__ = ("accessor", "stats", "label", "profiler")
+
+    def __init__(self, accessor: Callable[[dict], Any], stats: AccessorStats, profiler: "AccessorProfiler"):
+        self.accessor = accessor
+        self.stats = stats
+        self.label = f"{stats.processor_type}:{stats.name}"
+        self.profiler = profiler
+
+    def __call__(self, arguments: dict):
+        if self.stats.disabled:
+            mark_skipped_accessor(arguments.get("span"), self.label)
+            return None
+        allocated = tracemalloc.get_traced_memory()[0] if self.profiler.profile and tracemalloc.is_tracing() else None
+        started = time.perf_counter()
+        try:
+            return self.accessor(arguments)
+        finally:
+            elapsed = time.perf_counter() - started
+            if allocated is not None:
+                allocated = tracemalloc.get_traced_memory()[0] - allocated
+            self.profiler.record(self.stats, elapsed, allocated)
+
+def _accessor_name(accessor: Callable) -> str:
+    accessor = getattr(accessor, "accessor", accessor)
+    name = getattr(accessor, "__qualname__", None) or type(accessor).__qualname__
+    module = getattr(accessor, "__module__", None)
+    return f"{module}.{name}" if module else name
+
+class AccessorProfiler:
+    """Per accessor statistics and budget enforcement."""
+
+    def __init__(self, profile: bool = False, budget_ms: Optional[float] = None,
+                 max_strikes: int = DEFAULT_BUDGET_STRIKES):
+        self.profile = profile
+        self.budget = budget_ms / 1000 if budget_ms else None
+        self.max_strikes = max(1, max_strikes)
+        self._stats: Dict[Tuple[str, str], AccessorStats] = {}
+        self._lock = threading.Lock()
+        if profile and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @property
+    def active(self) -> bool:
+        return self.profile or self.budget is not None
+
+    def wrap(self, accessor: Callable[[dict], Any], processor_type: str, name: str,
+             source: Optional[Callable] = None) -> Callable[[dict], Any]:
+        """Return the accessor to put in a compiled plan, the accessor itself when the profiler isn't active.
+        The statistics are kept per ``source``, the accessor function of the output processor, so that the same named
+        accessor of another output processor is never disabled along with it."""
+        if not self.active:
+            return accessor
+        source = source if source is not None else accessor
+        key = (processor_type, name, source)
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = AccessorStats(processor_type, name, _accessor_name(source))
+        return ProfiledAccessor(accessor, stats, self)
+
+    def record(self, stats: AccessorStats, elapsed: float, allocated: Optional[int] = None) -> None:
+        disabled_now = False
+        with self._lock:
+            stats.calls += 1
+            stats.total_time += elapsed
+            if elapsed > stats.max_time:
+                stats.max_time = elapsed
+            if allocated is not None and allocated > 0:
+                stats.allocated_bytes += allocated
+            if self.budget is not None and elapsed > self.budget:
+                stats.over_budget += 1
+                if stats.over_budget >= self.max_strikes and not stats.disabled:
+                    stats.disabled = disabled_now = True
+        if disabled_now:
+            logger.warning(f"Accessor {stats.processor_type}:{stats.name} ({stats.accessor}) exceeded its {self.budget * 1000:g}ms budget "
+                           f"{stats.over_budget} times, disabling it")
+
+    def report(self, top: Optional[int] = DEFAULT_REPORT_SIZE) -> List[dict]:
+        """Accessor statistics by output processor type and name, the most expensive in total first."""
+        totals: Dict[Tuple[str, str], AccessorStats] = {}
+        with self._lock:
+            for stats in self._stats.values():
+                total = totals.get((stats.processor_type, stats.name))
+                if total is None:
+                    total = totals[(stats.processor_type, stats.name)] = AccessorStats(stats.processor_type, stats.name)
+                total.calls += stats.calls
+                total.total_time += stats.total_time
+                total.max_time = max(total.max_time, stats.max_time)
+                total.allocated_bytes += stats.allocated_bytes
+                total.over_budget += stats.over_budget
+                total.disabled = total.disabled or stats.disabled
+        ordered = sorted(totals.values(), key=lambda item: item.total_time, reverse=True)
+        return [item.to_dict() for item in ordered[:top]]
+
+    def get_disabled(self) -> List[str]:
+        """Disabled accessors as ``type:name (module.function)``."""
+        with self._lock:
+            return [f"{stats.processor_type}:{stats.name} ({stats.accessor})"
+                    for stats in self._stats.values() if stats.disabled]
+
+    def reset(self) -> None:
+        """Clear the statistics and re-enable the disabled accessors."""
+        with self._lock:
+            for stats in self._stats.values():
+                stats.__init__(stats.processor_type, stats.name, stats.accessor)
+
+    def log_report(self) -> None:
+        for item in self.report():
+            logger.info("Accessor %s:%s calls=%d total=%.2fms max=%.2fms allocated=%dB over_budget=%d%s",
+                        item["processor_type"], item["name"], item["calls"], item["total_ms"], item["max_ms"],
+                        item["allocated_bytes"], item["over_budget"], " disabled" if item["disabled"] else "")
+
+def create_accessor_profiler() -> AccessorProfiler:
+    profile = os.environ.get(ACCESSOR_PROFILING, "false").lower() == "true"
+    budget_ms = None
+    max_strikes = DEFAULT_BUDGET_STRIKES
+    try:
+        if os.environ.get(ACCESSOR_BUDGET_MS):
+            budget_ms = float(os.environ[ACCESSOR_BUDGET_MS])
+        max_strikes = int(os.environ.get(ACCESSOR_BUDGET_STRIKES, DEFAULT_BUDGET_STRIKES))
+    except ValueError:
+        logger.warning(f"Invalid {ACCESSOR_BUDGET_MS} or {ACCESSOR_BUDGET_STRIKES}, accessor budgets are off")
+        budget_ms = None
+    profiler = AccessorProfiler(profile=profile, budget_ms=budget_ms, max_strikes=max_strikes)
+    if profile:
+        atexit.register(profiler.log_report)
+    return profiler
+
+accessor_profiler: AccessorProfiler = create_accessor_profiler()
+
+def get_accessor_profiler() -> AccessorProfiler:
+    return accessor_profiler
+
+def set_accessor_profiler(profiler: AccessorProfiler) -> None:
+    """Replace the profiler, the output processor plans are compiled again with it."""
+    global accessor_profiler
+    from monocle_apptrace.instrumentation.common.processor_plan import clear_output_processor_plans
+    accessor_profiler = profiler
+    clear_output_processor_plans()
+
+def get_accessor_profile(top: Optional[int] = DEFAULT_REPORT_SIZE) -> List[dict]:
+    """The most expensive accessors seen so far."""
+    return accessor_profiler.report(top)
@@ -93,11 +93,47 @@ SCOPE_METHOD_LIST = "MONOCLE_SCOPE_METHODS"
 SCOPE_METHOD_FILE = "monocle_scopes.json"
 SCOPE_CONFIG_PATH = "MONOCLE_SCOPE_CONFIG_PATH"
 TRACE_PROPOGATION_URLS = "MONOCLE_TRACE_PROPAGATATION_URLS"
+SOURCE_PATH_CAPTURE = "MONOCLE_SOURCE_PATH_CAPTURE"
+SOURCE_PATH_SAMPLE_RATE = "MONOCLE_SOURCE_PATH_SAMPLE_RATE"
+# span_source capture policies
+SOURCE_PATH_ALWAYS = "always"
+SOURCE_PATH_ROOT = "root"
+SOURCE_PATH_SAMPLED = "sampled"
+SOURCE_PATH_OFF = "off"
+TAIL_SAMPLING = "MONOCLE_TAIL_SAMPLING"
+TAIL_SAMPLING_DEFAULT_RATE = "MONOCLE_TAIL_SAMPLING_DEFAULT_RATE"
+TAIL_SAMPLING_WORKFLOW_RATES = "MONOCLE_TAIL_SAMPLING_WORKFLOW_RATES"
+TAIL_SAMPLING_LATENCY_MS = "MONOCLE_TAIL_SAMPLING_LATENCY_MS"
+TAIL_SAMPLING_DECISION_CACHE_SIZE = "MONOCLE_TAIL_SAMPLING_DECISION_CACHE_SIZE"
+HEAD_SAMPLING_RATIO = "MONOCLE_HEAD_SAMPLING_RATIO"
+HEAD_SAMPLING_WORKFLOW_RATIOS = "MONOCLE_HEAD_SAMPLING_WORKFLOW_RATIOS"
+HEAD_SAMPLING_RATE_LIMIT = "MONOCLE_HEAD_SAMPLING_RATE_LIMIT"
+HEAD_SAMPLING_BURST = "MONOCLE_HEAD_SAMPLING_BURST"
+HEAD_SAMPLED_KEY = "monocle.head_sampled"
+DEFERRED_EVENTS = "MONOCLE_DEFERRED_EVENTS"
+LAZY_INSTRUMENTATION = "MONOCLE_LAZY_INSTRUMENTATION"
+STREAM_CAPTURE_MAX_CHARS = "MONOCLE_STREAM_CAPTURE_MAX_CHARS"
+STREAM_CAPTURE_MAX_BYTES = "MONOCLE_STREAM_CAPTURE_MAX_BYTES"
+SELF_TELEMETRY = "MONOCLE_SELF_TELEMETRY"
+ACCESSOR_PROFILING = "MONOCLE_ACCESSOR_PROFILING"
+ACCESSOR_BUDGET_MS = "MONOCLE_ACCESSOR_BUDGET_MS"
+ACCESSOR_BUDGET_STRIKES = "MONOCLE_ACCESSOR_BUDGET_STRIKES"
+SKIPPED_ACCESSORS_KEY = "monocle.skipped_accessors"
+SPAN_COLLAPSE = "MONOCLE_SPAN_COLLAPSE"
+SPAN_COLLAPSE_TYPES = "MONOCLE_SPAN_COLLAPSE_TYPES"
+# span collapse modes
+SPAN_COLLAPSE_OFF = "off"
+SPAN_COLLAPSE_SKIP = "skip"
+SPAN_COLLAPSE_MERGE = "merge"
+ACTIVE_SPAN_FAMILIES_KEY = "monocle.active_span_families"
+COLLAPSED_SPANS_KEY = "monocle.collapsed_spans"
 WORKFLOW_TYPE_KEY = "monocle.workflow_type"
 ADD_NEW_WORKFLOW = "monocle.add_new_workflow"
 WORKFLOW_TYPE_GENERIC = "workflow.generic"
 MONOCLE_SDK_VERSION = "monocle_apptrace.version"
 MONOCLE_SDK_LANGUAGE = "monocle_apptrace.language"
+APP_HOSTING_TYPE = "app_hosting.type"
+APP_HOSTING_NAME = "app_hosting.name"
 MONOCLE_DETECTED_SPAN_ERROR = "monocle_apptrace.detected_span_error"
 HTTP_SUCCESS_CODES = ("200", "201", "202", "204", "205", "206")
 CHILD_ERROR_CODE = "child.error.code"
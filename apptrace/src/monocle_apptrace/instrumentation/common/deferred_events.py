@@ -0,0 +1,130 @@
+"""
+Deferred materialization of the data.input / data.output span events.
+
+Extracting messages and JSON encoding full prompts and responses is the most expensive part of hydrating an inference
+span, and by default it runs inside the wrapped call. With ``MONOCLE_DEFERRED_EVENTS=true`` the wrapper only records
+a ``DeferredEvent`` holding the accessors and a shallow snapshot of the call arguments, for the events marked
+``"deferrable": True`` in their output processor. The accessors run the first time the event attributes are read, ie.
+when the span is encoded by an exporter, usually on the span processor's export thread. Spans that are never exported
+(dropped by sampling) never pay for the extraction.
+
+Only mark events whose accessors just extract the payload. Accessors raising ``MonocleSpanException`` to set the span
+status, setting scopes or span attributes must run in the wrapped call, the span has ended when deferred ones run.
+
+The snapshot copies the top level args, kwargs and list arguments (eg. ``messages``), objects referenced from them
+are kept alive until the span is exported and are expected not to be mutated in place by the application.
+"""
+import logging
+import os
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+from opentelemetry.attributes import BoundedAttributes
+from opentelemetry.sdk.trace import Event, Span
+from opentelemetry.trace.status import StatusCode
+from monocle_apptrace.instrumentation.common.constants import DEFERRED_EVENTS
+from monocle_apptrace.instrumentation.common.processor_plan import EventAttributeAccessor
+from monocle_apptrace.instrumentation.common.utils import MonocleSpanException
+
+logger = logging.getLogger(__name__)
+
+deferred_events_enabled: bool = os.environ.get(DEFERRED_EVENTS, "false").lower() == "true"
+
+def set_deferred_events(enabled: bool) -> None:
+    global deferred_events_enabled
+    deferred_events_enabled = enabled
+
+def is_deferred_events_enabled() -> bool:
+    return deferred_events_enabled
+
+def evaluate_event_attributes(accessors: Tuple[EventAttributeAccessor, ...], arguments: dict,
+                              span: Optional[Span] = None) -> Tuple[Dict[str, Any], bool]:
+    """Run the accessors of an event, returns its attributes and whether a MonocleSpanException was raised.
+    The span status is only updated when a span is passed, ie. while the span is still open."""
+    detected_error = False
+    event_attributes = {}
+    for attribute_key, accessor in accessors:
+        try:
+            try:
+                result = accessor(arguments)
+            except MonocleSpanException as e:
+                if span is not None:
+                    span.set_status(StatusCode.ERROR, e.message)
+                detected_error = True
+                result = e.get_err_code()
+            if result and isinstance(result, dict):
+                result = dict((key, value) for key, value in result.items() if value is not None)
+            if result and isinstance(result, (int, str, list, dict)):
+                if attribute_key is not None:
+                    event_attributes[attribute_key] = result
+                else:
+                    event_attributes.update(result)
+        except Exception as e:
+            logger.debug(f"Error evaluating accessor for attribute '{attribute_key}': {e}")
+    return event_attributes, detected_error
+
+def snapshot_arguments(arguments: dict) -> dict:
+    """Shallow copy of the accessor arguments that survives in place changes of the top level containers."""
+    snapshot = dict(arguments)
+    args = arguments.get("args")
+    if args is not None:
+        snapshot["args"] = tuple(list(arg) if isinstance(arg, list) else arg for arg in args)
+    kwargs = arguments.get("kwargs")
+    if kwargs is not None:
+        snapshot["kwargs"] = {key: list(value) if isinstance(value, list) else value for key, value in kwargs.items()}
+    return snapshot
+
+class DeferredEvent(Event):
+    """Span event whose attributes are computed by its accessors on first access."""
+
+    def __init__(self, name: str, accessors: Tuple[EventAttributeAccessor, ...], arguments: dict,
+                 timestamp: Optional[int] = None, max_attributes: Optional[int] = None,
+                 max_value_len: Optional[int] = None):
+        super().__init__(name=name, attributes=None, timestamp=timestamp)
+        self._pending: List[Tuple[Tuple[EventAttributeAccessor, ...], dict]] = [(accessors, arguments)]
+        self._max_attributes = max_attributes
+        self._max_value_len = max_value_len
+        self._lock = threading.Lock()
+
+    def defer(self, accessors: Tuple[EventAttributeAccessor, ...], arguments: dict) -> bool:
+        """Add accessors for an event of the same name, False when the attributes were already computed."""
+        with self._lock:
+            if self._pending is None:
+                return False
+            self._pending.append((accessors, arguments))
+            return True
+
+    @property
+    def is_materialized(self) -> bool:
+        return self._pending is None
+
+    @property
+    def attributes(self):
+        if self._pending is not None:
+            self._materialize()
+        return self._attributes
+
+    def _materialize(self) -> None:
+        with self._lock:
+            if self._pending is None:
+                return
+            event_attributes = {}
+            for accessors, arguments in self._pending:
+                attributes, _ = evaluate_event_attributes(accessors, arguments)
+                event_attributes.update(attributes)
+            self._attributes = BoundedAttributes(self._max_attributes, event_attributes,
+                                                 max_value_len=self._max_value_len, immutable=True)
+            # release the references to the call arguments and results
+            self._pending = None
+
+def add_deferred_event(span: Span, name: str, accessors: Tuple[EventAttributeAccessor, ...], arguments: dict,
+                       timestamp: Optional[int] = None) -> bool:
+    """Add a DeferredEvent to a span, or defer into an existing one. False when the event can't be deferred."""
+    if not isinstance(span, Span) or not span.is_recording():
+        return False
+    limits = span._limits
+    existing = [event for event in span.events if event.name == name]
+    if existing:
+        return all(isinstance(event, DeferredEvent) and event.defer(accessors, arguments) for event in existing)
+    span._add_event(DeferredEvent(name, accessors, arguments, timestamp=timestamp,
+                            max_attributes=limits.max_event_attributes, max_value_len=limits.max_attribute_length))
+    return True
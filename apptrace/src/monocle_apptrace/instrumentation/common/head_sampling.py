@@ -0,0 +1,127 @@
+"""
+Head sampling of Monocle traces.
+
+The decision is made once, when a call would start a new workflow trace and before any span is created or accessor
+runs. A trace continuing a remote parent, eg. a request carrying a ``traceparent`` header, follows the sampled flag of
+the parent so the upstream and Monocle traces are kept or dropped together. A dropped trace records the decision in the context and every instrumented call within it runs the wrapped
+method directly, without spans, hydration or scopes of its own. Configured with:
+
+- ``MONOCLE_HEAD_SAMPLING_RATIO``: fraction of the new traces that are sampled (default 1)
+- ``MONOCLE_HEAD_SAMPLING_WORKFLOW_RATIOS``: per workflow ratios, eg. ``chat=0.05,batch=1``
+- ``MONOCLE_HEAD_SAMPLING_RATE_LIMIT``: sampled traces per second, enforced with a token bucket (default unlimited)
+- ``MONOCLE_HEAD_SAMPLING_BURST``: token bucket size (default the rate limit, at least 1)
+
+Head sampling is off unless one of the ratio or rate limit settings is configured.
+"""
+import logging
+import os
+import random
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+from opentelemetry.context import attach, get_value, set_value
+from opentelemetry.trace import get_current_span
+from monocle_apptrace.instrumentation.common.constants import (
+    HEAD_SAMPLED_KEY, HEAD_SAMPLING_RATIO, HEAD_SAMPLING_WORKFLOW_RATIOS, HEAD_SAMPLING_RATE_LIMIT,
+    HEAD_SAMPLING_BURST, MONOCLE_WORKFLOW_NAME_KEY
+)
+from monocle_apptrace.instrumentation.common.self_telemetry import DROP_HEAD_SAMPLING, TRACES_DROPPED, add_counter
+from monocle_apptrace.instrumentation.common.tail_sampling import parse_workflow_rates
+from monocle_apptrace.instrumentation.common.utils import get_current_monocle_span, get_workflow_name
+
+logger = logging.getLogger(__name__)
+
+class TokenBucket:
+    """Thread safe token bucket, refilled continuously at ``rate`` tokens per second."""
+
+    def __init__(self, rate: float, burst: Optional[float] = None, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.capacity = max(1.0, burst if burst is not None else rate)
+        self.clock = clock
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            now = self.clock()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+class HeadSampler:
+    """Ratio, per workflow ratio and rate limited sampling of new traces."""
+
+    def __init__(self, ratio: float = 1.0, workflow_ratios: Optional[Dict[str, float]] = None,
+                 rate_limiter: Optional[TokenBucket] = None):
+        self.ratio = ratio
+        self.workflow_ratios = workflow_ratios or {}
+        self.rate_limiter = rate_limiter
+        self._metrics = {"sampled": 0, "dropped": 0}
+
+    def should_sample(self, workflow_name: Optional[str]) -> bool:
+        ratio = self.workflow_ratios.get(workflow_name, self.ratio)
+        sampled = ratio >= 1.0 or (ratio > 0 and random.random() < ratio)
+        if sampled and self.rate_limiter is not None:
+            sampled = self.rate_limiter.try_acquire()
+        # plain increments, the counts are best effort
+        self._metrics["sampled" if sampled else "dropped"] += 1
+        if not sampled:
+            add_counter(TRACES_DROPPED, 1, {"reason": DROP_HEAD_SAMPLING})
+        return sampled
+
+    def get_metrics(self) -> dict:
+        return dict(self._metrics)
+
+def _float_env(name: str) -> Optional[float]:
+    value = os.environ.get(name)
+    if value is None or value.strip() == "":
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        logger.warning(f"Invalid value for {name}: {value}")
+        return None
+
+def create_head_sampler() -> Optional[HeadSampler]:
+    """Build the head sampler from the environment, None when head sampling isn't configured."""
+    ratio = _float_env(HEAD_SAMPLING_RATIO)
+    workflow_ratios = parse_workflow_rates(os.environ.get(HEAD_SAMPLING_WORKFLOW_RATIOS))
+    rate_limit = _float_env(HEAD_SAMPLING_RATE_LIMIT)
+    if ratio is None and not workflow_ratios and rate_limit is None:
+        return None
+    rate_limiter = TokenBucket(rate_limit, _float_env(HEAD_SAMPLING_BURST)) if rate_limit is not None else None
+    return HeadSampler(1.0 if ratio is None else min(1.0, max(0.0, ratio)), workflow_ratios, rate_limiter)
+
+head_sampler: Optional[HeadSampler] = create_head_sampler()
+
+def set_head_sampler(sampler: Optional[HeadSampler]) -> None:
+    global head_sampler
+    head_sampler = sampler
+
+def get_head_sampler() -> Optional[HeadSampler]:
+    return head_sampler
+
+def get_head_sampling_decision(add_workflow_span: bool) -> Tuple[bool, Optional[object]]:
+    """Return whether the current call is traced and the context token to detach when a new trace was dropped."""
+    if head_sampler is None:
+        return True, None
+    if get_value(HEAD_SAMPLED_KEY) is False:
+        # within a dropped trace
+        return False, None
+    if not add_workflow_span and get_current_monocle_span().get_span_context().is_valid:
+        # within a sampled trace
+        return True, None
+    remote_parent = get_current_span().get_span_context()
+    if remote_parent.is_valid and remote_parent.is_remote:
+        if remote_parent.trace_flags.sampled:
+            return True, None
+        add_counter(TRACES_DROPPED, 1, {"reason": DROP_HEAD_SAMPLING})
+        return False, attach(set_value(HEAD_SAMPLED_KEY, False))
+    workflow_name = get_workflow_name() or get_value(MONOCLE_WORKFLOW_NAME_KEY)
+    if head_sampler.should_sample(workflow_name):
+        return True, None
+    return False, attach(set_value(HEAD_SAMPLED_KEY, False))
@@ -1,5 +1,6 @@
 import logging
 import inspect
+import os
 from typing import Collection, Dict, List, Union
 import uuid
 import inspect
@@ -16,12 +17,19 @@ from opentelemetry.trace import get_tracer
 from wrapt import wrap_function_wrapper
 from monocle_apptrace.exporters.monocle_exporters import get_monocle_exporter
 from monocle_apptrace.instrumentation.common.span_handler import SpanHandler, NonFrameworkSpanHandler
-from monocle_apptrace.instrumentation.common.wrapper_method import (
-    DEFAULT_METHODS_LIST,
-    WrapperMethod,
-    MONOCLE_SPAN_HANDLERS
+from monocle_apptrace.instrumentation.common.wrapper_method import WrapperMethod
+from monocle_apptrace.instrumentation.common.method_registry import (
+    MONOCLE_SPAN_HANDLERS,
+    LazyInstrumentation,
+    get_default_methods,
 )
 from monocle_apptrace.instrumentation.common.wrapper import scope_wrapper, ascope_wrapper, monocle_wrapper, amonocle_wrapper
+from monocle_apptrace.instrumentation.common.processor_plan import compile_method_plans
+from monocle_apptrace.instrumentation.common.resource_detector import MonocleResourceDetector, refresh_monocle_resource
+from monocle_apptrace.instrumentation.common.tail_sampling import TailSamplingSpanProcessor
+from monocle_apptrace.instrumentation.common.self_telemetry import (
+    MonocleBatchSpanProcessor, SelfTelemetrySpanProcessor, get_self_telemetry
+)
 from monocle_apptrace.instrumentation.common.utils import (
     load_scopes,
     setup_readablespan_patch,
@@ -29,8 +37,11 @@ from monocle_apptrace.instrumentation.common.utils import (
     build_setup_signature,
     check_duplicate_setup,
 )
-from monocle_apptrace.instrumentation.common.constants import MONOCLE_INSTRUMENTOR, MONOCLE_WORKFLOW_NAME_KEY
+from monocle_apptrace.instrumentation.common.constants import (
+    MONOCLE_INSTRUMENTOR, MONOCLE_WORKFLOW_NAME_KEY, TAIL_SAMPLING, LAZY_INSTRUMENTATION
+)
 from functools import wraps
+from collections import ChainMap
 
 logger = logging.getLogger(__name__)
 
@@ -59,6 +70,7 @@ class MonocleInstrumentor(BaseInstrumentor):
     instrumented_method_list: list[object] = []
     handlers:Dict[str,SpanHandler] = None # dict of handlers
     union_with_default_methods: bool = False
+    lazy_instrumentation: LazyInstrumentation = None
 
     def __init__(
             self,
@@ -68,14 +80,9 @@ class MonocleInstrumentor(BaseInstrumentor):
             union_with_default_methods: bool = True
             ) -> None:
         self.user_wrapper_methods = user_wrapper_methods or []
-        self.handlers = handlers
+        # the default handlers are created on first use
+        self.handlers = ChainMap(handlers if handlers is not None else {}, MONOCLE_SPAN_HANDLERS)
         self.exporters = exporters
-        if self.handlers is not None:
-            for key, val in MONOCLE_SPAN_HANDLERS.items():
-                if key not in self.handlers:
-                    self.handlers[key] = val
-        else:
-            self.handlers = MONOCLE_SPAN_HANDLERS
         self.union_with_default_methods = union_with_default_methods
         super().__init__()
 
@@ -107,8 +114,9 @@ class MonocleInstrumentor(BaseInstrumentor):
         tracer = get_tracer(instrumenting_module_name=MONOCLE_INSTRUMENTOR, tracer_provider=tracer_provider)
 
         final_method_list = []
-        if self.union_with_default_methods is True:
-            final_method_list= final_method_list + DEFAULT_METHODS_LIST
+        lazy = os.environ.get(LAZY_INSTRUMENTATION, "true").lower() == "true"
+        if self.union_with_default_methods is True and not lazy:
+            final_method_list= final_method_list + get_default_methods()
 
         for method in self.user_wrapper_methods:
             if isinstance(method, dict):
@@ -124,34 +132,47 @@ class MonocleInstrumentor(BaseInstrumentor):
             final_method_list.append(method)
         
         for method_config in final_method_list:
-            target_package = method_config.get("package", None)
-            target_object = method_config.get("object", None)
-            target_method = method_config.get("method", None)
-            wrapped_by = method_config.get("wrapper_method", None)
-            #get the requisite handler or default one
-            handler_key = method_config.get("span_handler",'default')
-            try:
-                handler =  self.handlers.get(handler_key)
-                if not handler:
-                    logger.warning("incorrect or empty handler falling back to default handler")
-                    handler = self.handlers.get('default')
-                handler.set_instrumentor(self.get_instrumentor(tracer))
-                wrap_function_wrapper(
-                    target_package,
-                    f"{target_object}.{target_method}" if target_object else target_method,
-                    wrapped_by(tracer, handler, method_config),
-                )
-                self.instrumented_method_list.append(method_config)
-            except ModuleNotFoundError as e:
-                logger.debug(f"ignoring module {e.name}")
-
-            except Exception as ex:
-                logger.error(f"""_instrument wrap exception: {str(ex)}
-                            for package: {target_package},
-                            object:{target_object},
-                            method:{target_method}""")
+            self._wrap_method(tracer, method_config)
+
+        if self.union_with_default_methods is True and lazy:
+            # the default methods are wrapped as the frameworks they instrument are imported
+            self.lazy_instrumentation = LazyInstrumentation(lambda method_config: self._wrap_method(tracer, method_config))
+            self.lazy_instrumentation.activate()
+
+    def _wrap_method(self, tracer, method_config: dict) -> None:
+        target_package = method_config.get("package", None)
+        target_object = method_config.get("object", None)
+        target_method = method_config.get("method", None)
+        wrapped_by = method_config.get("wrapper_method", None)
+        #get the requisite handler or default one
+        handler_key = method_config.get("span_handler",'default')
+        try:
+            handler =  self.handlers.get(handler_key)
+            if not handler:
+                logger.warning("incorrect or empty handler falling back to default handler")
+                handler = self.handlers.get('default')
+            handler.set_instrumentor(self.get_instrumentor(tracer))
+            wrap_function_wrapper(
+                target_package,
+                f"{target_object}.{target_method}" if target_object else target_method,
+                wrapped_by(tracer, handler, method_config),
+            )
+            self.instrumented_method_list.append(method_config)
+            # compile the entity definitions once so that hydrate doesn't walk the dicts on every call
+            compile_method_plans(method_config)
+        except ModuleNotFoundError as e:
+            logger.debug(f"ignoring module {e.name}")
+
+        except Exception as ex:
+            logger.error(f"""_instrument wrap exception: {str(ex)}
+                        for package: {target_package},
+                        object:{target_object},
+                        method:{target_method}""")
 
     def _uninstrument(self, **kwargs):
+        if self.lazy_instrumentation is not None:
+            self.lazy_instrumentation.deactivate()
+            self.lazy_instrumentation = None
         for wrapped_method in self.instrumented_method_list:
             try:
                 wrap_package = wrapped_method.get("package")
@@ -219,7 +240,8 @@ def setup_monocle_telemetry(
         The name of the workflow to be used as the service name in telemetry.
     span_processors : List[SpanProcessor], optional
         Custom span processors to use instead of the default ones. If None, 
-        BatchSpanProcessors with Monocle exporters will be used. This can't be combined with `monocle_exporters_list`.
+        MonocleBatchSpanProcessors with Monocle exporters will be used. This can't be combined with `monocle_exporters_list`.
+        When MONOCLE_TAIL_SAMPLING is true, the processors only receive the traces kept by a TailSamplingSpanProcessor.
     span_handlers : Dict[str, SpanHandler], optional
         Dictionary of span handlers to be used by the instrumentor, mapping handler names to handler objects.
     wrapper_methods : List[Union[dict, WrapperMethod]], optional
@@ -229,7 +251,7 @@ def setup_monocle_telemetry(
         If False, only use the provided wrapper_methods.
     monocle_exporters_list : str, optional
         Comma-separated list of exporters to use. This will override the env setting MONOCLE_EXPORTERS.
-        Supported exporters are: s3, blob, okahu, file, memory, console, otlp. 
+        Supported exporters are: s3, blob, okahu, file, memory, console, otlp, gcs, collector. 
         For OTLP exporter, configure the endpoint via OTEL_EXPORTER_OTLP_ENDPOINT environment variable.
         This can't be combined with `span_processors`.
     """
@@ -242,6 +264,9 @@ def setup_monocle_telemetry(
         monocle_exporters_list=monocle_exporters_list,
     )
 
+    # hosting and SDK attributes, detected once for all the spans
+    refresh_monocle_resource()
+
     if check_duplicate_setup(
         workflow_name=workflow_name,
         previous_signature=get_monocle_setup_signature(),
@@ -250,13 +275,16 @@ def setup_monocle_telemetry(
     ):
         return get_monocle_instrumentor()
 
-    resource = Resource(attributes={
+    resource = MonocleResourceDetector().detect().merge(Resource(attributes={
         SERVICE_NAME: workflow_name
-    })
+    }))
     if span_processors and monocle_exporters_list:
         raise ValueError("span_processors and monocle_exporters_list can't be used together")
     exporters:List[SpanExporter] = get_monocle_exporter(monocle_exporters_list)
-    span_processors = span_processors or [BatchSpanProcessor(exporter) for exporter in exporters]
+    span_processors = span_processors or [MonocleBatchSpanProcessor(exporter) for exporter in exporters]
+    if os.environ.get(TAIL_SAMPLING, "false").lower() == "true":
+        # buffer each trace once and forward only the kept traces to all the processors
+        span_processors = [TailSamplingSpanProcessor(span_processors)]
     set_monocle_span_processor(MonocleSynchronousMultiSpanProcessor())
     set_tracer_provider(TracerProvider(resource=resource, active_span_processor=get_monocle_span_processor()))
     set_workflow_name(workflow_name)
@@ -274,6 +302,13 @@ def setup_monocle_telemetry(
             tracer_provider_default.add_span_processor(processor)
         else:
             get_tracer_provider().add_span_processor(processor)
+    if get_self_telemetry().enabled:
+        # counts the spans started and ended, next to the exporting processors
+        telemetry_processor = SelfTelemetrySpanProcessor()
+        if not is_proxy_provider:
+            tracer_provider_default.add_span_processor(telemetry_processor)
+        else:
+            get_tracer_provider().add_span_processor(telemetry_processor)
     if is_proxy_provider:
         trace.set_tracer_provider(get_tracer_provider())
     instrumentor = MonocleInstrumentor(user_wrapper_methods=wrapper_methods or [], exporters=exporters,
@@ -0,0 +1,239 @@
+"""
+Registry of the default instrumentation, loaded lazily.
+
+Every metamodel is registered with the modules whose import makes its instrumentation relevant, the metamodel's
+method definitions and span handlers are only imported when needed. ``LazyInstrumentation`` installs post import
+hooks (a ``sys.meta_path`` finder, through wrapt) on those trigger modules. When one of them is imported, before or
+after ``setup_monocle_telemetry``, the metamodel's methods are loaded and the methods under that module are wrapped.
+Methods targeting a package that re-exports classes, eg. ``langchain.chat_models.base``, are wrapped when the module
+defining the classes is imported, as applications using ``langchain_core`` only never import ``langchain``.
+Methods under a trigger module that is still initializing, eg. ``flask`` when its import of ``werkzeug`` loads the
+flask metamodel, are applied by the post import hook of that module once it is fully imported.
+Wrapping imports the target modules, as targets may re-export classes the application reaches through other modules.
+Frameworks that the application never imports cost nothing at startup.
+
+Set ``MONOCLE_LAZY_INSTRUMENTATION=false`` to wrap all the default methods when the telemetry is set up.
+"""
+import importlib
+import logging
+import sys
+import threading
+from collections.abc import Mapping
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+from wrapt import register_post_import_hook
+from monocle_apptrace.instrumentation.common.span_handler import SpanHandler
+
+logger = logging.getLogger(__name__)
+
+_METAMODEL = "monocle_apptrace.instrumentation.metamodel"
+
+class MetamodelEntry(NamedTuple):
+    name: str
+    # modules whose import loads the metamodel, every method package is one of them or a submodule
+    trigger_modules: Tuple[str, ...]
+    # module and attribute of the method definitions list
+    methods: Tuple[str, str]
+    # method package re-exporting classes -> module defining them, the methods are applied when the defining module
+    # is imported, applications can reach the classes without importing the re-exporting package
+    defining_modules: Dict[str, str] = {}
+
+# in the order the default methods are wrapped
+DEFAULT_METAMODELS: Tuple[MetamodelEntry, ...] = (
+    MetamodelEntry("langchain", ("langchain", "langchain_core"), (f"{_METAMODEL}.langchain.methods", "LANGCHAIN_METHODS"),
+                   {"langchain.prompts.base": "langchain_core.prompts.base",
+                    "langchain.chat_models.base": "langchain_core.language_models.chat_models",
+                    "langchain.schema": "langchain_core.output_parsers.base",
+                    "langchain.schema.runnable": "langchain_core.runnables.base"}),
+    MetamodelEntry("llamaindex", ("llama_index",), (f"{_METAMODEL}.llamaindex.methods", "LLAMAINDEX_METHODS")),
+    MetamodelEntry("haystack", ("haystack", "haystack_integrations"), (f"{_METAMODEL}.haystack.methods", "HAYSTACK_METHODS")),
+    MetamodelEntry("botocore", ("botocore",), (f"{_METAMODEL}.botocore.methods", "BOTOCORE_METHODS")),
+    MetamodelEntry("flask", ("flask", "werkzeug"), (f"{_METAMODEL}.flask.methods", "FLASK_METHODS")),
+    MetamodelEntry("requests", ("requests",), (f"{_METAMODEL}.requests.methods", "REQUESTS_METHODS")),
+    MetamodelEntry("langgraph", ("langgraph", "langchain_core"), (f"{_METAMODEL}.langgraph.methods", "LANGGRAPH_METHODS")),
+    MetamodelEntry("crew_ai", ("crewai",), (f"{_METAMODEL}.crew_ai.methods", "CREW_AI_METHODS")),
+    MetamodelEntry("msagent", ("agent_framework",), (f"{_METAMODEL}.msagent.methods", "MSAGENT_METHODS")),
+    MetamodelEntry("agents", ("agents",), (f"{_METAMODEL}.agents.methods", "AGENTS_METHODS")),
+    MetamodelEntry("openai", ("openai",), (f"{_METAMODEL}.openai.methods", "OPENAI_METHODS")),
+    MetamodelEntry("teamsai", ("teams",), (f"{_METAMODEL}.teamsai.methods", "TEAMAI_METHODS")),
+    MetamodelEntry("anthropic", ("anthropic",), (f"{_METAMODEL}.anthropic.methods", "ANTHROPIC_METHODS")),
+    MetamodelEntry("aiohttp", ("aiohttp",), (f"{_METAMODEL}.aiohttp.methods", "AIOHTTP_METHODS")),
+    MetamodelEntry("azureaiinference", ("azure.ai.inference",),
+                   (f"{_METAMODEL}.azureaiinference.methods", "AZURE_AI_INFERENCE_METHODS")),
+    MetamodelEntry("azfunc", (f"{_METAMODEL}.azfunc.wrapper",), (f"{_METAMODEL}.azfunc.methods", "AZFUNC_HTTP_METHODS")),
+    MetamodelEntry("gemini", ("google.genai",), (f"{_METAMODEL}.gemini.methods", "GEMINI_METHODS")),
+    MetamodelEntry("fastapi", ("fastapi", "starlette"), (f"{_METAMODEL}.fastapi.methods", "FASTAPI_METHODS")),
+    MetamodelEntry("fastmcp", ("fastmcp",), (f"{_METAMODEL}.fastmcp.methods", "FASTMCP_METHODS")),
+    MetamodelEntry("lambdafunc", (f"{_METAMODEL}.lambdafunc.wrapper",),
+                   (f"{_METAMODEL}.lambdafunc.methods", "LAMBDA_HTTP_METHODS")),
+    MetamodelEntry("mcp", ("mcp", "langchain_mcp_adapters"), (f"{_METAMODEL}.mcp.methods", "MCP_METHODS")),
+    MetamodelEntry("a2a", ("a2a",), (f"{_METAMODEL}.a2a.methods", "A2A_CLIENT_METHODS")),
+    MetamodelEntry("litellm", ("litellm",), (f"{_METAMODEL}.litellm.methods", "LITELLM_METHODS")),
+    MetamodelEntry("adk", ("google.adk",), (f"{_METAMODEL}.adk.methods", "ADK_METHODS")),
+    MetamodelEntry("mistral", ("mistralai",), (f"{_METAMODEL}.mistral.methods", "MISTRAL_METHODS")),
+    MetamodelEntry("hugging_face", ("huggingface_hub",), (f"{_METAMODEL}.hugging_face.methods", "HUGGING_FACE_METHODS")),
+    MetamodelEntry("strands", ("strands",), (f"{_METAMODEL}.strands.methods", "STRAND_METHODS")),
+    MetamodelEntry("agentcore", ("bedrock_agentcore",), (f"{_METAMODEL}.agentcore.methods", "AGENTCORE_METHODS")),
+)
+
+# span handler name -> module and class of the handler
+DEFAULT_SPAN_HANDLERS: Dict[str, Tuple[str, str]] = {
+    "default": ("monocle_apptrace.instrumentation.common.span_handler", "SpanHandler"),
+    "aiohttp_handler": (f"{_METAMODEL}.aiohttp._helper", "aiohttpSpanHandler"),
+    "botocore_handler": (f"{_METAMODEL}.botocore.handlers.botocore_span_handler", "BotoCoreSpanHandler"),
+    "flask_handler": (f"{_METAMODEL}.flask._helper", "FlaskSpanHandler"),
+    "flask_response_handler": (f"{_METAMODEL}.flask._helper", "FlaskResponseSpanHandler"),
+    "request_handler": (f"{_METAMODEL}.requests._helper", "RequestSpanHandler"),
+    "non_framework_handler": ("monocle_apptrace.instrumentation.common.span_handler", "NonFrameworkSpanHandler"),
+    "openai_handler": (f"{_METAMODEL}.openai.openai_processor", "OpenAISpanHandler"),
+    "openai_agents_handler": (f"{_METAMODEL}.openai.openai_processor", "OpenAIAgentsSpanHandler"),
+    "azure_func_handler": (f"{_METAMODEL}.azfunc._helper", "azureSpanHandler"),
+    "mcp_agent_handler": (f"{_METAMODEL}.mcp.mcp_processor", "MCPAgentHandler"),
+    "fastapi_handler": (f"{_METAMODEL}.fastapi._helper", "FastAPISpanHandler"),
+    "fastapi_response_handler": (f"{_METAMODEL}.fastapi._helper", "FastAPIResponseSpanHandler"),
+    "langgraph_agent_handler": (f"{_METAMODEL}.langgraph.langgraph_processor", "LanggraphAgentHandler"),
+    "langgraph_tool_handler": (f"{_METAMODEL}.langgraph.langgraph_processor", "LanggraphToolHandler"),
+    "crew_ai_agent_handler": (f"{_METAMODEL}.crew_ai.crew_ai_processor", "CrewAIAgentHandler"),
+    "crew_ai_task_handler": (f"{_METAMODEL}.crew_ai.crew_ai_processor", "CrewAITaskHandler"),
+    "crew_ai_tool_handler": (f"{_METAMODEL}.crew_ai.crew_ai_processor", "CrewAIToolHandler"),
+    "msagent_request_handler": (f"{_METAMODEL}.msagent.msagent_processor", "MSAgentRequestHandler"),
+    "msagent_agent_handler": (f"{_METAMODEL}.msagent.msagent_processor", "MSAgentAgentHandler"),
+    "msagent_tool_handler": (f"{_METAMODEL}.msagent.msagent_processor", "MSAgentToolHandler"),
+    "agents_agent_handler": (f"{_METAMODEL}.agents.agents_processor", "AgentsSpanHandler"),
+    "llamaindex_tool_handler": (f"{_METAMODEL}.llamaindex.llamaindex_processor", "LlamaIndexToolHandler"),
+    "llamaindex_agent_handler": (f"{_METAMODEL}.llamaindex.llamaindex_processor", "LlamaIndexAgentHandler"),
+    "llamaindex_single_agent_tool_handler": (f"{_METAMODEL}.llamaindex.llamaindex_processor",
+                                             "LlamaIndexSingleAgenttToolHandlerWrapper"),
+    "lambda_func_handler": (f"{_METAMODEL}.lambdafunc._helper", "lambdaSpanHandler"),
+    "adk_handler": (f"{_METAMODEL}.adk.adk_handler", "AdkSpanHandler"),
+    "strands_handler": (f"{_METAMODEL}.strands.strands_processor", "StrandsSpanHandler"),
+}
+
+_load_lock = threading.RLock()
+_metamodel_methods: Dict[str, List[dict]] = {}
+
+def load_metamodel_methods(entry: MetamodelEntry) -> List[dict]:
+    """Import the method definitions of a metamodel, once."""
+    methods = _metamodel_methods.get(entry.name)
+    if methods is None:
+        with _load_lock:
+            methods = _metamodel_methods.get(entry.name)
+            if methods is None:
+                module_name, attribute = entry.methods
+                methods = getattr(importlib.import_module(module_name), attribute)
+                _metamodel_methods[entry.name] = methods
+    return methods
+
+def get_trigger_module(entry: MetamodelEntry, package: str) -> str:
+    """The module whose import applies a method: the defining module of re-exported classes, else the most specific
+    trigger module of the metamodel that covers the method package."""
+    if package in entry.defining_modules:
+        return entry.defining_modules[package]
+    covering = [module for module in entry.trigger_modules if package == module or package.startswith(module + ".")]
+    return max(covering, key=len) if covering else package
+
+def get_default_methods() -> List[dict]:
+    """All the default methods, importing every metamodel."""
+    methods = []
+    for entry in DEFAULT_METAMODELS:
+        methods.extend(load_metamodel_methods(entry))
+    return methods
+
+class LazySpanHandlers(Mapping):
+    """The default span handlers by name, each handler is imported and created on first access."""
+
+    def __init__(self, handler_classes: Dict[str, Tuple[str, str]]):
+        self._handler_classes = handler_classes
+        self._handlers: Dict[str, SpanHandler] = {}
+
+    def __getitem__(self, key: str) -> SpanHandler:
+        handler = self._handlers.get(key)
+        if handler is None:
+            module_name, class_name = self._handler_classes[key]
+            with _load_lock:
+                handler = self._handlers.get(key)
+                if handler is None:
+                    handler = getattr(importlib.import_module(module_name), class_name)()
+                    self._handlers[key] = handler
+        return handler
+
+    def __contains__(self, key) -> bool:
+        return key in self._handler_classes
+
+    def __iter__(self):
+        return iter(self._handler_classes)
+
+    def __len__(self) -> int:
+        return len(self._handler_classes)
+
+MONOCLE_SPAN_HANDLERS = LazySpanHandlers(DEFAULT_SPAN_HANDLERS)
+
+def _is_initializing(module) -> bool:
+    return getattr(getattr(module, "__spec__", None), "_initializing", False) is True
+
+class LazyInstrumentation:
+    """Applies the default methods as the modules they instrument are imported.
+
+    Post import hooks can't be removed, ``deactivate`` turns the hooks of this instance into no-ops."""
+
+    def __init__(self, apply_method: Callable[[dict], None],
+                 metamodels: Optional[Tuple[MetamodelEntry, ...]] = None):
+        self.apply_method = apply_method
+        self.metamodels = DEFAULT_METAMODELS if metamodels is None else metamodels
+        self.active = False
+        self._loaded_metamodels = set()
+        # module name -> methods waiting for the module to finish initializing
+        self._deferred_methods: Dict[str, List[dict]] = {}
+        self._lock = threading.RLock()
+
+    def activate(self) -> None:
+        self.active = True
+        for entry in self.metamodels:
+            for module_name in entry.trigger_modules:
+                # runs right away when the module is already imported
+                register_post_import_hook(self._metamodel_hook(entry), module_name)
+            for module_name in set(entry.defining_modules.values()):
+                register_post_import_hook(self._apply_deferred_methods, module_name)
+
+    def deactivate(self) -> None:
+        self.active = False
+
+    def _metamodel_hook(self, entry: MetamodelEntry):
+        def on_import(module):
+            self._apply_deferred_methods(module)
+            with self._lock:
+                if not self.active or entry.name in self._loaded_metamodels:
+                    return
+                self._loaded_metamodels.add(entry.name)
+            try:
+                methods = load_metamodel_methods(entry)
+            except Exception as e:
+                logger.warning(f"Unable to load the {entry.name} instrumentation: {e}")
+                return
+            for method_config in methods:
+                module_name = get_trigger_module(entry, method_config["package"])
+                if module_name != module.__name__ and _is_initializing(sys.modules.get(module_name)):
+                    # eg. flask importing werkzeug loads the flask metamodel while flask is half initialized, wrapping
+                    # now would import into the circular import, the post import hook of flask applies the method
+                    with self._lock:
+                        self._deferred_methods.setdefault(module_name, []).append(method_config)
+                    continue
+                # applied once the framework module covering the target is imported, right away for this one
+                register_post_import_hook(self._method_hook(method_config), module_name)
+        return on_import
+
+    def _method_hook(self, method_config: dict):
+        def on_import(module):
+            if self.active:
+                self.apply_method(method_config)
+        return on_import
+
+    def _apply_deferred_methods(self, module) -> None:
+        with self._lock:
+            methods = self._deferred_methods.pop(getattr(module, "__name__", None), None)
+        if methods and self.active:
+            for method_config in methods:
+                self.apply_method(method_config)
+
+    def get_loaded_metamodels(self) -> List[str]:
+        with self._lock:
+            return [entry.name for entry in self.metamodels if entry.name in self._loaded_metamodels]
@@ -9,9 +9,9 @@ from opentelemetry.trace.span import INVALID_SPAN
 from opentelemetry.trace import get_tracer
 from contextlib import contextmanager, asynccontextmanager
 from monocle_apptrace.instrumentation.common.span_handler import SpanHandler
-from monocle_apptrace.instrumentation.common.wrapper import atask_wrapper, get_current_monocle_span, set_monocle_span_in_context, task_wrapper, start_as_monocle_span
+from monocle_apptrace.instrumentation.common.wrapper import atask_wrapper, get_current_monocle_span, task_wrapper, start_as_monocle_span
 from monocle_apptrace.instrumentation.common.utils import (
-    http_route_handler, http_async_route_handler
+    http_route_handler, http_async_route_handler, set_monocle_span_in_context
 )
 from monocle_apptrace.instrumentation.common.constants import MONOCLE_INSTRUMENTOR
 from monocle_apptrace.instrumentation.common.instrumentor import get_tracer_provider
@@ -0,0 +1,106 @@
+"""
+Fork and process pool support.
+
+Monocle keeps worker threads, connection pools and open files in long lived objects: the upload engines, the Okahu
+exporter session, the S3, Azure Blob and GCS clients, the trace files of the file exporter, the export spool, the trace
+buffers. After ``os.fork``, eg.
+gunicorn or uvicorn prefork workers and ``multiprocessing`` with the fork start method, the child process gets copies
+of them without their threads, with the work queued by the parent and sharing the connections and files of the
+parent. Objects registered with ``register_fork_handler`` are reset in the child: the work of the parent is
+discarded (the parent still exports it), locks are recreated, threads are restarted on first use and sessions and
+files are reopened. The OpenTelemetry batch span processors reinitialize themselves the same way.
+
+``monocle_process_task`` wraps a function submitted to a process pool so it runs under the Monocle span and scopes of
+the code that submitted it, and flushes the spans of the task before returning, as pool workers can be terminated
+without running their exit handlers. With the spawn or forkserver start methods, call ``setup_monocle_telemetry`` in
+the pool initializer, the workers don't inherit the setup of the parent.
+"""
+import logging
+import os
+import weakref
+from typing import Callable, Optional
+from opentelemetry.context import attach
+from opentelemetry.trace import NonRecordingSpan, SpanContext, TraceFlags
+from monocle_apptrace.instrumentation.common.utils import (
+    get_current_monocle_span, get_monocle_span_context, get_scopes, remove_scopes, set_scopes
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FLUSH_TIMEOUT_MILLIS = 30000
+
+_fork_handlers = weakref.WeakSet()
+
+def register_fork_handler(handler) -> None:
+    """
+    Register an object implementing ``_before_fork`` and/or ``_after_fork_in_child``, held weakly. ``_before_fork``
+    runs in the parent, eg. to flush buffered files so the child doesn't write the buffers again, and
+    ``_after_fork_in_child`` resets the object in the child.
+    """
+    _fork_handlers.add(handler)
+
+def _run_fork_handlers(method_name: str) -> None:
+    for handler in list(_fork_handlers):
+        method = getattr(handler, method_name, None)
+        if method is None:
+            continue
+        try:
+            method()
+        except Exception as e:
+            logger.debug(f"Error running {method_name} of {type(handler).__name__}: {e}")
+
+def _before_fork() -> None:
+    _run_fork_handlers("_before_fork")
+
+def _after_fork_in_child() -> None:
+    _run_fork_handlers("_after_fork_in_child")
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(before=_before_fork, after_in_child=_after_fork_in_child)
+
+def flush_monocle_spans(timeout_millis: int = DEFAULT_FLUSH_TIMEOUT_MILLIS) -> bool:
+    """Export the spans ended so far by the Monocle tracer provider."""
+    from monocle_apptrace.instrumentation.common.instrumentor import get_tracer_provider
+    tracer_provider = get_tracer_provider()
+    if tracer_provider is None:
+        return True
+    return tracer_provider.force_flush(timeout_millis)
+
+class MonocleProcessTask:
+    """Picklable task running a function under the Monocle span and scopes it was created in."""
+
+    def __init__(self, func: Callable, flush: bool = True, flush_timeout_millis: int = DEFAULT_FLUSH_TIMEOUT_MILLIS):
+        self.func = func
+        self.flush = flush
+        self.flush_timeout_millis = flush_timeout_millis
+        span_context = get_current_monocle_span().get_span_context()
+        # plain values, span and context objects don't pickle
+        self.parent: Optional[tuple] = (span_context.trace_id, span_context.span_id, int(span_context.trace_flags)) \
+            if span_context.is_valid else None
+        self.scopes = get_scopes()
+
+    def __call__(self, *args, **kwargs):
+        token = None
+        if self.parent is not None:
+            trace_id, span_id, trace_flags = self.parent
+            parent_span = NonRecordingSpan(SpanContext(trace_id, span_id, is_remote=True,
+                                                       trace_flags=TraceFlags(trace_flags)))
+            token = attach(get_monocle_span_context(parent_span, set_current_span=True, scopes=self.scopes))
+        elif self.scopes:
+            token = set_scopes(self.scopes)
+        try:
+            return self.func(*args, **kwargs)
+        finally:
+            remove_scopes(token)
+            if self.flush:
+                try:
+                    flush_monocle_spans(self.flush_timeout_millis)
+                except Exception as e:
+                    logger.warning(f"Error flushing the spans of process task {getattr(self.func, '__name__', '')}: {e}")
+
+def monocle_process_task(func: Callable, flush: bool = True) -> MonocleProcessTask:
+    """
+    Wrap a function submitted to a process pool, eg. ``executor.submit(monocle_process_task(step), state)``, so its
+    spans are children of the current Monocle span and carry the current scopes. The function must be picklable.
+    """
+    return MonocleProcessTask(func, flush=flush)
@@ -0,0 +1,177 @@
+"""
+Compiled form of the ``output_processor`` entity definitions.
+
+The entity definitions in ``metamodel/*/entities/*.py`` are plain dicts that are convenient to author
+but expensive to interpret on every instrumented call. ``get_output_processor_plan`` turns such a dict into
+an immutable ``OutputProcessorPlan`` once, and ``SpanHandler`` hydrates spans from the plan afterwards.
+
+An entity attribute marked ``"static": True`` is evaluated once per instance and then reused, for values such as the
+provider, endpoint or deployment that only depend on a long-lived client object. Its accessor must only read
+``arguments['instance']``.
+"""
+import logging
+import sys
+import weakref
+from threading import Lock
+from typing import Any, Callable, Dict, NamedTuple, Optional, Tuple
+from monocle_apptrace.instrumentation.common import accessor_profiler
+
+logger = logging.getLogger(__name__)
+
+POST_EXECUTION_PHASE = "post_execution"
+STATIC_ACCESSOR = "static"
+EVENTS_SKIP_PREFIX = "events."
+# root spans carry workflow and hosting entities, so entity indexes can be shifted by this much
+MAX_ENTITY_INDEX_OFFSET = 2
+# upper bound on number of distinct output processors to cache, protects against per-call generated dicts
+MAX_CACHED_PLANS = 1024
+# events opt in to running their accessors at export time instead of inside the wrapped call, only for accessors
+# that don't raise MonocleSpanException, set scopes or span attributes, as the span has ended by then
+DEFERRABLE_EVENT = "deferrable"
+
+class AttributeAccessor(NamedTuple):
+    attribute: str
+    accessor: Callable[[dict], Any]
+    # keys[i] is the interned span attribute name "entity.{i+1}.{attribute}"
+    keys: Tuple[str, ...]
+
+class EntityPlan(NamedTuple):
+    pre_execution: Tuple[AttributeAccessor, ...]
+    post_execution: Tuple[AttributeAccessor, ...]
+
+class EventAttributeAccessor(NamedTuple):
+    attribute: Optional[str]
+    accessor: Callable[[dict], Any]
+
+class EventPlan(NamedTuple):
+    name: str
+    skip_key: str
+    attributes: Tuple[EventAttributeAccessor, ...]
+    deferrable: bool
+
+class OutputProcessorPlan(NamedTuple):
+    span_type: Optional[str]
+    subtype: Any
+    entities: Tuple[EntityPlan, ...]
+    events: Tuple[EventPlan, ...]
+    has_attributes: bool
+    has_events: bool
+
+def _evict_static_value(values: dict, key: int, ref: weakref.ref) -> None:
+    cached = values.get(key)
+    if cached is not None and cached[0] is ref:
+        del values[key]
+
+class StaticAccessor:
+    """Accessor evaluated once per instance, the value is dropped along with the instance."""
+    __slots__ = ("accessor", "values")
+
+    def __init__(self, accessor: Callable[[dict], Any]):
+        self.accessor = accessor
+        # keyed by the instance id, the instances of pydantic based clients aren't hashable
+        self.values: Dict[int, Tuple[weakref.ref, Any]] = {}
+
+    def __call__(self, arguments: dict):
+        instance = arguments.get("instance")
+        if instance is None:
+            return self.accessor(arguments)
+        key = id(instance)
+        cached = self.values.get(key)
+        if cached is not None and cached[0]() is instance:
+            return cached[1]
+        value = self.accessor(arguments)
+        try:
+            ref = weakref.ref(instance, lambda ref, values=self.values, key=key: _evict_static_value(values, key, ref))
+        except TypeError:
+            # instance can't be weakly referenced, evaluated on every call
+            return value
+        self.values[key] = (ref, value)
+        return value
+
+_plan_cache: dict[int, Tuple[dict, OutputProcessorPlan]] = {}
+_plan_cache_lock = Lock()
+
+def _processor_type(span_type) -> str:
+    return span_type if isinstance(span_type, str) else "generic"
+
+def _compile_entity(processors, max_index: int, entity_index: int, processor_type: str) -> EntityPlan:
+    profiler = accessor_profiler.get_accessor_profiler()
+    pre_execution = []
+    post_execution = []
+    for processor in processors:
+        attribute = processor.get('attribute')
+        accessor = processor.get('accessor')
+        if not (attribute and accessor):
+            logger.debug(f"{' and '.join([key for key in ['attribute', 'accessor'] if not processor.get(key)])} not found or incorrect in entity JSON")
+            continue
+        keys = tuple(sys.intern(f"entity.{index + 1}.{attribute}") for index in range(max_index))
+        if processor.get(STATIC_ACCESSOR):
+            accessor = StaticAccessor(accessor)
+        accessor = profiler.wrap(accessor, processor_type, f"entity.{entity_index + 1}.{attribute}",
+                                 processor.get('accessor'))
+        compiled = AttributeAccessor(attribute, accessor, keys)
+        if processor.get('phase', '') == POST_EXECUTION_PHASE:
+            post_execution.append(compiled)
+        else:
+            pre_execution.append(compiled)
+    return EntityPlan(tuple(pre_execution), tuple(post_execution))
+
+def _compile_event(event, span_type: Optional[str]) -> EventPlan:
+    event_name = event.get("name")
+    profiler = accessor_profiler.get_accessor_profiler()
+    processor_type = _processor_type(span_type)
+    attributes = tuple(
+        EventAttributeAccessor(attribute.get("attribute"), profiler.wrap(
+            attribute.get("accessor"), processor_type, f"{event_name}.{attribute.get('attribute') or '*'}"))
+        for attribute in event.get("attributes", [])
+        if attribute.get("accessor")
+    )
+    deferrable = event.get(DEFERRABLE_EVENT) is True
+    return EventPlan(sys.intern(event_name), sys.intern(EVENTS_SKIP_PREFIX + event_name), attributes, deferrable)
+
+def compile_output_processor(output_processor: dict) -> OutputProcessorPlan:
+    """Build an immutable plan from an output_processor entity definition."""
+    entity_definitions = output_processor.get("attributes") or []
+    max_index = len(entity_definitions) + MAX_ENTITY_INDEX_OFFSET + 1
+    span_type = output_processor.get('type')
+    entities = tuple(_compile_entity(processors, max_index, index, _processor_type(span_type))
+                     for index, processors in enumerate(entity_definitions))
+    events = tuple(_compile_event(event, span_type) for event in output_processor.get("events") or [])
+    return OutputProcessorPlan(
+        span_type=span_type,
+        subtype=output_processor.get('subtype'),
+        entities=entities,
+        events=events,
+        has_attributes='attributes' in output_processor,
+        has_events='events' in output_processor,
+    )
+
+def get_output_processor_plan(output_processor: dict) -> Optional[OutputProcessorPlan]:
+    """Return the cached plan for an output_processor, compiling it on first use."""
+    if output_processor is None:
+        return None
+    cached = _plan_cache.get(id(output_processor))
+    if cached is not None and cached[0] is output_processor:
+        return cached[1]
+    plan = compile_output_processor(output_processor)
+    with _plan_cache_lock:
+        if len(_plan_cache) < MAX_CACHED_PLANS:
+            # hold a reference to the definition so that its id can't be reused by another dict
+            _plan_cache[id(output_processor)] = (output_processor, plan)
+    return plan
+
+def compile_method_plans(method_config: dict) -> None:
+    """Pre-compile the output processors referenced by a wrapper method config."""
+    try:
+        output_processor = method_config.get("output_processor")
+        if isinstance(output_processor, dict):
+            get_output_processor_plan(output_processor)
+        for processor in method_config.get("output_processor_list") or []:
+            if isinstance(processor, dict):
+                get_output_processor_plan(processor)
+    except Exception as e:
+        logger.debug(f"Error compiling output processor for {method_config.get('package')}: {e}")
+
+def clear_output_processor_plans() -> None:
+    with _plan_cache_lock:
+        _plan_cache.clear()
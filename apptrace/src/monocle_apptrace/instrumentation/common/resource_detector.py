@@ -0,0 +1,71 @@
+"""
+Detection of the app hosting and Monocle SDK attributes.
+
+The hosting service is identified from its environment variables (see ``service_type_map``). The detection runs once
+in ``setup_monocle_telemetry``: its attributes are added to the tracer provider ``Resource`` and kept as cached
+attribute blocks that are copied to the spans, instead of scanning the environment for every workflow span.
+
+If the environment changes after the setup, eg. variables set by a hosting runtime once the process has started,
+call ``refresh_monocle_resource()`` to detect the attributes again. The resource of the tracer provider is immutable,
+only the spans created after the refresh get the new hosting attributes.
+"""
+import os
+from typing import Dict, Optional, Tuple
+from opentelemetry.sdk.resources import Resource, ResourceDetector
+from monocle_apptrace.instrumentation.common.constants import (
+    APP_HOSTING_NAME, APP_HOSTING_TYPE, MONOCLE_SDK_LANGUAGE, MONOCLE_SDK_VERSION, service_name_map, service_type_map
+)
+from monocle_apptrace.instrumentation.common.utils import get_monocle_version
+
+APP_HOSTING_SPAN_INDEX = 2
+
+class MonocleResource:
+    """Detected attributes, and the attribute blocks set on the spans."""
+    __slots__ = ("hosting_type", "hosting_name", "sdk_attributes", "hosting_attributes")
+
+    def __init__(self, hosting_type: str, hosting_name: str):
+        self.hosting_type = hosting_type
+        self.hosting_name = hosting_name
+        self.sdk_attributes: Dict[str, str] = {
+            MONOCLE_SDK_VERSION: get_monocle_version(),
+            MONOCLE_SDK_LANGUAGE: "python",
+        }
+        self.hosting_attributes: Dict[str, str] = {
+            f"entity.{APP_HOSTING_SPAN_INDEX}.type": f"app_hosting.{hosting_type}",
+            f"entity.{APP_HOSTING_SPAN_INDEX}.name": hosting_name,
+        }
+
+    def to_resource_attributes(self) -> Dict[str, str]:
+        attributes = dict(self.sdk_attributes)
+        attributes[APP_HOSTING_TYPE] = self.hosting_type
+        attributes[APP_HOSTING_NAME] = self.hosting_name
+        return attributes
+
+def detect_app_hosting() -> Tuple[str, str]:
+    """Hosting service type and name from the environment, generic if none is found."""
+    for type_env, type_name in service_type_map.items():
+        if type_env in os.environ:
+            entity_name_env = service_name_map.get(type_name, "unknown")
+            return type_name, os.environ.get(entity_name_env, "generic")
+    return "generic", "generic"
+
+_monocle_resource: Optional[MonocleResource] = None
+
+def refresh_monocle_resource() -> MonocleResource:
+    """Detect the hosting and SDK attributes again, for the spans created from now on."""
+    global _monocle_resource
+    _monocle_resource = MonocleResource(*detect_app_hosting())
+    return _monocle_resource
+
+def get_monocle_resource() -> MonocleResource:
+    resource = _monocle_resource
+    if resource is None:
+        # spans created without setup_monocle_telemetry
+        resource = refresh_monocle_resource()
+    return resource
+
+class MonocleResourceDetector(ResourceDetector):
+    """OTel resource detector for the app hosting and Monocle SDK attributes."""
+
+    def detect(self) -> Resource:
+        return Resource(get_monocle_resource().to_resource_attributes())
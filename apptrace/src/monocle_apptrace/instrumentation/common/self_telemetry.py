@@ -0,0 +1,361 @@
+"""
+Health metrics of the Monocle tracing pipeline.
+
+Monocle records its own counters (spans started, ended, exported and dropped, export retries), histograms (export
+batch latency and bytes, wrapper overhead per span name) and gauges (batch processor queue depth, trace buffer sizes,
+upload queue depth, export circuit breaker state and spool size). They are reported through the OpenTelemetry metrics API under the ``monocle_apptrace`` meter,
+so they reach any meter provider the application configures, and can be pulled at any time with
+``get_self_telemetry_snapshot()``.
+
+Set ``MONOCLE_SELF_TELEMETRY`` to false to stop recording counters and histograms.
+"""
+import logging
+import os
+import threading
+import time
+import weakref
+from typing import Callable, Dict, Iterable, Optional, Sequence, Tuple
+from opentelemetry import metrics
+from opentelemetry.sdk.trace import ReadableSpan, Span, SpanProcessor
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, SpanExporter, SpanExportResult
+from monocle_apptrace.instrumentation.common.constants import SELF_TELEMETRY
+from monocle_apptrace.instrumentation.common.multiprocess import register_fork_handler
+
+logger = logging.getLogger(__name__)
+
+METER_NAME = "monocle_apptrace"
+
+SPANS_STARTED = "monocle.spans.started"
+SPANS_ENDED = "monocle.spans.ended"
+SPANS_EXPORTED = "monocle.spans.exported"
+SPANS_DROPPED = "monocle.spans.dropped"
+TRACES_DROPPED = "monocle.traces.dropped"
+EXPORT_DURATION = "monocle.export.duration"
+EXPORT_BYTES = "monocle.export.bytes"
+EXPORT_RETRIES = "monocle.export.retries"
+UPLOADS = "monocle.uploads"
+EXPORT_BREAKER_TRIPS = "monocle.export.breaker_trips"
+EXPORT_SPOOL = "monocle.export.spool"
+COLLECTOR_SPANS = "monocle.collector.spans"
+TRACE_BUFFER_EVICTIONS = "monocle.trace_buffer.evictions"
+WRAPPER_OVERHEAD = "monocle.wrapper.overhead"
+PROCESSOR_QUEUE_DEPTH = "monocle.processor.queue_depth"
+TRACE_BUFFER_TRACES = "monocle.trace_buffer.traces"
+TRACE_BUFFER_SPANS = "monocle.trace_buffer.spans"
+TRACE_BUFFER_BYTES = "monocle.trace_buffer.bytes"
+UPLOAD_QUEUE_DEPTH = "monocle.upload.queue_depth"
+EXPORT_BREAKER_STATE = "monocle.export.breaker_state"
+EXPORT_SPOOL_BYTES = "monocle.export.spool.bytes"
+EXPORT_SPOOL_BATCHES = "monocle.export.spool.batches"
+
+# reasons of dropped spans and traces
+DROP_QUEUE_FULL = "queue_full"
+DROP_EXPORT_FAILED = "export_failed"
+DROP_WRITE_FAILED = "write_failed"
+DROP_FILTERED = "filtered"
+DROP_HEAD_SAMPLING = "head_sampling"
+DROP_TAIL_SAMPLING = "tail_sampling"
+
+COUNTER = "counter"
+HISTOGRAM = "histogram"
+GAUGE = "gauge"
+
+METRICS: Dict[str, Tuple[str, str, str]] = {
+    SPANS_STARTED: (COUNTER, "{span}", "Spans started"),
+    SPANS_ENDED: (COUNTER, "{span}", "Spans ended"),
+    SPANS_EXPORTED: (COUNTER, "{span}", "Spans exported, by exporter"),
+    SPANS_DROPPED: (COUNTER, "{span}", "Spans dropped, by reason"),
+    TRACES_DROPPED: (COUNTER, "{trace}", "Traces dropped by sampling, by reason"),
+    EXPORT_DURATION: (HISTOGRAM, "s", "Duration of an export call, by exporter"),
+    EXPORT_BYTES: (HISTOGRAM, "By", "Serialized bytes written or sent, by exporter"),
+    EXPORT_RETRIES: (COUNTER, "{retry}", "Retried export attempts, by exporter"),
+    UPLOADS: (COUNTER, "{upload}", "Background uploads, by outcome"),
+    EXPORT_BREAKER_TRIPS: (COUNTER, "{trip}", "Export circuit breaker openings, by exporter"),
+    EXPORT_SPOOL: (COUNTER, "{batch}", "Export batches spooled, replayed or dropped from the spool, by outcome"),
+    COLLECTOR_SPANS: (COUNTER, "{span}", "Spans received by the collector daemon, by outcome"),
+    TRACE_BUFFER_EVICTIONS: (COUNTER, "{trace}", "Traces removed from a trace buffer before completion, by reason"),
+    WRAPPER_OVERHEAD: (HISTOGRAM, "s", "Time spent by Monocle around an instrumented call, by span name"),
+    PROCESSOR_QUEUE_DEPTH: (GAUGE, "{span}", "Spans queued in a batch span processor"),
+    TRACE_BUFFER_TRACES: (GAUGE, "{trace}", "Traces held in a trace buffer"),
+    TRACE_BUFFER_SPANS: (GAUGE, "{span}", "Spans held in a trace buffer"),
+    TRACE_BUFFER_BYTES: (GAUGE, "By", "Estimated bytes held in a trace buffer"),
+    UPLOAD_QUEUE_DEPTH: (GAUGE, "{upload}", "Uploads queued or in flight"),
+    EXPORT_BREAKER_STATE: (GAUGE, "1", "Export circuit breaker state, 0 closed, 1 half open, 2 open"),
+    EXPORT_SPOOL_BYTES: (GAUGE, "By", "Bytes held in an export spool"),
+    EXPORT_SPOOL_BATCHES: (GAUGE, "{batch}", "Batches held in an export spool"),
+}
+
+GaugeCallback = Callable[[], Iterable[Tuple[float, Dict[str, str]]]]
+
+def _attribute_key(attributes: Optional[Dict[str, str]]) -> tuple:
+    return tuple(sorted(attributes.items())) if attributes else ()
+
+class SelfTelemetry:
+    """Thread safe store of the pipeline metrics, mirrored to OpenTelemetry instruments."""
+
+    def __init__(self, enabled: bool = True, meter: Optional[metrics.Meter] = None):
+        self.enabled = enabled
+        self._meter = meter
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, tuple], float] = {}
+        # count, sum, min, max
+        self._histograms: Dict[Tuple[str, tuple], list] = {}
+        self._gauges: Dict[str, list] = {}
+        self._instruments = {}
+        register_fork_handler(self)
+
+    def _after_fork_in_child(self) -> None:
+        # the counts so far are the parent's
+        self._lock = threading.Lock()
+        self._counters.clear()
+        self._histograms.clear()
+
+    def add(self, name: str, value: float = 1, attributes: Optional[Dict[str, str]] = None) -> None:
+        """Add to a counter."""
+        if not self.enabled:
+            return
+        key = (name, _attribute_key(attributes))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+        self._report(name, COUNTER, value, attributes)
+
+    def record(self, name: str, value: float, attributes: Optional[Dict[str, str]] = None) -> None:
+        """Record a value of a histogram."""
+        if not self.enabled:
+            return
+        key = (name, _attribute_key(attributes))
+        with self._lock:
+            summary = self._histograms.get(key)
+            if summary is None:
+                self._histograms[key] = [1, value, value, value]
+            else:
+                summary[0] += 1
+                summary[1] += value
+                if value < summary[2]:
+                    summary[2] = value
+                if value > summary[3]:
+                    summary[3] = value
+        self._report(name, HISTOGRAM, value, attributes)
+
+    def register_gauge(self, name: str, callback: GaugeCallback) -> None:
+        """Register a callback returning the (value, attributes) observations of a gauge."""
+        with self._lock:
+            callbacks = self._gauges.setdefault(name, [])
+            callbacks.append(callback)
+            first_callback = len(callbacks) == 1
+        if first_callback:
+            self._get_instrument(name, GAUGE)
+
+    def observe(self, name: str) -> list:
+        observations = []
+        with self._lock:
+            callbacks = list(self._gauges.get(name, ()))
+        for callback in callbacks:
+            try:
+                observations.extend(callback())
+            except Exception as e:
+                logger.debug(f"Error observing {name}: {e}")
+        return observations
+
+    def _report(self, name: str, kind: str, value: float, attributes: Optional[Dict[str, str]]) -> None:
+        instrument = self._instruments.get(name) or self._get_instrument(name, kind)
+        if instrument is None:
+            return
+        try:
+            if kind == COUNTER:
+                instrument.add(value, attributes)
+            else:
+                instrument.record(value, attributes)
+        except Exception as e:
+            logger.debug(f"Error reporting {name}: {e}")
+
+    def _get_instrument(self, name: str, kind: str):
+        with self._lock:
+            if name in self._instruments:
+                return self._instruments[name]
+            _, unit, description = METRICS.get(name, (kind, "1", ""))
+            try:
+                meter = self._meter or metrics.get_meter(METER_NAME)
+                if kind == COUNTER:
+                    instrument = meter.create_counter(name, unit=unit, description=description)
+                elif kind == HISTOGRAM:
+                    instrument = meter.create_histogram(name, unit=unit, description=description)
+                else:
+                    instrument = meter.create_observable_gauge(
+                        name, callbacks=[lambda options, name=name: [
+                            metrics.Observation(value, attributes) for value, attributes in self.observe(name)]],
+                        unit=unit, description=description)
+            except Exception as e:
+                logger.debug(f"Unable to create the {name} instrument: {e}")
+                instrument = None
+            self._instruments[name] = instrument
+            return instrument
+
+    def snapshot(self) -> dict:
+        """Current value of every metric, grouped by kind and name."""
+        snapshot = {"counters": {}, "histograms": {}, "gauges": {}}
+        with self._lock:
+            counters = list(self._counters.items())
+            histograms = [(key, list(summary)) for key, summary in self._histograms.items()]
+            gauge_names = list(self._gauges.keys())
+        for (name, attributes), value in counters:
+            snapshot["counters"].setdefault(name, []).append({"attributes": dict(attributes), "value": value})
+        for (name, attributes), (count, total, minimum, maximum) in histograms:
+            snapshot["histograms"].setdefault(name, []).append({
+                "attributes": dict(attributes), "count": count, "sum": total, "min": minimum, "max": maximum})
+        for name in gauge_names:
+            snapshot["gauges"][name] = [{"attributes": dict(attributes or {}), "value": value}
+                                        for value, attributes in self.observe(name)]
+        return snapshot
+
+    def reset(self) -> None:
+        """Clear the counters and histograms, gauges are kept."""
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+_self_telemetry = SelfTelemetry(enabled=os.environ.get(SELF_TELEMETRY, "true").lower() != "false")
+
+def get_self_telemetry() -> SelfTelemetry:
+    return _self_telemetry
+
+def get_self_telemetry_snapshot() -> dict:
+    """Pull the current Monocle pipeline metrics."""
+    return _self_telemetry.snapshot()
+
+def add_counter(name: str, value: float = 1, attributes: Optional[Dict[str, str]] = None) -> None:
+    _self_telemetry.add(name, value, attributes)
+
+def record_histogram(name: str, value: float, attributes: Optional[Dict[str, str]] = None) -> None:
+    _self_telemetry.record(name, value, attributes)
+
+def record_dropped_spans(count: int, reason: str, exporter: Optional[str] = None) -> None:
+    if count:
+        _self_telemetry.add(SPANS_DROPPED, count, {"reason": reason, "exporter": exporter} if exporter else {"reason": reason})
+
+def record_export_bytes(exporter, size: int) -> None:
+    _self_telemetry.record(EXPORT_BYTES, size, {"exporter": type(exporter).__name__})
+
+def record_wrapper_overhead(span_name: str, seconds: float) -> None:
+    _self_telemetry.record(WRAPPER_OVERHEAD, seconds, {"span_name": span_name})
+
+# objects observed by the gauges, held weakly so the gauges don't keep them alive
+_span_processors = weakref.WeakSet()
+_trace_buffers = weakref.WeakSet()
+_upload_engines = weakref.WeakSet()
+_export_resiliences = weakref.WeakSet()
+
+def _get_queue_state(processor) -> Tuple[Optional[int], Optional[int]]:
+    """Depth and capacity of the queue of a BatchSpanProcessor, across SDK versions."""
+    batch_processor = getattr(processor, "_batch_processor", processor)
+    queue = getattr(batch_processor, "_queue", None)
+    if queue is None:
+        queue = getattr(batch_processor, "queue", None)
+    capacity = getattr(batch_processor, "_max_queue_size", None) or getattr(batch_processor, "max_queue_size", None)
+    return (len(queue) if queue is not None else None), capacity
+
+def _observe_processor_queues():
+    for processor in list(_span_processors):
+        depth, _ = _get_queue_state(processor)
+        if depth is not None:
+            yield depth, {"exporter": processor.exporter_name}
+
+def _observe_trace_buffers(key: str):
+    def observe():
+        for trace_buffer in list(_trace_buffers):
+            yield trace_buffer.get_metrics()[key], {"buffer": trace_buffer.name}
+    return observe
+
+def _observe_upload_engines():
+    for engine in list(_upload_engines):
+        engine_metrics = engine.get_metrics()
+        yield engine_metrics["queued"] + engine_metrics["in_flight"], {"engine": engine.name}
+
+def _observe_export_breakers():
+    from monocle_apptrace.exporters.export_spool import BREAKER_STATE_VALUES
+    for resilience in list(_export_resiliences):
+        yield BREAKER_STATE_VALUES[resilience.breaker.state], {"exporter": resilience.name}
+
+def _observe_export_spools(key: str):
+    def observe():
+        # exporters of the same class share a spool
+        spools = {id(resilience.spool): resilience.spool for resilience in list(_export_resiliences)
+                  if resilience.spool is not None}
+        for spool in spools.values():
+            yield spool.get_metrics()[key], {"exporter": spool.name}
+    return observe
+
+def watch_trace_buffer(trace_buffer) -> None:
+    _trace_buffers.add(trace_buffer)
+
+def watch_upload_engine(engine) -> None:
+    _upload_engines.add(engine)
+
+def watch_export_resilience(resilience) -> None:
+    _export_resiliences.add(resilience)
+
+_self_telemetry.register_gauge(PROCESSOR_QUEUE_DEPTH, _observe_processor_queues)
+_self_telemetry.register_gauge(TRACE_BUFFER_TRACES, _observe_trace_buffers("traces"))
+_self_telemetry.register_gauge(TRACE_BUFFER_SPANS, _observe_trace_buffers("spans"))
+_self_telemetry.register_gauge(TRACE_BUFFER_BYTES, _observe_trace_buffers("bytes"))
+_self_telemetry.register_gauge(UPLOAD_QUEUE_DEPTH, _observe_upload_engines)
+_self_telemetry.register_gauge(EXPORT_BREAKER_STATE, _observe_export_breakers)
+_self_telemetry.register_gauge(EXPORT_SPOOL_BYTES, _observe_export_spools("bytes"))
+_self_telemetry.register_gauge(EXPORT_SPOOL_BATCHES, _observe_export_spools("batches"))
+
+class MeteredSpanExporter(SpanExporter):
+    """Exporter wrapper recording the export latency and the exported or dropped spans of the wrapped exporter."""
+
+    def __init__(self, exporter: SpanExporter):
+        self.exporter = exporter
+        self.exporter_name = type(exporter).__name__
+
+    def export(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
+        attributes = {"exporter": self.exporter_name}
+        started = time.perf_counter()
+        try:
+            result = self.exporter.export(spans)
+        except Exception:
+            record_dropped_spans(len(spans), DROP_EXPORT_FAILED, self.exporter_name)
+            raise
+        finally:
+            record_histogram(EXPORT_DURATION, time.perf_counter() - started, attributes)
+        if result == SpanExportResult.FAILURE:
+            record_dropped_spans(len(spans), DROP_EXPORT_FAILED, self.exporter_name)
+        else:
+            add_counter(SPANS_EXPORTED, len(spans), attributes)
+        return result
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return self.exporter.force_flush(timeout_millis)
+
+    def shutdown(self) -> None:
+        return self.exporter.shutdown()
+
+    def __getattr__(self, name):
+        return getattr(self.exporter, name)
+
+class MonocleBatchSpanProcessor(BatchSpanProcessor):
+    """BatchSpanProcessor reporting its queue depth, the spans it drops and the metrics of its exporter."""
+
+    def __init__(self, span_exporter: SpanExporter, *args, **kwargs):
+        self.exporter_name = type(span_exporter).__name__
+        super().__init__(MeteredSpanExporter(span_exporter), *args, **kwargs)
+        _span_processors.add(self)
+
+    def on_end(self, span: ReadableSpan) -> None:
+        if span.context and span.context.trace_flags.sampled:
+            depth, capacity = _get_queue_state(self)
+            if depth is not None and capacity is not None and depth >= capacity:
+                # the SDK drops a queued span to make room
+                record_dropped_spans(1, DROP_QUEUE_FULL, self.exporter_name)
+        super().on_end(span)
+
+class SelfTelemetrySpanProcessor(SpanProcessor):
+    """Counts the spans started and ended by the tracer provider."""
+
+    def on_start(self, span: Span, parent_context=None) -> None:
+        add_counter(SPANS_STARTED)
+
+    def on_end(self, span: ReadableSpan) -> None:
+        add_counter(SPANS_ENDED)
@@ -0,0 +1,120 @@
+"""
+Collapse of the nested spans of one logical call.
+
+Frameworks and provider SDKs are instrumented at several levels, eg. langchain ``BaseChatModel.invoke`` calls
+``_generate`` and the openai client, so one completion can produce two or three stacked inference spans. With span
+collapse on, an instrumented call entered while a span of the same type family (``inference`` for ``inference``,
+``inference.framework`` and ``inference.modelapi``) is active on the call stack doesn't get a span of its own.
+Configured with:
+
+- ``MONOCLE_SPAN_COLLAPSE``: ``off`` (default), ``skip`` to run the nested call without a span, or ``merge`` to also
+  add the attributes of the nested call that the outer span doesn't have yet
+- ``MONOCLE_SPAN_COLLAPSE_TYPES``: span type families that are collapsed (default ``inference,embedding,retrieval``)
+
+The outer span counts the calls collapsed into it in the ``monocle.collapsed_spans`` attribute.
+"""
+import logging
+import os
+from contextlib import contextmanager
+from typing import Dict, FrozenSet, Optional
+from opentelemetry.context import attach, detach, get_value, set_value
+from opentelemetry.trace import Span
+from monocle_apptrace.instrumentation.common.constants import (
+    ACTIVE_SPAN_FAMILIES_KEY, COLLAPSED_SPANS_KEY, SPAN_COLLAPSE, SPAN_COLLAPSE_MERGE, SPAN_COLLAPSE_OFF,
+    SPAN_COLLAPSE_SKIP, SPAN_COLLAPSE_TYPES
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_COLLAPSE_TYPES = "inference,embedding,retrieval"
+
+class SpanCollapse:
+    def __init__(self, mode: str = SPAN_COLLAPSE_OFF, families: str = DEFAULT_COLLAPSE_TYPES):
+        if mode not in (SPAN_COLLAPSE_OFF, SPAN_COLLAPSE_SKIP, SPAN_COLLAPSE_MERGE):
+            logger.warning(f"Invalid {SPAN_COLLAPSE} {mode}, span collapse is off")
+            mode = SPAN_COLLAPSE_OFF
+        self.mode = mode
+        self.families: FrozenSet[str] = frozenset(family.strip() for family in families.split(",") if family.strip())
+
+    @property
+    def active(self) -> bool:
+        return self.mode != SPAN_COLLAPSE_OFF
+
+    @property
+    def merge(self) -> bool:
+        return self.mode == SPAN_COLLAPSE_MERGE
+
+    def get_family(self, to_wrap) -> Optional[str]:
+        """Collapsible type family of the span of a wrapped method."""
+        output_processor = to_wrap.get("output_processor")
+        if not isinstance(output_processor, dict) and to_wrap.get("output_processor_list"):
+            output_processor = to_wrap["output_processor_list"][0]
+        if not isinstance(output_processor, dict) or not isinstance(output_processor.get("type"), str):
+            return None
+        family = output_processor["type"].split(".", 1)[0]
+        return family if family in self.families else None
+
+    def collapse(self, to_wrap) -> Optional[Span]:
+        """Active span the call is collapsed into and counted on, None if the call gets its own span."""
+        if not self.active:
+            return None
+        family = self.get_family(to_wrap)
+        if family is None:
+            return None
+        active_families: Optional[Dict[str, Span]] = get_value(ACTIVE_SPAN_FAMILIES_KEY)
+        span = active_families.get(family) if active_families else None
+        if span is None or not span.is_recording():
+            return None
+        span.set_attribute(COLLAPSED_SPANS_KEY, (span.attributes.get(COLLAPSED_SPANS_KEY) or 0) + 1)
+        return span
+
+    @contextmanager
+    def active_span(self, to_wrap, span: Span):
+        """Record the span as the active one of its family for the nested calls."""
+        family = self.get_family(to_wrap) if self.active else None
+        if family is None:
+            yield
+            return
+        active_families = dict(get_value(ACTIVE_SPAN_FAMILIES_KEY) or {})
+        active_families[family] = span
+        token = attach(set_value(ACTIVE_SPAN_FAMILIES_KEY, active_families))
+        try:
+            yield
+        finally:
+            detach(token)
+
+class MergedSpan:
+    """Outer span as seen by the output processor of a collapsed call, only missing attributes are set."""
+    __slots__ = ("span",)
+
+    def __init__(self, span: Span):
+        self.span = span
+
+    def set_attribute(self, key: str, value) -> None:
+        if self.span.attributes.get(key) is None:
+            self.span.set_attribute(key, value)
+
+    def set_status(self, *args, **kwargs) -> None:
+        pass
+
+    def __getattr__(self, name):
+        return getattr(self.span, name)
+
+def merge_into_span(handler, to_wrap, wrapped, instance, args, kwargs, result, span: Span, is_post_exec: bool) -> None:
+    """Add the attributes of a collapsed call to the outer span."""
+    if not span_collapse.merge or not isinstance(to_wrap.get("output_processor"), dict):
+        return
+    try:
+        handler.hydrate_attributes(to_wrap, wrapped, instance, args, kwargs, result, MergedSpan(span), None, is_post_exec)
+    except Exception as e:
+        logger.debug(f"Error merging collapsed span attributes: {e}")
+
+span_collapse = SpanCollapse(os.environ.get(SPAN_COLLAPSE, SPAN_COLLAPSE_OFF).lower(),
+                             os.environ.get(SPAN_COLLAPSE_TYPES, DEFAULT_COLLAPSE_TYPES))
+
+def get_span_collapse() -> SpanCollapse:
+    return span_collapse
+
+def set_span_collapse(collapse: SpanCollapse) -> None:
+    global span_collapse
+    span_collapse = collapse
@@ -10,13 +10,17 @@ from opentelemetry.trace.status import Status, StatusCode
 from monocle_apptrace.instrumentation.common.constants import (
     HTTP_HEALTH_CHECK_METHODS,
     QUERY,
-    service_name_map,
-    service_type_map,
-    MONOCLE_SDK_VERSION, MONOCLE_SDK_LANGUAGE, MONOCLE_DETECTED_SPAN_ERROR,
-    HTTP_SUCCESS_CODES, HEALTH_RESET_COUNTER
+    MONOCLE_DETECTED_SPAN_ERROR,
+    HTTP_SUCCESS_CODES, HEALTH_RESET_COUNTER, SOURCE_PATH_ROOT
 )
 
-from monocle_apptrace.instrumentation.common.utils import CyclicCounter, set_attribute, get_scopes, MonocleSpanException, get_monocle_version, replace_placeholders, propogate_inference_info_to_parent_span, get_workflow_name
+from monocle_apptrace.instrumentation.common.deferred_events import (
+    add_deferred_event, evaluate_event_attributes, is_deferred_events_enabled, snapshot_arguments
+)
+from monocle_apptrace.instrumentation.common.processor_plan import get_output_processor_plan
+from monocle_apptrace.instrumentation.common.resource_detector import get_monocle_resource
+from monocle_apptrace.instrumentation.common.utils import CyclicCounter, set_attribute, get_scope_snapshot, MonocleSpanException, replace_placeholders, propogate_inference_info_to_parent_span, get_workflow_name, \
+    get_source_path_capture_policy, resolve_source_path
 from monocle_apptrace.instrumentation.common.constants import \
     (WORKFLOW_TYPE_KEY, WORKFLOW_TYPE_GENERIC, CHILD_ERROR_CODE, MONOCLE_SKIP_EXECUTIONS, SKIPPED_EXECUTION, MONOCLE_WORKFLOW_NAME_KEY)
 
@@ -38,6 +42,9 @@ WORKFLOW_TYPE_MAP = {
     "huggingface_hub": "workflow.huggingface"
 }
 
+PRE_EXEC_SKIP_EVENTS = frozenset(['events.data.output', 'events.metadata'])
+POST_EXEC_SKIP_EVENTS = frozenset(['events.data.input'])
+
 FRAMEWORK_WORKFLOW_LIST = [
     "workflow.llamaindex",
     "workflow.langchain",
@@ -88,14 +95,15 @@ class SpanHandler:
     @staticmethod
     def set_default_monocle_attributes(span: Span, source_path = "" ):
         """ Set default monocle attributes for all spans """
-        span.set_attribute(MONOCLE_SDK_VERSION, get_monocle_version())
-        span.set_attribute(MONOCLE_SDK_LANGUAGE, "python")
-        span.set_attribute("span_source", source_path)
-        for scope_key, scope_value in get_scopes().items():
-            span.set_attribute(f"scope.{scope_key}", scope_value)
+        # the SDK and scope attributes are precomputed, all the attributes are set in a single call
+        attributes = dict(get_monocle_resource().sdk_attributes)
+        is_root = get_source_path_capture_policy() == SOURCE_PATH_ROOT and SpanHandler.is_root_span(span)
+        attributes["span_source"] = resolve_source_path(source_path, is_root)
+        attributes.update(get_scope_snapshot().attributes)
         workflow_name = SpanHandler.get_workflow_name(span=span)
         if workflow_name:
-            span.set_attribute("workflow.name", workflow_name)
+            attributes["workflow.name"] = workflow_name
+        span.set_attributes(attributes)
 
     @staticmethod
     def set_workflow_properties(span: Span, to_wrap = None):
@@ -143,47 +151,47 @@ class SpanHandler:
         span_index = 0
         if SpanHandler.is_root_span(span):
             span_index = 2 # root span will have workflow and hosting entities pre-populated
-        if 'output_processor' in to_wrap and to_wrap["output_processor"] is not None:
-            output_processor=to_wrap['output_processor']
+        output_processor = to_wrap.get('output_processor')
+        if output_processor is not None:
+            plan = get_output_processor_plan(output_processor)
             self.set_span_type(to_wrap, wrapped, instance, output_processor, span, args, kwargs)
             skip_processors:list[str] = self.skip_processor(to_wrap, wrapped, instance, span, args, kwargs) or []
-            if 'attributes' in output_processor and 'attributes' not in skip_processors:
+            if plan.has_attributes and 'attributes' not in skip_processors:
                 arguments = {"instance":instance, "args":args, "kwargs":kwargs, "result":result, "parent_span":parent_span, "span":span}
-
-                for processors in output_processor["attributes"]:
+                span_attributes = span.attributes
+                for entity in plan.entities:
+                    if is_post_exec:
+                        active, inactive = entity.post_execution, entity.pre_execution
+                    else:
+                        active, inactive = entity.pre_execution, entity.post_execution
                     entity_has_attributes = False
-                    for processor in processors:
-                        attribute = processor.get('attribute')
-                        accessor = processor.get('accessor')
-
-                        if attribute and accessor:
-                            attribute_name = f"entity.{span_index + 1}.{attribute}"
-                            try:
-                                if (not is_post_exec and processor.get('phase', '') != 'post_execution') or (is_post_exec and processor.get('phase', '') == 'post_execution'):
-                                    processor_result = accessor(arguments)
-                                    if processor_result and isinstance(processor_result, (str, list)):
-                                        span.set_attribute(attribute_name, processor_result)
-                                        entity_has_attributes = True
-                                else:
-                                    # During post_execution, we need to find the next available entity index
-                                    if span.attributes.get(attribute_name) is not None:
-                                        entity_has_attributes = True
-                            except MonocleSpanException as e:
-                                span.set_status(StatusCode.ERROR, e.message)
-                                detected_error = True
-                            except Exception as e:
-                                logger.debug(f"Error processing accessor: {e}")
-                        else:
-                            logger.debug(f"{' and '.join([key for key in ['attribute', 'accessor'] if not processor.get(key)])} not found or incorrect in entity JSON")
+                    for processor in active:
+                        try:
+                            processor_result = processor.accessor(arguments)
+                            if processor_result and isinstance(processor_result, (str, list)):
+                                span.set_attribute(processor.keys[span_index], processor_result)
+                                entity_has_attributes = True
+                        except MonocleSpanException as e:
+                            span.set_status(StatusCode.ERROR, e.message)
+                            detected_error = True
+                        except Exception as e:
+                            logger.debug(f"Error processing accessor: {e}")
+                    if not entity_has_attributes:
+                        # Attributes of the other phase may already be set, count the entity in that case
+                        for processor in inactive:
+                            if span_attributes.get(processor.keys[span_index]) is not None:
+                                entity_has_attributes = True
+                                break
 
                     # Only increment span_index if this entity actually has attributes set
                     if entity_has_attributes:
                         span_index += 1
 
-        # set scopes as attributes by calling get_scopes()
-        # scopes is a Mapping[str:object], iterate directly with .items()
-        for scope_key, scope_value in get_scopes().items():
-            span.set_attribute(f"scope.{scope_key}", scope_value)
+        # scopes are set at span start, only the ones set or changed since then are written
+        scope_attributes = get_scope_snapshot().attributes
+        for scope_key, scope_value in scope_attributes.items():
+            if span.attributes.get(scope_key) != scope_value:
+                span.set_attribute(scope_key, scope_value)
 
         if span_index > 0:
             span.set_attribute("entity.count", span_index)
@@ -192,15 +200,14 @@ class SpanHandler:
     def hydrate_events(self, to_wrap, wrapped, instance, args, kwargs, ret_result, span: Span, parent_span=None, ex:Exception=None,
                        is_post_exec: bool = False) -> bool:
         detected_error:bool = False
-        if 'output_processor' in to_wrap and to_wrap["output_processor"] is not None:
-            output_processor=to_wrap['output_processor']
-            if is_post_exec:
-                skip_events:list[str] = ['events.data.input']
-            else:
-                skip_events:list[str] = ['events.data.output', 'events.metadata']
-            skip_processors:list[str] = list(set(self.skip_processor(to_wrap, wrapped, instance, span, args, kwargs) or []).union(set(skip_events)))
+        output_processor = to_wrap.get('output_processor')
+        if output_processor is not None:
+            plan = get_output_processor_plan(output_processor)
+            skip_events = POST_EXEC_SKIP_EVENTS if is_post_exec else PRE_EXEC_SKIP_EVENTS
+            handler_skip_processors = self.skip_processor(to_wrap, wrapped, instance, span, args, kwargs)
+            skip_processors = skip_events.union(handler_skip_processors) if handler_skip_processors else skip_events
             arguments = {"instance": instance, "args": args, "kwargs": kwargs, "result": ret_result, "exception":ex, "parent_span":parent_span, "span": span}
-            subtype = output_processor.get('subtype')
+            subtype = plan.subtype
             if subtype:
                 if callable(subtype):
                     try:
@@ -212,42 +219,22 @@ class SpanHandler:
                     span.set_attribute("span.subtype", subtype)
             # Process events if they are defined in the output_processor.
             # In case of inference.modelapi skip the event processing unless the span has an exception
-            if 'events' in output_processor and ('events' not in skip_processors or ex is not None):
-                events = output_processor['events']
-                for event in events:
-                    event_name = event.get("name")
-                    if 'events.'+event_name in skip_processors and ex is None:
+            if plan.has_events and ('events' not in skip_processors or ex is not None):
+                timestamps = getattr(ret_result, "timestamps", {})
+                deferred_arguments = None
+                for event in plan.events:
+                    event_name = event.name
+                    if event.skip_key in skip_processors and ex is None:
                         continue
-                    event_attributes = {}
-                    attributes = event.get("attributes", [])
-                    for attribute in attributes:
-                        attribute_key = attribute.get("attribute")
-                        accessor = attribute.get("accessor")
-                        if accessor:
-                            try:
-                                try:
-                                    result = accessor(arguments)
-                                except MonocleSpanException as e:
-                                    span.set_status(StatusCode.ERROR, e.message)
-                                    detected_error = True
-                                    result = e.get_err_code()
-                                if result and isinstance(result, dict):
-                                    result = dict((key, value) for key, value in result.items() if value is not None)
-                                if result and isinstance(result, (int, str, list, dict)):
-                                    if attribute_key is not None:
-                                        event_attributes[attribute_key] = result
-                                    else:
-                                        event_attributes.update(result)
-                                if not is_post_exec and event_name == "data.input" and attribute_key == "input" and result:
-                                    # append memory to input if available
-                                    # update the result with new input
-                                    pass
-                                elif not detected_error and is_post_exec and event_name == "data.output" and attribute_key == "response" and result:
-                                    # capture memory
-                                    pass
-                            except Exception as e:
-                                logger.debug(f"Error evaluating accessor for attribute '{attribute_key}': {e}")
-                    matching_timestamp = getattr(ret_result, "timestamps", {}).get(event_name, None)
+                    matching_timestamp = timestamps.get(event_name, None) if isinstance(timestamps, dict) else None
+                    if event.deferrable and is_deferred_events_enabled():
+                        if deferred_arguments is None:
+                            deferred_arguments = snapshot_arguments(arguments)
+                        if add_deferred_event(span, event_name, event.attributes, deferred_arguments,
+                                              matching_timestamp if isinstance(matching_timestamp, int) else None):
+                            continue
+                    event_attributes, event_error = evaluate_event_attributes(event.attributes, arguments, span)
+                    detected_error = detected_error or event_error
                     alreadyExist = False
                     for existing_event in span.events:
                         if event_name == existing_event.name:
@@ -298,16 +285,8 @@ class SpanHandler:
         return workflow_type
 
     def set_app_hosting_identifier_attribute(span):
-        span_index = 2
-        # Search env to indentify the infra service type, if found check env for service name if possible
-        span.set_attribute(f"entity.{span_index}.type", f"app_hosting.generic")
-        span.set_attribute(f"entity.{span_index}.name", "generic")
-        for type_env, type_name in service_type_map.items():
-            if type_env in os.environ:
-                span.set_attribute(f"entity.{span_index}.type", f"app_hosting.{type_name}")
-                entity_name_env = service_name_map.get(type_name, "unknown")
-                span.set_attribute(f"entity.{span_index}.name", os.environ.get(entity_name_env, "generic"))
-                break
+        # hosting service detected once at setup, see resource_detector
+        span.set_attributes(get_monocle_resource().hosting_attributes)
 
     @staticmethod
     def get_workflow_name(span: Span) -> str:
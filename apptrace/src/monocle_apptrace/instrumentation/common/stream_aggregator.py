@@ -0,0 +1,198 @@
+"""
+Accumulation of streamed inference responses.
+
+``StreamAggregator`` keeps what the span needs from a streamed response as it is read: the text deltas are kept in a
+list and joined once when the stream ends, tool call deltas are merged per tool call as they arrive and the raw
+chunks are never retained. The captured text and tool call arguments are capped, memory per stream is bounded by:
+
+- ``MONOCLE_STREAM_CAPTURE_MAX_CHARS``: characters captured per stream (default 100000, 0 disables the cap)
+- ``MONOCLE_STREAM_CAPTURE_MAX_BYTES``: utf-8 bytes captured per stream (default 400000, 0 disables the cap)
+
+``AggregatingStreamHooks`` feeds the items of an instrumented stream to an aggregator and completes the span with
+its result.
+"""
+import json
+import logging
+import os
+import time
+from types import SimpleNamespace
+from typing import Callable, Dict, List, Optional
+from monocle_apptrace.instrumentation.common.constants import STREAM_CAPTURE_MAX_BYTES, STREAM_CAPTURE_MAX_CHARS
+from monocle_apptrace.instrumentation.common.stream_proxy import StreamHooks
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_CHARS = 100_000
+DEFAULT_MAX_BYTES = 400_000
+
+def _get_limit(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except ValueError:
+        logger.warning(f"Invalid value for {name}, using {default}")
+        return default
+
+class _ToolCall:
+    __slots__ = ("id", "name", "arguments")
+
+    def __init__(self):
+        self.id: Optional[str] = None
+        self.name: Optional[str] = None
+        self.arguments: List[str] = []
+
+class StreamAggregator:
+    """Bounded accumulator of the text, tool calls and metadata of a streamed response."""
+
+    def __init__(self, max_chars: Optional[int] = None, max_bytes: Optional[int] = None):
+        self.max_chars = max_chars if max_chars is not None else _get_limit(STREAM_CAPTURE_MAX_CHARS, DEFAULT_MAX_CHARS)
+        self.max_bytes = max_bytes if max_bytes is not None else _get_limit(STREAM_CAPTURE_MAX_BYTES, DEFAULT_MAX_BYTES)
+        self.start_time = time.time_ns()
+        self.first_token_time: Optional[int] = None
+        self.closed_time: Optional[int] = None
+        self.role = "assistant"
+        self.finish_reason: Optional[str] = None
+        self.usage = None
+        self.truncated = False
+        self._text: List[str] = []
+        self._tool_calls: Dict[int, _ToolCall] = {}
+        self._chars = 0
+        self._bytes = 0
+
+    def _capture(self, value: str) -> str:
+        """Account a captured string against the budgets, returns the part that fits."""
+        if self.truncated or not value:
+            return ""
+        if self.max_chars > 0 and self._chars + len(value) > self.max_chars:
+            value = value[:self.max_chars - self._chars]
+            self.truncated = True
+        if self.max_bytes > 0:
+            size = len(value.encode("utf-8"))
+            if self._bytes + size > self.max_bytes:
+                value = value.encode("utf-8")[:self.max_bytes - self._bytes].decode("utf-8", errors="ignore")
+                size = len(value.encode("utf-8"))
+                self.truncated = True
+            self._bytes += size
+        self._chars += len(value)
+        return value
+
+    def mark_first_token(self) -> None:
+        if self.first_token_time is None:
+            self.first_token_time = time.time_ns()
+
+    def mark_closed(self) -> None:
+        self.closed_time = time.time_ns()
+
+    def add_text(self, text: Optional[str]) -> None:
+        if not text or not isinstance(text, str):
+            return
+        self.mark_first_token()
+        text = self._capture(text)
+        if text:
+            self._text.append(text)
+
+    def add_tool_call(self, index: Optional[int], call_id: Optional[str] = None, name: Optional[str] = None,
+                      arguments: Optional[str] = None) -> None:
+        """Merge a tool call delta, deltas without an index continue the last tool call unless they carry an id."""
+        self.mark_first_token()
+        if index is None:
+            index = len(self._tool_calls) - 1 if self._tool_calls and call_id is None else len(self._tool_calls)
+        tool_call = self._tool_calls.get(index)
+        if tool_call is None:
+            tool_call = self._tool_calls[index] = _ToolCall()
+        if call_id:
+            tool_call.id = call_id
+        if name:
+            tool_call.name = name
+        if arguments is not None and not isinstance(arguments, str):
+            arguments = json.dumps(arguments, default=str)
+        arguments = self._capture(arguments)
+        if arguments:
+            tool_call.arguments.append(arguments)
+
+    def add_chat_chunk(self, chunk) -> None:
+        """Add a chat completion chunk, the ``choices[0].delta`` shape shared by most providers."""
+        choices = getattr(chunk, "choices", None)
+        if choices:
+            choice = choices[0]
+            delta = getattr(choice, "delta", None)
+            if delta is not None:
+                role = getattr(delta, "role", None)
+                if role:
+                    self.role = role
+                self.add_text(getattr(delta, "content", None))
+                for tool_call in getattr(delta, "tool_calls", None) or ():
+                    function = getattr(tool_call, "function", None)
+                    index = getattr(tool_call, "index", None)
+                    self.add_tool_call(index if isinstance(index, int) else None,
+                                       getattr(tool_call, "id", None),
+                                       getattr(function, "name", None),
+                                       getattr(function, "arguments", None))
+            finish_reason = getattr(choice, "finish_reason", None)
+            if finish_reason:
+                self.finish_reason = finish_reason
+        usage = getattr(chunk, "usage", None)
+        if usage:
+            self.usage = usage
+            self.mark_closed()
+
+    @property
+    def text(self) -> str:
+        if len(self._text) > 1:
+            self._text = ["".join(self._text)]
+        return self._text[0] if self._text else ""
+
+    @property
+    def tools(self) -> Optional[List[dict]]:
+        if not self._tool_calls:
+            return None
+        return [{"id": tool_call.id, "name": tool_call.name, "arguments": "".join(tool_call.arguments)}
+                for _, tool_call in sorted(self._tool_calls.items())]
+
+    def _timestamps(self) -> dict:
+        return {
+            "data.input": int(self.start_time),
+            "data.output": int(self.first_token_time or self.start_time),
+            "metadata": int(self.closed_time or time.time_ns()),
+        }
+
+    def to_stream_result(self) -> SimpleNamespace:
+        """The ``type="stream"`` result read by the openai style accessors."""
+        return SimpleNamespace(
+            type="stream",
+            role=self.role,
+            timestamps=self._timestamps(),
+            output_text=self.text,
+            tools=self.tools,
+            usage=self.usage,
+            finish_reason=self.finish_reason,
+            truncated=self.truncated,
+        )
+
+    def to_completion_result(self) -> SimpleNamespace:
+        """The stream result shaped like a chat completion, for accessors that read ``choices[0].message``."""
+        result = self.to_stream_result()
+        tool_calls = [SimpleNamespace(id=tool["id"], type="function",
+                                      function=SimpleNamespace(name=tool["name"], arguments=tool["arguments"]))
+                      for tool in result.tools or ()]
+        message = SimpleNamespace(role=self.role, content=result.output_text, tool_calls=tool_calls or None)
+        result.choices = [SimpleNamespace(index=0, message=message, finish_reason=self.finish_reason)]
+        return result
+
+class AggregatingStreamHooks(StreamHooks):
+    """Feeds the stream items to a StreamAggregator and completes the span with the aggregated result."""
+
+    def __init__(self, span_processor, add_item: Callable[[StreamAggregator, object], None] = None,
+                 completion_result: bool = False):
+        self.span_processor = span_processor
+        self.add_item = add_item or StreamAggregator.add_chat_chunk
+        self.completion_result = completion_result
+        self.aggregator = StreamAggregator()
+
+    def on_item(self, item) -> None:
+        self.add_item(self.aggregator, item)
+
+    def on_close(self, error: Optional[BaseException] = None) -> None:
+        if self.span_processor:
+            aggregator = self.aggregator
+            self.span_processor(aggregator.to_completion_result() if self.completion_result
+                                else aggregator.to_stream_result())
@@ -0,0 +1,234 @@
+"""
+Instrumentation of streamed responses.
+
+A streaming inference call returns before its response is read, the span is completed while the application consumes
+the stream. ``instrument_stream`` attaches ``StreamHooks`` to a response without creating a class per response: the
+response class is swapped for a subclass that is created once per original class and cached, the hooks are kept on the
+instance. Objects whose class can't be swapped (generators, builtins, classes with ``__slots__``) are wrapped in a
+transparent ``StreamProxy`` instead, so callers must use the returned object.
+
+Providers pick the methods to hook, ``ITER_METHODS`` when ``__iter__`` / ``__aiter__`` produce the items (eg. openai
+streams) or ``NEXT_METHODS`` when the stream is its own iterator (eg. azure ai inference and mistral streams).
+"""
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+ITER_METHODS = ("__iter__", "__aiter__")
+NEXT_METHODS = ("__next__", "__anext__")
+_STATES_ATTRIBUTE = "_monocle_stream_states"
+
+class StreamHooks:
+    """Callbacks invoked as an instrumented stream is consumed, on_close is called once when the stream is exhausted,
+    fails or is closed early. Errors raised by hooks are logged and never reach the application."""
+
+    def on_first_item(self, item) -> None:
+        pass
+
+    def on_item(self, item) -> None:
+        pass
+
+    def on_close(self, error: Optional[BaseException] = None) -> None:
+        pass
+
+class _StreamState:
+    __slots__ = ("hooks", "started", "closed")
+
+    def __init__(self, hooks: StreamHooks):
+        self.hooks = hooks
+        self.started = False
+        self.closed = False
+
+    def item(self, item) -> None:
+        try:
+            if not self.started:
+                self.started = True
+                self.hooks.on_first_item(item)
+            self.hooks.on_item(item)
+        except Exception as e:
+            logger.warning("Warning: Error occurred while processing stream item: %s", str(e))
+
+    def close(self, error: Optional[BaseException] = None) -> None:
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self.hooks.on_close(error)
+        except Exception as e:
+            logger.warning("Warning: Error occurred while closing stream: %s", str(e))
+
+def _on_item(states: List[_StreamState], item) -> None:
+    for state in states:
+        state.item(item)
+
+def _on_close(states: List[_StreamState], error: Optional[BaseException] = None) -> None:
+    for state in states:
+        state.close(error)
+
+def _iterate(iterator, states: List[_StreamState]):
+    error = None
+    try:
+        for item in iterator:
+            _on_item(states, item)
+            yield item
+    except GeneratorExit:
+        raise
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        _on_close(states, error)
+
+async def _aiterate(iterator, states: List[_StreamState]):
+    error = None
+    try:
+        async for item in iterator:
+            _on_item(states, item)
+            yield item
+    except GeneratorExit:
+        raise
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        _on_close(states, error)
+
+def _next(states: List[_StreamState], next_item):
+    try:
+        item = next_item()
+    except StopIteration:
+        _on_close(states)
+        raise
+    except Exception as e:
+        _on_close(states, e)
+        raise
+    _on_item(states, item)
+    return item
+
+async def _anext(states: List[_StreamState], next_item):
+    try:
+        item = await next_item()
+    except StopAsyncIteration:
+        _on_close(states)
+        raise
+    except Exception as e:
+        _on_close(states, e)
+        raise
+    _on_item(states, item)
+    return item
+
+def _build_stream_class(cls: type, methods: Tuple[str, ...]) -> type:
+    namespace = {"__slots__": (), "__module__": cls.__module__, "__qualname__": cls.__qualname__}
+    if "__iter__" in methods:
+        def __iter__(self):
+            return _iterate(cls.__iter__(self), getattr(self, _STATES_ATTRIBUTE))
+        namespace["__iter__"] = __iter__
+    if "__aiter__" in methods:
+        def __aiter__(self):
+            return _aiterate(cls.__aiter__(self), getattr(self, _STATES_ATTRIBUTE))
+        namespace["__aiter__"] = __aiter__
+    if "__next__" in methods:
+        def __next__(self):
+            return _next(getattr(self, _STATES_ATTRIBUTE), lambda: cls.__next__(self))
+        namespace["__next__"] = __next__
+    if "__anext__" in methods:
+        async def __anext__(self):
+            return await _anext(getattr(self, _STATES_ATTRIBUTE), lambda: cls.__anext__(self))
+        namespace["__anext__"] = __anext__
+    return type(cls.__name__, (cls,), namespace)
+
+# (original class, hooked methods) -> instrumented subclass
+_stream_classes: Dict[Tuple[type, Tuple[str, ...]], type] = {}
+_stream_classes_lock = threading.Lock()
+
+def get_stream_class(cls: type, methods: Tuple[str, ...]) -> type:
+    """Return the cached instrumented subclass of a stream class."""
+    key = (cls, methods)
+    stream_class = _stream_classes.get(key)
+    if stream_class is None:
+        with _stream_classes_lock:
+            stream_class = _stream_classes.get(key)
+            if stream_class is None:
+                stream_class = _build_stream_class(cls, methods)
+                _stream_classes[key] = stream_class
+    return stream_class
+
+class StreamProxy:
+    """Transparent wrapper of a stream that runs the hooks as items are read."""
+    __slots__ = ("_monocle_wrapped", _STATES_ATTRIBUTE, "_monocle_iterator")
+
+    def __init__(self, wrapped, states: List[_StreamState]):
+        object.__setattr__(self, "_monocle_wrapped", wrapped)
+        object.__setattr__(self, _STATES_ATTRIBUTE, states)
+        object.__setattr__(self, "_monocle_iterator", None)
+
+    def __getattr__(self, name):
+        return getattr(self._monocle_wrapped, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._monocle_wrapped, name, value)
+
+    def __repr__(self):
+        return repr(self._monocle_wrapped)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._monocle_iterator is None:
+            object.__setattr__(self, "_monocle_iterator", iter(self._monocle_wrapped))
+        return _next(self._monocle_stream_states, self._monocle_iterator.__next__)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._monocle_iterator is None:
+            object.__setattr__(self, "_monocle_iterator", self._monocle_wrapped.__aiter__())
+        return await _anext(self._monocle_stream_states, self._monocle_iterator.__anext__)
+
+    def __enter__(self):
+        self._monocle_wrapped.__enter__()
+        return self
+
+    def __exit__(self, *args):
+        try:
+            return self._monocle_wrapped.__exit__(*args)
+        finally:
+            _on_close(self._monocle_stream_states)
+
+    async def __aenter__(self):
+        await self._monocle_wrapped.__aenter__()
+        return self
+
+    async def __aexit__(self, *args):
+        try:
+            return await self._monocle_wrapped.__aexit__(*args)
+        finally:
+            _on_close(self._monocle_stream_states)
+
+def instrument_stream(response, hooks: StreamHooks, methods: Tuple[str, ...] = ITER_METHODS):
+    """Attach hooks to a streamed response and return the object to hand back to the application, which is the
+    response itself unless it had to be wrapped in a StreamProxy."""
+    if isinstance(response, StreamProxy):
+        response._monocle_stream_states.append(_StreamState(hooks))
+        return response
+    states = getattr(response, _STATES_ATTRIBUTE, None) if hasattr(response, "__dict__") else None
+    if states is not None:
+        # already instrumented by an outer span
+        states.append(_StreamState(hooks))
+        return response
+    cls = type(response)
+    hooked_methods = tuple(method for method in methods if hasattr(cls, method))
+    if not hooked_methods:
+        return response
+    if hasattr(response, "__dict__"):
+        try:
+            response.__dict__[_STATES_ATTRIBUTE] = [_StreamState(hooks)]
+            response.__class__ = get_stream_class(cls, hooked_methods)
+            return response
+        except TypeError:
+            response.__dict__.pop(_STATES_ATTRIBUTE, None)
+    return StreamProxy(response, [_StreamState(hooks)])
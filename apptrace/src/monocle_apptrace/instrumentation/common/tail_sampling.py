@@ -0,0 +1,210 @@
+"""
+Tail based sampling of Monocle traces.
+
+``TailSamplingSpanProcessor`` sits in front of the exporting span processors and holds the spans of each trace until
+the local root (workflow) span ends. The whole trace is then either forwarded or dropped. A trace is always kept when
+one of its spans has an error (``MONOCLE_DETECTED_SPAN_ERROR`` or an ERROR status), a non success ``finish_type`` or
+when the root span took longer than the latency threshold. Other traces are kept at the rate configured for their
+``workflow.name``. The decision is derived from the trace id, so every process of a distributed trace agrees on it.
+
+Spans are buffered in a ``TraceBuffer`` so memory is bounded by its caps, a trace that is evicted before its root
+span ends is decided on the spans seen so far. Spans that end after the decision follow it. Configured with:
+
+- ``MONOCLE_TAIL_SAMPLING``: set to true to enable tail sampling in ``setup_monocle_telemetry``
+- ``MONOCLE_TAIL_SAMPLING_DEFAULT_RATE``: fraction of the uninteresting traces that are kept (default 0.1)
+- ``MONOCLE_TAIL_SAMPLING_WORKFLOW_RATES``: per workflow rates, eg. ``chat=0.02,batch=1``
+- ``MONOCLE_TAIL_SAMPLING_LATENCY_MS``: root span duration over which a trace is kept (default 10000, 0 disables)
+- ``MONOCLE_TAIL_SAMPLING_DECISION_CACHE_SIZE``: decisions remembered for late spans (default 10000)
+"""
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Sequence, Union
+from opentelemetry.context import Context
+from opentelemetry.sdk.trace import ReadableSpan, Span, SpanProcessor
+from opentelemetry.trace import StatusCode
+from monocle_apptrace.exporters.trace_buffer import TraceBuffer, TraceEntry, estimate_span_size
+from monocle_apptrace.instrumentation.common.multiprocess import register_fork_handler
+from monocle_apptrace.instrumentation.common.self_telemetry import (
+    DROP_TAIL_SAMPLING, TRACES_DROPPED, add_counter, record_dropped_spans
+)
+from monocle_apptrace.instrumentation.common.constants import (
+    MONOCLE_DETECTED_SPAN_ERROR, META_DATA, TAIL_SAMPLING_DEFAULT_RATE, TAIL_SAMPLING_WORKFLOW_RATES,
+    TAIL_SAMPLING_LATENCY_MS, TAIL_SAMPLING_DECISION_CACHE_SIZE
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SAMPLE_RATE = 0.1
+DEFAULT_LATENCY_THRESHOLD_MS = 10_000
+DEFAULT_DECISION_CACHE_SIZE = 10_000
+# finish types of a normal completion, any other finish type marks the trace as interesting
+SUCCESS_FINISH_TYPES = ("success", "tool_call")
+
+# reasons a trace is kept
+KEEP_ERROR = "error"
+KEEP_FINISH_TYPE = "finish_type"
+KEEP_LATENCY = "latency"
+KEEP_RATE = "rate"
+
+_TRACE_ID_LOWER_BITS = (1 << 64) - 1
+
+def parse_workflow_rates(value: Optional[str]) -> Dict[str, float]:
+    """Parse ``name=rate`` pairs separated by commas."""
+    rates = {}
+    for item in (value or "").split(","):
+        if not item.strip():
+            continue
+        name, _, rate = item.partition("=")
+        try:
+            rates[name.strip()] = min(1.0, max(0.0, float(rate)))
+        except ValueError:
+            logger.warning(f"Invalid tail sampling rate for workflow {name.strip()}: {rate}")
+    return rates
+
+def get_span_interest(span: ReadableSpan) -> Optional[str]:
+    """Return the reason a span makes its trace worth keeping, if any."""
+    if span.status.status_code == StatusCode.ERROR or (span.attributes or {}).get(MONOCLE_DETECTED_SPAN_ERROR):
+        return KEEP_ERROR
+    for event in span.events:
+        if event.name == META_DATA and event.attributes:
+            finish_type = event.attributes.get("finish_type")
+            if finish_type is not None and finish_type not in SUCCESS_FINISH_TYPES:
+                return KEEP_FINISH_TYPE
+    return None
+
+def is_local_root(span: ReadableSpan) -> bool:
+    return span.parent is None or span.parent.is_remote
+
+class _TraceSampleState:
+    __slots__ = ("workflow_name", "reason")
+
+    def __init__(self):
+        self.workflow_name: Optional[str] = None
+        self.reason: Optional[str] = None
+
+class TailSamplingSpanProcessor(SpanProcessor):
+    """Buffers spans per trace and forwards only the traces that are kept to the wrapped span processors."""
+
+    def __init__(self, span_processors: Union[SpanProcessor, Sequence[SpanProcessor]],
+                 default_rate: Optional[float] = None, workflow_rates: Optional[Dict[str, float]] = None,
+                 latency_threshold_ms: Optional[float] = None, decision_cache_size: Optional[int] = None,
+                 trace_buffer: Optional[TraceBuffer] = None):
+        if isinstance(span_processors, SpanProcessor):
+            span_processors = [span_processors]
+        self.span_processors = list(span_processors)
+        self.default_rate = default_rate if default_rate is not None else \
+            float(os.environ.get(TAIL_SAMPLING_DEFAULT_RATE, DEFAULT_SAMPLE_RATE))
+        self.workflow_rates = workflow_rates if workflow_rates is not None else \
+            parse_workflow_rates(os.environ.get(TAIL_SAMPLING_WORKFLOW_RATES))
+        self.latency_threshold_ms = latency_threshold_ms if latency_threshold_ms is not None else \
+            float(os.environ.get(TAIL_SAMPLING_LATENCY_MS, DEFAULT_LATENCY_THRESHOLD_MS))
+        self.decision_cache_size = decision_cache_size or \
+            int(os.environ.get(TAIL_SAMPLING_DECISION_CACHE_SIZE, DEFAULT_DECISION_CACHE_SIZE))
+        self.trace_buffer = trace_buffer if trace_buffer is not None else TraceBuffer(name=type(self).__name__)
+        self.trace_buffer.on_evict = self._on_trace_evicted
+        # trace id -> kept, for the spans that end after the trace was decided
+        self._decisions: "OrderedDict[int, bool]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._metrics = {"kept_traces": 0, "dropped_traces": 0, "kept_spans": 0, "dropped_spans": 0,
+                         KEEP_ERROR: 0, KEEP_FINISH_TYPE: 0, KEEP_LATENCY: 0, KEEP_RATE: 0}
+        register_fork_handler(self)
+
+    def _after_fork_in_child(self) -> None:
+        self._lock = threading.Lock()
+
+    def on_start(self, span: Span, parent_context: Optional[Context] = None) -> None:
+        for span_processor in self.span_processors:
+            span_processor.on_start(span, parent_context=parent_context)
+
+    def on_end(self, span: ReadableSpan) -> None:
+        trace_id = span.context.trace_id
+        completed = None
+        # a span must not be appended to a trace the root span has just decided, the lookup, append and root pop
+        # happen under the lock that records the decisions
+        with self._lock:
+            decision = self._decisions.get(trace_id)
+            if decision is None:
+                entry = self.trace_buffer.get_or_create(trace_id, _TraceSampleState)
+                state: _TraceSampleState = entry.payload
+                entry.spans.append(span)
+                if state.reason is None:
+                    state.reason = get_span_interest(span)
+                if state.workflow_name is None:
+                    state.workflow_name = (span.attributes or {}).get("workflow.name")
+                if is_local_root(span):
+                    if state.reason is None and self.latency_threshold_ms > 0 and span.end_time is not None and \
+                            (span.end_time - (span.start_time or 0)) / 1e6 >= self.latency_threshold_ms:
+                        state.reason = KEEP_LATENCY
+                    completed = self.trace_buffer.pop(trace_id)
+                    if completed is not None:
+                        decision = self._record_decision(completed)
+        if completed is not None:
+            self._forward(completed.spans, decision)
+        elif decision is not None:
+            self._forward([span], decision)
+            return
+        elif not is_local_root(span):
+            self.trace_buffer.account(entry, 1, estimate_span_size(span))
+        self.trace_buffer.expire()
+
+    def _on_trace_evicted(self, entry: TraceEntry, reason: str) -> None:
+        logger.debug(f"Tail sampling trace {entry.trace_id:032x} before its root span ended ({reason})")
+        self._decide(entry)
+
+    def _decide(self, entry: TraceEntry) -> None:
+        with self._lock:
+            keep = self._record_decision(entry)
+        self._forward(entry.spans, keep)
+
+    def _record_decision(self, entry: TraceEntry) -> bool:
+        # called with the lock held
+        state: _TraceSampleState = entry.payload
+        reason = state.reason
+        if reason is None and self._sampled_by_rate(entry.trace_id, state.workflow_name):
+            reason = KEEP_RATE
+        keep = reason is not None
+        self._decisions[entry.trace_id] = keep
+        while len(self._decisions) > self.decision_cache_size:
+            self._decisions.popitem(last=False)
+        if keep:
+            self._metrics[reason] += 1
+        self._metrics["kept_traces" if keep else "dropped_traces"] += 1
+        if not keep:
+            add_counter(TRACES_DROPPED, 1, {"reason": DROP_TAIL_SAMPLING})
+        return keep
+
+    def _sampled_by_rate(self, trace_id: int, workflow_name: Optional[str]) -> bool:
+        rate = self.workflow_rates.get(workflow_name, self.default_rate)
+        # derived from the trace id rather than drawn at random, so all the services tail sampling a trace agree,
+        # the head sampler decides before the trace id exists and draws at random
+        return (trace_id & _TRACE_ID_LOWER_BITS) < rate * (_TRACE_ID_LOWER_BITS + 1)
+
+    def _forward(self, spans, keep: bool) -> None:
+        with self._lock:
+            self._metrics["kept_spans" if keep else "dropped_spans"] += len(spans)
+        if not keep:
+            record_dropped_spans(len(spans), DROP_TAIL_SAMPLING)
+            return
+        for span in spans:
+            for span_processor in self.span_processors:
+                try:
+                    span_processor.on_end(span)
+                except Exception as e:
+                    logger.warning(f"Error forwarding span to {type(span_processor).__name__}: {e}")
+
+    def get_metrics(self) -> dict:
+        with self._lock:
+            metrics = dict(self._metrics)
+        metrics["buffer"] = self.trace_buffer.get_metrics()
+        return metrics
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return all(span_processor.force_flush(timeout_millis) for span_processor in self.span_processors)
+
+    def shutdown(self) -> None:
+        for entry in self.trace_buffer.drain():
+            self._decide(entry)
+        for span_processor in self.span_processors:
+            span_processor.shutdown()
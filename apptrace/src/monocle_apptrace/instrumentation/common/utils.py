@@ -1,8 +1,10 @@
 import ast
 import logging, json
 import os
+import random
+import sys
 import threading
-import traceback
+from functools import lru_cache
 from typing import Callable, Generic, Optional, TypeVar, Mapping, Union
 
 from opentelemetry.context import attach, detach, get_current, get_value, set_value, Context
@@ -11,13 +13,17 @@ from opentelemetry.trace.propagation import _SPAN_KEY
 from opentelemetry.sdk.trace import id_generator, TracerProvider, ReadableSpan
 from opentelemetry.propagate import extract
 from opentelemetry import baggage
+from opentelemetry.baggage import _BAGGAGE_KEY
+from monocle_apptrace.exporters.span_encoder import encode_span
 from monocle_apptrace.instrumentation.common.constants import (
     ANY_AGENT, LAST_INFERENCE, MONOCLE_SCOPE_NAME_PREFIX, SCOPE_METHOD_FILE, SCOPE_CONFIG_PATH, SPAN_TYPES, llm_type_map, MONOCLE_SDK_VERSION, ADD_NEW_WORKFLOW, AGENT_NAME_KEY,
-    AGENT_INVOCATION_SPAN_NAME, LAST_AGENT_INVOCATION_ID, LAST_AGENT_NAME, INFERENCE_DECISION, INFERENCE_AGENT_DELEGATION, INFERENCE_TOOL_CALL, INFERENCE_TURN_END, SPAN_SUBTYPES
+    AGENT_INVOCATION_SPAN_NAME, LAST_AGENT_INVOCATION_ID, LAST_AGENT_NAME, INFERENCE_DECISION, INFERENCE_AGENT_DELEGATION, INFERENCE_TOOL_CALL, INFERENCE_TURN_END, SPAN_SUBTYPES,
+    SOURCE_PATH_CAPTURE, SOURCE_PATH_SAMPLE_RATE, SOURCE_PATH_ALWAYS, SOURCE_PATH_ROOT, SOURCE_PATH_SAMPLED, SOURCE_PATH_OFF
 )
 from importlib.metadata import version
 from opentelemetry.trace.span import INVALID_SPAN
 _MONOCLE_SPAN_KEY = "monocle" + _SPAN_KEY
+_MONOCLE_SCOPES_KEY = "monocle-scopes"
 
 T = TypeVar('T')
 U = TypeVar('U')
@@ -28,6 +34,11 @@ embedding_model_context = {}
 scope_id_generator = id_generator.RandomIdGenerator()
 http_scopes:dict[str:str] = {}
 monocle_workflow_name: str = None
+source_path_capture_policy: str = os.getenv(SOURCE_PATH_CAPTURE, SOURCE_PATH_ALWAYS).lower()
+try:
+    source_path_sample_rate: float = float(os.getenv(SOURCE_PATH_SAMPLE_RATE, "0.1"))
+except ValueError:
+    source_path_sample_rate = 0.1
 
 try:
     monocle_sdk_version = version("monocle_apptrace")
@@ -97,11 +108,8 @@ def with_tracer_wrapper(func):
             except Exception as e:
                 logger.error("Exception in attaching parent context: %s", e)
             if not source_path:
-                if traceback.extract_stack().__len__() > 2:
-                    filename, line_number, _, _ = traceback.extract_stack()[-2]
-                    source_path = f"{filename}:{line_number}"
-                else:
-                    source_path = ""
+                # caller of this wrapper, only the code object and line are captured here
+                source_path = capture_source_location(1)
             val = func(tracer, handler, to_wrap, wrapped, instance, source_path, args, kwargs)
             return val
 
@@ -110,6 +118,68 @@ def with_tracer_wrapper(func):
     return _with_tracer
 
 
+class SourceLocation:
+    """Lightweight reference to the calling code location, formatted to a path only when it's used."""
+    __slots__ = ("code", "lineno")
+
+    def __init__(self, code, lineno: int):
+        self.code = code
+        self.lineno = lineno
+
+    def resolve(self) -> str:
+        return _format_source_location(self.code, self.lineno)
+
+    def __str__(self) -> str:
+        return self.resolve()
+
+@lru_cache(maxsize=4096)
+def _format_source_location(code, lineno: int) -> str:
+    return f"{code.co_filename}:{lineno}"
+
+def set_source_path_capture_policy(policy: str, sample_rate: Optional[float] = None) -> None:
+    """
+    Set the span_source capture policy.
+
+    Args:
+        policy: one of 'always', 'root' (root spans only), 'sampled' or 'off'.
+        sample_rate: fraction of spans that keep span_source with the 'sampled' policy.
+    """
+    global source_path_capture_policy, source_path_sample_rate
+    policy = policy.lower()
+    if policy not in (SOURCE_PATH_ALWAYS, SOURCE_PATH_ROOT, SOURCE_PATH_SAMPLED, SOURCE_PATH_OFF):
+        raise ValueError(f"Unsupported source path capture policy '{policy}'")
+    source_path_capture_policy = policy
+    if sample_rate is not None:
+        source_path_sample_rate = sample_rate
+
+def get_source_path_capture_policy() -> str:
+    return source_path_capture_policy
+
+def capture_source_location(depth: int = 1) -> Optional[SourceLocation]:
+    """Capture the code location of the frame ``depth`` levels above the caller without walking the stack."""
+    if source_path_capture_policy == SOURCE_PATH_OFF:
+        return None
+    try:
+        frame = sys._getframe(depth + 1)
+    except ValueError:
+        return None
+    return SourceLocation(frame.f_code, frame.f_lineno)
+
+def resolve_source_path(source_path: Union[str, SourceLocation, None], is_root_span: bool = False) -> str:
+    """Return the span_source value for a span as per the capture policy, empty if the span shouldn't keep it."""
+    if not source_path:
+        return ""
+    policy = source_path_capture_policy
+    if policy == SOURCE_PATH_OFF:
+        return ""
+    if policy == SOURCE_PATH_ROOT and not is_root_span:
+        return ""
+    if policy == SOURCE_PATH_SAMPLED and random.random() >= source_path_sample_rate:
+        return ""
+    if isinstance(source_path, SourceLocation):
+        return source_path.resolve()
+    return source_path
+
 def resolve_from_alias(my_map, alias):
     """Find a alias that is not none from list of aliases"""
 
@@ -299,36 +369,78 @@ def __generate_scope_id() -> str:
     global scope_id_generator
     return f"{hex(scope_id_generator.generate_trace_id())}"
 
+class ScopeSnapshot:
+    """Monocle scopes of a baggage, with the scope span attributes precomputed."""
+    __slots__ = ("baggage", "version", "scopes", "attributes")
+
+    def __init__(self, baggage_entries: Optional[Mapping[str, object]] = None):
+        global scope_snapshot_version
+        scope_snapshot_version += 1
+        self.baggage = baggage_entries
+        self.version = scope_snapshot_version
+        self.scopes: dict[str, object] = {}
+        for key, val in (baggage_entries or {}).items():
+            if key.startswith(MONOCLE_SCOPE_NAME_PREFIX):
+                self.scopes[key[len(MONOCLE_SCOPE_NAME_PREFIX):]] = val
+        self.attributes: dict[str, object] = {f"scope.{key}": val for key, val in self.scopes.items()}
+
+scope_snapshot_version: int = 0
+EMPTY_SCOPE_SNAPSHOT = ScopeSnapshot()
+# snapshot of the last baggage that wasn't set through set_scopes, eg. propagated by a non Monocle instrumentation
+last_scope_snapshot: ScopeSnapshot = EMPTY_SCOPE_SNAPSHOT
+
+def __scope_entries(scopes: dict[str, object], context: Context) -> tuple[dict[str, object], ScopeSnapshot]:
+    entries = dict(baggage.get_all(context))
+    for scope_name, scope_value in scopes.items():
+        if scope_value is None:
+            scope_value = __generate_scope_id()
+        entries[f"{MONOCLE_SCOPE_NAME_PREFIX}{scope_name}"] = scope_value
+    return entries, ScopeSnapshot(entries)
+
 def set_scope(scope_name: str, scope_value:str = None, context:Context = None) -> object:
     return set_scopes({scope_name: scope_value}, context)
 
 def set_scopes(scopes:dict[str, object], baggage_context:Context = None) -> object:
     if baggage_context is None:
         baggage_context:Context = get_current()
-    for scope_name, scope_value in scopes.items():
-        if scope_value is None:
-            scope_value = __generate_scope_id()
-        baggage_context = baggage.set_baggage(f"{MONOCLE_SCOPE_NAME_PREFIX}{scope_name}", scope_value, baggage_context)
-        
-    token:object = attach(baggage_context)
+    # the baggage and the scope snapshot are set in a single copy of the context
+    updated = dict(baggage_context)
+    updated[_BAGGAGE_KEY], updated[_MONOCLE_SCOPES_KEY] = __scope_entries(scopes, baggage_context)
+    token:object = attach(Context(updated))
     return token
 
 def remove_scope(token:object) -> None:
     remove_scopes(token)
 
 def remove_scopes(token:object) -> None:
+    # detaching restores the previous baggage along with its scope snapshot
     if token is not None:
         detach(token)
 
+def get_scope_snapshot(context: Optional[Context] = None) -> ScopeSnapshot:
+    """Scopes of the context, rebuilt only when the baggage changed outside of set_scopes."""
+    global last_scope_snapshot
+    entries = get_value(_BAGGAGE_KEY, context)
+    if not entries:
+        return EMPTY_SCOPE_SNAPSHOT
+    snapshot = get_value(_MONOCLE_SCOPES_KEY, context)
+    if snapshot is not None and snapshot.baggage is entries:
+        return snapshot
+    snapshot = last_scope_snapshot
+    if snapshot.baggage is not entries:
+        snapshot = last_scope_snapshot = ScopeSnapshot(entries)
+    return snapshot
+
 def get_scopes(scope_name: Optional[str] = None) -> dict[str, object]:
-    monocle_scopes:dict[str, object] = {}
-    for key, val in baggage.get_all().items():
-        if key.startswith(MONOCLE_SCOPE_NAME_PREFIX) and (scope_name is None or key == f"{MONOCLE_SCOPE_NAME_PREFIX}{scope_name}"):
-            monocle_scopes[key[len(MONOCLE_SCOPE_NAME_PREFIX):]] = val
-    return monocle_scopes
+    scopes = get_scope_snapshot().scopes
+    if scope_name is None:
+        return dict(scopes)
+    if scope_name in scopes:
+        return {scope_name: scopes[scope_name]}
+    return {}
 
 def is_scope_set(scepe_name: str) -> bool:
-    return len(get_scopes(scepe_name)) > 0
+    return scepe_name in get_scope_snapshot().scopes
 
 def get_baggage_for_scopes():
     baggage_context:Context = None
@@ -530,23 +642,6 @@ def get_status(arguments):
     else:
         return 'error'
 
-def patch_instance_method(obj, method_name, func):
-    """
-    Patch a special method (like __iter__) for a single instance.
-
-    Args:
-        obj: the instance to patch
-        method_name: the name of the method (e.g., '__iter__')
-        func: the new function, expecting (self, ...)
-    """
-    cls = obj.__class__
-    # Dynamically create a new class that inherits from obj's class
-    new_cls = type(f"Patched{cls.__name__}", (cls,), {
-        method_name: func
-    })
-    obj.__class__ = new_cls
-
-
 def set_monocle_span_in_context(
     span: Span, context: Optional[Context] = None
 ) -> Context:
@@ -560,6 +655,32 @@ def set_monocle_span_in_context(
     ctx = set_value(_MONOCLE_SPAN_KEY, span, context=context)
     return ctx
 
+def get_monocle_span_context(span: Span, set_current_span: bool = False, values: Optional[dict] = None,
+                             scopes: Optional[dict] = None, context: Optional[Context] = None) -> Context:
+    """Copy of the context with the Monocle span, the given values and scopes set.
+
+    All the keys are updated in a single copy of the context, instead of one copy per key.
+
+    Args:
+        span: The Span to set as the current Monocle span.
+        set_current_span: Set the span as the current OTel span as well.
+        values: Context values to set.
+        scopes: Scopes to set, a None value generates the scope id.
+        context: a Context object. if one is not passed, the
+            default current context is used instead.
+    """
+    if context is None:
+        context = get_current()
+    updated = dict(context)
+    updated[_MONOCLE_SPAN_KEY] = span
+    if set_current_span:
+        updated[_SPAN_KEY] = span
+    if values:
+        updated.update(values)
+    if scopes:
+        updated[_BAGGAGE_KEY], updated[_MONOCLE_SCOPES_KEY] = __scope_entries(scopes, context)
+    return Context(updated)
+
 def get_current_monocle_span(context: Optional[Context] = None) -> Span:
     """Retrieve the current span.
 
@@ -689,26 +810,9 @@ def extract_from_agent_name(parent_span):
 # Store original to_json method for monkey-patching
 _original_to_json = None
 
-def _remove_0x_prefix(obj):
-    """Recursively remove 0x prefix from hex strings in a JSON object."""
-    if isinstance(obj, dict):
-        return {k: _remove_0x_prefix(v) for k, v in obj.items()}
-    elif isinstance(obj, list):
-        return [_remove_0x_prefix(item) for item in obj]
-    elif isinstance(obj, str) and obj.startswith("0x"):
-        return obj[2:]
-    return obj
-
 def _patched_to_json(self, indent=None):
-    """Patched to_json that removes 0x prefix from trace_id/span_id/parent_id."""
-    global _original_to_json
-    original_json = _original_to_json(self, indent=indent)
-    obj = json.loads(original_json)
-    obj = _remove_0x_prefix(obj)
-    if indent is None:
-        return json.dumps(obj, separators=(',', ':'))
-    else:
-        return json.dumps(obj, indent=indent)
+    """Patched to_json that writes the Monocle wire format (no 0x prefix on trace_id/span_id/parent_id) in one pass."""
+    return encode_span(self, indent=indent)
 
 def setup_readablespan_patch():
     """Apply monkey-patch to ReadableSpan.to_json to remove 0x prefix from trace/span IDs."""
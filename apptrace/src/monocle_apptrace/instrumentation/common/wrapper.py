@@ -1,34 +1,36 @@
 # pylint: disable=protected-access
 import logging
 import os
+import time
 from contextlib import contextmanager
 import os
-from typing import AsyncGenerator, Iterator
+from typing import AsyncGenerator, Iterator, Optional
 import logging
 from opentelemetry.trace import Tracer
 from opentelemetry.trace.propagation import set_span_in_context, get_current_span
-from opentelemetry.context import set_value, attach, detach, get_value
+from opentelemetry.context import attach, detach, get_current, get_value
 from opentelemetry.trace.span import INVALID_SPAN, Span, SpanContext, TraceFlags, TraceState
-from opentelemetry.trace.status import StatusCode
+from opentelemetry.trace.status import Status, StatusCode
 
 from monocle_apptrace.instrumentation.common.constants import (
     ADD_NEW_WORKFLOW,
     AGENTIC_SPANS,
     WORKFLOW_TYPE_KEY,
 )
-from monocle_apptrace.instrumentation.common.scope_wrapper import monocle_trace_scope
+from monocle_apptrace.instrumentation.common.head_sampling import get_head_sampling_decision
+from monocle_apptrace.instrumentation.common.self_telemetry import record_wrapper_overhead
+from monocle_apptrace.instrumentation.common.span_collapse import get_span_collapse, merge_into_span
 from monocle_apptrace.instrumentation.common.span_handler import SpanHandler
 from monocle_apptrace.instrumentation.common.utils import (
     get_current_monocle_span,
+    get_monocle_span_context,
     remove_scope,
-    set_monocle_span_in_context,
     set_scope,
     set_scopes,
     with_tracer_wrapper,
     set_scope,
     remove_scope,
     get_current_monocle_span,
-    set_monocle_span_in_context,
 )
 
 logger = logging.getLogger(__name__)
@@ -100,14 +102,15 @@ def get_span_name(to_wrap, instance):
         name = to_wrap.get("package", "") + "." + to_wrap.get("object", "") + "." + to_wrap.get("method", "")
     return name
 
-def monocle_wrapper_span_processor(tracer: Tracer, handler: SpanHandler, to_wrap, wrapped, instance, source_path, add_workflow_span, args, kwargs):
+def monocle_wrapper_span_processor(tracer: Tracer, handler: SpanHandler, to_wrap, wrapped, instance, source_path, add_workflow_span, args, kwargs, scope_name=None):
     # Main span processing logic
+    started = time.perf_counter()
     name = get_span_name(to_wrap, instance)
     return_value = None
     span_status = None
     auto_close_span = get_auto_close_span(to_wrap, kwargs)
     parent_span = get_current_monocle_span()
-    with start_as_monocle_span(tracer, name, auto_close_span) as span:
+    with start_as_monocle_span(tracer, name, auto_close_span, {ADD_NEW_WORKFLOW: False}, scope_name) as span:
         pre_process_span(name, tracer, handler, add_workflow_span, to_wrap, wrapped, instance, args, kwargs, span, source_path)
         
         if SpanHandler.is_root_span(span) or add_workflow_span:
@@ -126,8 +129,8 @@ def monocle_wrapper_span_processor(tracer: Tracer, handler: SpanHandler, to_wrap
                 except Exception as e:
                     logger.info(f"Warning: Error occurred in hydrate_span pre_process_span: {e}")
                 try:
-                    with monocle_trace_scope(get_builtin_scope_names(to_wrap)):
-                        return_value, span_status = monocle_wrapper_span_processor(tracer, handler, to_wrap, wrapped, instance, source_path, False, args, kwargs)
+                    return_value, span_status = monocle_wrapper_span_processor(tracer, handler, to_wrap, wrapped, instance, source_path, False,
+                                                                               args, kwargs, get_builtin_scope_names(to_wrap))
                 except Exception as e:
                     ex = e
                     raise
@@ -139,22 +142,28 @@ def monocle_wrapper_span_processor(tracer: Tracer, handler: SpanHandler, to_wrap
                                 is_post_exec=False)
                 except Exception as e:
                     logger.info(f"Warning: Error occurred in hydrate_span pre_process_span: {e}")
+                overhead = time.perf_counter() - started
                 try:
                     skip_execution, return_value = SpanHandler.skip_execution(span)
                     if not skip_execution:
-                        with SpanHandler.workflow_type(to_wrap, span):
+                        with SpanHandler.workflow_type(to_wrap, span), get_span_collapse().active_span(to_wrap, span):
                             return_value = wrapped(*args, **kwargs)
                 except Exception as e:
                     ex = e
                     raise
                 finally:
                     def post_process_span_internal(ret_val):
+                        post_started = time.perf_counter()
                         post_process_span(handler, to_wrap, wrapped, instance, args, kwargs, ret_val, span, parent_span ,ex)
                         if not auto_close_span:
                             span.end()
+                        record_wrapper_overhead(name, overhead + time.perf_counter() - post_started)
                         return ret_val
                     if ex is None and not auto_close_span and to_wrap.get("output_processor") and to_wrap.get("output_processor").get("response_processor"):
-                        to_wrap.get("output_processor").get("response_processor")(to_wrap, return_value, post_process_span_internal)
+                        # the response processor may hand back a proxy of the streamed response
+                        instrumented_value = to_wrap.get("output_processor").get("response_processor")(to_wrap, return_value, post_process_span_internal)
+                        if instrumented_value is not None:
+                            return_value = instrumented_value
                     else:
                         return_value = post_process_span_internal(return_value)
             span_status = span.status
@@ -163,7 +172,7 @@ def monocle_wrapper_span_processor(tracer: Tracer, handler: SpanHandler, to_wrap
 def monocle_wrapper(tracer: Tracer, handler: SpanHandler, to_wrap, wrapped, instance, source_path, args, kwargs):
     return_value = None
     pre_trace_token = None
-    token = None
+    sampling_token = None
     try:
         try:
             pre_trace_token, alternate_to_wrapp = handler.pre_tracing(to_wrap, wrapped, instance, args, kwargs)
@@ -171,32 +180,45 @@ def monocle_wrapper(tracer: Tracer, handler: SpanHandler, to_wrap, wrapped, inst
                 to_wrap = alternate_to_wrapp
         except Exception as e:
             logger.info(f"Warning: Error occurred in pre_tracing: {e}")
-        if to_wrap.get('skip_span', False) or handler.skip_span(to_wrap, wrapped, instance, args, kwargs):
+        # decided once pre_tracing has imported the upstream trace context, eg. of an http request
+        sampled, sampling_token = get_head_sampling_decision(get_value(ADD_NEW_WORKFLOW) == True)
+        if not sampled:
+            # trace dropped by head sampling, no span or accessor work
+            return_value = wrapped(*args, **kwargs)
+            return return_value
+        skip_span = to_wrap.get('skip_span', False) or handler.skip_span(to_wrap, wrapped, instance, args, kwargs)
+        outer_span = None if skip_span else get_span_collapse().collapse(to_wrap)
+        if skip_span:
+            return_value = wrapped(*args, **kwargs)
+        elif outer_span is not None:
+            # nested call of the same logical call, traced by the outer span
+            merge_into_span(handler, to_wrap, wrapped, instance, args, kwargs, None, outer_span, is_post_exec=False)
             return_value = wrapped(*args, **kwargs)
+            merge_into_span(handler, to_wrap, wrapped, instance, args, kwargs, return_value, outer_span, is_post_exec=True)
         else:
+            # the workflow flag and the builtin scope are set along with the span context
             add_workflow_span = get_value(ADD_NEW_WORKFLOW) == True
-            token = attach(set_value(ADD_NEW_WORKFLOW, False))
-            try:
-                with monocle_trace_scope(get_builtin_scope_names(to_wrap)):
-                    return_value, span_status = monocle_wrapper_span_processor(tracer, handler, to_wrap, wrapped, instance, source_path, add_workflow_span, args, kwargs)
-            finally:
-                detach(token)
+            return_value, span_status = monocle_wrapper_span_processor(tracer, handler, to_wrap, wrapped, instance, source_path, add_workflow_span,
+                                                                       args, kwargs, get_builtin_scope_names(to_wrap))
         return return_value
     finally:
+        if sampling_token is not None:
+            detach(sampling_token)
         try:
             handler.post_tracing(to_wrap, wrapped, instance, args, kwargs, return_value, token=pre_trace_token)
         except Exception as e:
             logger.info(f"Warning: Error occurred in post_tracing: {e}")
 
 async def amonocle_wrapper_span_processor(tracer: Tracer, handler: SpanHandler, to_wrap, wrapped, instance, source_path, add_workflow_span,
-                                        args, kwargs):
+                                        args, kwargs, scope_name=None):
     # Main span processing logic
+    started = time.perf_counter()
     name = get_span_name(to_wrap, instance)
     return_value = None
     span_status = None
     auto_close_span = get_auto_close_span(to_wrap, kwargs)
     parent_span = get_current_monocle_span()
-    with start_as_monocle_span(tracer, name, auto_close_span) as span:
+    with start_as_monocle_span(tracer, name, auto_close_span, {ADD_NEW_WORKFLOW: False}, scope_name) as span:
         pre_process_span(name, tracer, handler, add_workflow_span, to_wrap, wrapped, instance, args, kwargs, span, source_path)
         
         if SpanHandler.is_root_span(span) or add_workflow_span:
@@ -216,8 +238,8 @@ async def amonocle_wrapper_span_processor(tracer: Tracer, handler: SpanHandler,
                     logger.info(f"Warning: Error occurred in hydrate_span pre_process_span: {e}")
 
                 try:
-                    with monocle_trace_scope(get_builtin_scope_names(to_wrap)):
-                        return_value, span_status = await amonocle_wrapper_span_processor(tracer, handler, to_wrap, wrapped, instance, source_path, False, args, kwargs)
+                    return_value, span_status = await amonocle_wrapper_span_processor(tracer, handler, to_wrap, wrapped, instance, source_path, False,
+                                                                                      args, kwargs, get_builtin_scope_names(to_wrap))
                 except Exception as e:
                     ex = e
                     raise
@@ -229,36 +251,43 @@ async def amonocle_wrapper_span_processor(tracer: Tracer, handler: SpanHandler,
                                 is_post_exec=False)
                 except Exception as e:
                     logger.info(f"Warning: Error occurred in hydrate_span pre_process_span: {e}")
+                overhead = time.perf_counter() - started
                 try:
                     skip_execution, return_value = SpanHandler.skip_execution(span)
                     if not skip_execution:
-                        with SpanHandler.workflow_type(to_wrap, span):
+                        with SpanHandler.workflow_type(to_wrap, span), get_span_collapse().active_span(to_wrap, span):
                             return_value = await wrapped(*args, **kwargs)
                 except Exception as e:
                     ex = e
                     raise
                 finally:
                     def post_process_span_internal(ret_val):
+                        post_started = time.perf_counter()
                         ret_val = post_process_span(handler, to_wrap, wrapped, instance, args, kwargs, ret_val, span, parent_span, ex)
                         if not auto_close_span:
                             span.end()
+                        record_wrapper_overhead(name, overhead + time.perf_counter() - post_started)
                         return ret_val
                     if ex is None and not auto_close_span and to_wrap.get("output_processor") and to_wrap.get("output_processor").get("response_processor"):
-                        to_wrap.get("output_processor").get("response_processor")(to_wrap, return_value, post_process_span_internal)
+                        # the response processor may hand back a proxy of the streamed response
+                        instrumented_value = to_wrap.get("output_processor").get("response_processor")(to_wrap, return_value, post_process_span_internal)
+                        if instrumented_value is not None:
+                            return_value = instrumented_value
                     else:
                         return_value = post_process_span_internal(return_value)
         span_status = span.status
     return return_value, span_status
 
 async def amonocle_iter_wrapper_span_processor(tracer: Tracer, handler: SpanHandler, to_wrap, wrapped, instance, source_path, add_workflow_span,
-                                        args, kwargs) -> AsyncGenerator[any, None]:
+                                        args, kwargs, scope_name=None) -> AsyncGenerator[any, None]:
     # Main span processing logic
+    started = time.perf_counter()
     name = get_span_name(to_wrap, instance)
     auto_close_span = get_auto_close_span(to_wrap, kwargs)
     parent_span = get_current_monocle_span()
     last_item = None
 
-    with start_as_monocle_span(tracer, name, auto_close_span) as span:
+    with start_as_monocle_span(tracer, name, auto_close_span, {ADD_NEW_WORKFLOW: False}, scope_name) as span:
         pre_process_span(name, tracer, handler, add_workflow_span, to_wrap, wrapped, instance, args, kwargs, span, source_path)
 
         if SpanHandler.is_root_span(span) or add_workflow_span:
@@ -278,10 +307,10 @@ async def amonocle_iter_wrapper_span_processor(tracer: Tracer, handler: SpanHand
                 except Exception as e:
                     logger.info(f"Warning: Error occurred in hydrate_span pre_process_span: {e}")
                 try:
-                    with monocle_trace_scope(get_builtin_scope_names(to_wrap)):
-                        async for item in amonocle_iter_wrapper_span_processor(tracer, handler, to_wrap, wrapped, instance, source_path, False, args, kwargs):
-                            last_item = item
-                            yield item
+                    async for item in amonocle_iter_wrapper_span_processor(tracer, handler, to_wrap, wrapped, instance, source_path, False,
+                                                                           args, kwargs, get_builtin_scope_names(to_wrap)):
+                        last_item = item
+                        yield item
                 except Exception as e:
                     ex = e
                     raise
@@ -293,10 +322,11 @@ async def amonocle_iter_wrapper_span_processor(tracer: Tracer, handler: SpanHand
                                 is_post_exec=False)
                 except Exception as e:
                     logger.info(f"Warning: Error occurred in hydrate_span pre_process_span: {e}")
+                overhead = time.perf_counter() - started
                 try:
                     skip_execution, last_item = SpanHandler.skip_execution(span)
                     if not skip_execution:
-                        with SpanHandler.workflow_type(to_wrap, span):
+                        with SpanHandler.workflow_type(to_wrap, span), get_span_collapse().active_span(to_wrap, span):
                             async for item in wrapped(*args, **kwargs):
                                 last_item = item
                                 yield item
@@ -307,9 +337,11 @@ async def amonocle_iter_wrapper_span_processor(tracer: Tracer, handler: SpanHand
                     raise
                 finally:
                     def post_process_span_internal(ret_val):
+                        post_started = time.perf_counter()
                         ret_val = post_process_span(handler, to_wrap, wrapped, instance, args, kwargs, ret_val, span, parent_span, ex)
                         if not auto_close_span:
                             span.end()
+                        record_wrapper_overhead(name, overhead + time.perf_counter() - post_started)
                     if ex is None and not auto_close_span and to_wrap.get("output_processor") and to_wrap.get("output_processor").get("response_processor"):
                         to_wrap.get("output_processor").get("response_processor")(to_wrap, None, post_process_span_internal)
                     else:
@@ -318,8 +350,8 @@ async def amonocle_iter_wrapper_span_processor(tracer: Tracer, handler: SpanHand
 
 async def amonocle_wrapper(tracer: Tracer, handler: SpanHandler, to_wrap, wrapped, instance, source_path, args, kwargs):
     return_value = None
-    token = None
     pre_trace_token = None
+    sampling_token = None
     try:
         try:
             pre_trace_token, alternate_to_wrapp = handler.pre_tracing(to_wrap, wrapped, instance, args, kwargs)
@@ -327,27 +359,36 @@ async def amonocle_wrapper(tracer: Tracer, handler: SpanHandler, to_wrap, wrappe
                 to_wrap = alternate_to_wrapp
         except Exception as e:
             logger.info(f"Warning: Error occurred in pre_tracing: {e}")
-        if to_wrap.get('skip_span', False) or handler.skip_span(to_wrap, wrapped, instance, args, kwargs):
+        sampled, sampling_token = get_head_sampling_decision(get_value(ADD_NEW_WORKFLOW) == True)
+        if not sampled:
             return_value = await wrapped(*args, **kwargs)
+            return return_value
+        skip_span = to_wrap.get('skip_span', False) or handler.skip_span(to_wrap, wrapped, instance, args, kwargs)
+        outer_span = None if skip_span else get_span_collapse().collapse(to_wrap)
+        if skip_span:
+            return_value = await wrapped(*args, **kwargs)
+        elif outer_span is not None:
+            # nested call of the same logical call, traced by the outer span
+            merge_into_span(handler, to_wrap, wrapped, instance, args, kwargs, None, outer_span, is_post_exec=False)
+            return_value = await wrapped(*args, **kwargs)
+            merge_into_span(handler, to_wrap, wrapped, instance, args, kwargs, return_value, outer_span, is_post_exec=True)
         else:
+            # the workflow flag and the builtin scope are set along with the span context
             add_workflow_span = get_value(ADD_NEW_WORKFLOW) == True
-            token = attach(set_value(ADD_NEW_WORKFLOW, False))
-            try:
-                with monocle_trace_scope(get_builtin_scope_names(to_wrap)):
-                    return_value, span_status = await amonocle_wrapper_span_processor(tracer, handler, to_wrap, wrapped, instance, source_path, 
-                                                                        add_workflow_span, args, kwargs)
-            finally:
-                detach(token)
+            return_value, span_status = await amonocle_wrapper_span_processor(tracer, handler, to_wrap, wrapped, instance, source_path,
+                                                                              add_workflow_span, args, kwargs, get_builtin_scope_names(to_wrap))
         return return_value
     finally:
+        if sampling_token is not None:
+            detach(sampling_token)
         try:
             handler.post_tracing(to_wrap, wrapped, instance, args, kwargs, return_value, pre_trace_token)
         except Exception as e:
             logger.info(f"Warning: Error occurred in post_tracing: {e}")
 
 async def amonocle_iter_wrapper(tracer: Tracer, handler: SpanHandler, to_wrap, wrapped, instance, source_path, args, kwargs) -> AsyncGenerator[any, None]:
-    token = None
     pre_trace_token = None
+    sampling_token = None
     try:
         try:
             pre_trace_token, alternate_to_wrapp = handler.pre_tracing(to_wrap, wrapped, instance, args, kwargs)
@@ -355,20 +396,34 @@ async def amonocle_iter_wrapper(tracer: Tracer, handler: SpanHandler, to_wrap, w
                 to_wrap = alternate_to_wrapp
         except Exception as e:
             logger.info(f"Warning: Error occurred in pre_tracing: {e}")
-        if to_wrap.get('skip_span', False) or handler.skip_span(to_wrap, wrapped, instance, args, kwargs):
+        sampled, sampling_token = get_head_sampling_decision(get_value(ADD_NEW_WORKFLOW) == True)
+        if not sampled:
+            async for item in wrapped(*args, **kwargs):
+                yield item
+            return
+        skip_span = to_wrap.get('skip_span', False) or handler.skip_span(to_wrap, wrapped, instance, args, kwargs)
+        outer_span = None if skip_span else get_span_collapse().collapse(to_wrap)
+        if skip_span:
+            async for item in wrapped(*args, **kwargs):
+                yield item
+        elif outer_span is not None:
+            # nested call of the same logical call, traced by the outer span
+            merge_into_span(handler, to_wrap, wrapped, instance, args, kwargs, None, outer_span, is_post_exec=False)
+            last_item = None
             async for item in wrapped(*args, **kwargs):
+                last_item = item
                 yield item
+            merge_into_span(handler, to_wrap, wrapped, instance, args, kwargs, last_item, outer_span, is_post_exec=True)
         else:
+            # the workflow flag and the builtin scope are set along with the span context
             add_workflow_span = get_value(ADD_NEW_WORKFLOW) == True
-            token = attach(set_value(ADD_NEW_WORKFLOW, False))
-            try:
-                with monocle_trace_scope(get_builtin_scope_names(to_wrap)):
-                    async for item in amonocle_iter_wrapper_span_processor(tracer, handler, to_wrap, wrapped, instance, source_path, add_workflow_span, args, kwargs):
-                        yield item
-            finally:
-                detach(token)
+            async for item in amonocle_iter_wrapper_span_processor(tracer, handler, to_wrap, wrapped, instance, source_path, add_workflow_span,
+                                                                   args, kwargs, get_builtin_scope_names(to_wrap)):
+                yield item
         return
     finally:
+        if sampling_token is not None:
+            detach(sampling_token)
         try:
             handler.post_tracing(to_wrap, wrapped, instance, args, kwargs, None, pre_trace_token)
         except Exception as e:
@@ -452,25 +507,38 @@ def evaluate_scope_values(args, kwargs, to_wrap, scope_values):
     return None
 
 @contextmanager
-def start_as_monocle_span(tracer: Tracer, name: str, auto_close_span: bool) -> Iterator["Span"]:
-    """ Wrapper to OTEL start_as_current_span to isolate monocle and non monocle spans.
+def start_as_monocle_span(tracer: Tracer, name: str, auto_close_span: bool, context_values: Optional[dict] = None,
+                          scope_name: Optional[str] = None) -> Iterator["Span"]:
+    """ Start a span and make it the current monocle span, isolating monocle and non monocle spans.
         This essentially links monocle and non-monocle spans separately which is default behavior.
         It can be optionally overridden by setting the environment variable MONOCLE_ISOLATE_SPANS to false.
+        The monocle span, the context_values and the optional scope are set in a single context switch.
     """
-    if not ISOLATE_MONOCLE_SPANS:
-        # If not isolating, use the default start_as_current_span
-        yield tracer.start_as_current_span(name, end_on_exit=auto_close_span)
-        return
-    
-    original_span = get_current_span()
-    monocle_span_token = attach(set_span_in_context(get_current_monocle_span()))
-    with tracer.start_as_current_span(name, end_on_exit=auto_close_span) as span:
-        new_monocle_token = attach(set_monocle_span_in_context(span))
-        original_span_token = attach(set_span_in_context(original_span))
+    context = get_current()
+    if ISOLATE_MONOCLE_SPANS:
+        # the parent is the current monocle span, the current OTel span is left unchanged
+        monocle_parent = get_current_monocle_span(context)
+        parent_context = None
+        if monocle_parent is not get_current_span(context):
+            parent_context = set_span_in_context(monocle_parent, context)
+        span = tracer.start_span(name, context=parent_context)
+    else:
+        span = tracer.start_span(name, context=context)
+    token = attach(get_monocle_span_context(span, set_current_span=not ISOLATE_MONOCLE_SPANS,
+                                            values=context_values,
+                                            scopes={scope_name: None} if scope_name else None, context=context))
+    try:
         yield span
-        detach(original_span_token)
-        detach(new_monocle_token)
-    detach(monocle_span_token)
+    except Exception as exc:
+        # same as OTel use_span
+        if span.is_recording():
+            span.record_exception(exc)
+            span.set_status(Status(StatusCode.ERROR, f"{type(exc).__name__}: {exc}"))
+        raise
+    finally:
+        detach(token)
+        if auto_close_span:
+            span.end()
 
 def get_builtin_scope_names(to_wrap) -> str:
     output_processor = None
@@ -17,14 +17,17 @@ INFERENCE = {
             },
             {
                 "attribute": "provider_name",
+                "static": True,
                 "accessor": lambda arguments: _helper.extract_provider_name(arguments['instance'])
             },
             {
                 "attribute": "deployment",
+                "static": True,
                 "accessor": lambda arguments: resolve_from_alias(arguments['instance'].__dict__, ['engine', 'azure_deployment', 'deployment_name', 'deployment_id', 'deployment'])
             },
             {
                 "attribute": "inference_endpoint",
+                "static": True,
                 "accessor": lambda arguments: resolve_from_alias(arguments['instance'].__dict__, ['azure_endpoint', 'api_base', 'endpoint']) or _helper.extract_inference_endpoint(arguments['instance'])
             }
         ],
@@ -56,6 +59,7 @@ INFERENCE = {
     ],
     "events": [
         {"name": "data.input",
+         "deferrable": True,
          "attributes": [
 
              {
@@ -67,6 +71,7 @@ INFERENCE = {
          },
         {
             "name": "data.output",
+            "deferrable": True,
             "attributes": [
                 {
                     "attribute": "error_code",
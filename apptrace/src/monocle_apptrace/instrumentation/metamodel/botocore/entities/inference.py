@@ -52,6 +52,7 @@ INFERENCE = {
     ],
     "events": [
         {"name": "data.input",
+         "deferrable": True,
          "attributes": [
              {
                  "_comment": "this is instruction and user query to LLM",
@@ -62,6 +63,7 @@ INFERENCE = {
          },
         {
             "name": "data.output",
+            "deferrable": True,
             "attributes": [
                 {
                     "attribute": "error_code",
@@ -1,11 +1,21 @@
 from monocle_apptrace.instrumentation.common.constants import SPAN_TYPES
 from monocle_apptrace.instrumentation.common.utils import get_error_message, resolve_from_alias
+from monocle_apptrace.instrumentation.common.stream_aggregator import AggregatingStreamHooks
+from monocle_apptrace.instrumentation.common.stream_proxy import ITER_METHODS, instrument_stream
 from monocle_apptrace.instrumentation.metamodel.hugging_face import _helper
 
 
+def process_stream(to_wrap, response, span_processor):
+    # chat_completion(stream=True) returns a (async) generator, which is handed back wrapped in a stream proxy
+    hooks = AggregatingStreamHooks(span_processor, completion_result=True)
+    return instrument_stream(response, hooks, ITER_METHODS)
+
+
 INFERENCE = {
     "type": SPAN_TYPES.INFERENCE,
     "subtype": lambda arguments: _helper.agent_inference_type(arguments),
+    "is_auto_close": lambda kwargs: kwargs.get("stream", False) is False,
+    "response_processor": process_stream,
     "attributes": [
         [
             {
@@ -12,19 +12,23 @@ INFERENCE = {
             {
                 "_comment": "provider type ,name , deployment , inference_endpoint",
                 "attribute": "type",
+                "static": True,
                 "accessor": lambda arguments: 'inference.' + (get_llm_type(arguments['instance']) or 'generic')
 
             },
             {
                 "attribute": "provider_name",
+                "static": True,
                 "accessor": lambda arguments: _helper.extract_provider_name(arguments['instance'])
             },
             {
                 "attribute": "deployment",
+                "static": True,
                 "accessor": lambda arguments: resolve_from_alias(arguments['instance'].__dict__, ['engine', 'azure_deployment', 'deployment_name', 'deployment_id', 'deployment'])
             },
             {
                 "attribute": "inference_endpoint",
+                "static": True,
                 "accessor": lambda arguments: resolve_from_alias(arguments['instance'].__dict__, ['azure_endpoint', 'api_base', 'endpoint']) or _helper.extract_inference_endpoint(arguments['instance'])
             }
         ],
@@ -32,10 +36,12 @@ INFERENCE = {
             {
                 "_comment": "LLM Model",
                 "attribute": "name",
+                "static": True,
                 "accessor": lambda arguments: resolve_from_alias(arguments['instance'].__dict__, ['model', 'model_name', 'endpoint_name', 'deployment_name', 'model_id'])
             },
             {
                 "attribute": "type",
+                "static": True,
                 "accessor": lambda arguments: 'model.llm.' + resolve_from_alias(arguments['instance'].__dict__, ['model', 'model_name', 'endpoint_name', 'deployment_name', 'model_id'])
             }
         ],
@@ -56,6 +62,7 @@ INFERENCE = {
     ],
     "events": [
         {"name": "data.input",
+         "deferrable": True,
          "attributes": [
 
              {
@@ -67,6 +74,7 @@ INFERENCE = {
          },
         {
             "name": "data.output",
+            "deferrable": True,
             "attributes": [
                 {
                     "attribute": "error_code",
@@ -11,6 +11,7 @@ INFERENCE = {
             {
                 "_comment": "provider type ,name , deployment , inference_endpoint",
                 "attribute": "type",
+                "static": True,
                 "accessor": lambda arguments: 'inference.' + (get_llm_type(arguments['instance']) or 'generic')
 
             },
@@ -21,10 +22,12 @@ INFERENCE = {
             },
             {
                 "attribute": "deployment",
+                "static": True,
                 "accessor": lambda arguments: resolve_from_alias(arguments['instance'].__dict__, ['engine', 'azure_deployment', 'deployment_name', 'deployment_id', 'deployment'])
             },
             {
                 "attribute": "inference_endpoint",
+                "static": True,
                 "accessor": lambda arguments: resolve_from_alias(arguments['instance'].__dict__, ['azure_endpoint', 'api_base']) or _helper.extract_inference_endpoint(arguments['instance'])
             }
         ],
@@ -32,10 +35,12 @@ INFERENCE = {
             {
                 "_comment": "LLM Model",
                 "attribute": "name",
+                "static": True,
                 "accessor": lambda arguments: resolve_from_alias(arguments['instance'].__dict__, ['model', 'model_name'])
             },
             {
                 "attribute": "type",
+                "static": True,
                 "accessor": lambda arguments: 'model.llm.' + resolve_from_alias(arguments['instance'].__dict__, ['model', 'model_name'])
             }
         ],
@@ -1,6 +1,8 @@
 from monocle_apptrace.instrumentation.common.constants import SPAN_TYPES
 from monocle_apptrace.instrumentation.metamodel.mistral import _helper
 from monocle_apptrace.instrumentation.common.utils import get_error_message, resolve_from_alias
+from monocle_apptrace.instrumentation.common.stream_aggregator import AggregatingStreamHooks
+from monocle_apptrace.instrumentation.common.stream_proxy import NEXT_METHODS, instrument_stream
 
 MISTRAL_INFERENCE = {
     "type": SPAN_TYPES.INFERENCE,
@@ -103,3 +105,18 @@ MISTRAL_INFERENCE = {
         }
     ]
 }
+
+def _add_stream_event(aggregator, event):
+    # stream events wrap the completion chunk in data
+    aggregator.add_chat_chunk(getattr(event, "data", event))
+
+def process_stream(to_wrap, response, span_processor):
+    # mistral event streams are their own iterators, the span ends with the aggregated stream shaped as a completion
+    hooks = AggregatingStreamHooks(span_processor, _add_stream_event, completion_result=True)
+    return instrument_stream(response, hooks, NEXT_METHODS)
+
+MISTRAL_STREAM_INFERENCE = {
+    **MISTRAL_INFERENCE,
+    "is_auto_close": lambda kwargs: False,
+    "response_processor": process_stream,
+}
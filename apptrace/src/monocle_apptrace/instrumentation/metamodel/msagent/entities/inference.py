@@ -8,7 +8,7 @@ from monocle_apptrace.instrumentation.common.constants import (
     SPAN_TYPES,
 )
 from monocle_apptrace.instrumentation.metamodel.msagent import _helper
-from monocle_apptrace.instrumentation.common.utils import get_error_message, patch_instance_method, resolve_from_alias
+from monocle_apptrace.instrumentation.common.utils import get_error_message, resolve_from_alias
 
 logger = logging.getLogger(__name__)
 
@@ -0,0 +1,4 @@
+from monocle_apptrace.query.index import DEFAULT_INDEX_FILE, TraceIndex, parse_time
+from monocle_apptrace.query.reader import find_trace_files, iter_spans
+
+__all__ = ["DEFAULT_INDEX_FILE", "TraceIndex", "find_trace_files", "iter_spans", "parse_time"]
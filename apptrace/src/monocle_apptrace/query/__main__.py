@@ -0,0 +1,96 @@
+"""
+Query Monocle trace files from the command line.
+
+    python -m monocle_apptrace.query index .monocle
+    python -m monocle_apptrace.query spans --workflow my_app --span-type inference
+    python -m monocle_apptrace.query trace 0102375d603cc4f5f4495b4e156e0e71
+    python -m monocle_apptrace.query latency --since 2025-01-01T00:00:00Z
+    python -m monocle_apptrace.query tokens
+    python -m monocle_apptrace.query errors
+"""
+import argparse
+import json
+import os
+import sys
+
+from monocle_apptrace.query.index import DEFAULT_INDEX_FILE, TraceIndex
+
+def _add_filters(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--trace-id", help="trace id, hex")
+    parser.add_argument("--workflow", help="workflow.name")
+    parser.add_argument("--span-type", help="span.type, a trailing * matches a prefix")
+    parser.add_argument("--entity", help="entity name, e.g. a model or tool name")
+    parser.add_argument("--scope", help="scope value as name=value")
+    parser.add_argument("--since", help="start time lower bound, ISO 8601")
+    parser.add_argument("--until", help="start time upper bound, ISO 8601")
+    parser.add_argument("--status", help="status code, OK or ERROR")
+
+def _filters(args: argparse.Namespace) -> dict:
+    scope = None
+    if args.scope:
+        if "=" not in args.scope:
+            raise SystemExit("--scope must be name=value")
+        scope = tuple(args.scope.split("=", 1))
+    return {"trace_id": args.trace_id, "workflow": args.workflow, "span_type": args.span_type,
+            "entity": args.entity, "scope": scope, "start": args.since, "end": args.until, "status": args.status}
+
+def _print_rows(rows) -> None:
+    for row in rows:
+        print(json.dumps(row))
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m monocle_apptrace.query",
+                                     description="Index and query Monocle trace files.")
+    parser.add_argument("--index", default=os.path.join(".monocle", DEFAULT_INDEX_FILE),
+                        help="index database path (default: %(default)s)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    index_command = commands.add_parser("index", help="index new and changed trace files")
+    index_command.add_argument("paths", nargs="+", help="trace files, folders or glob patterns")
+    index_command.add_argument("--prune", action="store_true", help="drop the spans of deleted files")
+
+    spans_command = commands.add_parser("spans", help="list the matching spans")
+    _add_filters(spans_command)
+    spans_command.add_argument("--limit", type=int, default=100)
+
+    trace_command = commands.add_parser("trace", help="print the full spans of a trace")
+    trace_command.add_argument("trace_id")
+
+    latency_command = commands.add_parser("latency", help="latency percentiles (ms) per span.type")
+    _add_filters(latency_command)
+    latency_command.add_argument("--percentiles", default="50,95", help="comma separated (default: %(default)s)")
+    latency_command.add_argument("--group-by", default="span_type")
+
+    tokens_command = commands.add_parser("tokens", help="token usage per model")
+    _add_filters(tokens_command)
+    tokens_command.add_argument("--group-by", default="model")
+
+    errors_command = commands.add_parser("errors", help="error counts per tool")
+    _add_filters(errors_command)
+    errors_command.add_argument("--group-by", default="tool")
+
+    args = parser.parse_args(argv)
+    index_dir = os.path.dirname(args.index)
+    if index_dir:
+        os.makedirs(index_dir, exist_ok=True)
+    with TraceIndex(args.index) as index:
+        if args.command == "index":
+            stats = index.add_paths(args.paths)
+            if args.prune:
+                stats["removed"] = index.remove_missing_files()
+            print(json.dumps(stats))
+        elif args.command == "spans":
+            _print_rows(index.search(limit=args.limit, **_filters(args)))
+        elif args.command == "trace":
+            print(json.dumps(index.get_trace(args.trace_id), indent=4))
+        elif args.command == "latency":
+            percentiles = [float(value) for value in args.percentiles.split(",") if value.strip()]
+            _print_rows(index.latency_percentiles(percentiles, group_by=args.group_by, **_filters(args)))
+        elif args.command == "tokens":
+            _print_rows(index.token_usage(group_by=args.group_by, **_filters(args)))
+        elif args.command == "errors":
+            _print_rows(index.error_counts(group_by=args.group_by, **_filters(args)))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
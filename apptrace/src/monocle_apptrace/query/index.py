@@ -0,0 +1,313 @@
+"""
+On-disk SQLite index over Monocle trace files.
+
+Each span is reduced to one row holding the fields that queries filter and aggregate on (trace id, workflow name,
+span type, time range, status, model, tool and token counts) plus its entity names and scope values. Files are
+indexed incrementally, a file is only read again when its size or modification time changes. Queries and aggregates
+run inside SQLite, so they don't need the spans in memory.
+"""
+import logging
+import os
+import sqlite3
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+from monocle_apptrace.query.reader import find_trace_files, iter_spans
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INDEX_FILE = "monocle_index.sqlite"
+TOOL_SPAN_TYPE = "agentic.tool.invocation"
+MODEL_ENTITY_TYPE_PREFIX = "model.llm."
+SCOPE_ATTRIBUTE_PREFIX = "scope."
+METADATA_EVENT = "metadata"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    file_id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS spans (
+    span_key INTEGER PRIMARY KEY,
+    file_id INTEGER NOT NULL,
+    trace_id TEXT,
+    span_id TEXT,
+    parent_id TEXT,
+    name TEXT,
+    span_type TEXT,
+    workflow_name TEXT,
+    start_time REAL,
+    end_time REAL,
+    duration_ms REAL,
+    status_code TEXT,
+    model TEXT,
+    tool TEXT,
+    prompt_tokens INTEGER,
+    completion_tokens INTEGER,
+    total_tokens INTEGER
+);
+CREATE TABLE IF NOT EXISTS entities (span_key INTEGER NOT NULL, name TEXT, type TEXT);
+CREATE TABLE IF NOT EXISTS scopes (span_key INTEGER NOT NULL, name TEXT, value TEXT);
+CREATE INDEX IF NOT EXISTS spans_trace_id ON spans (trace_id);
+CREATE INDEX IF NOT EXISTS spans_workflow_name ON spans (workflow_name);
+CREATE INDEX IF NOT EXISTS spans_span_type ON spans (span_type);
+CREATE INDEX IF NOT EXISTS spans_start_time ON spans (start_time);
+CREATE INDEX IF NOT EXISTS spans_file_id ON spans (file_id);
+CREATE INDEX IF NOT EXISTS entities_name ON entities (name);
+CREATE INDEX IF NOT EXISTS entities_span_key ON entities (span_key);
+CREATE INDEX IF NOT EXISTS scopes_name_value ON scopes (name, value);
+CREATE INDEX IF NOT EXISTS scopes_span_key ON scopes (span_key);
+"""
+
+SPAN_COLUMNS = ("trace_id", "span_id", "parent_id", "name", "span_type", "workflow_name", "start_time", "end_time",
+                "duration_ms", "status_code", "model", "tool", "prompt_tokens", "completion_tokens", "total_tokens")
+
+def parse_time(value: Union[str, float, int, datetime, None]) -> Optional[float]:
+    """Convert an ISO 8601 timestamp (as written by the exporters) or datetime to epoch seconds."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.timestamp()
+    if value.endswith("Z"):
+        value = value[:-1] + "+00:00"
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+def _to_int(value) -> Optional[int]:
+    try:
+        return int(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+def _span_row(span: Dict) -> Tuple[tuple, List[Tuple[str, str]], List[Tuple[str, str]]]:
+    """Reduce a span dict to the indexed row, entity list and scope list."""
+    attributes = span.get("attributes") or {}
+    context = span.get("context") or {}
+    entities = []
+    index = 1
+    while f"entity.{index}.type" in attributes or f"entity.{index}.name" in attributes:
+        entities.append((attributes.get(f"entity.{index}.name"), attributes.get(f"entity.{index}.type")))
+        index += 1
+    scopes = [(key[len(SCOPE_ATTRIBUTE_PREFIX):], str(value)) for key, value in attributes.items()
+              if key.startswith(SCOPE_ATTRIBUTE_PREFIX)]
+    model = next((name for name, entity_type in entities
+                  if isinstance(entity_type, str) and entity_type.startswith(MODEL_ENTITY_TYPE_PREFIX)), None)
+    span_type = attributes.get("span.type")
+    tool = entities[0][0] if span_type == TOOL_SPAN_TYPE and entities else None
+    metadata = next((event.get("attributes") or {} for event in span.get("events") or []
+                     if event.get("name") == METADATA_EVENT), {})
+    start_time = parse_time(span.get("start_time"))
+    end_time = parse_time(span.get("end_time"))
+    duration_ms = (end_time - start_time) * 1000 if start_time is not None and end_time is not None else None
+    row = (
+        context.get("trace_id"), context.get("span_id"), span.get("parent_id"), span.get("name"), span_type,
+        attributes.get("workflow.name"), start_time, end_time, duration_ms,
+        (span.get("status") or {}).get("status_code"), model, tool,
+        _to_int(metadata.get("prompt_tokens")), _to_int(metadata.get("completion_tokens")),
+        _to_int(metadata.get("total_tokens")),
+    )
+    return row, entities, scopes
+
+class TraceIndex:
+    """SQLite index of the spans in a set of trace files."""
+
+    def __init__(self, index_path: str = DEFAULT_INDEX_FILE):
+        self.index_path = index_path
+        self.connection = sqlite3.connect(index_path)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def add_paths(self, paths: Union[str, Iterable[str]]) -> Dict[str, int]:
+        """Index new and changed trace files, returns the count of indexed files and spans."""
+        stats = {"files": 0, "spans": 0, "skipped": 0}
+        for path in find_trace_files(paths):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            existing = self.connection.execute("SELECT file_id, size, mtime FROM files WHERE path = ?", (path,)).fetchone()
+            if existing is not None and existing["size"] == stat.st_size and existing["mtime"] == stat.st_mtime:
+                stats["skipped"] += 1
+                continue
+            try:
+                stats["spans"] += self._index_file(path, stat, existing["file_id"] if existing else None)
+                stats["files"] += 1
+            except Exception as e:
+                logger.warning(f"Unable to index trace file {path}: {e}")
+        return stats
+
+    def _index_file(self, path: str, stat: os.stat_result, file_id: Optional[int]) -> int:
+        with self.connection:
+            if file_id is not None:
+                self._remove_file(file_id)
+                self.connection.execute("UPDATE files SET size = ?, mtime = ? WHERE file_id = ?",
+                                        (stat.st_size, stat.st_mtime, file_id))
+            else:
+                file_id = self.connection.execute("INSERT INTO files (path, size, mtime) VALUES (?, ?, ?)",
+                                                  (path, stat.st_size, stat.st_mtime)).lastrowid
+            span_count = 0
+            for span in iter_spans(path):
+                row, entities, scopes = _span_row(span)
+                span_key = self.connection.execute(
+                    f"INSERT INTO spans (file_id, {', '.join(SPAN_COLUMNS)}) VALUES ({', '.join('?' * (len(SPAN_COLUMNS) + 1))})",
+                    (file_id,) + row).lastrowid
+                if entities:
+                    self.connection.executemany("INSERT INTO entities (span_key, name, type) VALUES (?, ?, ?)",
+                                                [(span_key, name, entity_type) for name, entity_type in entities])
+                if scopes:
+                    self.connection.executemany("INSERT INTO scopes (span_key, name, value) VALUES (?, ?, ?)",
+                                                [(span_key, name, value) for name, value in scopes])
+                span_count += 1
+        return span_count
+
+    def _remove_file(self, file_id: int) -> None:
+        self.connection.execute("DELETE FROM entities WHERE span_key IN (SELECT span_key FROM spans WHERE file_id = ?)", (file_id,))
+        self.connection.execute("DELETE FROM scopes WHERE span_key IN (SELECT span_key FROM spans WHERE file_id = ?)", (file_id,))
+        self.connection.execute("DELETE FROM spans WHERE file_id = ?", (file_id,))
+
+    def remove_missing_files(self) -> int:
+        """Drop the spans of indexed files that no longer exist."""
+        removed = 0
+        with self.connection:
+            for row in self.connection.execute("SELECT file_id, path FROM files").fetchall():
+                if not os.path.exists(row["path"]):
+                    self._remove_file(row["file_id"])
+                    self.connection.execute("DELETE FROM files WHERE file_id = ?", (row["file_id"],))
+                    removed += 1
+        return removed
+
+    @staticmethod
+    def _where(trace_id: Optional[str] = None, workflow: Optional[str] = None, span_type: Optional[str] = None,
+               entity: Optional[str] = None, scope: Optional[Tuple[str, str]] = None,
+               start: Union[str, float, datetime, None] = None, end: Union[str, float, datetime, None] = None,
+               status: Optional[str] = None) -> Tuple[str, list]:
+        clauses = []
+        params = []
+        if trace_id:
+            trace_id = trace_id.lower()
+            clauses.append("spans.trace_id = ?")
+            params.append(trace_id[2:] if trace_id.startswith("0x") else trace_id)
+        if workflow:
+            clauses.append("spans.workflow_name = ?")
+            params.append(workflow)
+        if span_type:
+            if span_type.endswith("*"):
+                clauses.append("spans.span_type LIKE ?")
+                params.append(span_type[:-1] + "%")
+            else:
+                clauses.append("spans.span_type = ?")
+                params.append(span_type)
+        if entity:
+            clauses.append("spans.span_key IN (SELECT span_key FROM entities WHERE name = ?)")
+            params.append(entity)
+        if scope:
+            clauses.append("spans.span_key IN (SELECT span_key FROM scopes WHERE name = ? AND value = ?)")
+            params.extend(scope)
+        if start is not None:
+            clauses.append("spans.start_time >= ?")
+            params.append(parse_time(start))
+        if end is not None:
+            clauses.append("spans.start_time < ?")
+            params.append(parse_time(end))
+        if status:
+            clauses.append("spans.status_code = ?")
+            params.append(status)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+    def search(self, limit: Optional[int] = None, **filters) -> Iterator[Dict]:
+        """Yield the indexed spans matching the filters, ordered by start time."""
+        where, params = self._where(**filters)
+        query = f"SELECT {', '.join(SPAN_COLUMNS)}, files.path AS path FROM spans JOIN files USING (file_id){where} " \
+                f"ORDER BY spans.start_time"
+        if limit:
+            query += " LIMIT ?"
+            params.append(limit)
+        for row in self.connection.execute(query, params):
+            yield dict(row)
+
+    def get_trace(self, trace_id: str) -> List[Dict]:
+        """Read the full spans of a trace back from the indexed files."""
+        where, params = self._where(trace_id=trace_id)
+        paths = [row["path"] for row in self.connection.execute(
+            f"SELECT DISTINCT files.path AS path FROM spans JOIN files USING (file_id){where}", params)]
+        trace_id = params[0]
+        return [span for path in paths for span in iter_spans(path)
+                if (span.get("context") or {}).get("trace_id") == trace_id]
+
+    def latency_percentiles(self, percentiles: Sequence[float] = (50, 95), group_by: str = "span_type",
+                            **filters) -> List[Dict]:
+        """Nearest rank latency percentiles (ms) of the matching spans per group."""
+        if group_by not in SPAN_COLUMNS:
+            raise ValueError(f"Unsupported group by column {group_by}")
+        where, params = self._where(**filters)
+        where = (where + " AND " if where else " WHERE ") + "spans.duration_ms IS NOT NULL"
+        percentile_columns = ", ".join(
+            f"MIN(CASE WHEN rank >= {self._rank_expression(percentile)} THEN duration_ms END) AS \"p{percentile:g}\""
+            for percentile in percentiles)
+        query = f"""
+            WITH ranked AS (
+                SELECT spans.{group_by} AS group_key, spans.duration_ms AS duration_ms,
+                    ROW_NUMBER() OVER (PARTITION BY spans.{group_by} ORDER BY spans.duration_ms) AS rank,
+                    COUNT(*) OVER (PARTITION BY spans.{group_by}) AS total
+                FROM spans{where}
+            )
+            SELECT group_key AS {group_by}, total AS count, AVG(duration_ms) AS avg, MAX(duration_ms) AS max,
+                {percentile_columns}
+            FROM ranked GROUP BY group_key, total ORDER BY group_key
+        """
+        return [dict(row) for row in self.connection.execute(query, params)]
+
+    @staticmethod
+    def _rank_expression(percentile: float) -> str:
+        if not 0 < percentile <= 100:
+            raise ValueError(f"Percentile {percentile} is out of range")
+        # ceil(p * total / 100) without a CEIL function, which older SQLite builds lack
+        scaled = f"({percentile!r} * total / 100.0)"
+        return f"(CAST({scaled} AS INTEGER) + ({scaled} > CAST({scaled} AS INTEGER)))"
+
+    def token_usage(self, group_by: str = "model", **filters) -> List[Dict]:
+        """Token sums of the matching spans per model (or another column)."""
+        if group_by not in SPAN_COLUMNS:
+            raise ValueError(f"Unsupported group by column {group_by}")
+        where, params = self._where(**filters)
+        where = (where + " AND " if where else " WHERE ") + \
+            "(spans.prompt_tokens IS NOT NULL OR spans.completion_tokens IS NOT NULL OR spans.total_tokens IS NOT NULL)"
+        query = f"""
+            SELECT spans.{group_by} AS {group_by}, COUNT(*) AS calls,
+                SUM(COALESCE(spans.prompt_tokens, 0)) AS prompt_tokens,
+                SUM(COALESCE(spans.completion_tokens, 0)) AS completion_tokens,
+                SUM(COALESCE(spans.total_tokens, COALESCE(spans.prompt_tokens, 0) + COALESCE(spans.completion_tokens, 0))) AS total_tokens
+            FROM spans{where} GROUP BY spans.{group_by} ORDER BY total_tokens DESC
+        """
+        return [dict(row) for row in self.connection.execute(query, params)]
+
+    def error_counts(self, group_by: str = "tool", **filters) -> List[Dict]:
+        """Call and error counts of the matching spans per tool (or another column)."""
+        if group_by not in SPAN_COLUMNS:
+            raise ValueError(f"Unsupported group by column {group_by}")
+        if group_by == "tool" and not filters.get("span_type"):
+            filters["span_type"] = TOOL_SPAN_TYPE
+        where, params = self._where(**filters)
+        query = f"""
+            SELECT spans.{group_by} AS {group_by}, COUNT(*) AS calls,
+                SUM(CASE WHEN spans.status_code = 'ERROR' THEN 1 ELSE 0 END) AS errors
+            FROM spans{where} GROUP BY spans.{group_by} ORDER BY errors DESC, calls DESC
+        """
+        return [dict(row) for row in self.connection.execute(query, params)]
@@ -0,0 +1,136 @@
+"""
+Streaming readers for Monocle trace files.
+
+Handles the JSON array files written by the file exporter, the NDJSON files written by the S3, Blob and GCS
+exporters and the NDJSON segments of the file exporter, plain or gzip/zstd compressed. Spans are yielded one at a
+time so that files of any size can be read with constant memory.
+"""
+import glob
+import gzip
+import io
+import json
+import logging
+import os
+from typing import Dict, IO, Iterable, Iterator, List, Union
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+TRACE_FILE_PATTERNS = ("*.json", "*.ndjson", "*.ndjson.gz", "*.ndjson.zst")
+_ARRAY_SEPARATORS = " \t\r\n,"
+
+def _open_text(path: str) -> IO[str]:
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="UTF-8")
+    if path.endswith(".zst"):
+        import zstandard
+        raw = open(path, "rb")
+        try:
+            reader = zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True, closefd=True)
+        except TypeError:
+            # older zstandard releases, which read across frames by default
+            reader = zstandard.ZstdDecompressor().stream_reader(raw)
+        return io.TextIOWrapper(reader, encoding="UTF-8")
+    return open(path, "r", encoding="UTF-8")
+
+def _iter_json_array(handle: IO[str]) -> Iterator[Dict]:
+    """Incrementally decode the objects of a JSON array, tolerating a missing closing bracket."""
+    decoder = json.JSONDecoder()
+    buffer = handle.read(CHUNK_SIZE)
+    position = 0
+    eof = not buffer
+    opened = False
+    while True:
+        while position < len(buffer) and buffer[position] in _ARRAY_SEPARATORS:
+            position += 1
+        if position == len(buffer):
+            if eof:
+                return
+            buffer = handle.read(CHUNK_SIZE)
+            position = 0
+            eof = not buffer
+            continue
+        if not opened:
+            if buffer[position] != "[":
+                raise ValueError("trace file is not a JSON array")
+            opened = True
+            position += 1
+            continue
+        if buffer[position] == "]":
+            return
+        try:
+            item, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if eof:
+                # trace file that is still being written
+                logger.debug(f"Ignoring truncated span at the end of {getattr(handle, 'name', 'trace file')}")
+                return
+            # grow the read size with the pending object so that huge spans are decoded in linear time
+            more = handle.read(max(CHUNK_SIZE, len(buffer) - position))
+            buffer = buffer[position:] + more
+            position = 0
+            eof = not more
+            continue
+        yield item
+
+def _iter_ndjson(handle: IO[str]) -> Iterator[Dict]:
+    for line in handle:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError:
+            logger.debug(f"Ignoring malformed span line in {getattr(handle, 'name', 'trace file')}")
+
+def iter_spans(path: str) -> Iterator[Dict]:
+    """Yield the spans of a trace file, JSON array or NDJSON."""
+    with _open_text(path) as handle:
+        first_char = ""
+        while True:
+            first_char = handle.read(1)
+            if not first_char or not first_char.isspace():
+                break
+        if not first_char:
+            return
+        # put back the peeked character
+        rest = _PrefixedReader(first_char, handle)
+        if first_char == "[":
+            yield from _iter_json_array(rest)
+        else:
+            yield from _iter_ndjson(rest)
+
+class _PrefixedReader:
+    """Text reader that returns a prefix before the rest of the wrapped handle."""
+
+    def __init__(self, prefix: str, handle: IO[str]):
+        self.prefix = prefix
+        self.handle = handle
+        self.name = getattr(handle, "name", "trace file")
+
+    def read(self, size: int = -1) -> str:
+        prefix, self.prefix = self.prefix, ""
+        if size is not None and size >= 0:
+            return prefix + self.handle.read(max(0, size - len(prefix)))
+        return prefix + self.handle.read()
+
+    def __iter__(self):
+        if self.prefix:
+            prefix, self.prefix = self.prefix, ""
+            yield prefix + self.handle.readline()
+        yield from self.handle
+
+def find_trace_files(paths: Union[str, Iterable[str]]) -> List[str]:
+    """Expand files, folders and glob patterns to the list of trace files."""
+    if isinstance(paths, str):
+        paths = [paths]
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for pattern in TRACE_FILE_PATTERNS:
+                files.extend(glob.glob(os.path.join(path, "**", pattern), recursive=True))
+        elif os.path.isfile(path):
+            files.append(path)
+        else:
+            files.extend(glob.glob(path))
+    return sorted(set(os.path.abspath(file) for file in files))
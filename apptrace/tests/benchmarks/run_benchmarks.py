@@ -0,0 +1,288 @@
+"""
+Instrumentation overhead benchmarks.
+
+Drives each metamodel through offline stub providers (see scenarios.py) in three modes:
+
+- ``baseline``: before the telemetry is set up
+- ``sampled``: instrumented, every trace is recorded and exported to an in-memory exporter
+- ``dropped``: instrumented, every trace is dropped by the head sampler
+
+For each scenario and mode it records the per call latency (mean and percentiles of the best of ``--repeat`` runs),
+the memory allocated per call (tracemalloc peak) and the memory retained per call, and for the sampled mode the spans
+recorded per call and per second. The overhead of the instrumented modes over the baseline is checked against
+thresholds.json, and optionally against a previous results file. A scenario recording no spans in the sampled mode
+fails, as its overhead doesn't measure the instrumentation. The results are written as JSON and the exit status is 1
+when a threshold is exceeded.
+
+Run from the apptrace directory:
+
+    python tests/benchmarks/run_benchmarks.py --output benchmark_results.json
+    python tests/benchmarks/run_benchmarks.py --scenario openai_chat --compare previous_results.json
+"""
+import argparse
+import asyncio
+import gc
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+
+from scenarios import SCENARIOS, Scenario
+
+MODES = ("baseline", "sampled", "dropped")
+DEFAULT_THRESHOLDS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "thresholds.json")
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+class Runner:
+    """Calls scenario functions, sync or async, on a loop shared by the whole run."""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+
+    def caller(self, scenario: Scenario, call: Callable) -> Callable[[], object]:
+        if scenario.is_async:
+            return lambda: self.loop.run_until_complete(call())
+        return call
+
+    def close(self):
+        self.loop.close()
+
+def measure_latency(call: Callable, iterations: int) -> dict:
+    gc.collect()
+    samples = []
+    started = time.perf_counter_ns()
+    for _ in range(iterations):
+        start = time.perf_counter_ns()
+        call()
+        samples.append(time.perf_counter_ns() - start)
+    elapsed_ns = time.perf_counter_ns() - started
+    samples.sort()
+    return {
+        "iterations": iterations,
+        "elapsed_s": elapsed_ns / 1e9,
+        "mean_us": statistics.fmean(samples) / 1e3,
+        "p50_us": percentile(samples, 0.5) / 1e3,
+        "p95_us": percentile(samples, 0.95) / 1e3,
+        "p99_us": percentile(samples, 0.99) / 1e3,
+        "calls_per_s": iterations / (elapsed_ns / 1e9) if elapsed_ns else 0.0,
+    }
+
+def measure_allocations(call: Callable, iterations: int) -> dict:
+    """Peak memory allocated during a call and memory retained across calls, from tracemalloc."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        peaks = []
+        retained_start, _ = tracemalloc.get_traced_memory()
+        for _ in range(iterations):
+            before, _ = tracemalloc.get_traced_memory()
+            if hasattr(tracemalloc, "reset_peak"):
+                tracemalloc.reset_peak()
+            call()
+            _, peak = tracemalloc.get_traced_memory()
+            peaks.append(max(0, peak - before))
+        gc.collect()
+        retained_end, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "alloc_peak_bytes": statistics.median(peaks),
+        "retained_bytes_per_call": max(0, retained_end - retained_start) / iterations,
+    }
+
+def run_scenario(scenario: Scenario, runner: Runner, args, exporter=None) -> dict:
+    call = runner.caller(scenario, scenario.build())
+    for _ in range(args.warmup):
+        call()
+    runs = []
+    for _ in range(args.repeat):
+        if exporter is not None:
+            exporter.clear()
+        run = measure_latency(call, args.iterations)
+        if exporter is not None:
+            spans = len(exporter.get_finished_spans())
+            run["spans_per_call"] = spans / args.iterations
+            run["spans_per_s"] = spans / run["elapsed_s"] if run["elapsed_s"] else 0.0
+        runs.append(run)
+    # the least disturbed of the repeated runs
+    result = min(runs, key=lambda run: run["p50_us"])
+    if exporter is not None:
+        exporter.clear()
+    result.update(measure_allocations(call, args.alloc_iterations))
+    if exporter is not None:
+        exporter.clear()
+    return result
+
+def run_mode(mode: str, scenarios: List[Scenario], runner: Runner, args, exporter=None) -> Dict[str, dict]:
+    results = {}
+    for scenario in scenarios:
+        try:
+            results[scenario.name] = run_scenario(scenario, runner, args, exporter)
+        except Exception as e:
+            logging.warning(f"{scenario.name} failed in {mode} mode: {e!r}")
+            results[scenario.name] = {"error": repr(e)}
+    return results
+
+def load_thresholds(path: Optional[str]) -> dict:
+    if not path or not os.path.exists(path):
+        return {"default": {}, "scenarios": {}}
+    with open(path) as f:
+        thresholds = json.load(f)
+    thresholds.setdefault("default", {})
+    thresholds.setdefault("scenarios", {})
+    return thresholds
+
+def compute_overheads(scenario_results: dict) -> dict:
+    baseline = scenario_results.get("baseline", {})
+    overheads = {}
+    for mode in ("sampled", "dropped"):
+        result = scenario_results.get(mode, {})
+        if "error" in baseline or "error" in result or not baseline or not result:
+            continue
+        overheads[mode] = {
+            "mean_us": result["mean_us"] - baseline["mean_us"],
+            "p50_us": result["p50_us"] - baseline["p50_us"],
+            "ratio": result["mean_us"] / baseline["mean_us"] if baseline["mean_us"] else None,
+            "alloc_peak_bytes": result["alloc_peak_bytes"] - baseline["alloc_peak_bytes"],
+            "retained_bytes_per_call": result["retained_bytes_per_call"] - baseline["retained_bytes_per_call"],
+        }
+    return overheads
+
+def check_thresholds(name: str, scenario_results: dict, thresholds: dict, previous: Optional[dict]) -> List[str]:
+    limits = {**thresholds["default"], **thresholds["scenarios"].get(name, {})}
+    violations = []
+    sampled = scenario_results.get("sampled", {})
+    if "error" not in sampled and not sampled.get("spans_per_call"):
+        # the scenario doesn't reach the instrumentation, its overheads don't measure anything
+        violations.append(f"{name}: no spans recorded in sampled mode")
+    for mode, overhead in scenario_results.get("overhead", {}).items():
+        checks = (
+            (f"{mode}_overhead_us", overhead["p50_us"], "us"),
+            (f"{mode}_alloc_overhead_bytes", overhead["alloc_peak_bytes"], "bytes"),
+            (f"{mode}_retained_bytes_per_call", overhead["retained_bytes_per_call"], "bytes"),
+        )
+        for key, value, unit in checks:
+            limit = limits.get(key)
+            if limit is not None and value > limit:
+                violations.append(f"{name}: {key} {value:.1f}{unit} exceeds {limit}{unit}")
+        previous_overhead = ((previous or {}).get(name, {}).get("overhead", {})).get(mode)
+        if previous_overhead:
+            # overheads under the noise floor can be negative
+            allowed = max(0.0, previous_overhead["p50_us"]) * (1 + limits.get("max_regression", 0.25)) + \
+                limits.get("min_regression_us", 25)
+            if overhead["p50_us"] > allowed:
+                violations.append(f"{name}: {mode} overhead {overhead['p50_us']:.1f}us regressed from "
+                                  f"{previous_overhead['p50_us']:.1f}us")
+    return violations
+
+def get_monocle_version() -> Optional[str]:
+    try:
+        from importlib.metadata import version
+        return version("monocle_apptrace")
+    except Exception:
+        return None
+
+def print_summary(results: dict) -> None:
+    print(f"{'scenario':<22}{'baseline p50':>14}{'sampled +p50':>14}{'dropped +p50':>14}{'spans/s':>12}"
+          f"{'alloc +B':>12}")
+    for name, scenario_results in results["scenarios"].items():
+        baseline = scenario_results.get("baseline", {})
+        overhead = scenario_results.get("overhead", {})
+        if "p50_us" not in baseline:
+            print(f"{name:<22}{'failed':>14}")
+            continue
+        sampled = overhead.get("sampled", {})
+        dropped = overhead.get("dropped", {})
+        spans_per_s = scenario_results.get("sampled", {}).get("spans_per_s", 0.0)
+        print(f"{name:<22}{baseline['p50_us']:>12.1f}us{sampled.get('p50_us', float('nan')):>12.1f}us"
+              f"{dropped.get('p50_us', float('nan')):>12.1f}us{spans_per_s:>12.0f}"
+              f"{sampled.get('alloc_peak_bytes', float('nan')):>12.0f}")
+    for violation in results["violations"]:
+        print(f"THRESHOLD EXCEEDED {violation}")
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Measure the overhead of the Monocle instrumentation.")
+    parser.add_argument("--scenario", action="append", help="scenario to run, can be repeated (default: all)")
+    parser.add_argument("--iterations", type=int, default=500, help="timed calls per scenario and mode")
+    parser.add_argument("--warmup", type=int, default=50, help="untimed calls before measuring")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per scenario and mode, the best is kept")
+    parser.add_argument("--alloc-iterations", type=int, default=50, help="calls measured with tracemalloc")
+    parser.add_argument("--output", default="benchmark_results.json", help="results file")
+    parser.add_argument("--thresholds", default=DEFAULT_THRESHOLDS_FILE, help="thresholds file")
+    parser.add_argument("--compare", help="previous results file to check for regressions")
+    parser.add_argument("--list", action="store_true", help="list the scenarios and exit")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING)
+    # span handler warnings about the stub payloads would drown the summary
+    logging.getLogger("monocle_apptrace").setLevel(logging.ERROR)
+
+    if args.list:
+        for scenario in SCENARIOS:
+            print(f"{scenario.name:<22}{scenario.metamodel:<14}{'available' if scenario.is_available() else 'skipped'}")
+        return 0
+
+    selected = [scenario for scenario in SCENARIOS if not args.scenario or scenario.name in args.scenario]
+    scenarios = [scenario for scenario in selected if scenario.is_available()]
+    skipped = [scenario.name for scenario in selected if scenario not in scenarios]
+
+    from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+    from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+    from monocle_apptrace.instrumentation.common.head_sampling import HeadSampler, set_head_sampler
+    from monocle_apptrace.instrumentation.common.instrumentor import setup_monocle_telemetry
+
+    runner = Runner()
+    mode_results = {"baseline": run_mode("baseline", scenarios, runner, args)}
+
+    exporter = InMemorySpanExporter()
+    instrumentor = setup_monocle_telemetry(workflow_name="monocle_benchmarks",
+                                           span_processors=[SimpleSpanProcessor(exporter)])
+    try:
+        set_head_sampler(None)
+        mode_results["sampled"] = run_mode("sampled", scenarios, runner, args, exporter)
+        set_head_sampler(HeadSampler(ratio=0.0))
+        mode_results["dropped"] = run_mode("dropped", scenarios, runner, args, exporter)
+    finally:
+        set_head_sampler(None)
+        if instrumentor is not None and instrumentor.is_instrumented_by_opentelemetry:
+            instrumentor.uninstrument()
+        runner.close()
+
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f).get("scenarios", {})
+    thresholds = load_thresholds(args.thresholds)
+    results = {
+        "monocle_version": get_monocle_version(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "iterations": args.iterations,
+        "skipped": skipped,
+        "scenarios": {},
+        "violations": [],
+    }
+    for scenario in scenarios:
+        scenario_results = {mode: mode_results[mode][scenario.name] for mode in MODES}
+        scenario_results["metamodel"] = scenario.metamodel
+        scenario_results["overhead"] = compute_overheads(scenario_results)
+        results["scenarios"][scenario.name] = scenario_results
+        results["violations"].extend(check_thresholds(scenario.name, scenario_results, thresholds, previous))
+        if any("error" in scenario_results[mode] for mode in MODES):
+            results["violations"].append(f"{scenario.name}: failed to run")
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print_summary(results)
+    return 1 if results["violations"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,130 @@
+"""
+Benchmark scenarios, one or more per metamodel.
+
+A scenario builds its client once per run mode and returns the call to measure, so objects created by instrumented
+factories (eg. botocore clients) are built after the telemetry is set up. Scenarios whose framework isn't installed
+are skipped.
+"""
+import importlib.util
+from typing import Callable, List, NamedTuple, Tuple
+
+import stubs
+
+QUESTION = "What is the capital of France?"
+
+class Scenario(NamedTuple):
+    name: str
+    metamodel: str
+    # modules that must be importable to run the scenario
+    requires: Tuple[str, ...]
+    # returns the call to measure, a coroutine function when is_async is set
+    build: Callable[[], Callable]
+    is_async: bool = False
+
+    def is_available(self) -> bool:
+        try:
+            return all(importlib.util.find_spec(module) is not None for module in self.requires)
+        except (ImportError, ValueError):
+            return False
+
+def _openai_chat():
+    client = stubs.openai_client()
+    messages = [{"role": "user", "content": QUESTION}]
+    return lambda: client.chat.completions.create(model="gpt-4o-mini", messages=messages)
+
+def _openai_chat_stream():
+    client = stubs.openai_client(stream=True)
+    messages = [{"role": "user", "content": QUESTION}]
+
+    def call():
+        for _ in client.chat.completions.create(model="gpt-4o-mini", messages=messages, stream=True):
+            pass
+    return call
+
+def _anthropic_messages():
+    client = stubs.anthropic_client()
+    messages = [{"role": "user", "content": QUESTION}]
+    return lambda: client.messages.create(model="claude-3-5-haiku-latest", max_tokens=64, messages=messages)
+
+def _bedrock_converse():
+    client = stubs.bedrock_runtime_client()
+    messages = [{"role": "user", "content": [{"text": QUESTION}]}]
+    return lambda: client.converse(modelId="anthropic.claude-3-haiku-20240307-v1:0", messages=messages)
+
+def _gemini_generate():
+    client = stubs.gemini_client()
+    return lambda: client.models.generate_content(model="gemini-2.0-flash", contents=QUESTION)
+
+def _langchain_chain():
+    from langchain_core.output_parsers import StrOutputParser
+    from langchain_core.prompts import ChatPromptTemplate
+    chain = ChatPromptTemplate.from_template("Answer briefly: {question}") | stubs.fake_chat_model() | StrOutputParser()
+    return lambda: chain.invoke({"question": QUESTION})
+
+def _langgraph_graph():
+    from langgraph.graph import END, START, MessagesState, StateGraph
+    model = stubs.fake_chat_model()
+
+    def agent(state):
+        return {"messages": [model.invoke(state["messages"])]}
+    builder = StateGraph(MessagesState)
+    builder.add_node("agent", agent)
+    builder.add_edge(START, "agent")
+    builder.add_edge("agent", END)
+    graph = builder.compile()
+    return lambda: graph.invoke({"messages": [("user", QUESTION)]})
+
+def _llamaindex_chat():
+    from llama_index.core.base.llms.types import ChatMessage
+    from llama_index.core.llms import MockLLM
+    llm = MockLLM(max_tokens=8)
+    messages = [ChatMessage(role="user", content=QUESTION)]
+    return lambda: llm.chat(messages)
+
+def _requests_get():
+    from monocle_apptrace.instrumentation.common.instrumentor import get_tracer_provider
+    from monocle_apptrace.instrumentation.common.method_wrappers import monocle_trace_method
+    from monocle_apptrace.instrumentation.metamodel.requests import allowed_urls
+    # outbound requests are only traced for the propagation urls, passed as the url keyword
+    if "http://service.bench" not in allowed_urls:
+        allowed_urls.append("http://service.bench")
+    session = stubs.requests_session()
+
+    def call():
+        return session.request(method="GET", url="http://service.bench/ask", params={"question": QUESTION})
+    if get_tracer_provider() is None:
+        return call
+    # an outbound call made while handling a traced request, the parent goes through the head sampler
+    return monocle_trace_method("bench_handler")(call)
+
+def _flask_request():
+    client = stubs.flask_client()
+    return lambda: client.get("/ask", query_string={"question": QUESTION})
+
+def _fastapi_request():
+    client = stubs.fastapi_client()
+    return lambda: client.get("/ask", params={"question": QUESTION})
+
+def _aiohttp_request():
+    from aiohttp.test_utils import make_mocked_request
+    app = stubs.aiohttp_app()
+
+    async def call():
+        # dispatch through the application without opening a socket
+        return await app._handle(make_mocked_request("GET", "/ask", app=app))
+    return call
+
+SCENARIOS: List[Scenario] = [
+    Scenario("openai_chat", "openai", ("openai", "httpx"), _openai_chat),
+    Scenario("openai_chat_stream", "openai", ("openai", "httpx"), _openai_chat_stream),
+    Scenario("anthropic_messages", "anthropic", ("anthropic", "httpx"), _anthropic_messages),
+    Scenario("bedrock_converse", "botocore", ("botocore",), _bedrock_converse),
+    Scenario("gemini_generate", "gemini", ("google.genai",), _gemini_generate),
+    Scenario("langchain_chain", "langchain", ("langchain_core",), _langchain_chain),
+    Scenario("langgraph_graph", "langgraph", ("langgraph", "langchain_core"), _langgraph_graph),
+    Scenario("llamaindex_chat", "llamaindex", ("llama_index.core",), _llamaindex_chat),
+    Scenario("requests_get", "requests", ("requests",), _requests_get),
+    Scenario("flask_request", "flask", ("flask",), _flask_request),
+    Scenario("fastapi_request", "fastapi", ("fastapi", "httpx"), _fastapi_request),
+    Scenario("aiohttp_request", "aiohttp", ("aiohttp",), _aiohttp_request, is_async=True),
+]
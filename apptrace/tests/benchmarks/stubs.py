@@ -0,0 +1,165 @@
+"""
+Offline stand-ins for the model providers and web servers driven by the benchmarks.
+
+The provider SDKs are used as they are, only their transport is replaced so every call returns a canned response
+without touching the network.
+"""
+import json
+
+ANSWER = "Paris is the capital of France."
+STREAM_WORDS = ["Paris ", "is ", "the ", "capital ", "of ", "France."]
+
+OPENAI_CHAT_RESPONSE = {
+    "id": "chatcmpl-bench",
+    "object": "chat.completion",
+    "created": 0,
+    "model": "gpt-4o-mini",
+    "choices": [{"index": 0, "message": {"role": "assistant", "content": ANSWER}, "finish_reason": "stop"}],
+    "usage": {"prompt_tokens": 12, "completion_tokens": 8, "total_tokens": 20},
+}
+
+ANTHROPIC_MESSAGE_RESPONSE = {
+    "id": "msg_bench",
+    "type": "message",
+    "role": "assistant",
+    "model": "claude-3-5-haiku-latest",
+    "content": [{"type": "text", "text": ANSWER}],
+    "stop_reason": "end_turn",
+    "stop_sequence": None,
+    "usage": {"input_tokens": 12, "output_tokens": 8},
+}
+
+BEDROCK_CONVERSE_RESPONSE = {
+    "output": {"message": {"role": "assistant", "content": [{"text": ANSWER}]}},
+    "stopReason": "end_turn",
+    "usage": {"inputTokens": 12, "outputTokens": 8, "totalTokens": 20},
+    "metrics": {"latencyMs": 1},
+}
+
+GEMINI_GENERATE_RESPONSE = {
+    "candidates": [{"content": {"role": "model", "parts": [{"text": ANSWER}]}, "finishReason": "STOP"}],
+    "usageMetadata": {"promptTokenCount": 12, "candidatesTokenCount": 8, "totalTokenCount": 20},
+    "modelVersion": "gemini-2.0-flash",
+}
+
+def openai_stream_body() -> bytes:
+    """Server sent events of a streamed chat completion, the last chunk carries the usage."""
+    events = []
+    for index, word in enumerate(STREAM_WORDS):
+        delta = {"content": word}
+        if index == 0:
+            delta["role"] = "assistant"
+        events.append({"id": "chatcmpl-bench", "object": "chat.completion.chunk", "created": 0,
+                       "model": "gpt-4o-mini", "choices": [{"index": 0, "delta": delta, "finish_reason": None}]})
+    events.append({"id": "chatcmpl-bench", "object": "chat.completion.chunk", "created": 0, "model": "gpt-4o-mini",
+                   "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                   "usage": OPENAI_CHAT_RESPONSE["usage"]})
+    body = "".join(f"data: {json.dumps(event)}\n\n" for event in events) + "data: [DONE]\n\n"
+    return body.encode("utf-8")
+
+def httpx_transport(payload: dict = None, stream_body: bytes = None):
+    """httpx transport answering every request with the payload, or with the event stream when given."""
+    import httpx
+
+    def handler(request):
+        if stream_body is not None:
+            return httpx.Response(200, headers={"content-type": "text/event-stream"}, content=stream_body)
+        return httpx.Response(200, json=payload)
+    return httpx.MockTransport(handler)
+
+def openai_client(stream: bool = False):
+    import httpx
+    from openai import OpenAI
+    transport = httpx_transport(stream_body=openai_stream_body()) if stream else httpx_transport(OPENAI_CHAT_RESPONSE)
+    return OpenAI(api_key="bench", base_url="http://openai.bench/v1", http_client=httpx.Client(transport=transport))
+
+def anthropic_client():
+    import httpx
+    from anthropic import Anthropic
+    return Anthropic(api_key="bench", base_url="http://anthropic.bench",
+                     http_client=httpx.Client(transport=httpx_transport(ANTHROPIC_MESSAGE_RESPONSE)))
+
+def gemini_client():
+    from google import genai
+    from google.genai import types
+    http_options = types.HttpOptions(base_url="http://gemini.bench",
+                                     client_args={"transport": httpx_transport(GEMINI_GENERATE_RESPONSE)})
+    return genai.Client(api_key="bench", http_options=http_options)
+
+class _RawBody:
+    def __init__(self, body: bytes):
+        self.body = body
+
+    def stream(self, **kwargs):
+        yield self.body
+
+def bedrock_runtime_client():
+    """bedrock-runtime client whose requests are answered by a before-send handler."""
+    import botocore.session
+    from botocore.awsrequest import AWSResponse
+
+    client = botocore.session.get_session().create_client("bedrock-runtime", region_name="us-east-1",
+                                                           aws_access_key_id="bench", aws_secret_access_key="bench")
+    body = json.dumps(BEDROCK_CONVERSE_RESPONSE).encode("utf-8")
+
+    def before_send(request, **kwargs):
+        return AWSResponse(request.url, 200, {"content-type": "application/json"}, _RawBody(body))
+    client.meta.events.register("before-send.bedrock-runtime.Converse", before_send)
+    return client
+
+def requests_session():
+    """requests session whose http and https requests are answered by an in process adapter."""
+    import requests
+    from requests.adapters import BaseAdapter
+    from requests.models import Response
+
+    class CannedAdapter(BaseAdapter):
+        def send(self, request, **kwargs):
+            response = Response()
+            response.status_code = 200
+            response.headers["content-type"] = "application/json"
+            response._content = json.dumps({"answer": ANSWER}).encode("utf-8")
+            response.url = request.url
+            response.request = request
+            return response
+
+        def close(self):
+            pass
+
+    session = requests.Session()
+    session.mount("http://", CannedAdapter())
+    session.mount("https://", CannedAdapter())
+    return session
+
+def fake_chat_model():
+    from langchain_core.language_models.fake_chat_models import FakeListChatModel
+    return FakeListChatModel(responses=[ANSWER])
+
+def flask_client():
+    from flask import Flask
+    app = Flask("monocle_bench")
+
+    @app.route("/ask")
+    def ask():
+        return {"answer": ANSWER}
+    return app.test_client()
+
+def fastapi_client():
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    app = FastAPI()
+
+    @app.get("/ask")
+    def ask():
+        return {"answer": ANSWER}
+    return TestClient(app)
+
+def aiohttp_app():
+    from aiohttp import web
+
+    async def ask(request):
+        return web.json_response({"answer": ANSWER})
+    app = web.Application()
+    app.router.add_get("/ask", ask)
+    app.freeze()
+    return app
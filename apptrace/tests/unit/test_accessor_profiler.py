@@ -0,0 +1,98 @@
+import time
+import tracemalloc
+import unittest
+
+from monocle_apptrace.instrumentation.common.accessor_profiler import (
+    AccessorProfiler, get_accessor_profiler, set_accessor_profiler
+)
+from monocle_apptrace.instrumentation.common.constants import SKIPPED_ACCESSORS_KEY
+from monocle_apptrace.instrumentation.common.processor_plan import get_output_processor_plan
+from monocle_apptrace.instrumentation.common.span_handler import SpanHandler
+from opentelemetry.sdk.trace import TracerProvider
+
+def slow_accessor(arguments):
+    time.sleep(0.005)
+    return "slow"
+
+OUTPUT_PROCESSOR = {
+    "type": "inference",
+    "attributes": [
+        [
+            {"attribute": "name", "accessor": lambda arguments: "fast"},
+            {"attribute": "deployment", "accessor": slow_accessor},
+        ]
+    ],
+    "events": [
+        {"name": "data.input", "attributes": [{"attribute": "input", "accessor": lambda arguments: ["hello"]}]},
+    ],
+}
+
+class TestAccessorProfiler(unittest.TestCase):
+
+    def setUp(self):
+        self.previous_profiler = get_accessor_profiler()
+        self.was_tracing = tracemalloc.is_tracing()
+        self.tracer = TracerProvider().get_tracer("test")
+
+    def tearDown(self):
+        set_accessor_profiler(self.previous_profiler)
+        if not self.was_tracing and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def _hydrate(self):
+        to_wrap = {"output_processor": OUTPUT_PROCESSOR}
+        with self.tracer.start_as_current_span("parent"), self.tracer.start_as_current_span("test") as span:
+            SpanHandler().hydrate_attributes(to_wrap, None, None, (), {}, None, span, None, is_post_exec=False)
+        return span
+
+    def test_inactive_profiler_keeps_accessors(self):
+        accessor = OUTPUT_PROCESSOR["attributes"][0][0]["accessor"]
+        self.assertIs(AccessorProfiler().wrap(accessor, "inference", "entity.1.name"), accessor)
+
+    def test_profile_reports_slowest_accessors(self):
+        set_accessor_profiler(AccessorProfiler(profile=True))
+        self._hydrate()
+        plan = get_output_processor_plan(OUTPUT_PROCESSOR)
+        plan.events[0].attributes[0].accessor({})
+        report = get_accessor_profiler().report()
+        self.assertEqual([(item["processor_type"], item["name"]) for item in report][0],
+                         ("inference", "entity.1.deployment"))
+        self.assertEqual({item["name"] for item in report},
+                         {"entity.1.name", "entity.1.deployment", "data.input.input"})
+        self.assertTrue(all(item["calls"] == 1 for item in report))
+
+    def test_budget_disables_slow_accessor(self):
+        set_accessor_profiler(AccessorProfiler(budget_ms=1, max_strikes=2))
+        span = self._hydrate()
+        self.assertEqual(span.attributes["entity.1.deployment"], "slow")
+        self._hydrate()
+        self.assertEqual(get_accessor_profiler().get_disabled(),
+                         [f"inference:entity.1.deployment ({__name__}.slow_accessor)"])
+
+        span = self._hydrate()
+        self.assertNotIn("entity.1.deployment", span.attributes)
+        self.assertEqual(span.attributes["entity.1.name"], "fast")
+        self.assertEqual(list(span.attributes[SKIPPED_ACCESSORS_KEY]), ["inference:entity.1.deployment"])
+
+        get_accessor_profiler().reset()
+        self.assertEqual(self._hydrate().attributes["entity.1.deployment"], "slow")
+
+    def test_budget_disables_only_the_slow_processor_accessor(self):
+        fast_processor = {
+            "type": "inference",
+            "attributes": [[{"attribute": "deployment", "accessor": lambda arguments: "fast"}]],
+        }
+        set_accessor_profiler(AccessorProfiler(budget_ms=1, max_strikes=1))
+        slow = get_output_processor_plan(OUTPUT_PROCESSOR).entities[0].pre_execution[1].accessor
+        fast = get_output_processor_plan(fast_processor).entities[0].pre_execution[0].accessor
+        self.assertEqual(slow({}), "slow")
+        self.assertIsNone(slow({}))
+        self.assertEqual(fast({}), "fast")
+        self.assertEqual(len(get_accessor_profiler().get_disabled()), 1)
+
+        report = {item["name"]: item for item in get_accessor_profiler().report()}
+        self.assertEqual(report["entity.1.deployment"]["calls"], 2)
+        self.assertTrue(report["entity.1.deployment"]["disabled"])
+
+if __name__ == '__main__':
+    unittest.main()
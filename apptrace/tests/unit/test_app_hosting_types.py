@@ -6,10 +6,18 @@ from base_unit import MonocleTestBase
 from common.dummy_class import DummyClass
 from common.mock_span_exporter import MockSpanExporter
 from monocle_apptrace.instrumentation.common.constants import (
+    APP_HOSTING_TYPE,
+    AWS_LAMBDA_ENV_NAME,
+    AWS_LAMBDA_FUNCTION_IDENTIFIER_ENV_NAME,
+    AWS_LAMBDA_SERVICE_NAME,
+    MONOCLE_SDK_LANGUAGE,
     service_name_map,
     service_type_map,
 )
 from monocle_apptrace.instrumentation.common.instrumentor import setup_monocle_telemetry
+from monocle_apptrace.instrumentation.common.resource_detector import (
+    MonocleResourceDetector, get_monocle_resource, refresh_monocle_resource
+)
 from monocle_apptrace.instrumentation.common.wrapper import task_wrapper
 from monocle_apptrace.instrumentation.common.wrapper_method import WrapperMethod
 from opentelemetry.sdk.trace.export import SimpleSpanProcessor
@@ -76,5 +84,26 @@ class TestHandler(MonocleTestBase):
                     if entity_name_env is not None and entity_name_env in os.environ:
                         del os.environ[entity_name_env]
 
+    def test_refresh_resource(self):
+        os.environ.pop(AWS_LAMBDA_ENV_NAME, None)
+        refresh_monocle_resource()
+        self.assertEqual(get_monocle_resource().hosting_attributes["entity.2.type"], "app_hosting.generic")
+        try:
+            os.environ[AWS_LAMBDA_ENV_NAME] = "true"
+            os.environ[AWS_LAMBDA_FUNCTION_IDENTIFIER_ENV_NAME] = "lambda123"
+            self.assertEqual(get_monocle_resource().hosting_attributes["entity.2.type"], "app_hosting.generic")
+            refresh_monocle_resource()
+            self.assertEqual(get_monocle_resource().hosting_attributes, {
+                "entity.2.type": "app_hosting." + AWS_LAMBDA_SERVICE_NAME,
+                "entity.2.name": "lambda123"
+            })
+            resource_attributes = MonocleResourceDetector().detect().attributes
+            self.assertEqual(resource_attributes[APP_HOSTING_TYPE], AWS_LAMBDA_SERVICE_NAME)
+            self.assertEqual(resource_attributes[MONOCLE_SDK_LANGUAGE], "python")
+        finally:
+            os.environ.pop(AWS_LAMBDA_ENV_NAME, None)
+            os.environ.pop(AWS_LAMBDA_FUNCTION_IDENTIFIER_ENV_NAME, None)
+            refresh_monocle_resource()
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,75 @@
+import os
+import tempfile
+import time
+import unittest
+
+from monocle_apptrace.collector import CollectorDaemon
+from monocle_apptrace.exporters.collector_exporter import CollectorSpanExporter
+from monocle_apptrace.exporters.span_encoder import encode_span
+from monocle_apptrace.instrumentation.common.constants import MONOCLE_SDK_VERSION
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+
+@unittest.skipUnless(hasattr(__import__("socket"), "AF_UNIX"), "requires Unix domain sockets")
+class TestCollector(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.socket_path = os.path.join(self.directory.name, "collector.sock")
+        self.daemon_exporter = InMemorySpanExporter()
+        self.daemon = CollectorDaemon(socket_path=self.socket_path, exporters=[self.daemon_exporter])
+        self.daemon.start()
+        self.client = CollectorSpanExporter(socket_path=self.socket_path, timeout=5)
+        tracer_provider = TracerProvider()
+        tracer_provider.add_span_processor(SimpleSpanProcessor(self.client))
+        self.tracer = tracer_provider.get_tracer("test")
+
+    def tearDown(self):
+        self.client.shutdown()
+        self.daemon.stop()
+        self.directory.cleanup()
+
+    def _wait_for_spans(self, daemon, count):
+        deadline = time.time() + 10
+        while daemon.get_metrics()["spans"] < count and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(daemon.force_flush())
+
+    def _trace(self):
+        attributes = {MONOCLE_SDK_VERSION: "test"}
+        with self.tracer.start_as_current_span("parent", attributes=attributes) as parent:
+            with self.tracer.start_as_current_span("child", attributes=attributes) as child:
+                child.add_event("data.input", {"input": "hello"})
+        return parent, child
+
+    def test_spans_exported_by_daemon(self):
+        parent, child = self._trace()
+        with self.tracer.start_as_current_span("not_monocle"):
+            pass
+        self._wait_for_spans(self.daemon, 2)
+        received = {span.name: span for span in self.daemon_exporter.get_finished_spans()}
+        self.assertEqual(set(received), {"parent", "child"})
+        self.assertEqual(encode_span(received["child"]), encode_span(child))
+        self.assertEqual(encode_span(received["parent"]), encode_span(parent))
+        self.assertIsNone(received["parent"].parent)
+
+    def test_reconnect_to_restarted_daemon(self):
+        self._trace()
+        self._wait_for_spans(self.daemon, 2)
+        self.daemon.stop()
+        restarted_exporter = InMemorySpanExporter()
+        self.daemon = CollectorDaemon(socket_path=self.socket_path, exporters=[restarted_exporter])
+        self.daemon.start()
+        self._trace()
+        self._wait_for_spans(self.daemon, 2)
+        self.assertEqual(len(restarted_exporter.get_finished_spans()), 2)
+
+    def test_export_fails_without_daemon(self):
+        self.daemon.stop()
+        client = CollectorSpanExporter(socket_path=os.path.join(self.directory.name, "missing.sock"))
+        parent, _ = self._trace()
+        self.assertEqual(client.export([parent]).name, "FAILURE")
+
+if __name__ == '__main__':
+    unittest.main()
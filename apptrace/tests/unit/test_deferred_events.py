@@ -0,0 +1,94 @@
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.trace.status import StatusCode
+
+from monocle_apptrace.instrumentation.common import deferred_events
+from monocle_apptrace.instrumentation.common.deferred_events import DeferredEvent, set_deferred_events
+from monocle_apptrace.instrumentation.common.span_handler import SpanHandler
+from monocle_apptrace.instrumentation.metamodel.msagent.entities.inference import AGENT_REQUEST
+from monocle_apptrace.instrumentation.metamodel.teamsai.entities.inference.teamsai_output_processor import (
+    TEAMAI_OUTPUT_PROCESSOR
+)
+
+class TestDeferredEvents(unittest.TestCase):
+
+    def setUp(self):
+        self.previous = deferred_events.is_deferred_events_enabled()
+        set_deferred_events(True)
+        self.tracer = TracerProvider().get_tracer("test")
+        self.calls = []
+
+    def tearDown(self):
+        set_deferred_events(self.previous)
+
+    def _output_processor(self, deferrable: bool) -> dict:
+        def extract_messages(arguments):
+            self.calls.append("input")
+            return [str(message) for message in arguments["kwargs"]["messages"]]
+        return {
+            "type": "inference",
+            "events": [
+                {"name": "data.input", "deferrable": deferrable,
+                 "attributes": [{"attribute": "input", "accessor": extract_messages}]},
+                {"name": "metadata", "attributes": [{"attribute": "finish_type",
+                                                     "accessor": lambda arguments: self.calls.append("meta") or "success"}]},
+            ],
+        }
+
+    def _hydrate(self, deferrable: bool = True):
+        messages = ["hello"]
+        with self.tracer.start_as_current_span("inference") as span:
+            SpanHandler().hydrate_events({"output_processor": self._output_processor(deferrable)}, None, None, (),
+                                         {"messages": messages}, None, span, is_post_exec=False)
+            SpanHandler().hydrate_events({"output_processor": self._output_processor(deferrable)}, None, None, (),
+                                         {"messages": messages}, "done", span, is_post_exec=True)
+            # the application changes its message list after the call
+            messages.append("later")
+        return span
+
+    def test_payload_is_extracted_on_first_read(self):
+        span = self._hydrate()
+        event = span.events[0]
+        self.assertIsInstance(event, DeferredEvent)
+        self.assertEqual(self.calls, ["meta"])
+        self.assertEqual(dict(event.attributes), {"input": ("hello",)})
+        self.assertEqual(dict(event.attributes), {"input": ("hello",)})
+        self.assertEqual(self.calls, ["meta", "input"])
+        self.assertEqual(dict(span.events[1].attributes), {"finish_type": "success"})
+
+    def test_events_not_marked_deferrable_stay_eager(self):
+        span = self._hydrate(deferrable=False)
+        self.assertNotIsInstance(span.events[0], DeferredEvent)
+        self.assertEqual(self.calls, ["input", "meta"])
+
+    def test_status_check_accessor_sets_error_in_call(self):
+        # teams ai reports a failed completion by raising MonocleSpanException from a data.output accessor
+        result = SimpleNamespace(status="error", message=SimpleNamespace(content="failed"))
+        with self.tracer.start_as_current_span("teamsai") as span:
+            detected_error = SpanHandler().hydrate_events({"output_processor": TEAMAI_OUTPUT_PROCESSOR}, None, None, (),
+                                                          {}, result, span, is_post_exec=True)
+        self.assertTrue(detected_error)
+        self.assertEqual(span.status.status_code, StatusCode.ERROR)
+        self.assertFalse(any(isinstance(event, DeferredEvent) for event in span.events))
+
+    def test_scope_setting_accessor_runs_in_call(self):
+        # msagent sets the agent session scope while extracting the response
+        with patch("monocle_apptrace.instrumentation.metamodel.msagent._helper.extract_agent_response",
+                   return_value="done") as extract_agent_response:
+            with self.tracer.start_as_current_span("msagent") as span:
+                SpanHandler().hydrate_events({"output_processor": AGENT_REQUEST}, None, None, (), {}, "done", span,
+                                             is_post_exec=True)
+                extract_agent_response.assert_called_once()
+        self.assertFalse(any(isinstance(event, DeferredEvent) for event in span.events))
+
+    def test_disabled(self):
+        set_deferred_events(False)
+        span = self._hydrate()
+        self.assertNotIsInstance(span.events[0], DeferredEvent)
+        self.assertEqual(dict(span.events[0].attributes), {"input": ("hello",)})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from monocle_apptrace.exporters.base_exporter import SpanExporterBase
+from monocle_apptrace.exporters.export_spool import (
+    CLOSED, EXPORT_SPOOL_DIR_ENV, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError, ExportSpool,
+    get_export_resilience
+)
+from monocle_apptrace.instrumentation.common.self_telemetry import (
+    EXPORT_SPOOL_BATCHES, get_self_telemetry_snapshot
+)
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class FlakyExporter:
+    def __init__(self):
+        self.down = True
+        self.calls = 0
+        self.sent = []
+
+    @SpanExporterBase.retry_with_backoff(retries=3, exceptions=(ConnectionError,))
+    def _upload(self, span_data_batch: str, trace_id: int):
+        self.calls += 1
+        if self.down:
+            raise ConnectionError("backend down")
+        self.sent.append(span_data_batch)
+
+class TestCircuitBreaker(unittest.TestCase):
+
+    def test_open_probe_close(self):
+        clock = Clock()
+        breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=10, clock=clock)
+        self.assertFalse(breaker.record_failure())
+        self.assertTrue(breaker.record_failure())
+        self.assertFalse(breaker.allow())
+        clock.now = 10
+        self.assertEqual(breaker.state, HALF_OPEN)
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        self.assertTrue(breaker.record_failure())
+        self.assertEqual(breaker.state, OPEN)
+        clock.now = 20
+        self.assertTrue(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.state, CLOSED)
+
+class TestExportSpool(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.spool_dir = os.path.join(self.directory.name, "test")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_replay_in_order_and_keep_unsent(self):
+        spool = ExportSpool(self.spool_dir, segment_bytes=40)
+        for index in range(5):
+            self.assertTrue(spool.append({"index": index}))
+        self.assertGreater(len(os.listdir(self.spool_dir)), 1)
+        replayed = []
+        def send(record):
+            if record["index"] == 3:
+                raise ConnectionError("backend down")
+            replayed.append(record["index"])
+            return True
+        self.assertFalse(spool.replay(send))
+        self.assertEqual(replayed, [0, 1, 2])
+        self.assertEqual(spool.get_metrics()["batches"], 2)
+        # the batches left are picked up by a new spool, eg. after a restart
+        spool.close()
+        restarted = ExportSpool(self.spool_dir)
+        self.assertEqual(restarted.get_metrics()["batches"], 2)
+        self.assertTrue(restarted.replay(lambda record: replayed.append(record["index"]) or True))
+        self.assertEqual(replayed, [0, 1, 2, 3, 4])
+        self.assertEqual(restarted.get_metrics()["bytes"], 0)
+        self.assertEqual(os.listdir(self.spool_dir), [])
+
+    def test_size_limit_drops_oldest(self):
+        line_size = len(json.dumps({"index": 0}, separators=(",", ":"))) + 1
+        spool = ExportSpool(self.spool_dir, max_bytes=line_size * 3, segment_bytes=line_size)
+        for index in range(5):
+            self.assertTrue(spool.append({"index": index}))
+        metrics = spool.get_metrics()
+        self.assertEqual(metrics["batches"], 3)
+        self.assertEqual(metrics["dropped"], 2)
+        self.assertLessEqual(metrics["bytes"], line_size * 3)
+        replayed = []
+        spool.replay(lambda record: replayed.append(record["index"]) or True)
+        self.assertEqual(replayed, [2, 3, 4])
+
+class TestExportResilience(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.sleep = patch("monocle_apptrace.exporters.export_spool.time.sleep")
+        self.sleep_mock = self.sleep.start()
+
+    def tearDown(self):
+        self.sleep.stop()
+        self.directory.cleanup()
+
+    def test_open_breaker_rejects_without_spool(self):
+        with patch.dict(os.environ, {"MONOCLE_EXPORT_BREAKER_FAILURES": "2"}):
+            exporter = FlakyExporter()
+            with self.assertRaises(Exception):
+                exporter._upload("batch", 1)
+        self.assertEqual(exporter.calls, 2)
+        self.assertEqual(self.sleep_mock.call_count, 1)
+        with self.assertRaises(CircuitOpenError):
+            exporter._upload("batch", 2)
+        self.assertEqual(exporter.calls, 2)
+
+    def test_spool_and_replay(self):
+        with patch.dict(os.environ, {EXPORT_SPOOL_DIR_ENV: self.directory.name, "MONOCLE_EXPORT_BREAKER_FAILURES": "2",
+                                     "MONOCLE_EXPORT_BREAKER_RESET_SECONDS": "0"}):
+            exporter = FlakyExporter()
+            resilience = get_export_resilience(exporter)
+        self.assertIsNone(exporter._upload("batch1", 1))
+        self.assertIsNone(exporter._upload("batch2", 2))
+        self.assertEqual(resilience.spool.get_metrics()["batches"], 2)
+        gauges = get_self_telemetry_snapshot()["gauges"][EXPORT_SPOOL_BATCHES]
+        self.assertIn({"attributes": {"exporter": "FlakyExporter"}, "value": 2}, gauges)
+        exporter.down = False
+        exporter._upload("batch3", 3)
+        resilience._replay_thread.join(5)
+        self.assertEqual(exporter.sent, ["batch3", "batch1", "batch2"])
+        self.assertEqual(resilience.spool.get_metrics()["batches"], 0)
+        self.assertEqual(resilience.breaker.state, CLOSED)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,5 @@
 import datetime
+import json
 import logging
 import os
 import unittest
@@ -8,6 +9,7 @@ from monocle_apptrace.exporters.gcp.gcs_exporter import GCSSpanExporter
 from monocle_apptrace.exporters.base_exporter import format_trace_id_without_0x
 from opentelemetry.sdk.trace import ReadableSpan
 from opentelemetry.sdk.trace.export import SpanExportResult
+from opentelemetry.trace import SpanContext
 
 logger = logging.getLogger(__name__)
 
@@ -167,11 +169,11 @@ class TestGCSSpanExporter(unittest.TestCase):
 
         exporter._add_spans_to_trace(trace_id, [mock_span1], has_root=False)
         self.assertIn(trace_id, exporter.trace_spans)
-        self.assertEqual(len(exporter.trace_spans[trace_id][0]), 1)
+        self.assertEqual(len(exporter.trace_spans.get(trace_id).spans), 1)
         exporter._add_spans_to_trace(trace_id, [mock_span2], has_root=True)
 
-        self.assertEqual(len(exporter.trace_spans[trace_id][0]), 2)
-        self.assertTrue(exporter.trace_spans[trace_id][2])  # has_root flag
+        self.assertEqual(len(exporter.trace_spans.get(trace_id).spans), 2)
+        self.assertTrue(exporter.trace_spans.get(trace_id).has_root)
 
     @patch('google.cloud.storage.Client')
     def test_cleanup_expired_traces(self, mock_storage_client):
@@ -197,10 +199,11 @@ class TestGCSSpanExporter(unittest.TestCase):
         
         trace_id = 0x123456789abcdef0123456789abcdef0
 
-        old_time = datetime.datetime.now() - datetime.timedelta(seconds=61)
-        exporter.trace_spans[trace_id] = ([mock_span], old_time, False)
+        exporter._add_spans_to_trace(trace_id, [mock_span], has_root=False)
+        exporter.trace_spans.get(trace_id).creation_time -= 61
         exporter._cleanup_expired_traces()
         self.assertNotIn(trace_id, exporter.trace_spans)
+        self.assertTrue(exporter.force_flush())
         mock_bucket.blob.assert_called()
 
     @patch('google.cloud.storage.Client')
@@ -215,16 +218,18 @@ class TestGCSSpanExporter(unittest.TestCase):
 
         exporter = GCSSpanExporter(bucket_name="test-bucket", project_id="test-project")
 
-        mock_span1 = MagicMock(spec=ReadableSpan)
-        mock_span1.to_json.return_value = '{"span": 1}'
-        mock_span1.context.span_id = 1
-        
-        mock_span2 = MagicMock(spec=ReadableSpan)
-        mock_span2.to_json.return_value = '{"span": 2}'
-        mock_span2.context.span_id = 2
-        result = exporter._GCSSpanExporter__serialize_spans([mock_span1, mock_span2])
-        expected = '{"span": 1}\n{"span": 2}\n'
-        self.assertEqual(result, expected)
+        span1 = ReadableSpan(name="span1", context=SpanContext(trace_id=0x1234, span_id=0x1, is_remote=False))
+        span2 = ReadableSpan(name="span2", context=SpanContext(trace_id=0x1234, span_id=0x2, is_remote=False),
+                             parent=SpanContext(trace_id=0x1234, span_id=0x1, is_remote=False))
+        result = exporter._GCSSpanExporter__serialize_spans([span1, span2])
+        lines = result.split("\n")
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(lines[2], "")
+        first, second = json.loads(lines[0]), json.loads(lines[1])
+        self.assertEqual(first["name"], "span1")
+        self.assertEqual(first["context"]["trace_id"], "00000000000000000000000000001234")
+        self.assertEqual(second["context"]["span_id"], "0000000000000002")
+        self.assertEqual(second["parent_id"], "0000000000000001")
 
     @patch('google.cloud.storage.Client')
     def test_export_returns_success(self, mock_storage_client):
@@ -238,7 +243,7 @@ class TestGCSSpanExporter(unittest.TestCase):
 
         exporter = GCSSpanExporter(bucket_name="test-bucket", project_id="test-project")
 
-        with patch.object(exporter, '_export_async'):
+        with patch.object(exporter, '_export_spans'):
             result = exporter.export([])
             self.assertEqual(result, SpanExportResult.SUCCESS)
 
@@ -0,0 +1,107 @@
+import unittest
+
+from common.dummy_class import DummyClass
+from monocle_apptrace.instrumentation.common import head_sampling
+from monocle_apptrace.instrumentation.common.head_sampling import HeadSampler, TokenBucket, set_head_sampler
+from monocle_apptrace.instrumentation.common.instrumentor import setup_monocle_telemetry
+from monocle_apptrace.instrumentation.common.span_handler import SpanHandler
+from monocle_apptrace.instrumentation.common.utils import clear_http_scopes, extract_http_headers
+from monocle_apptrace.instrumentation.common.wrapper import task_wrapper
+from monocle_apptrace.instrumentation.common.wrapper_method import WrapperMethod
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+
+TRACE_ID = "0af7651916cd43dd8448eb211c80319c"
+
+class RemoteParentHandler(SpanHandler):
+    """Imports the trace context of an incoming request, like the http framework handlers."""
+
+    def __init__(self):
+        super().__init__()
+        self.headers = {}
+
+    def pre_tracing(self, to_wrap, wrapped, instance, args, kwargs):
+        return extract_http_headers(self.headers), None
+
+    def post_tracing(self, to_wrap, wrapped, instance, args, kwargs, return_value, token):
+        clear_http_scopes(token)
+
+class TestHeadSampling(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.exporter = InMemorySpanExporter()
+        cls.remote_parent_handler = RemoteParentHandler()
+        cls.instrumentor = setup_monocle_telemetry(
+            workflow_name="head_sampling_test",
+            span_processors=[SimpleSpanProcessor(cls.exporter)],
+            span_handlers={"remote_parent_handler": cls.remote_parent_handler},
+            wrapper_methods=[
+                WrapperMethod(package="common.dummy_class", object_name="DummyClass", method="double_it",
+                              span_name="double_it", wrapper_method=task_wrapper),
+                WrapperMethod(package="common.dummy_class", object_name="DummyClass", method="triple_it",
+                              span_name="triple_it", wrapper_method=task_wrapper),
+                WrapperMethod(package="common.dummy_class", object_name="DummyClass", method="dummy_chat",
+                              span_name="dummy_chat", wrapper_method=task_wrapper, span_handler="remote_parent_handler"),
+            ])
+        cls.dummy = DummyClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        if cls.instrumentor is not None:
+            cls.instrumentor.uninstrument()
+
+    def setUp(self):
+        self.previous_sampler = head_sampling.get_head_sampler()
+        self.exporter.clear()
+
+    def tearDown(self):
+        set_head_sampler(self.previous_sampler)
+
+    def _span_names(self):
+        return sorted(span.name for span in self.exporter.get_finished_spans())
+
+    def test_dropped_trace_creates_no_spans(self):
+        set_head_sampler(HeadSampler(ratio=0.0))
+        self.assertEqual(self.dummy.triple_it(2), 6)
+        self.assertEqual(self.exporter.get_finished_spans(), ())
+
+    def test_sampled_trace_is_complete(self):
+        set_head_sampler(HeadSampler(ratio=0.0, workflow_ratios={"head_sampling_test": 1.0}))
+        self.dummy.triple_it(2)
+        self.assertEqual(self._span_names(), ["double_it", "triple_it", "workflow"])
+
+    def _call_with_traceparent(self, flags: str):
+        self.remote_parent_handler.headers = {"traceparent": f"00-{TRACE_ID}-b7ad6b7169203331-{flags}"}
+        try:
+            self.dummy.dummy_chat("hello")
+        finally:
+            self.remote_parent_handler.headers = {}
+
+    def test_sampled_remote_parent_is_followed(self):
+        set_head_sampler(HeadSampler(ratio=0.0))
+        self._call_with_traceparent("01")
+        self.assertEqual(self._span_names(), ["dummy_chat", "workflow"])
+
+    def test_unsampled_remote_parent_is_followed(self):
+        sampler = HeadSampler(ratio=1.0)
+        set_head_sampler(sampler)
+        self._call_with_traceparent("00")
+        self.assertEqual(self.exporter.get_finished_spans(), ())
+        # the decision of the upstream service, not of the sampler
+        self.assertEqual(sampler.get_metrics(), {"sampled": 0, "dropped": 0})
+
+    def test_rate_limit(self):
+        now = [0.0]
+        sampler = HeadSampler(rate_limiter=TokenBucket(1, clock=lambda: now[0]))
+        set_head_sampler(sampler)
+        self.dummy.triple_it(1)
+        self.dummy.triple_it(2)
+        self.assertEqual(len(self.exporter.get_finished_spans()), 3)
+        now[0] = 1.0
+        self.dummy.triple_it(3)
+        self.assertEqual(len(self.exporter.get_finished_spans()), 6)
+        self.assertEqual(sampler.get_metrics(), {"sampled": 2, "dropped": 1})
+
+if __name__ == '__main__':
+    unittest.main()
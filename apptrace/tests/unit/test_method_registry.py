@@ -0,0 +1,133 @@
+import importlib.util
+import os
+import subprocess
+import sys
+import tempfile
+import textwrap
+import unittest
+
+from monocle_apptrace.instrumentation.common.method_registry import (
+    DEFAULT_METAMODELS, DEFAULT_SPAN_HANDLERS, MONOCLE_SPAN_HANDLERS, LazyInstrumentation, MetamodelEntry,
+    get_trigger_module, load_metamodel_methods
+)
+from monocle_apptrace.instrumentation.common.span_handler import NonFrameworkSpanHandler
+
+class TestMethodRegistry(unittest.TestCase):
+
+    def test_methods_are_under_their_trigger_modules(self):
+        for entry in DEFAULT_METAMODELS:
+            for method in load_metamodel_methods(entry):
+                package = method["package"]
+                self.assertTrue(any(package == module or package.startswith(module + ".")
+                                    for module in entry.trigger_modules),
+                                f"{package} isn't covered by the {entry.name} trigger modules")
+                self.assertIn(method.get("span_handler", "default"), DEFAULT_SPAN_HANDLERS)
+
+    def test_trigger_module_of_reexported_method(self):
+        entry = next(entry for entry in DEFAULT_METAMODELS if entry.name == "langchain")
+        self.assertEqual(get_trigger_module(entry, "langchain.chat_models.base"),
+                         "langchain_core.language_models.chat_models")
+        self.assertEqual(get_trigger_module(entry, "langchain_core.retrievers"), "langchain_core")
+
+    @unittest.skipUnless(importlib.util.find_spec("langchain_core") and importlib.util.find_spec("langchain"),
+                         "langchain isn't installed")
+    def test_langchain_core_import_wraps_chat_model(self):
+        script = textwrap.dedent("""
+            import sys
+            from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+            from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+            from wrapt import FunctionWrapper
+            from monocle_apptrace.instrumentation.common.instrumentor import setup_monocle_telemetry
+            setup_monocle_telemetry(workflow_name="lazy_langchain", span_processors=[SimpleSpanProcessor(InMemorySpanExporter())])
+            assert "langchain_core" not in sys.modules
+            from langchain_core.language_models.chat_models import BaseChatModel
+            assert isinstance(BaseChatModel.__dict__["invoke"], FunctionWrapper)
+            assert isinstance(BaseChatModel.__dict__["ainvoke"], FunctionWrapper)
+        """)
+        self._run_after_setup(script)
+
+    @unittest.skipUnless(importlib.util.find_spec("flask"), "flask isn't installed")
+    def test_flask_import_after_setup_wraps_app(self):
+        # flask imports werkzeug, a trigger of the flask metamodel, while flask is initializing
+        script = textwrap.dedent("""
+            from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+            from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+            from wrapt import FunctionWrapper
+            from monocle_apptrace.instrumentation.common.instrumentor import setup_monocle_telemetry
+            setup_monocle_telemetry(workflow_name="lazy_flask", span_processors=[SimpleSpanProcessor(InMemorySpanExporter())])
+            from flask import Flask
+            assert isinstance(Flask.__dict__["wsgi_app"], FunctionWrapper)
+        """)
+        self._run_after_setup(script)
+
+    def _run_after_setup(self, script: str):
+        # a fresh interpreter, the application imports the framework after the setup
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+        env.pop("MONOCLE_LAZY_INSTRUMENTATION", None)
+        result = subprocess.run([sys.executable, "-c", script], env=env, capture_output=True, text=True, timeout=120)
+        self.assertEqual(result.returncode, 0, result.stderr)
+
+    def test_span_handlers_are_created_on_access(self):
+        self.assertIn("non_framework_handler", MONOCLE_SPAN_HANDLERS)
+        handler = MONOCLE_SPAN_HANDLERS["non_framework_handler"]
+        self.assertIsInstance(handler, NonFrameworkSpanHandler)
+        self.assertIs(MONOCLE_SPAN_HANDLERS["non_framework_handler"], handler)
+
+class TestLazyInstrumentation(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        root = os.path.join(self.directory.name, "lazy_target")
+        os.makedirs(root)
+        with open(os.path.join(root, "__init__.py"), "w") as f:
+            f.write("")
+        with open(os.path.join(root, "client.py"), "w") as f:
+            f.write("def call():\n    return 1\n")
+        with open(os.path.join(self.directory.name, "lazy_target_methods.py"), "w") as f:
+            f.write(textwrap.dedent("""
+                METHODS = [{"package": "lazy_target.client", "object": None, "method": "call"}]
+            """))
+        sys.path.insert(0, self.directory.name)
+        self.entry = MetamodelEntry("lazy_target", ("lazy_target",), ("lazy_target_methods", "METHODS"))
+
+    def tearDown(self):
+        sys.path.remove(self.directory.name)
+        for name in ("lazy_target", "lazy_target.client", "lazy_target_methods"):
+            sys.modules.pop(name, None)
+        self.directory.cleanup()
+
+    def test_methods_are_applied_on_import(self):
+        applied = []
+        instrumentation = LazyInstrumentation(applied.append, metamodels=(self.entry,))
+        instrumentation.activate()
+        self.assertEqual(applied, [])
+        self.assertNotIn("lazy_target_methods", sys.modules)
+
+        import lazy_target
+        self.assertEqual(instrumentation.get_loaded_metamodels(), ["lazy_target"])
+        self.assertEqual([method["method"] for method in applied], ["call"])
+        instrumentation.deactivate()
+
+    def test_trigger_module_of_method(self):
+        entry = MetamodelEntry("x", ("google.genai", "google.adk"), ("x", "X"))
+        self.assertEqual(get_trigger_module(entry, "google.adk.runners"), "google.adk")
+        self.assertEqual(get_trigger_module(entry, "google.genai"), "google.genai")
+
+    def test_already_imported_modules_are_applied_right_away(self):
+        import lazy_target
+        applied = []
+        instrumentation = LazyInstrumentation(applied.append, metamodels=(self.entry,))
+        instrumentation.activate()
+        self.assertEqual(len(applied), 1)
+        instrumentation.deactivate()
+
+    def test_deactivated_hooks_do_nothing(self):
+        applied = []
+        instrumentation = LazyInstrumentation(applied.append, metamodels=(self.entry,))
+        instrumentation.activate()
+        instrumentation.deactivate()
+        import lazy_target
+        self.assertEqual(applied, [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+
+from monocle_apptrace.instrumentation.common.constants import ADD_NEW_WORKFLOW
+from monocle_apptrace.instrumentation.common.utils import get_current_monocle_span, get_scopes
+from monocle_apptrace.instrumentation.common.wrapper import start_as_monocle_span
+from opentelemetry.context import get_value
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+from opentelemetry.trace import INVALID_SPAN, get_current_span
+from opentelemetry.trace.status import StatusCode
+
+class TestMonocleContext(unittest.TestCase):
+
+    def setUp(self):
+        self.exporter = InMemorySpanExporter()
+        tracer_provider = TracerProvider()
+        tracer_provider.add_span_processor(SimpleSpanProcessor(self.exporter))
+        self.tracer = tracer_provider.get_tracer("test")
+
+    def test_monocle_spans_isolated(self):
+        with self.tracer.start_as_current_span("otel_outer") as otel_outer:
+            with start_as_monocle_span(self.tracer, "monocle_outer", True) as monocle_outer:
+                self.assertIs(get_current_span(), otel_outer)
+                self.assertIs(get_current_monocle_span(), monocle_outer)
+                with self.tracer.start_as_current_span("otel_inner"):
+                    with start_as_monocle_span(self.tracer, "monocle_inner", True) as monocle_inner:
+                        self.assertIs(get_current_monocle_span(), monocle_inner)
+                self.assertIs(get_current_monocle_span(), monocle_outer)
+            self.assertIs(get_current_span(), otel_outer)
+            self.assertIs(get_current_monocle_span(), INVALID_SPAN)
+        spans = {span.name: span for span in self.exporter.get_finished_spans()}
+        self.assertEqual(spans["monocle_inner"].parent.span_id, spans["monocle_outer"].context.span_id)
+        self.assertIsNone(spans["monocle_outer"].parent)
+        self.assertEqual(spans["otel_inner"].parent.span_id, spans["otel_outer"].context.span_id)
+
+    def test_values_and_scope_set_with_span(self):
+        with start_as_monocle_span(self.tracer, "monocle", True, {ADD_NEW_WORKFLOW: False}, "agentic.turn"):
+            self.assertIs(get_value(ADD_NEW_WORKFLOW), False)
+            self.assertIn("agentic.turn", get_scopes())
+        self.assertIsNone(get_value(ADD_NEW_WORKFLOW))
+        self.assertEqual(get_scopes(), {})
+
+    def test_context_restored_on_error(self):
+        with self.tracer.start_as_current_span("otel_outer") as otel_outer:
+            with self.assertRaises(ValueError):
+                with start_as_monocle_span(self.tracer, "monocle", True):
+                    raise ValueError("failed")
+            self.assertIs(get_current_span(), otel_outer)
+            self.assertIs(get_current_monocle_span(), INVALID_SPAN)
+        span = [span for span in self.exporter.get_finished_spans() if span.name == "monocle"][0]
+        self.assertEqual(span.status.status_code, StatusCode.ERROR)
+        self.assertEqual(span.events[0].name, "exception")
+
+    def test_span_left_open(self):
+        with start_as_monocle_span(self.tracer, "monocle", False) as span:
+            pass
+        self.assertTrue(span.is_recording())
+        span.end()
+
+if __name__ == '__main__':
+    unittest.main()
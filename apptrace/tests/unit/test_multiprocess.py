@@ -0,0 +1,105 @@
+import os
+import pickle
+import threading
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+from unittest.mock import MagicMock, patch
+
+from monocle_apptrace.exporters.trace_buffer import TraceBuffer
+from monocle_apptrace.exporters.upload_engine import UploadEngine
+from monocle_apptrace.instrumentation.common.multiprocess import monocle_process_task
+from monocle_apptrace.instrumentation.common.utils import get_current_monocle_span, get_scopes, remove_scopes, set_scope
+from monocle_apptrace.instrumentation.common.wrapper import start_as_monocle_span
+from opentelemetry.sdk.trace import TracerProvider
+
+def current_parent_and_scopes():
+    span_context = get_current_monocle_span().get_span_context()
+    return span_context.trace_id, span_context.span_id, get_scopes()
+
+class TestForkReset(unittest.TestCase):
+
+    @unittest.skipUnless(hasattr(os, "fork"), "requires fork")
+    def test_child_discards_parent_work(self):
+        engine = UploadEngine(max_workers=1, max_queue_size=10, name="ForkTest")
+        release = threading.Event()
+        engine.submit(release.wait)
+        engine.submit(lambda: None)
+        trace_buffer = TraceBuffer(name="ForkTest")
+        trace_buffer.add(1, [])
+        pid = os.fork()
+        if pid == 0:
+            ok = False
+            try:
+                metrics = engine.get_metrics()
+                done = threading.Event()
+                ok = metrics["queued"] == 0 and metrics["in_flight"] == 0 and len(trace_buffer) == 0
+                engine.submit(done.set)
+                ok = ok and done.wait(5)
+            finally:
+                os._exit(0 if ok else 1)
+        release.set()
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual(os.WEXITSTATUS(status), 0)
+        self.assertTrue(engine.flush(5000))
+        self.assertEqual(engine.get_metrics()["completed"], 2)
+        self.assertEqual(len(trace_buffer), 1)
+        engine.shutdown()
+
+class TestProcessTask(unittest.TestCase):
+
+    def setUp(self):
+        self.tracer = TracerProvider().get_tracer("test")
+
+    def test_task_runs_under_submitting_span(self):
+        token = set_scope("session", "s1")
+        try:
+            with start_as_monocle_span(self.tracer, "parent", True) as span:
+                task = pickle.loads(pickle.dumps(monocle_process_task(current_parent_and_scopes, flush=False)))
+        finally:
+            remove_scopes(token)
+        trace_id, span_id, scopes = task()
+        self.assertEqual((trace_id, span_id), (span.context.trace_id, span.context.span_id))
+        self.assertEqual(scopes, {"session": "s1"})
+        self.assertEqual(get_scopes(), {})
+        self.assertFalse(get_current_monocle_span().get_span_context().is_valid)
+
+    @unittest.skipUnless("fork" in multiprocessing.get_all_start_methods(), "requires fork")
+    def test_process_pool(self):
+        with start_as_monocle_span(self.tracer, "parent", True) as span:
+            with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("fork")) as executor:
+                trace_id, span_id, _ = executor.submit(monocle_process_task(current_parent_and_scopes)).result(30)
+        self.assertEqual((trace_id, span_id), (span.context.trace_id, span.context.span_id))
+
+class TestStorageExporterForkReset(unittest.TestCase):
+    """The storage clients pool connections, the child gets its own client."""
+
+    def test_s3_client_is_recreated(self):
+        from monocle_apptrace.exporters.aws.s3_exporter import S3SpanExporter
+        with patch("monocle_apptrace.exporters.aws.s3_exporter.boto3.client", side_effect=lambda *a, **k: MagicMock()):
+            exporter = S3SpanExporter(bucket_name="bucket", region_name="us-east-1")
+            parent_client = exporter.s3_client
+            exporter._after_fork_in_child()
+        self.assertIsNot(exporter.s3_client, parent_client)
+
+    def test_blob_client_is_recreated(self):
+        from monocle_apptrace.exporters.azure.blob_exporter import AzureBlobSpanExporter
+        with patch("monocle_apptrace.exporters.azure.blob_exporter.BlobServiceClient") as blob_service_client:
+            blob_service_client.from_connection_string.side_effect = lambda *a, **k: MagicMock()
+            exporter = AzureBlobSpanExporter(connection_string="UseDevelopmentStorage=true", container_name="traces")
+            parent_client = exporter.blob_service_client
+            exporter._after_fork_in_child()
+        self.assertIsNot(exporter.blob_service_client, parent_client)
+        blob_service_client.from_connection_string.assert_called_with("UseDevelopmentStorage=true")
+
+    def test_gcs_client_is_recreated(self):
+        from monocle_apptrace.exporters.gcp.gcs_exporter import GCSSpanExporter
+        with patch("google.cloud.storage.Client", side_effect=lambda *a, **k: MagicMock()):
+            exporter = GCSSpanExporter(bucket_name="bucket", project_id="project")
+            parent_client, parent_bucket = exporter.storage_client, exporter.bucket
+            exporter._after_fork_in_child()
+        self.assertIsNot(exporter.storage_client, parent_client)
+        self.assertIsNot(exporter.bucket, parent_bucket)
+
+if __name__ == '__main__':
+    unittest.main()
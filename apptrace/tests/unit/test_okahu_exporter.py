@@ -0,0 +1,105 @@
+import gzip
+import json
+import os
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest.mock import patch
+
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import ReadableSpan
+from opentelemetry.sdk.trace.export import SpanExportResult
+from opentelemetry.trace import SpanContext
+
+from monocle_apptrace.exporters.okahu.okahu_exporter import OkahuSpanExporter
+from monocle_apptrace.instrumentation.common.constants import MONOCLE_SDK_VERSION
+
+class _IngestHandler(BaseHTTPRequestHandler):
+    """Local stand-in for the Okahu ingest endpoint."""
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        server = self.server
+        with server.lock:
+            status = server.statuses.pop(0) if server.statuses else 200
+            if status == 200:
+                if self.headers.get("Content-Encoding") == "gzip":
+                    body = gzip.decompress(body)
+                elif self.headers.get("Content-Encoding") == "zstd":
+                    import zstandard
+                    body = zstandard.ZstdDecompressor().decompress(body)
+                server.requests.append((self.headers.get("Content-Encoding"), json.loads(body)))
+        self.send_response(status)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+def _span(span_id: int, parent_id: int = None) -> ReadableSpan:
+    parent = SpanContext(trace_id=0xabc, span_id=parent_id, is_remote=False) if parent_id else None
+    return ReadableSpan(name=f"span{span_id}", context=SpanContext(trace_id=0xabc, span_id=span_id, is_remote=False),
+                        parent=parent, attributes={MONOCLE_SDK_VERSION: "0.1"},
+                        resource=Resource(attributes={"service.name": "okahu_test"}))
+
+class TestOkahuSpanExporter(unittest.TestCase):
+
+    def setUp(self):
+        self.server = HTTPServer(("127.0.0.1", 0), _IngestHandler)
+        self.server.lock = threading.Lock()
+        self.server.requests = []
+        self.server.statuses = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.endpoint = f"http://127.0.0.1:{self.server.server_port}/api/v1/trace/ingest"
+        self.env = patch.dict(os.environ, {"OKAHU_API_KEY": "test-key"})
+        self.env.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.env.stop()
+
+    def test_sync_gzip(self):
+        with patch.dict(os.environ, {"MONOCLE_OKAHU_COMPRESSION": "gzip"}):
+            exporter = OkahuSpanExporter(endpoint=self.endpoint)
+        self.assertEqual(exporter.export([_span(1)]), SpanExportResult.SUCCESS)
+        encoding, payload = self.server.requests[0]
+        self.assertEqual(encoding, "gzip")
+        self.assertEqual(payload["batch"][0]["context"]["span_id"], "0000000000000001")
+        exporter.shutdown()
+
+    def test_async_coalesces_batches(self):
+        with patch.dict(os.environ, {"MONOCLE_OKAHU_ASYNC_SEND": "true", "MONOCLE_OKAHU_COMPRESSION": "zstd",
+                                     "MONOCLE_OKAHU_LINGER_MS": "60000"}):
+            exporter = OkahuSpanExporter(endpoint=self.endpoint)
+        for span_id in range(2, 6):
+            self.assertEqual(exporter.export([_span(span_id, 1)]), SpanExportResult.SUCCESS)
+        self.assertEqual(self.server.requests, [])
+        self.assertTrue(exporter.force_flush())
+        self.assertEqual(len(self.server.requests), 1)
+        encoding, payload = self.server.requests[0]
+        self.assertEqual(encoding, "zstd")
+        self.assertEqual([span["name"] for span in payload["batch"]], ["span2", "span3", "span4", "span5"])
+        exporter.shutdown()
+
+    def test_async_payload_size_cap(self):
+        with patch.dict(os.environ, {"MONOCLE_OKAHU_ASYNC_SEND": "true", "MONOCLE_OKAHU_MAX_PAYLOAD_BYTES": "1",
+                                     "MONOCLE_OKAHU_LINGER_MS": "60000"}):
+            exporter = OkahuSpanExporter(endpoint=self.endpoint)
+        exporter.export([_span(2, 1), _span(3, 1), _span(1)])
+        exporter.force_flush()
+        self.assertEqual(len(self.server.requests), 3)
+        exporter.shutdown()
+
+    def test_async_retries_throttled_requests(self):
+        self.server.statuses = [429, 503]
+        with patch.dict(os.environ, {"MONOCLE_OKAHU_ASYNC_SEND": "true"}), \
+                patch("monocle_apptrace.exporters.base_exporter.time.sleep"):
+            exporter = OkahuSpanExporter(endpoint=self.endpoint)
+            exporter.export([_span(1)])
+            self.assertTrue(exporter.force_flush())
+            self.assertEqual(len(self.server.requests), 1)
+            self.assertEqual(exporter.sender.get_metrics()["completed"], 1)
+            exporter.shutdown()
+
+if __name__ == '__main__':
+    unittest.main()
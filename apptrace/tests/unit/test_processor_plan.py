@@ -0,0 +1,103 @@
+import gc
+import unittest
+from unittest.mock import MagicMock, patch
+
+from opentelemetry.sdk.trace import Span
+
+from monocle_apptrace.instrumentation.common.processor_plan import (
+    StaticAccessor,
+    compile_output_processor,
+    get_output_processor_plan,
+)
+from monocle_apptrace.instrumentation.common.span_handler import SpanHandler
+from monocle_apptrace.instrumentation.common.utils import EMPTY_SCOPE_SNAPSHOT
+
+OUTPUT_PROCESSOR = {
+    "type": "inference",
+    "subtype": "turn_end",
+    "attributes": [
+        [
+            {"attribute": "type", "accessor": lambda arguments: "inference.openai"},
+            {"attribute": "provider_name", "accessor": lambda arguments: "api.openai.com"},
+            {"attribute": "missing_accessor"},
+        ],
+        [
+            {"attribute": "name", "phase": "post_execution", "accessor": lambda arguments: "tool_a"},
+        ],
+    ],
+    "events": [
+        {"name": "data.input", "attributes": [{"attribute": "input", "accessor": lambda arguments: ["hello"]}]},
+        {"name": "data.output", "attributes": [{"attribute": "response", "accessor": lambda arguments: "world"}]},
+    ],
+}
+
+class TestProcessorPlan(unittest.TestCase):
+
+    def setUp(self):
+        self.span = MagicMock(spec=Span)
+        self.span.attributes = {}
+        self.span.events = []
+        self.span.parent = MagicMock()
+        self.span.set_attribute = MagicMock(side_effect=lambda key, value: self.span.attributes.__setitem__(key, value))
+
+    def test_compile_splits_phases(self):
+        plan = compile_output_processor(OUTPUT_PROCESSOR)
+        self.assertEqual(plan.span_type, "inference")
+        self.assertEqual(len(plan.entities), 2)
+        self.assertEqual([p.attribute for p in plan.entities[0].pre_execution], ["type", "provider_name"])
+        self.assertEqual(plan.entities[0].post_execution, ())
+        self.assertEqual([p.attribute for p in plan.entities[1].post_execution], ["name"])
+        self.assertEqual(plan.entities[0].pre_execution[0].keys[2], "entity.3.type")
+        self.assertEqual([event.skip_key for event in plan.events], ["events.data.input", "events.data.output"])
+
+    def test_plan_is_cached(self):
+        self.assertIs(get_output_processor_plan(OUTPUT_PROCESSOR), get_output_processor_plan(OUTPUT_PROCESSOR))
+
+    def test_hydrate_from_plan(self):
+        handler = SpanHandler()
+        to_wrap = {"output_processor": OUTPUT_PROCESSOR}
+        with patch('monocle_apptrace.instrumentation.common.span_handler.get_scope_snapshot', return_value=EMPTY_SCOPE_SNAPSHOT):
+            handler.hydrate_attributes(to_wrap, None, None, [], {}, None, self.span, None, is_post_exec=False)
+            self.assertEqual(self.span.attributes.get("entity.1.provider_name"), "api.openai.com")
+            self.assertEqual(self.span.attributes.get("entity.count"), 1)
+            handler.hydrate_attributes(to_wrap, None, None, [], {}, None, self.span, None, is_post_exec=True)
+        self.assertEqual(self.span.attributes.get("entity.2.name"), "tool_a")
+        self.assertEqual(self.span.attributes.get("entity.count"), 2)
+
+    def test_hydrate_events_respects_phase(self):
+        handler = SpanHandler()
+        to_wrap = {"output_processor": OUTPUT_PROCESSOR}
+        handler.hydrate_events(to_wrap, None, None, [], {}, None, self.span, None, None, is_post_exec=False)
+        event_names = [call.kwargs["name"] for call in self.span.add_event.call_args_list]
+        self.assertEqual(event_names, ["data.input"])
+        self.span.set_attribute.assert_any_call("span.subtype", "turn_end")
+
+    def test_static_accessor_per_instance(self):
+        class Client:
+            def __init__(self, endpoint):
+                self.endpoint = endpoint
+        calls = []
+        def endpoint_accessor(arguments):
+            calls.append(arguments["instance"].endpoint)
+            return arguments["instance"].endpoint
+        plan = compile_output_processor({"type": "inference", "attributes": [[
+            {"attribute": "inference_endpoint", "static": True, "accessor": endpoint_accessor},
+        ]]})
+        accessor = plan.entities[0].pre_execution[0].accessor
+        self.assertIsInstance(accessor, StaticAccessor)
+        first, second = Client("https://a"), Client("https://b")
+        self.assertEqual(accessor({"instance": first}), "https://a")
+        self.assertEqual(accessor({"instance": first}), "https://a")
+        self.assertEqual(accessor({"instance": second}), "https://b")
+        self.assertEqual(len(calls), 2)
+        del first, second
+        gc.collect()
+        self.assertEqual(accessor.values, {})
+
+    def test_static_accessor_without_weakref(self):
+        accessor = StaticAccessor(lambda arguments: len(arguments["instance"]))
+        self.assertEqual(accessor({"instance": (1, 2)}), 2)
+        self.assertEqual(accessor.values, {})
+
+if __name__ == '__main__':
+    unittest.main()
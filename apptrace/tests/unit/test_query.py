@@ -0,0 +1,81 @@
+import gzip
+import json
+import os
+import tempfile
+import unittest
+
+from monocle_apptrace.query import TraceIndex, iter_spans
+
+def _span(trace_id: str, span_id: str, span_type: str, duration_ms: int, status: str = "OK", **attributes) -> dict:
+    span_attributes = {"workflow.name": "query_test", "span.type": span_type}
+    span_attributes.update(attributes.pop("attributes", {}))
+    return {
+        "name": span_type,
+        "context": {"trace_id": trace_id, "span_id": span_id},
+        "parent_id": None,
+        "start_time": "2025-01-01T00:00:00.000000Z",
+        "end_time": f"2025-01-01T00:00:00.{duration_ms * 1000:06d}Z",
+        "status": {"status_code": status},
+        "attributes": span_attributes,
+        "events": attributes.pop("events", []),
+    }
+
+def _inference(trace_id: str, span_id: str, duration_ms: int, model: str, prompt: int, completion: int) -> dict:
+    return _span(trace_id, span_id, "inference", duration_ms,
+                 attributes={"entity.1.type": "inference.openai", "entity.2.name": model,
+                             "entity.2.type": f"model.llm.{model}", "scope.session": "s1"},
+                 events=[{"name": "metadata", "attributes": {"prompt_tokens": prompt, "completion_tokens": completion,
+                                                              "total_tokens": prompt + completion}}])
+
+def _tool(trace_id: str, span_id: str, tool: str, status: str) -> dict:
+    return _span(trace_id, span_id, "agentic.tool.invocation", 5, status,
+                 attributes={"entity.1.name": tool, "entity.1.type": "tool.function"})
+
+class TestTraceQuery(unittest.TestCase):
+
+    def setUp(self):
+        self.trace_dir = tempfile.TemporaryDirectory()
+        self.path = self.trace_dir.name
+        array_spans = [_inference("a1", "01", 10, "gpt-4o", 10, 5), _inference("a1", "02", 20, "gpt-4o", 20, 5),
+                       _tool("a1", "03", "search", "OK"), _tool("a1", "04", "search", "ERROR")]
+        # JSON array file as written by the file exporter, the last span is cut off mid write
+        with open(os.path.join(self.path, "monocle_trace_a1.json"), "w") as array_file:
+            array_file.write("[" + "\n,".join(json.dumps(span, indent=4) for span in array_spans) + "\n,{\"name\": ")
+        ndjson_spans = [_inference("b2", "05", 30, "claude", 7, 3), _tool("b2", "06", "lookup", "ERROR"),
+                        _span("b2", "07", "workflow", 40)]
+        with gzip.open(os.path.join(self.path, "monocle_trace_b2.ndjson.gz"), "wt") as ndjson_file:
+            ndjson_file.write("\n".join(json.dumps(span) for span in ndjson_spans) + "\n")
+        self.index = TraceIndex(os.path.join(self.path, "index.sqlite"))
+        self.stats = self.index.add_paths(self.path)
+
+    def tearDown(self):
+        self.index.close()
+        self.trace_dir.cleanup()
+
+    def test_stream_parse(self):
+        spans = list(iter_spans(os.path.join(self.path, "monocle_trace_a1.json")))
+        self.assertEqual([span["context"]["span_id"] for span in spans], ["01", "02", "03", "04"])
+        self.assertEqual(self.stats, {"files": 2, "spans": 7, "skipped": 0})
+        self.assertEqual(self.index.add_paths(self.path)["skipped"], 2)
+
+    def test_filters(self):
+        self.assertEqual(len(list(self.index.search(trace_id="B2"))), 3)
+        self.assertEqual(len(list(self.index.search(entity="gpt-4o"))), 2)
+        self.assertEqual(len(list(self.index.search(scope=("session", "s1")))), 3)
+        self.assertEqual(len(list(self.index.search(workflow="query_test", span_type="agentic.*"))), 3)
+        self.assertEqual(list(self.index.search(start="2025-01-02T00:00:00Z")), [])
+        self.assertEqual(len(self.index.get_trace("a1")), 4)
+
+    def test_aggregates(self):
+        latency = {row["span_type"]: row for row in self.index.latency_percentiles()}
+        self.assertEqual(latency["inference"]["count"], 3)
+        self.assertAlmostEqual(latency["inference"]["p50"], 20, places=3)
+        self.assertAlmostEqual(latency["inference"]["p95"], 30, places=3)
+        tokens = {row["model"]: row for row in self.index.token_usage()}
+        self.assertEqual((tokens["gpt-4o"]["prompt_tokens"], tokens["gpt-4o"]["total_tokens"]), (30, 40))
+        self.assertEqual(tokens["claude"]["completion_tokens"], 3)
+        errors = {row["tool"]: (row["calls"], row["errors"]) for row in self.index.error_counts()}
+        self.assertEqual(errors, {"search": (2, 1), "lookup": (1, 1)})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import unittest
+
+from monocle_apptrace.instrumentation.common.utils import (
+    EMPTY_SCOPE_SNAPSHOT, get_scope_snapshot, get_scopes, is_scope_set, remove_scopes, set_scope, set_scopes
+)
+from opentelemetry import baggage
+from opentelemetry.context import attach, detach
+
+class TestScopeSnapshot(unittest.TestCase):
+
+    def test_snapshot_follows_scopes(self):
+        self.assertIs(get_scope_snapshot(), EMPTY_SCOPE_SNAPSHOT)
+        token = set_scopes({"session": "s1", "turn": None})
+        try:
+            snapshot = get_scope_snapshot()
+            self.assertIs(get_scope_snapshot(), snapshot)
+            self.assertEqual(snapshot.attributes["scope.session"], "s1")
+            self.assertTrue(is_scope_set("turn"))
+            self.assertEqual(get_scopes("session"), {"session": "s1"})
+            nested_token = set_scope("session", "s2")
+            self.assertEqual(get_scopes()["session"], "s2")
+            self.assertGreater(get_scope_snapshot().version, snapshot.version)
+            remove_scopes(nested_token)
+            self.assertIs(get_scope_snapshot(), snapshot)
+        finally:
+            remove_scopes(token)
+        self.assertEqual(get_scopes(), {})
+        self.assertFalse(is_scope_set("turn"))
+
+    def test_baggage_set_outside_scopes(self):
+        token = set_scope("session", "s1")
+        baggage_token = attach(baggage.set_baggage("monocle.scope.request", "r1"))
+        try:
+            self.assertEqual(get_scopes(), {"session": "s1", "request": "r1"})
+            self.assertIs(get_scope_snapshot(), get_scope_snapshot())
+        finally:
+            detach(baggage_token)
+            remove_scopes(token)
+
+    def test_get_scopes_returns_copy(self):
+        token = set_scope("session", "s1")
+        try:
+            get_scopes()["session"] = "changed"
+            self.assertEqual(get_scopes()["session"], "s1")
+        finally:
+            remove_scopes(token)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import glob
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import ReadableSpan
+from opentelemetry.trace import SpanContext
+
+from monocle_apptrace.exporters.file_exporter import FileSpanExporter
+from monocle_apptrace.exporters.segment_writer import iter_index, read_trace
+from monocle_apptrace.instrumentation.common.constants import MONOCLE_SDK_VERSION
+
+def _span(trace_id: int, span_id: int, parent_id: int = None) -> ReadableSpan:
+    parent = SpanContext(trace_id=trace_id, span_id=parent_id, is_remote=False) if parent_id else None
+    return ReadableSpan(name=f"span{span_id}", context=SpanContext(trace_id=trace_id, span_id=span_id, is_remote=False),
+                        parent=parent, attributes={MONOCLE_SDK_VERSION: "0.1"},
+                        resource=Resource(attributes={"service.name": "segment_test"}))
+
+class TestSegmentOutput(unittest.TestCase):
+
+    def setUp(self):
+        self.output_dir = tempfile.TemporaryDirectory()
+        self.output_path = self.output_dir.name
+
+    def tearDown(self):
+        self.output_dir.cleanup()
+
+    def _exporter(self, **env) -> FileSpanExporter:
+        with patch.dict(os.environ, env):
+            return FileSpanExporter(out_path=self.output_path, output_format="ndjson")
+
+    def test_traces_share_a_segment(self):
+        exporter = self._exporter()
+        exporter.export([_span(0x1, 2, 1), _span(0x2, 2, 1)])
+        exporter.export([_span(0x1, 1), _span(0x2, 1)])
+        exporter.shutdown()
+        self.assertEqual(len(glob.glob(os.path.join(self.output_path, "*.ndjson"))), 1)
+        self.assertEqual([span["name"] for span in read_trace(self.output_path, 0x1)], ["span2", "span1"])
+        self.assertEqual(len(read_trace(self.output_path, "00000000000000000000000000000002")), 2)
+        self.assertEqual(exporter.last_trace_id, 0x2)
+
+    def test_compressed_segments(self):
+        for compression, extension in (("gzip", ".ndjson.gz"), ("zstd", ".ndjson.zst")):
+            exporter = self._exporter(MONOCLE_FILE_EXPORTER_COMPRESSION=compression)
+            exporter.export([_span(0x3, 2, 1), _span(0x3, 1)])
+            exporter.shutdown()
+            self.assertTrue(exporter.last_file_processed.endswith(extension))
+            self.assertEqual(len(read_trace(self.output_path, 0x3)), 2)
+            for path in glob.glob(os.path.join(self.output_path, "*")):
+                os.remove(path)
+
+    def test_size_rotation(self):
+        exporter = self._exporter(MONOCLE_FILE_SEGMENT_MAX_BYTES="1")
+        for trace_id in range(1, 4):
+            exporter.export([_span(trace_id, 1)])
+        exporter.shutdown()
+        records = list(iter_index(self.output_path))
+        self.assertEqual(len({record["segment"] for record in records}), 3)
+        self.assertTrue(all(record["offset"] == 0 for record in records))
+        self.assertEqual(len(read_trace(self.output_path, 2)), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+import unittest
+
+from common.dummy_class import DummyClass
+from monocle_apptrace.exporters.trace_buffer import TraceBuffer
+from monocle_apptrace.instrumentation.common.instrumentor import setup_monocle_telemetry
+from monocle_apptrace.instrumentation.common.self_telemetry import (
+    EXPORT_DURATION, SPANS_DROPPED, SPANS_EXPORTED, TRACE_BUFFER_SPANS, WRAPPER_OVERHEAD, MeteredSpanExporter,
+    SelfTelemetry, get_self_telemetry, get_self_telemetry_snapshot
+)
+from monocle_apptrace.instrumentation.common.wrapper import task_wrapper
+from monocle_apptrace.instrumentation.common.wrapper_method import WrapperMethod
+from opentelemetry.sdk.metrics import MeterProvider
+from opentelemetry.sdk.metrics.export import InMemoryMetricReader
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor, SpanExporter, SpanExportResult
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+
+class FailingSpanExporter(SpanExporter):
+    def export(self, spans):
+        return SpanExportResult.FAILURE
+
+def _values(snapshot: dict, kind: str, name: str) -> dict:
+    return {tuple(sorted(point["attributes"].items())): point for point in snapshot[kind].get(name, [])}
+
+class TestSelfTelemetry(unittest.TestCase):
+
+    def test_snapshot(self):
+        telemetry = SelfTelemetry()
+        telemetry.add("spans", 2, {"exporter": "file"})
+        telemetry.add("spans", 3, {"exporter": "file"})
+        telemetry.record("latency", 0.5)
+        telemetry.record("latency", 1.5)
+        telemetry.register_gauge("depth", lambda: [(7, {"queue": "a"})])
+        snapshot = telemetry.snapshot()
+        self.assertEqual(snapshot["counters"]["spans"], [{"attributes": {"exporter": "file"}, "value": 5}])
+        self.assertEqual(snapshot["histograms"]["latency"],
+                         [{"attributes": {}, "count": 2, "sum": 2.0, "min": 0.5, "max": 1.5}])
+        self.assertEqual(snapshot["gauges"]["depth"], [{"attributes": {"queue": "a"}, "value": 7}])
+        telemetry.reset()
+        self.assertEqual(telemetry.snapshot()["counters"], {})
+
+    def test_disabled(self):
+        telemetry = SelfTelemetry(enabled=False)
+        telemetry.add("spans")
+        telemetry.record("latency", 1)
+        self.assertEqual(telemetry.snapshot()["counters"], {})
+        self.assertEqual(telemetry.snapshot()["histograms"], {})
+
+    def test_reported_to_meter_provider(self):
+        reader = InMemoryMetricReader()
+        telemetry = SelfTelemetry(meter=MeterProvider(metric_readers=[reader]).get_meter("test"))
+        telemetry.add(SPANS_EXPORTED, 4, {"exporter": "file"})
+        telemetry.register_gauge(TRACE_BUFFER_SPANS, lambda: [(3, {"buffer": "file"})])
+        points = {}
+        for resource_metrics in reader.get_metrics_data().resource_metrics:
+            for scope_metrics in resource_metrics.scope_metrics:
+                for metric in scope_metrics.metrics:
+                    points[metric.name] = [point.value for point in metric.data.data_points]
+        self.assertEqual(points[SPANS_EXPORTED], [4])
+        self.assertEqual(points[TRACE_BUFFER_SPANS], [3])
+
+    def test_metered_exporter(self):
+        get_self_telemetry().reset()
+        metered = MeteredSpanExporter(InMemorySpanExporter())
+        metered.export([object(), object()])
+        MeteredSpanExporter(FailingSpanExporter()).export([object()])
+        snapshot = get_self_telemetry_snapshot()
+        exported = _values(snapshot, "counters", SPANS_EXPORTED)
+        self.assertEqual(exported[(("exporter", "InMemorySpanExporter"),)]["value"], 2)
+        dropped = _values(snapshot, "counters", SPANS_DROPPED)
+        self.assertEqual(dropped[(("exporter", "FailingSpanExporter"), ("reason", "export_failed"))]["value"], 1)
+        self.assertEqual(_values(snapshot, "histograms", EXPORT_DURATION)[(("exporter", "InMemorySpanExporter"),)]["count"], 1)
+
+    def test_trace_buffer_gauge(self):
+        trace_buffer = TraceBuffer(name="test_buffer")
+        trace_buffer.account(trace_buffer.get_or_create(1), 5, 100)
+        spans = _values(get_self_telemetry_snapshot(), "gauges", TRACE_BUFFER_SPANS)
+        self.assertEqual(spans[(("buffer", "test_buffer"),)]["value"], 5)
+        del trace_buffer
+        self.assertNotIn((("buffer", "test_buffer"),), _values(get_self_telemetry_snapshot(), "gauges", TRACE_BUFFER_SPANS))
+
+class TestWrapperOverhead(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.exporter = InMemorySpanExporter()
+        cls.instrumentor = setup_monocle_telemetry(
+            workflow_name="self_telemetry_test",
+            span_processors=[SimpleSpanProcessor(cls.exporter)],
+            wrapper_methods=[
+                WrapperMethod(package="common.dummy_class", object_name="DummyClass", method="double_it",
+                              span_name="double_it", wrapper_method=task_wrapper),
+            ])
+
+    @classmethod
+    def tearDownClass(cls):
+        if cls.instrumentor is not None:
+            cls.instrumentor.uninstrument()
+
+    def test_overhead_per_span_name(self):
+        get_self_telemetry().reset()
+        DummyClass().double_it(2)
+        DummyClass().double_it(3)
+        overhead = _values(get_self_telemetry_snapshot(), "histograms", WRAPPER_OVERHEAD)
+        self.assertEqual(overhead[(("span_name", "double_it"),)]["count"], 2)
+        self.assertGreater(overhead[(("span_name", "double_it"),)]["sum"], 0)
+
+if __name__ == '__main__':
+    unittest.main()
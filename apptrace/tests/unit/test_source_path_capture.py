@@ -0,0 +1,59 @@
+import inspect
+import unittest
+
+from monocle_apptrace.instrumentation.common import utils
+from monocle_apptrace.instrumentation.common.utils import (
+    SourceLocation,
+    resolve_source_path,
+    set_source_path_capture_policy,
+    with_tracer_wrapper,
+)
+
+@with_tracer_wrapper
+def _echo_source_path(tracer, handler, to_wrap, wrapped, instance, source_path, args, kwargs):
+    return source_path
+
+class TestSourcePathCapture(unittest.TestCase):
+
+    def setUp(self):
+        self.previous_policy = utils.source_path_capture_policy
+        self.previous_rate = utils.source_path_sample_rate
+
+    def tearDown(self):
+        set_source_path_capture_policy(self.previous_policy, self.previous_rate)
+
+    def test_captures_caller_location(self):
+        set_source_path_capture_policy("always")
+        wrapper = _echo_source_path(None, None, {})
+        source_path, line_number = wrapper(None, None, (), {}), inspect.currentframe().f_lineno
+        self.assertIsInstance(source_path, SourceLocation)
+        self.assertEqual(resolve_source_path(source_path), f"{__file__}:{line_number}")
+
+    def test_explicit_source_path_is_kept(self):
+        set_source_path_capture_policy("always")
+        wrapper = _echo_source_path(None, None, {})
+        self.assertEqual(wrapper(None, None, (), {}, source_path="app.py:10"), "app.py:10")
+
+    def test_off_policy(self):
+        set_source_path_capture_policy("off")
+        wrapper = _echo_source_path(None, None, {})
+        self.assertIsNone(wrapper(None, None, (), {}))
+        self.assertEqual(resolve_source_path("app.py:10"), "")
+
+    def test_root_policy(self):
+        set_source_path_capture_policy("root")
+        self.assertEqual(resolve_source_path("app.py:10", is_root_span=False), "")
+        self.assertEqual(resolve_source_path("app.py:10", is_root_span=True), "app.py:10")
+
+    def test_sampled_policy(self):
+        set_source_path_capture_policy("sampled", 0.0)
+        self.assertEqual(resolve_source_path("app.py:10"), "")
+        set_source_path_capture_policy("sampled", 1.0)
+        self.assertEqual(resolve_source_path("app.py:10"), "app.py:10")
+
+    def test_invalid_policy(self):
+        with self.assertRaises(ValueError):
+            set_source_path_capture_policy("sometimes")
+
+if __name__ == '__main__':
+    unittest.main()
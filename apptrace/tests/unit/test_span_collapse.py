@@ -0,0 +1,81 @@
+import unittest
+
+from common.dummy_class import DummyClass
+from monocle_apptrace.instrumentation.common.constants import COLLAPSED_SPANS_KEY
+from monocle_apptrace.instrumentation.common.instrumentor import setup_monocle_telemetry
+from monocle_apptrace.instrumentation.common.span_collapse import SpanCollapse, get_span_collapse, set_span_collapse
+from monocle_apptrace.instrumentation.common.wrapper import task_wrapper
+from monocle_apptrace.instrumentation.common.wrapper_method import WrapperMethod
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+
+OUTER_PROCESSOR = {
+    "type": "inference.framework",
+    "attributes": [[{"attribute": "name", "accessor": lambda arguments: "outer"}]],
+}
+INNER_PROCESSOR = {
+    "type": "inference.modelapi",
+    "attributes": [[
+        {"attribute": "name", "accessor": lambda arguments: "inner"},
+        {"attribute": "deployment", "accessor": lambda arguments: "inner_deployment"},
+    ]],
+}
+
+class TestSpanCollapse(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.exporter = InMemorySpanExporter()
+        cls.instrumentor = setup_monocle_telemetry(
+            workflow_name="span_collapse_test",
+            span_processors=[SimpleSpanProcessor(cls.exporter)],
+            wrapper_methods=[
+                WrapperMethod(package="common.dummy_class", object_name="DummyClass", method="triple_it",
+                              span_name="triple_it", output_processor=OUTER_PROCESSOR, wrapper_method=task_wrapper),
+                WrapperMethod(package="common.dummy_class", object_name="DummyClass", method="double_it",
+                              span_name="double_it", output_processor=INNER_PROCESSOR, wrapper_method=task_wrapper),
+            ])
+
+    @classmethod
+    def tearDownClass(cls):
+        if cls.instrumentor is not None:
+            cls.instrumentor.uninstrument()
+
+    def setUp(self):
+        self.previous_collapse = get_span_collapse()
+        self.exporter.clear()
+
+    def tearDown(self):
+        set_span_collapse(self.previous_collapse)
+
+    def _spans(self):
+        self.assertEqual(DummyClass().triple_it(2), 6)
+        return {span.name: span for span in self.exporter.get_finished_spans()}
+
+    def test_off(self):
+        set_span_collapse(SpanCollapse())
+        spans = self._spans()
+        self.assertIn("double_it", spans)
+        self.assertEqual(spans["double_it"].parent.span_id, spans["triple_it"].context.span_id)
+
+    def test_skip(self):
+        set_span_collapse(SpanCollapse("skip"))
+        spans = self._spans()
+        self.assertNotIn("double_it", spans)
+        self.assertEqual(spans["triple_it"].attributes[COLLAPSED_SPANS_KEY], 1)
+        self.assertNotIn("entity.1.deployment", spans["triple_it"].attributes)
+
+    def test_merge(self):
+        set_span_collapse(SpanCollapse("merge"))
+        spans = self._spans()
+        self.assertNotIn("double_it", spans)
+        self.assertEqual(spans["triple_it"].attributes["entity.1.name"], "outer")
+        self.assertEqual(spans["triple_it"].attributes["entity.1.deployment"], "inner_deployment")
+        self.assertEqual(spans["triple_it"].attributes["span.type"], "inference.framework")
+
+    def test_other_family_not_collapsed(self):
+        set_span_collapse(SpanCollapse("skip", "retrieval"))
+        self.assertIn("double_it", self._spans())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import json
+import unittest
+
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import ReadableSpan, TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+
+from monocle_apptrace.exporters.span_encoder import encode_span, encode_spans_ndjson, span_to_dict
+from monocle_apptrace.instrumentation.common import utils
+
+def _remove_0x_prefix(obj):
+    if isinstance(obj, dict):
+        return {k: _remove_0x_prefix(v) for k, v in obj.items()}
+    elif isinstance(obj, list):
+        return [_remove_0x_prefix(item) for item in obj]
+    elif isinstance(obj, str) and obj.startswith("0x"):
+        return obj[2:]
+    return obj
+
+class TestSpanEncoder(unittest.TestCase):
+
+    def setUp(self):
+        self.exporter = InMemorySpanExporter()
+        tracer_provider = TracerProvider(resource=Resource(attributes={"service.name": "encoder_test"}))
+        tracer_provider.add_span_processor(SimpleSpanProcessor(self.exporter))
+        tracer = tracer_provider.get_tracer("encoder_test")
+        with tracer.start_as_current_span("workflow"):
+            with tracer.start_as_current_span("inference") as span:
+                span.set_attribute("last.inference", "0x00000000000000ab:tool")
+                span.set_attribute("entity.1.type", "inference.openai")
+                span.add_event("data.input", {"input": ["hello"]})
+        self.spans = self.exporter.get_finished_spans()
+
+    def _otel_json(self, span) -> dict:
+        original_to_json = utils._original_to_json or ReadableSpan.to_json
+        return _remove_0x_prefix(json.loads(original_to_json(span)))
+
+    def test_matches_otel_layout_without_0x(self):
+        for span in self.spans:
+            self.assertEqual(span_to_dict(span), self._otel_json(span))
+            self.assertEqual(json.loads(encode_span(span)), self._otel_json(span))
+            self.assertEqual(json.loads(encode_span(span, indent=4)), self._otel_json(span))
+
+    def test_compact_encoding(self):
+        encoded = encode_span(self.spans[0])
+        self.assertNotIn("\n", encoded)
+        self.assertNotIn('"0x', encoded)
+
+    def test_ndjson(self):
+        lines = encode_spans_ndjson(self.spans).split("\n")
+        self.assertEqual(len(lines), len(self.spans) + 1)
+        self.assertEqual([json.loads(line)["name"] for line in lines[:-1]], ["inference", "workflow"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,6 +3,7 @@ from unittest.mock import MagicMock, patch
 from opentelemetry.sdk.trace import Span
 
 from monocle_apptrace.instrumentation.common.span_handler import SpanHandler
+from monocle_apptrace.instrumentation.common.utils import EMPTY_SCOPE_SNAPSHOT
 
 
 class TestSpanHandlerEntityCount(unittest.TestCase):
@@ -65,8 +66,8 @@ class TestSpanHandlerEntityCount(unittest.TestCase):
         instance = MagicMock()
         wrapped = MagicMock()
         
-        # Mock get_scopes to return empty dict (no scope attributes)
-        with patch('monocle_apptrace.instrumentation.common.span_handler.get_scopes', return_value={}):
+        # Mock get_scope_snapshot to return no scopes (no scope attributes)
+        with patch('monocle_apptrace.instrumentation.common.span_handler.get_scope_snapshot', return_value=EMPTY_SCOPE_SNAPSHOT):
             # Call hydrate_attributes during regular execution (not post_exec)
             self.span_handler.hydrate_attributes(
                 to_wrap, wrapped, instance, args, kwargs, result, 
@@ -117,8 +118,8 @@ class TestSpanHandlerEntityCount(unittest.TestCase):
         instance = MagicMock()
         wrapped = MagicMock()
 
-        # Mock get_scopes to return empty dict (no scope attributes)
-        with patch('monocle_apptrace.instrumentation.common.span_handler.get_scopes', return_value={}):
+        # Mock get_scope_snapshot to return no scopes (no scope attributes)
+        with patch('monocle_apptrace.instrumentation.common.span_handler.get_scope_snapshot', return_value=EMPTY_SCOPE_SNAPSHOT):
             # Call hydrate_attributes
             self.span_handler.hydrate_attributes(
                 to_wrap, wrapped, instance, args, kwargs, result,
@@ -0,0 +1,71 @@
+import unittest
+from types import SimpleNamespace
+
+from monocle_apptrace.instrumentation.common.stream_aggregator import AggregatingStreamHooks, StreamAggregator
+from monocle_apptrace.instrumentation.common.stream_proxy import ITER_METHODS, instrument_stream
+
+def chunk(content=None, role=None, tool_calls=None, finish_reason=None, usage=None):
+    delta = SimpleNamespace(content=content, role=role, tool_calls=tool_calls)
+    return SimpleNamespace(choices=[SimpleNamespace(delta=delta, finish_reason=finish_reason)], usage=usage)
+
+def tool_delta(index, call_id=None, name=None, arguments=None):
+    return SimpleNamespace(index=index, id=call_id, function=SimpleNamespace(name=name, arguments=arguments))
+
+class TestStreamAggregator(unittest.TestCase):
+
+    def test_text_and_metadata(self):
+        aggregator = StreamAggregator(max_chars=0, max_bytes=0)
+        usage = SimpleNamespace(prompt_tokens=3, completion_tokens=2, total_tokens=5)
+        for item in [chunk(role="assistant", content="Hello"), chunk(content=", world"),
+                     chunk(finish_reason="stop"), SimpleNamespace(choices=[], usage=usage)]:
+            aggregator.add_chat_chunk(item)
+        result = aggregator.to_stream_result()
+        self.assertEqual(result.output_text, "Hello, world")
+        self.assertEqual(result.finish_reason, "stop")
+        self.assertIs(result.usage, usage)
+        self.assertIsNone(result.tools)
+        self.assertFalse(result.truncated)
+        self.assertLessEqual(result.timestamps["data.input"], result.timestamps["data.output"])
+
+    def test_tool_call_deltas_are_merged(self):
+        aggregator = StreamAggregator()
+        aggregator.add_chat_chunk(chunk(tool_calls=[tool_delta(0, "call_1", "get_weather", "")]))
+        aggregator.add_chat_chunk(chunk(tool_calls=[tool_delta(0, arguments='{"city"')]))
+        aggregator.add_chat_chunk(chunk(tool_calls=[tool_delta(1, "call_2", "get_time", "{}")]))
+        aggregator.add_chat_chunk(chunk(tool_calls=[tool_delta(0, arguments=': "Paris"}')]))
+        self.assertEqual(aggregator.tools, [
+            {"id": "call_1", "name": "get_weather", "arguments": '{"city": "Paris"}'},
+            {"id": "call_2", "name": "get_time", "arguments": "{}"},
+        ])
+        message = aggregator.to_completion_result().choices[0].message
+        self.assertEqual(message.tool_calls[0].function.name, "get_weather")
+
+    def test_char_budget(self):
+        aggregator = StreamAggregator(max_chars=8, max_bytes=0)
+        for text in ["abc", "def"]:
+            aggregator.add_text(text)
+        self.assertFalse(aggregator.truncated)
+        aggregator.add_text("ghij")
+        aggregator.add_text("k")
+        self.assertTrue(aggregator.truncated)
+        self.assertEqual(aggregator.text, "abcdefgh")
+
+    def test_byte_budget_keeps_whole_characters(self):
+        aggregator = StreamAggregator(max_chars=0, max_bytes=5)
+        aggregator.add_text("ééé")
+        self.assertEqual(aggregator.text, "éé")
+        self.assertTrue(aggregator.truncated)
+
+    def test_hooks_do_not_retain_chunks(self):
+        results = []
+        hooks = AggregatingStreamHooks(results.append, completion_result=True)
+        stream = instrument_stream(iter([chunk(content="a"), chunk(content="b", finish_reason="stop")]),
+                                   hooks, ITER_METHODS)
+        list(stream)
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0].choices[0].message.content, "ab")
+        self.assertEqual(results[0].choices[0].finish_reason, "stop")
+        self.assertNotIn("items", vars(hooks))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+import asyncio
+import unittest
+
+from monocle_apptrace.instrumentation.common.stream_proxy import (
+    ITER_METHODS, NEXT_METHODS, StreamHooks, StreamProxy, instrument_stream
+)
+
+class RecordingHooks(StreamHooks):
+    def __init__(self):
+        self.calls = []
+
+    def on_first_item(self, item):
+        self.calls.append(("first", item))
+
+    def on_item(self, item):
+        self.calls.append(("item", item))
+
+    def on_close(self, error=None):
+        self.calls.append(("close", error))
+
+class IterStream:
+    def __init__(self, items):
+        self.items = items
+
+    def __iter__(self):
+        return iter(self.items)
+
+class NextStream:
+    def __init__(self, items):
+        self.items = list(items)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if not self.items:
+            raise StopIteration
+        return self.items.pop(0)
+
+class AsyncNextStream:
+    def __init__(self, items):
+        self.items = list(items)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self.items:
+            raise StopAsyncIteration
+        return self.items.pop(0)
+
+class FailingStream:
+    def __iter__(self):
+        yield 1
+        raise ValueError("broken stream")
+
+class TestStreamProxy(unittest.TestCase):
+
+    def test_stream_class_is_cached(self):
+        first = instrument_stream(IterStream([1]), StreamHooks(), ITER_METHODS)
+        second = instrument_stream(IterStream([2]), StreamHooks(), ITER_METHODS)
+        self.assertIs(type(first), type(second))
+        self.assertIsNot(type(first), IterStream)
+        self.assertIsInstance(first, IterStream)
+        self.assertEqual(type(first).__name__, "IterStream")
+
+    def test_hooks_order_and_close_once(self):
+        hooks = RecordingHooks()
+        stream = instrument_stream(NextStream([1, 2]), hooks, NEXT_METHODS)
+        self.assertEqual(list(stream), [1, 2])
+        self.assertRaises(StopIteration, next, stream)
+        self.assertEqual(hooks.calls, [("first", 1), ("item", 1), ("item", 2), ("close", None)])
+
+    def test_error_is_reported_on_close(self):
+        hooks = RecordingHooks()
+        stream = instrument_stream(FailingStream(), hooks, ITER_METHODS)
+        with self.assertRaises(ValueError):
+            list(stream)
+        self.assertEqual(hooks.calls[-1][0], "close")
+        self.assertIsInstance(hooks.calls[-1][1], ValueError)
+
+    def test_generator_is_proxied(self):
+        hooks = RecordingHooks()
+        stream = instrument_stream((i for i in range(2)), hooks, ITER_METHODS)
+        self.assertIsInstance(stream, StreamProxy)
+        self.assertEqual(list(stream), [0, 1])
+        self.assertEqual(hooks.calls, [("first", 0), ("item", 0), ("item", 1), ("close", None)])
+
+    def test_nested_instrumentation(self):
+        outer, inner = RecordingHooks(), RecordingHooks()
+        stream = instrument_stream(IterStream([1]), inner, ITER_METHODS)
+        self.assertIs(instrument_stream(stream, outer, ITER_METHODS), stream)
+        list(stream)
+        self.assertEqual(inner.calls, outer.calls)
+
+    def test_hook_errors_are_not_raised(self):
+        class BrokenHooks(StreamHooks):
+            def on_item(self, item):
+                raise RuntimeError("hook failure")
+
+        self.assertEqual(list(instrument_stream(IterStream([1, 2]), BrokenHooks(), ITER_METHODS)), [1, 2])
+
+    def test_async_stream(self):
+        hooks = RecordingHooks()
+        stream = instrument_stream(AsyncNextStream(["a", "b"]), hooks, NEXT_METHODS)
+
+        async def consume():
+            return [item async for item in stream]
+
+        self.assertEqual(asyncio.run(consume()), ["a", "b"])
+        self.assertEqual(hooks.calls[-1], ("close", None))
+        self.assertEqual(len(hooks.calls), 4)
+
+if __name__ == '__main__':
+    unittest.main()
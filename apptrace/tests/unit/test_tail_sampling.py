@@ -0,0 +1,103 @@
+import threading
+import unittest
+
+from opentelemetry.sdk.trace import ReadableSpan, Event
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+from opentelemetry.trace import SpanContext, Status, StatusCode, TraceFlags
+
+from monocle_apptrace.exporters.trace_buffer import TraceBuffer
+from monocle_apptrace.instrumentation.common.constants import MONOCLE_DETECTED_SPAN_ERROR
+from monocle_apptrace.instrumentation.common.tail_sampling import TailSamplingSpanProcessor, parse_workflow_rates
+
+def _span(trace_id: int, span_id: int, parent_id: int = None, duration_ms: int = 1, status=StatusCode.OK,
+          attributes: dict = None, events=()) -> ReadableSpan:
+    parent = SpanContext(trace_id=trace_id, span_id=parent_id, is_remote=False) if parent_id else None
+    span_attributes = {"workflow.name": "chat"}
+    span_attributes.update(attributes or {})
+    return ReadableSpan(name=f"span{span_id}", context=SpanContext(trace_id=trace_id, span_id=span_id, is_remote=False,
+                                                                           trace_flags=TraceFlags(TraceFlags.SAMPLED)),
+                        parent=parent, attributes=span_attributes, events=events, status=Status(status),
+                        start_time=0, end_time=duration_ms * 1_000_000)
+
+class InterleavingTraceBuffer(TraceBuffer):
+    """Runs a callback on another thread right after the next trace lookup, before the span is appended."""
+
+    def __init__(self):
+        super().__init__()
+        self.interleave = None
+        self.threads = []
+
+    def get_or_create(self, trace_id, payload_factory=None):
+        entry = super().get_or_create(trace_id, payload_factory)
+        if self.interleave is not None:
+            interleave, self.interleave = self.interleave, None
+            thread = threading.Thread(target=interleave)
+            thread.start()
+            # blocked while the lookup holds the processor lock
+            thread.join(0.2)
+            self.threads.append(thread)
+        return entry
+
+class TestTailSampling(unittest.TestCase):
+
+    def setUp(self):
+        self.exporter = InMemorySpanExporter()
+        self.processor = TailSamplingSpanProcessor(SimpleSpanProcessor(self.exporter), default_rate=0.0,
+                                                   latency_threshold_ms=1000)
+
+    def _exported_traces(self):
+        return {span.context.trace_id for span in self.exporter.get_finished_spans()}
+
+    def test_keeps_interesting_traces(self):
+        self.processor.on_end(_span(1, 2, 1, attributes={MONOCLE_DETECTED_SPAN_ERROR: True}))
+        self.processor.on_end(_span(1, 1))
+        self.processor.on_end(_span(2, 2, 1, events=[Event("metadata", {"finish_type": "truncated"})]))
+        self.processor.on_end(_span(2, 1))
+        self.processor.on_end(_span(3, 1, duration_ms=5000))
+        self.processor.on_end(_span(4, 2, 1, events=[Event("metadata", {"finish_type": "success"})]))
+        self.processor.on_end(_span(4, 1))
+        self.processor.on_end(_span(5, 1, status=StatusCode.ERROR))
+        self.assertEqual(self._exported_traces(), {1, 2, 3, 5})
+        self.assertEqual(len(self.exporter.get_finished_spans()), 6)
+        metrics = self.processor.get_metrics()
+        self.assertEqual((metrics["kept_traces"], metrics["dropped_traces"], metrics["error"]), (4, 1, 2))
+
+    def test_spans_held_until_root_ends(self):
+        self.processor.default_rate = 1.0
+        self.processor.on_end(_span(6, 2, 1))
+        self.assertEqual(self.exporter.get_finished_spans(), ())
+        self.processor.on_end(_span(6, 1))
+        # late spans follow the decision of their trace
+        self.processor.on_end(_span(6, 3, 1))
+        self.assertEqual(len(self.exporter.get_finished_spans()), 3)
+
+    def test_child_ending_with_root_is_not_lost(self):
+        trace_buffer = InterleavingTraceBuffer()
+        processor = TailSamplingSpanProcessor(SimpleSpanProcessor(self.exporter), default_rate=1.0,
+                                              trace_buffer=trace_buffer)
+        trace_buffer.interleave = lambda: processor.on_end(_span(14, 1))
+        processor.on_end(_span(14, 2, 1))
+        for thread in trace_buffer.threads:
+            thread.join(5)
+        self.assertEqual(sorted(span.name for span in self.exporter.get_finished_spans()), ["span1", "span2"])
+
+    def test_workflow_rates(self):
+        self.assertEqual(parse_workflow_rates("chat=0.5, batch=2,bad=x"), {"chat": 0.5, "batch": 1.0})
+        self.processor.workflow_rates = {"chat": 1.0}
+        self.processor.on_end(_span(7, 1))
+        self.processor.on_end(_span(8, 1, attributes={"workflow.name": "other"}))
+        self.assertEqual(self._exported_traces(), {7})
+
+    def test_memory_is_bounded(self):
+        processor = TailSamplingSpanProcessor(SimpleSpanProcessor(self.exporter), default_rate=0.0,
+                                              trace_buffer=TraceBuffer(max_spans=2))
+        processor.on_end(_span(9, 2, 1, attributes={MONOCLE_DETECTED_SPAN_ERROR: True}))
+        for trace_id in range(10, 13):
+            processor.on_end(_span(trace_id, 2, 1))
+        self.assertLessEqual(processor.trace_buffer.get_metrics()["spans"], 2)
+        # the evicted error trace was kept with the spans seen so far
+        self.assertEqual(self._exported_traces(), {9})
+
+if __name__ == '__main__':
+    unittest.main()
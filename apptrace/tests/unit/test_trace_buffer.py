@@ -0,0 +1,93 @@
+import unittest
+
+from opentelemetry.sdk.trace import ReadableSpan
+from opentelemetry.trace import SpanContext
+
+from monocle_apptrace.exporters.trace_buffer import (
+    EVICT_CAPACITY,
+    EVICT_EXPIRED,
+    EVICT_SPAN_LIMIT,
+    TraceBuffer,
+    estimate_span_size,
+)
+
+def _span(trace_id: int, span_id: int, name: str = "span") -> ReadableSpan:
+    return ReadableSpan(name=name, context=SpanContext(trace_id=trace_id, span_id=span_id, is_remote=False),
+                        attributes={"entity.1.name": "x" * 100})
+
+class TestTraceBuffer(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 0.0
+        self.evicted = []
+
+    def _buffer(self, **kwargs) -> TraceBuffer:
+        kwargs.setdefault("timeout_seconds", 60)
+        kwargs.setdefault("max_spans", 1000)
+        kwargs.setdefault("max_bytes", 10_000_000)
+        kwargs.setdefault("max_spans_per_trace", 100)
+        return TraceBuffer(on_evict=lambda entry, reason: self.evicted.append((entry.trace_id, reason)),
+                           clock=lambda: self.now, **kwargs)
+
+    def test_add_and_pop(self):
+        buffer = self._buffer()
+        buffer.add(1, [_span(1, 1)])
+        entry = buffer.add(1, [_span(1, 2)], has_root=True)
+        self.assertEqual(entry.span_count, 2)
+        self.assertTrue(entry.has_root)
+        self.assertIs(buffer.pop(1), entry)
+        self.assertNotIn(1, buffer)
+        self.assertIsNone(buffer.pop(1))
+        metrics = buffer.get_metrics()
+        self.assertEqual(metrics["spans"], 0)
+        self.assertEqual(metrics["bytes"], 0)
+        self.assertEqual(metrics["completed"], 1)
+        self.assertEqual(self.evicted, [])
+
+    def test_expire_oldest_only(self):
+        buffer = self._buffer()
+        buffer.add(1, [_span(1, 1)])
+        self.now = 30
+        buffer.add(2, [_span(2, 1)])
+        # updating a trace doesn't extend its lifetime
+        buffer.add(1, [_span(1, 2)])
+        self.now = 61
+        self.assertEqual([entry.trace_id for entry in buffer.expire()], [1])
+        self.assertEqual(self.evicted, [(1, EVICT_EXPIRED)])
+        self.assertIn(2, buffer)
+
+    def test_span_cap_evicts_least_recently_used(self):
+        buffer = self._buffer(max_spans=3)
+        buffer.add(1, [_span(1, 1)])
+        buffer.add(2, [_span(2, 1)])
+        buffer.add(1, [_span(1, 2)])
+        buffer.add(3, [_span(3, 1)])
+        self.assertEqual(self.evicted, [(2, EVICT_CAPACITY)])
+        self.assertEqual(buffer.keys(), [1, 3])
+        self.assertEqual(buffer.get_metrics()["spans"], 3)
+
+    def test_byte_cap(self):
+        span = _span(1, 1)
+        buffer = self._buffer(max_bytes=estimate_span_size(span) * 2)
+        buffer.add(1, [span])
+        buffer.add(2, [_span(2, 1)])
+        buffer.add(3, [_span(3, 1)])
+        self.assertEqual(self.evicted, [(1, EVICT_CAPACITY)])
+
+    def test_per_trace_cap(self):
+        buffer = self._buffer(max_spans_per_trace=2)
+        buffer.add(1, [_span(1, 1)])
+        buffer.add(1, [_span(1, 2)])
+        self.assertEqual(self.evicted, [(1, EVICT_SPAN_LIMIT)])
+        entry = buffer.add(1, [_span(1, 3)])
+        self.assertEqual(entry.span_count, 1)
+
+    def test_drain(self):
+        buffer = self._buffer()
+        buffer.add(2, [_span(2, 1)])
+        buffer.add(1, [_span(1, 1)])
+        self.assertEqual([entry.trace_id for entry in buffer.drain()], [2, 1])
+        self.assertEqual(len(buffer), 0)
+
+if __name__ == '__main__':
+    unittest.main()
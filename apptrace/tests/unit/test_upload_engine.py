@@ -0,0 +1,81 @@
+import threading
+import unittest
+
+from monocle_apptrace.exporters.upload_engine import UploadEngine
+
+class TestUploadEngine(unittest.TestCase):
+
+    def setUp(self):
+        self.uploaded = []
+        self.release = threading.Event()
+
+    def _upload(self, data):
+        self.uploaded.append(data)
+
+    def _blocked_upload(self, data):
+        self.release.wait(5)
+        self.uploaded.append(data)
+
+    def test_flush_waits_for_uploads(self):
+        engine = UploadEngine(max_workers=2, max_queue_size=10)
+        for i in range(5):
+            self.assertTrue(engine.submit(self._upload, kwargs={"data": i}))
+        self.assertTrue(engine.flush(5000))
+        self.assertEqual(sorted(self.uploaded), list(range(5)))
+        metrics = engine.get_metrics()
+        self.assertEqual(metrics["completed"], 5)
+        self.assertEqual(metrics["queued"], 0)
+        self.assertEqual(metrics["in_flight"], 0)
+        engine.shutdown()
+
+    def test_failed_upload_is_counted(self):
+        engine = UploadEngine(max_workers=1, max_queue_size=10)
+        def failing_upload():
+            raise ConnectionError("unreachable")
+        engine.submit(failing_upload)
+        engine.flush(5000)
+        self.assertEqual(engine.get_metrics()["failed"], 1)
+        engine.shutdown()
+
+    def test_drop_oldest(self):
+        engine = UploadEngine(max_workers=1, max_queue_size=1, drop_policy="drop_oldest")
+        engine.submit(self._blocked_upload, kwargs={"data": "in_flight"})
+        engine._condition.acquire()
+        engine._condition.wait_for(lambda: engine._in_flight == 1, timeout=5)
+        engine._condition.release()
+        engine.submit(self._upload, kwargs={"data": "oldest"})
+        self.assertTrue(engine.submit(self._upload, kwargs={"data": "newest"}))
+        self.release.set()
+        engine.flush(5000)
+        self.assertEqual(self.uploaded, ["in_flight", "newest"])
+        self.assertEqual(engine.get_metrics()["dropped"], 1)
+        engine.shutdown()
+
+    def test_drop_newest(self):
+        engine = UploadEngine(max_workers=1, max_queue_size=1, drop_policy="drop_newest")
+        engine.submit(self._blocked_upload, kwargs={"data": "in_flight"})
+        engine._condition.acquire()
+        engine._condition.wait_for(lambda: engine._in_flight == 1, timeout=5)
+        engine._condition.release()
+        engine.submit(self._upload, kwargs={"data": "oldest"})
+        self.assertFalse(engine.submit(self._upload, kwargs={"data": "newest"}))
+        self.release.set()
+        engine.flush(5000)
+        self.assertEqual(self.uploaded, ["in_flight", "oldest"])
+        engine.shutdown()
+
+    def test_flush_timeout(self):
+        engine = UploadEngine(max_workers=1, max_queue_size=10)
+        engine.submit(self._blocked_upload, kwargs={"data": 1})
+        self.assertFalse(engine.flush(50))
+        self.release.set()
+        self.assertTrue(engine.shutdown(5000))
+
+    def test_submit_after_shutdown_runs_inline(self):
+        engine = UploadEngine(max_workers=1, max_queue_size=10)
+        engine.shutdown()
+        self.assertTrue(engine.submit(self._upload, kwargs={"data": "late"}))
+        self.assertEqual(self.uploaded, ["late"])
+
+if __name__ == '__main__':
+    unittest.main()